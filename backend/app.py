@@ -0,0 +1,181 @@
+"""Application factory.
+
+``create_app()`` builds the API: every controller router under ``/api``,
+the health and ``/metrics`` endpoints, and the middleware (metrics, rate
+limiting, route context for slow command logs, CORS).
+
+``lifespan`` opens storage before the app reports ready and releases it
+on shutdown. On MongoDB it sets up, per shard, the repositories and
+balance cache, then pings the home database, loads the price snapshot,
+and starts index creation and the monitoring tasks in the background.
+With ``STORAGE_BACKEND=memory`` no client is opened and the app runs on
+the in-process store.
+
+    uvicorn backend.server:app --reload --port 8001   # development
+    python -m backend.serve --port 8001               # production, one worker per CPU
+"""
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import os
+
+from typing import Optional
+
+from fastapi import APIRouter, FastAPI
+from fastapi.responses import PlainTextResponse
+from starlette.middleware.cors import CORSMiddleware
+
+from . import database, metrics, profiling, rate_limit, repositories, slow_queries
+from .controllers import (
+    account_controller,
+    admin_controller,
+    auth_controller,
+    investment_controller,
+    job_controller,
+    schedule_controller,
+    transaction_controller,
+)
+from .repositories import memory_repositories, mongo_repositories
+from .repositories.balance_cache import enable_balance_cache
+from .services.quote_hub import stop_price_hub
+from .services.scheduler import scheduler_lag
+from .services.valuation import get_price_snapshot
+from .sharding import HOME_SHARD
+
+logger = logging.getLogger(__name__)
+
+ROUTERS = [
+    auth_controller.router,
+    account_controller.router,
+    transaction_controller.router,
+    investment_controller.router,
+    schedule_controller.router,
+    job_controller.router,
+    admin_controller.router,
+]
+
+async def _create_indexes(shards):
+    try:
+        await shards.fan_out(database.create_indexes)
+        logger.info("Indexes ensured")
+    except Exception as e:
+        logger.error(f"Index creation failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if repositories.storage_backend() == "memory":
+        # No MongoDB: the repository-backed endpoints run on an in-process store, the rest answer 503
+        repos = memory_repositories()
+        balance_task = enable_balance_cache(repos)
+        repositories.set_repositories(repos)
+        rate_limit.start()
+        lag_task = asyncio.create_task(metrics.monitor_event_loop())
+        app.state.db = None
+        yield
+        lag_task.cancel()
+        await stop_price_hub()
+        rate_limit.stop()
+        if balance_task:
+            balance_task.cancel()
+        repositories.clear_repositories()
+        return
+
+    db = database.connect()
+    shard_repositories = {}
+    balance_tasks = []
+    for name, shard_db in database.shards.databases.items():
+        # Users and market data are read from home whatever the shard
+        shard_repos = mongo_repositories(shard_db, home=db)
+        balance_tasks.append(enable_balance_cache(shard_repos, shard_db))
+        shard_repositories[name] = (shard_repos, mongo_repositories(database.analytics(shard_db), home=database.analytics(db)))
+    repos, analytics_repos = shard_repositories.pop(HOME_SHARD)
+    repositories.set_repositories(repos, analytics_repos, shards=shard_repositories, ring=database.shards.ring)
+    rate_limit.start(db)
+    try:
+        # Open the first pooled connection and load the price snapshot now rather than on the first request
+        await db.command("ping")
+        await get_price_snapshot(repos.market)
+    except Exception as e:
+        logger.error(f"MongoDB not reachable at startup: {e}")
+    index_task = asyncio.create_task(_create_indexes(database.shards))
+    lag_task = asyncio.create_task(metrics.monitor_event_loop())
+    profiling_task = asyncio.create_task(profiling.watch_settings(app, db))
+    slow_command_task = asyncio.create_task(slow_queries.record_slow_commands(db))
+    app.state.db = db
+    yield
+    index_task.cancel()
+    lag_task.cancel()
+    profiling_task.cancel()
+    slow_command_task.cancel()
+    for balance_task in filter(None, balance_tasks):
+        balance_task.cancel()
+    profiling.apply_settings(app, db, None)
+    await stop_price_hub()
+    rate_limit.stop()
+    repositories.clear_repositories()
+    database.close()
+    logger.info("Database connection closed")
+
+def create_app(instrument: Optional[bool] = None, limit_rate: Optional[bool] = None) -> FastAPI:
+    """Build the API.
+
+    ``instrument`` (default: ``METRICS_ENABLED``, on) adds the request
+    metrics middleware, ``limit_rate`` (default: ``RATE_LIMIT_ENABLED``,
+    on) the rate limiter.
+    """
+    if instrument is None:
+        instrument = os.environ.get("METRICS_ENABLED", "1") != "0"
+    if limit_rate is None:
+        limit_rate = rate_limit.RATE_LIMIT_ENABLED
+
+    app = FastAPI(
+        title="BankSys API",
+        description="Mobile Banking Application API",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+
+    api_router = APIRouter(prefix="/api")
+
+    @api_router.get("/")
+    async def root():
+        return {"message": "BankSys API - Mobile Banking Application", "version": "1.0.0"}
+
+    @api_router.get("/health")
+    async def health_check():
+        return {"status": "healthy", "service": "banksys-api"}
+
+    @api_router.get("/health/pool")
+    async def pool_health():
+        """Connection pool usage per server: checked out, waiting, saturation and checkout wait"""
+        return database.pool_stats()
+
+    for router in ROUTERS:
+        api_router.include_router(router)
+    app.include_router(api_router)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        metrics.set_pool_gauges(database.pool_stats())
+        if app.state.db is not None:
+            try:
+                metrics.set_scheduler_gauges(await scheduler_lag(app.state.db))
+            except Exception as e:
+                logger.warning(f"Scheduler lag not read for /metrics: {e}")
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    # Inside the metrics middleware, so rejections show up in the request metrics
+    if limit_rate:
+        app.add_middleware(rate_limit.RateLimitMiddleware)
+    if instrument:
+        app.add_middleware(metrics.MetricsMiddleware)
+    app.add_middleware(slow_queries.RouteContextMiddleware)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get("CORS_ORIGINS", "*").split(","),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
@@ -0,0 +1,228 @@
+"""Async load test of the API, in process.
+
+The app runs inside this process (ASGI transport, full lifespan, no
+sockets) against a scratch database on a local mongod (``--mongo-url``,
+default ``MONGO_URL``) or, with ``--in-memory``, on the in-memory
+repositories (``STORAGE_BACKEND=memory``), which leaves only the
+Python side of each request to measure. ``--shards N`` spreads the users
+over N more scratch databases on the same mongod (``MONGO_SHARDS``), to
+measure the cost of routing by shard.
+Each virtual user registers, logs in and seeds a few transactions, then
+runs weighted scenarios until the time is up:
+
+- ``login``: POST /api/auth/login
+- ``dashboard``: profile, balance, last transactions and credit cards
+- ``pix``: POST /api/transactions/pix
+- ``analytics``: GET /api/transactions/analytics
+- ``investments``: portfolio, CDB options and a CDB simulation
+
+Throughput and p50/p95/p99 latency per endpoint (and overall) are
+written as JSON to ``--output`` so runs can be compared.
+
+    python -m backend.benchmarks.load_test --users 50 --seconds 30 --output load-test.json
+    python -m backend.benchmarks.load_test --in-memory --mix dashboard=5,pix=2,analytics=1
+    python -m backend.benchmarks.load_test --shards 2
+"""
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import time
+
+import httpx
+import numpy as np
+
+from .. import database
+from ..app import create_app
+
+DEFAULT_MIX = "dashboard=5,pix=2,investments=2,analytics=1,login=1"
+PASSWORD = "LoadTest@123"
+SEED_TRANSACTIONS = 20
+CATEGORIES = ["food", "transport", "shopping", "entertainment", "bills", "health"]
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def call(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        name = f"{method} {url.split('?')[0]}"
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            raise
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+class VirtualUser:
+    def __init__(self, number: int, client: httpx.AsyncClient, recorder: Recorder):
+        self.client = client
+        self.recorder = recorder
+        suffix = f"{os.getpid() % 1000:03d}{number:08d}"
+        self.credentials = {"cpf": suffix, "password": PASSWORD}
+        self.profile = {
+            **self.credentials,
+            "full_name": f"Load Test {number}",
+            "email": f"load{suffix}@banksys.test",
+            "phone": f"11{suffix[-9:]}",
+        }
+        self.headers = {}
+
+    async def call(self, method: str, url: str, **kwargs) -> httpx.Response:
+        return await self.recorder.call(self.client, method, url, headers=self.headers, **kwargs)
+
+    async def setup(self):
+        await self.call("POST", "/api/auth/register", json=self.profile)
+        await self.login()
+        await self.call("POST", "/api/transactions/", json={
+            "transaction_type": "credit", "category": "transfer", "amount": 100000.0, "description": "Salary",
+        })
+        for _ in range(SEED_TRANSACTIONS):
+            await self.call("POST", "/api/transactions/", json={
+                "transaction_type": "debit",
+                "category": random.choice(CATEGORIES),
+                "amount": round(random.uniform(5, 300), 2),
+                "description": "Card purchase",
+            })
+
+    async def login(self):
+        response = await self.call("POST", "/api/auth/login", json=self.credentials)
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def dashboard(self):
+        await self.call("GET", "/api/auth/me")
+        await self.call("GET", "/api/accounts/balance")
+        await self.call("GET", "/api/transactions/?limit=10")
+        await self.call("GET", "/api/accounts/credit-cards")
+
+    async def pix(self):
+        await self.call("POST", "/api/transactions/pix", json={
+            "pix_key": f"friend{random.randint(1, 1000)}@email.com",
+            "amount": round(random.uniform(1, 50), 2),
+            "description": "PIX",
+            "recipient_name": "Friend",
+        })
+
+    async def analytics(self):
+        await self.call("GET", "/api/transactions/analytics?months=6")
+
+    async def investments(self):
+        await self.call("GET", "/api/investments/portfolio")
+        await self.call("GET", "/api/investments/cdb-options")
+        await self.call("GET", f"/api/investments/cdb-options/simulate?amount={random.randint(1, 100) * 1000}&months=12")
+
+    async def run(self, scenarios: list, weights: list, deadline: float):
+        while time.perf_counter() < deadline:
+            scenario = random.choices(scenarios, weights)[0]
+            try:
+                await getattr(self, scenario)()
+            except httpx.HTTPError:
+                pass
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in {"login", "dashboard", "pix", "analytics", "investments"}:
+            raise SystemExit(f"Unknown scenario: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+def summarize(latencies: list, errors: int, seconds: float) -> dict:
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": int(ms.size),
+        "errors": errors,
+        "throughput_rps": ms.size / seconds,
+        "mean_ms": float(ms.mean()) if ms.size else None,
+        "p50_ms": float(np.percentile(ms, 50)) if ms.size else None,
+        "p95_ms": float(np.percentile(ms, 95)) if ms.size else None,
+        "p99_ms": float(np.percentile(ms, 99)) if ms.size else None,
+        "max_ms": float(ms.max()) if ms.size else None,
+    }
+
+def _shard_db_names(args) -> list:
+    return [f"{args.db_name}_s{i}" for i in range(1, args.shards + 1)]
+
+async def main(args) -> dict:
+    weights = parse_mix(args.mix)
+    if args.in_memory:
+        os.environ["STORAGE_BACKEND"] = "memory"
+    else:
+        os.environ["MONGO_URL"] = args.mongo_url
+        os.environ["DB_NAME"] = args.db_name
+        # Never the shards of the environment: they are real data
+        os.environ.pop("SHARD_RING", None)
+        os.environ["MONGO_SHARDS"] = ",".join(
+            f"s{i}={args.mongo_url.rstrip('/')}/{name}" for i, name in enumerate(_shard_db_names(args), 1)
+        )
+
+    app = create_app(limit_rate=args.rate_limit)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False), base_url="http://loadtest", limits=limits, timeout=60.0) as client:
+            setup = Recorder()
+            users = [VirtualUser(number, client, setup) for number in range(args.users)]
+            await asyncio.gather(*(user.setup() for user in users))
+
+            recorder = Recorder()
+            for user in users:
+                user.recorder = recorder
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                user.run(list(weights), list(weights.values()), started + args.seconds) for user in users
+            ))
+            elapsed = time.perf_counter() - started
+        if not args.keep and not args.in_memory:
+            for name in [args.db_name, *_shard_db_names(args)]:
+                await database.client.drop_database(name)
+
+    all_latencies = [latency for latencies in recorder.latencies.values() for latency in latencies]
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "config": {
+            "users": args.users,
+            "seconds": args.seconds,
+            "mix": weights,
+            "database": "in-memory" if args.in_memory else "mongod",
+            "shards": 1 if args.in_memory else 1 + args.shards,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "setup_errors": sum(setup.errors.values()),
+        "total": summarize(all_latencies, sum(recorder.errors.values()), elapsed),
+        "endpoints": {
+            name: summarize(latencies, recorder.errors.get(name, 0), elapsed)
+            for name, latencies in sorted(recorder.latencies.items())
+        },
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the API in process")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent virtual users")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. dashboard=5,pix=2")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="banksys_loadtest", help="Scratch database (dropped afterwards)")
+    parser.add_argument("--in-memory", action="store_true", help="Run on the in-memory repositories instead of mongod")
+    parser.add_argument("--shards", type=int, default=0, help="Extra scratch shard databases (MONGO_SHARDS)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch databases")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="Keep the rate limiter on (virtual users share one address and loop faster than real clients)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="load-test-results.json")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = asyncio.run(main(args))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["total"], indent=2))
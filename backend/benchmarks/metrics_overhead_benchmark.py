@@ -0,0 +1,89 @@
+"""CPU cost of the metrics instrumentation.
+
+Calls the ASGI app directly (no sockets, no database) for a few routes,
+with and without the metrics middleware, in interleaved rounds, and
+reports the best-round CPU time per request and the relative overhead. The Mongo
+command listener is timed separately per started/succeeded event pair.
+
+    python -m backend.benchmarks.metrics_overhead_benchmark --requests 5000 --rounds 5
+"""
+from types import SimpleNamespace
+import argparse
+import asyncio
+import gc
+import json
+import time
+
+from ..app import create_app
+from ..metrics import command_metrics
+
+PATHS = [
+    ("/api/health", b""),
+    ("/api/investments/cdb-options", b""),
+    ("/api/investments/cdb-options/simulate", b"amount=10000&months=12"),
+]
+
+async def _call(app, path: str, query: bytes):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": query,
+        "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+async def _cpu_per_request(app, path: str, query: bytes, requests: int) -> float:
+    gc.collect()
+    started = time.process_time()
+    for _ in range(requests):
+        await _call(app, path, query)
+    return (time.process_time() - started) / requests * 1e6
+
+def _listener_cost(events: int) -> float:
+    started_event = SimpleNamespace(command={"find": "transactions"}, command_name="find", connection_id=("bench", 27017), request_id=0)
+    succeeded_event = SimpleNamespace(command_name="find", connection_id=("bench", 27017), request_id=0, duration_micros=800)
+    started = time.process_time()
+    for i in range(events):
+        started_event.request_id = succeeded_event.request_id = i
+        command_metrics.started(started_event)
+        command_metrics.succeeded(succeeded_event)
+    return (time.process_time() - started) / events * 1e6
+
+async def main(args):
+    plain, instrumented = create_app(instrument=False), create_app(instrument=True)
+    results = []
+    for path, query in PATHS:
+        # Warm-up, then interleave rounds so drift affects both variants alike
+        await _cpu_per_request(plain, path, query, 200)
+        await _cpu_per_request(instrumented, path, query, 200)
+        base, with_metrics = [], []
+        for _ in range(args.rounds):
+            base.append(await _cpu_per_request(plain, path, query, args.requests))
+            with_metrics.append(await _cpu_per_request(instrumented, path, query, args.requests))
+        # Best round of each: the least disturbed by the rest of the machine
+        base_us, metrics_us = min(base), min(with_metrics)
+        results.append({
+            "path": path,
+            "cpu_us_per_request": base_us,
+            "cpu_us_per_request_instrumented": metrics_us,
+            "overhead_us": metrics_us - base_us,
+            "overhead_percent": (metrics_us - base_us) / base_us * 100,
+        })
+    print(json.dumps({
+        "requests_per_round": args.requests,
+        "rounds": args.rounds,
+        "routes": results,
+        "mongo_listener_us_per_command": _listener_cost(args.requests * 10),
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure metrics instrumentation overhead")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,303 @@
+"""Micro-benchmarks of the code that runs on every request.
+
+Each benchmark times one call (sync or async) in rounds: the number of
+calls per round is calibrated so a round lasts ``--min-time``, and
+per-call min / median / mean / stddev over the rounds are reported, in
+microseconds. No database is involved; the code under test gets fixed
+in-memory inputs (or the in-memory repositories).
+
+Results can be saved as a named baseline (``baselines/<name>.json``)
+and later compared: a benchmark whose statistic (by default the best
+round, the one least disturbed by the rest of the machine) got slower by more than ``--threshold`` percent is a regression, and the
+command exits with status 1.
+
+    python -m backend.benchmarks.micro_benchmark run --save main
+    python -m backend.benchmarks.micro_benchmark run -k jwt
+    python -m backend.benchmarks.micro_benchmark compare main --threshold 10
+    python -m backend.benchmarks.micro_benchmark compare main --against results.json
+
+Baselines are only comparable on the machine (and Python) they were
+recorded on; ``machine`` in the file says which.
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from bson import ObjectId
+from fastapi.security import HTTPAuthorizationCredentials
+from jose import jwt
+
+from ..controllers.auth_controller import (
+    ALGORITHM, SECRET_KEY, create_access_token, get_current_user, get_password_hash, verify_password
+)
+from ..controllers.investment_controller import to_responses
+from ..controllers.transaction_controller import summarize_transactions, to_response
+from ..repositories import memory_repositories
+from ..services.valuation import PriceSnapshot, portfolio_summary_pipeline
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+STATISTICS = ("min", "median", "mean")
+
+BENCHMARKS: Dict[str, Callable[[], Callable]] = {}
+
+def benchmark(name: str):
+    """Register a factory that prepares inputs and returns the callable to time"""
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+CATEGORIES = ["food", "transport", "shopping", "entertainment", "bills", "health", "education", "other"]
+TYPES = ["debit", "debit", "debit", "pix_sent", "bill_payment", "credit", "pix_received"]
+MERCHANTS = [f"Merchant {i}" for i in range(30)] + [None] * 10
+SYMBOLS = ["BTC", "ETH", "ADA", "SOL", "DOT", "XRP", "DOGE", "LTC", "LINK", "AVAX"]
+
+def _transactions(count: int) -> list:
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "user_id": ObjectId(),
+            "transaction_type": random.choice(TYPES),
+            "category": random.choice(CATEGORIES),
+            "amount": round(random.uniform(1, 500), 2),
+            "description": "Card purchase",
+            "merchant_name": random.choice(MERCHANTS),
+            "recipient_name": None,
+            "transaction_date": now - timedelta(days=random.uniform(0, 180)),
+            "status": "completed",
+            "balance_after": round(random.uniform(0, 10000), 2),
+        }
+        for _ in range(count)
+    ]
+
+def _holdings(count: int) -> list:
+    now = datetime.utcnow()
+    holdings = []
+    for _ in range(count):
+        symbol = random.choice(SYMBOLS + [None])
+        quantity = random.uniform(0.01, 5)
+        price = random.uniform(1, 50000)
+        holdings.append({
+            "_id": ObjectId(),
+            "investment_type": "cryptocurrency" if symbol else "cdb",
+            "asset_name": symbol or "CDB Banco Inter",
+            "symbol": symbol,
+            "quantity": quantity,
+            "purchase_price": price,
+            "total_invested": quantity * price,
+            "accrued_value": None if symbol else quantity * price * 1.05,
+            "purchase_date": now,
+        })
+    return holdings
+
+def _snapshot() -> PriceSnapshot:
+    return PriceSnapshot({symbol: random.uniform(1, 50000) for symbol in SYMBOLS}, time.monotonic())
+
+@benchmark("jwt.encode")
+def bench_jwt_encode():
+    user_id = str(ObjectId())
+    return lambda: create_access_token({"sub": user_id}, timedelta(minutes=30))
+
+@benchmark("jwt.decode")
+def bench_jwt_decode():
+    token = create_access_token({"sub": str(ObjectId())}, timedelta(minutes=30))
+    return lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+@benchmark("auth.get_current_user")
+def bench_get_current_user():
+    user_id = ObjectId()
+    credentials = HTTPAuthorizationCredentials(
+        scheme="Bearer", credentials=create_access_token({"sub": str(user_id)}, timedelta(minutes=30))
+    )
+    repos = memory_repositories()
+    asyncio.run(repos.users.insert({
+        "_id": user_id, "cpf": "12345678901", "password": "$2b$12$" + "x" * 53, "full_name": "Maria Silva Santos",
+        "email": "maria@email.com", "phone": "11999991234", "profile_image": None, "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(), "is_active": True, "biometric_enabled": False,
+    }))
+
+    async def call():
+        return await get_current_user(credentials, repos)
+    return call
+
+@benchmark("transactions.response_x100")
+def bench_transaction_responses():
+    transactions = _transactions(100)
+    return lambda: [to_response(transaction) for transaction in transactions]
+
+@benchmark("transactions.analytics_x1000")
+def bench_transaction_analytics():
+    # get_transaction_analytics reads at most 1000 transactions
+    transactions = _transactions(1000)
+    return lambda: summarize_transactions(transactions)
+
+@benchmark("investments.responses_x50")
+def bench_investment_responses():
+    holdings, snapshot = _holdings(50), _snapshot()
+    return lambda: to_responses(holdings, snapshot)
+
+@benchmark("investments.summary_pipeline")
+def bench_portfolio_pipeline():
+    user_id, snapshot = ObjectId(), _snapshot()
+    return lambda: portfolio_summary_pipeline(user_id, snapshot)
+
+@benchmark("password.hash")
+def bench_password_hash():
+    return lambda: get_password_hash("MinhaSenh@123")
+
+@benchmark("password.verify")
+def bench_password_verify():
+    hashed = get_password_hash("MinhaSenh@123")
+    return lambda: verify_password("MinhaSenh@123", hashed)
+
+async def _time_async(call: Callable, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    return time.perf_counter() - started
+
+def _time_sync(call: Callable, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call()
+    return time.perf_counter() - started
+
+def measure(call: Callable, rounds: int, min_time: float) -> dict:
+    loop = asyncio.new_event_loop() if asyncio.iscoroutinefunction(call) else None
+
+    def timed(iterations: int) -> float:
+        if loop is not None:
+            return loop.run_until_complete(_time_async(call, iterations))
+        return _time_sync(call, iterations)
+
+    try:
+        # Calibrate (which also warms up), then time the rounds without GC pauses
+        per_call = timed(1)
+        if per_call < min_time / 100:
+            per_call = timed(100) / 100
+        iterations = max(1, int(min_time / per_call))
+        timed(iterations)
+        gc.collect()
+        gc.disable()
+        try:
+            samples = [timed(iterations) / iterations * 1e6 for _ in range(rounds)]
+        finally:
+            gc.enable()
+    finally:
+        if loop is not None:
+            loop.close()
+
+    median = statistics.median(samples)
+    return {
+        "min": min(samples),
+        "median": median,
+        "mean": statistics.fmean(samples),
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "rounds": rounds,
+        "iterations": iterations,
+        "ops_per_second": 1e6 / median,
+    }
+
+def machine() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+def run(selected: Optional[str], rounds: int, min_time: float) -> dict:
+    results = {}
+    for name, factory in BENCHMARKS.items():
+        if selected and selected not in name:
+            continue
+        random.seed(0)
+        try:
+            results[name] = measure(factory(), rounds, min_time)
+        except Exception as e:
+            print(f"{name:<32} failed: {e!r}", file=sys.stderr)
+            continue
+        print(f"{name:<32} {results[name]['median']:>12.2f} us  (min {results[name]['min']:.2f}, ±{results[name]['stddev']:.2f})",
+              file=sys.stderr)
+    return {"created_at": datetime.utcnow().isoformat(), "machine": machine(), "benchmarks": results}
+
+def compare(baseline: dict, current: dict, threshold: float, stat: str) -> list:
+    rows = []
+    for name, base in baseline["benchmarks"].items():
+        now = current["benchmarks"].get(name)
+        if now is None:
+            continue
+        change = (now[stat] - base[stat]) / base[stat] * 100
+        status = "regression" if change > threshold else "improvement" if change < -threshold else "ok"
+        rows.append({"name": name, "baseline_us": base[stat], "current_us": now[stat], "change_percent": change, "status": status})
+    return rows
+
+def _baseline_path(name: str) -> str:
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+
+def _write(path: str, results: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of request hot paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--save", metavar="NAME", help="Store the results as baseline NAME")
+    run_parser.add_argument("--output", help="Also write the results to this file")
+
+    compare_parser = commands.add_parser("compare", help="Compare against a stored baseline")
+    compare_parser.add_argument("baseline", help="Baseline name (or path to a results file)")
+    compare_parser.add_argument("--against", help="Results file to compare (default: run the benchmarks now)")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="Slowdown, in percent, counted as a regression")
+    compare_parser.add_argument("--stat", choices=STATISTICS, default="min")
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument("-k", dest="selected", help="Only benchmarks whose name contains this")
+        sub.add_argument("--rounds", type=int, default=10)
+        sub.add_argument("--min-time", type=float, default=0.05, help="Seconds per round")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.selected, args.rounds, args.min_time)
+        if args.save:
+            _write(_baseline_path(args.save), results)
+        if args.output:
+            _write(args.output, results)
+        print(json.dumps(results, indent=2))
+        return 0
+
+    with open(_baseline_path(args.baseline)) as f:
+        baseline = json.load(f)
+    if args.against:
+        with open(args.against) as f:
+            current = json.load(f)
+    else:
+        current = run(args.selected, args.rounds, args.min_time)
+    rows = compare(baseline, current, args.threshold, args.stat)
+    if baseline["machine"] != current["machine"]:
+        print("warning: baseline was recorded on a different machine", file=sys.stderr)
+    for row in rows:
+        print(f"{row['name']:<32} {row['baseline_us']:>12.2f} -> {row['current_us']:>12.2f} us  "
+              f"{row['change_percent']:>+7.1f}%  {row['status']}")
+    regressions = [row["name"] for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:g}%: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
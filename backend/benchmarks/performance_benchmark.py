@@ -0,0 +1,75 @@
+"""Latency of the portfolio performance chart.
+
+Seeds a scratch database with a year of daily bars and one user's
+holdings, then times ``portfolio_performance`` (query plus vectorized
+reconstruction) and reports percentiles as JSON. Target: p95 under 50 ms.
+
+    python -m backend.benchmarks.performance_benchmark --holdings 200 --runs 200
+"""
+from datetime import datetime, timedelta
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from ..services.price_history import RESOLUTIONS, create_price_history_collections, portfolio_performance
+
+SYMBOLS = ["BTC", "ETH", "ADA", "SOL"]
+
+async def seed(db, days: int, holdings: int, end: datetime) -> list:
+    await db.price_bars_1d.drop()
+    await create_price_history_collections(db)
+
+    start = end - timedelta(days=days)
+    bars = []
+    for symbol in SYMBOLS:
+        price = random.uniform(1, 100000)
+        for day in range(days + 1):
+            price *= float(np.exp(random.gauss(0, 0.03)))
+            bars.append({"symbol": symbol, "ts": start + timedelta(days=day), "open": price, "high": price, "low": price, "close": price})
+    await db[RESOLUTIONS["1d"][0]].insert_many(bars, ordered=False)
+
+    return [
+        {
+            "symbol": random.choice(SYMBOLS + [None]),
+            "quantity": random.uniform(0.01, 5),
+            "total_invested": random.uniform(100, 10000),
+            "purchase_date": start + timedelta(days=random.randrange(days))
+        }
+        for _ in range(holdings)
+    ]
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[args.db_name]
+    end = datetime.utcnow()
+    holdings = await seed(db, args.days, args.holdings, end)
+
+    latencies = []
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        await portfolio_performance(db, holdings, end - timedelta(days=args.days), end, "1d")
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    latencies = np.array(latencies)
+    print(json.dumps({
+        "days": args.days,
+        "holdings": args.holdings,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }, indent=2))
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the portfolio performance reconstruction")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--holdings", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--db-name", default="banksys_bench")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""Fan-out throughput of the quote hub on one event loop.
+
+Subscribes N in-process clients (each a task that encodes every batch it
+receives, as the WebSocket handler does), publishes simulated ticks at a
+fixed rate and reports publish cost, delivered quotes per second,
+delivery latency percentiles and how many updates slow clients skipped
+through coalescing, as JSON. No database needed.
+
+    python -m backend.benchmarks.quote_fanout_benchmark --subscribers 10000 --rate 10 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+
+from ..services.pricing import MOCK_CRYPTO_DATA
+from ..services.quote_hub import PriceHub, SimulatedSource, encode_batch
+
+SYMBOLS = [crypto["symbol"] for crypto in MOCK_CRYPTO_DATA]
+
+async def client(subscription, latencies: list, slow: bool, sample_every: int):
+    received = 0
+    while True:
+        batch = await subscription.next_batch()
+        message = encode_batch(batch)
+        received += 1
+        if received % sample_every == 0:
+            now = time.time()
+            latencies.extend(now - quote["published_at"] for quote in json.loads(message)["quotes"])
+        if slow:
+            await asyncio.sleep(1.0)
+
+async def main(args):
+    hub = PriceHub()
+    source = SimulatedSource(seed=42)
+    rng = random.Random(42)
+    latencies = []
+    subscriptions = []
+    tasks = []
+    for i in range(args.subscribers):
+        subscription = hub.subscribe(rng.sample(SYMBOLS, rng.randint(1, len(SYMBOLS))))
+        subscriptions.append(subscription)
+        tasks.append(asyncio.create_task(client(subscription, latencies, i < args.subscribers * args.slow_fraction, args.sample_every)))
+    await asyncio.sleep(0)
+
+    publish_ms = []
+    interval = 1.0 / args.rate
+    started = time.perf_counter()
+    for _ in range(int(args.seconds * args.rate)):
+        tick_started = time.perf_counter()
+        quotes = await source.tick()
+        t0 = time.perf_counter()
+        hub.publish(quotes)
+        publish_ms.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(max(interval - (time.perf_counter() - tick_started), 0))
+    elapsed = time.perf_counter() - started
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    delivered = sum(subscription.delivered for subscription in subscriptions)
+    print(json.dumps({
+        "subscribers": args.subscribers,
+        "ticks_per_second": args.rate,
+        "publish_p50_ms": float(np.percentile(publish_ms, 50)),
+        "publish_p99_ms": float(np.percentile(publish_ms, 99)),
+        "delivered_quotes_per_second": delivered / elapsed,
+        "delivery_latency_p50_ms": float(np.percentile(latencies, 50)),
+        "delivery_latency_p99_ms": float(np.percentile(latencies, 99)),
+        "coalesced_updates": sum(subscription.coalesced for subscription in subscriptions),
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure quote hub fan-out")
+    parser.add_argument("--subscribers", type=int, default=10_000)
+    parser.add_argument("--rate", type=float, default=10.0, help="Ticks published per second")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--slow-fraction", type=float, default=0.05, help="Share of clients that read once a second")
+    parser.add_argument("--sample-every", type=int, default=10, help="Latency sampled on every Nth batch per client")
+    asyncio.run(main(parser.parse_args()))
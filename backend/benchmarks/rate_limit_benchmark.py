@@ -0,0 +1,97 @@
+"""CPU cost of the rate limiter per request.
+
+Calls ``RateLimitMiddleware`` (in-memory buckets) around an ASGI app
+that does nothing, and the bare app, in interleaved rounds, and reports
+the best-round CPU time per request and the difference, for a request
+with a bearer token (signature already checked), an anonymous one, an
+exempt one and one that is rejected with 429. Limits are raised so that
+only the last one ever runs out. Exits with status 1 when an allowed
+request costs more than ``--budget-us``.
+
+    python -m backend.benchmarks.rate_limit_benchmark --requests 20000 --rounds 5
+"""
+from datetime import timedelta
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+
+from bson import ObjectId
+
+from .. import rate_limit
+from ..controllers.auth_controller import create_access_token
+
+# Analytics buckets never refill: every request after the first is answered 429
+LIMITS = "auth=1e9/1e9,analytics=1e-9/1,market=1e9/1e9,write=1e9/1e9,read=1e9/1e9"
+ALLOWED = ("authenticated", "anonymous", "exempt")
+
+async def _noop(scope, receive, send):
+    pass
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+async def _send(message):
+    pass
+
+def _scope(method: str, path: str, token: str = None, client: str = "127.0.0.1") -> dict:
+    headers = [(b"host", b"bench"), (b"user-agent", b"bench"), (b"accept", b"*/*")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": headers, "client": (client, 1), "server": ("bench", 80),
+    }
+
+async def _cpu_per_request(app, scope: dict, requests: int) -> float:
+    gc.collect()
+    started = time.process_time()
+    for _ in range(requests):
+        await app(scope, _receive, _send)
+    return (time.process_time() - started) / requests * 1e6
+
+async def main(args) -> int:
+    os.environ["RATE_LIMITS"] = LIMITS
+    rate_limit.start(backend="memory")
+    limited = rate_limit.RateLimitMiddleware(_noop)
+    token = create_access_token({"sub": str(ObjectId())}, timedelta(minutes=30))
+    scenarios = {
+        "authenticated": _scope("GET", "/api/accounts/balance", token),
+        "anonymous": _scope("GET", "/api/investments/cdb-options"),
+        "exempt": _scope("GET", "/api/health"),
+        "rejected": _scope("GET", "/api/transactions/analytics", token),
+    }
+
+    results = {}
+    for name, scope in scenarios.items():
+        # Warm-up (checks the token signature once), then interleave rounds so drift affects both alike
+        await _cpu_per_request(_noop, scope, 200)
+        await _cpu_per_request(limited, scope, 200)
+        base, with_limiter = [], []
+        for _ in range(args.rounds):
+            base.append(await _cpu_per_request(_noop, scope, args.requests))
+            with_limiter.append(await _cpu_per_request(limited, scope, args.requests))
+        # Best round of each: the least disturbed by the rest of the machine
+        results[name] = {"cpu_us_per_request": min(with_limiter), "overhead_us": min(with_limiter) - min(base)}
+    rate_limit.stop()
+
+    over = [name for name in ALLOWED if results[name]["overhead_us"] > args.budget_us]
+    print(json.dumps({
+        "requests_per_round": args.requests,
+        "rounds": args.rounds,
+        "budget_us": args.budget_us,
+        "scenarios": results,
+        "over_budget": over,
+    }, indent=2))
+    return 1 if over else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure rate limiter overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--budget-us", type=float, default=50.0, help="Allowed overhead per request, in microseconds")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,69 @@
+"""Import-to-ready time of the API.
+
+Each run is a fresh interpreter that imports the app module, calls
+``create_app()``, enters the lifespan (Motor client, first connection)
+and serves a first ``/api/health`` request in process; the median time
+of each phase over all runs is reported as JSON. Uses ``MONGO_URL``.
+
+    python -m backend.benchmarks.startup_benchmark --runs 10
+"""
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+
+PHASES = ("import_ms", "create_app_ms", "lifespan_ms", "first_request_ms", "ready_ms")
+
+async def _ready(marks: dict):
+    import httpx
+
+    from ..app import create_app
+    marks["import_ms"] = time.perf_counter()
+    app = create_app()
+    marks["create_app_ms"] = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        marks["lifespan_ms"] = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://startup") as client:
+            response = await client.get("/api/health")
+            response.raise_for_status()
+        marks["first_request_ms"] = time.perf_counter()
+
+def child():
+    marks = {}
+    asyncio.run(_ready(marks))
+    previous, phases = STARTED, {}
+    for phase in PHASES[:-1]:
+        phases[phase] = (marks[phase] - previous) * 1000
+        previous = marks[phase]
+    phases["ready_ms"] = (previous - STARTED) * 1000
+    print(json.dumps(phases))
+
+def main(args):
+    runs = []
+    for _ in range(args.runs):
+        output = subprocess.run(
+            [sys.executable, "-m", "backend.benchmarks.startup_benchmark", "--child"],
+            check=True, capture_output=True, text=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps({
+        "runs": args.runs,
+        **{phase: statistics.median(run[phase] for run in runs) for phase in PHASES},
+        "ready_max_ms": max(run["ready_ms"] for run in runs),
+    }, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API import-to-ready time")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+    else:
+        main(args)
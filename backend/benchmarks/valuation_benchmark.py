@@ -0,0 +1,129 @@
+"""Stored-value vs lazy portfolio valuation at a fixed tick rate.
+
+Seeds a scratch database with synthetic holdings, then for each approach
+runs one market tick per second while issuing portfolio reads, and
+reports documents written per tick and read latency percentiles as JSON.
+
+    python -m backend.benchmarks.valuation_benchmark --users 2000 --holdings 20 --seconds 30
+"""
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateMany
+
+from ..repositories.mongo import MongoMarketRepository
+from ..services.pricing import SimulatedPriceFeed, get_quotes, market_tick, seed_price_table
+from ..services.valuation import HOLDING_PROJECTION, get_price_snapshot, value_holdings
+
+SYMBOLS = ["BTC", "ETH", "ADA", "SOL"]
+
+def stored_revaluation_pipeline(price: float, now: datetime) -> list:
+    """What every tick had to write per holding before lazy valuation"""
+    return [
+        {"$set": {"current_price": price, "current_value": {"$multiply": ["$quantity", price]}, "updated_at": now}},
+        {"$set": {"profit_loss": {"$subtract": ["$current_value", "$total_invested"]}}},
+        {"$set": {"profit_loss_percentage": {"$cond": [
+            {"$gt": ["$total_invested", 0]},
+            {"$multiply": [{"$divide": ["$profit_loss", "$total_invested"]}, 100]},
+            0
+        ]}}}
+    ]
+
+async def seed(db, users: int, holdings: int):
+    await db.investments.drop()
+    await db.market_prices.drop()
+    await seed_price_table(db)
+    quotes = await get_quotes(db)
+
+    now = datetime.utcnow()
+    batch = []
+    for user in range(users):
+        for _ in range(holdings):
+            symbol = random.choice(SYMBOLS)
+            price = quotes[symbol]["current_price"]
+            quantity = random.uniform(0.01, 5)
+            batch.append({
+                "user_id": user, "investment_type": "cryptocurrency", "asset_name": symbol, "symbol": symbol,
+                "quantity": quantity, "purchase_price": price, "total_invested": quantity * price,
+                "current_price": price, "current_value": quantity * price, "profit_loss": 0.0,
+                "profit_loss_percentage": 0.0, "purchase_date": now, "created_at": now, "is_active": True
+            })
+            if len(batch) >= 10000:
+                await db.investments.insert_many(batch, ordered=False)
+                batch = []
+    if batch:
+        await db.investments.insert_many(batch, ordered=False)
+    await db.investments.create_index([("user_id", 1), ("is_active", 1)])
+    await db.investments.create_index([("symbol", 1), ("is_active", 1)])
+
+async def stored_tick(db, feed) -> int:
+    prices = await market_tick(db, feed)
+    now = datetime.utcnow()
+    result = await db.investments.bulk_write(
+        [UpdateMany({"symbol": symbol, "is_active": True}, stored_revaluation_pipeline(price, now)) for symbol, price in prices.items()],
+        ordered=False
+    )
+    return len(prices) + result.modified_count
+
+async def lazy_tick(db, feed) -> int:
+    return len(await market_tick(db, feed))
+
+async def stored_read(db, user_id):
+    investments = await db.investments.find({"user_id": user_id, "is_active": True}).to_list(None)
+    return sum(inv["current_value"] for inv in investments)
+
+async def lazy_read(db, user_id):
+    investments = await db.investments.find({"user_id": user_id, "is_active": True}, HOLDING_PROJECTION).to_list(None)
+    snapshot = await get_price_snapshot(MongoMarketRepository(db))
+    return float(value_holdings(investments, snapshot)["current_value"].sum()) if investments else 0.0
+
+async def run(db, tick, read, users: int, seconds: int, reads_per_second: int) -> dict:
+    feed = SimulatedPriceFeed(tick_seconds=1.0, seed=42)
+    writes = []
+    latencies = []
+    for _ in range(seconds):
+        started = time.perf_counter()
+        writes.append(await tick(db, feed))
+        for _ in range(reads_per_second):
+            t0 = time.perf_counter()
+            await read(db, random.randrange(users))
+            latencies.append((time.perf_counter() - t0) * 1000)
+        await asyncio.sleep(max(1.0 - (time.perf_counter() - started), 0))
+
+    latencies = np.array(latencies)
+    return {
+        "docs_written_per_tick": float(np.mean(writes)),
+        "read_p50_ms": float(np.percentile(latencies, 50)),
+        "read_p95_ms": float(np.percentile(latencies, 95)),
+        "read_p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[args.db_name]
+    await seed(db, args.users, args.holdings)
+
+    report = {
+        "users": args.users,
+        "holdings_per_user": args.holdings,
+        "stored": await run(db, stored_tick, stored_read, args.users, args.seconds, args.reads),
+        "lazy": await run(db, lazy_tick, lazy_read, args.users, args.seconds, args.reads),
+    }
+    print(json.dumps(report, indent=2))
+    client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare stored-value and lazy portfolio valuation")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--holdings", type=int, default=20)
+    parser.add_argument("--seconds", type=int, default=30)
+    parser.add_argument("--reads", type=int, default=50, help="Portfolio reads issued per tick")
+    parser.add_argument("--db-name", default="banksys_bench")
+    asyncio.run(main(parser.parse_args()))
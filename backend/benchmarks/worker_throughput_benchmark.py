@@ -0,0 +1,137 @@
+"""Throughput of ``GET /api/accounts/balance`` against the number of workers.
+
+For each worker count the production launcher is started on a free
+port, a benchmark user is registered (or logged in), and load client
+processes keep a fixed number of keep-alive connections busy for a
+fixed time. Requests per second and latency percentiles per worker
+count are reported as JSON. Needs ``MONGO_URL``; use fewer load
+clients than spare cores so the generator is not the bottleneck.
+
+    python -m backend.benchmarks.worker_throughput_benchmark --workers 1 2 4 --seconds 15
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+BENCH_USER = {
+    "cpf": "99999999999",
+    "password": "bench-password",
+    "full_name": "Benchmark User",
+    "email": "bench@banksys.test",
+    "phone": "11999999999",
+}
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_healthy(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become healthy")
+
+def _token(base_url: str) -> str:
+    httpx.post(f"{base_url}/api/auth/register", json=BENCH_USER, timeout=10.0)
+    response = httpx.post(f"{base_url}/api/auth/login", json={"cpf": BENCH_USER["cpf"], "password": BENCH_USER["password"]}, timeout=10.0)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+async def _load(url: str, headers: dict, concurrency: int, seconds: float) -> tuple:
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def user(client):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await client.get(url, headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+    return latencies, errors
+
+def _load_client(url: str, headers: dict, concurrency: int, seconds: float, results):
+    results.put(asyncio.run(_load(url, headers, concurrency, seconds)))
+
+def measure(workers: int, args) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "backend.serve", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        _wait_healthy(base_url)
+        headers = {"Authorization": f"Bearer {_token(base_url)}"} if args.auth else {}
+        url = base_url + args.path
+        # Warm every worker's pool before measuring
+        asyncio.run(_load(url, headers, args.concurrency, 1.0))
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        clients = [
+            context.Process(target=_load_client, args=(url, headers, args.concurrency, args.seconds, results))
+            for _ in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        outcomes = [results.get() for _ in clients]
+        for client in clients:
+            client.join()
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    latencies = np.array([latency for outcome in outcomes for latency in outcome[0]]) * 1000
+    return {
+        "workers": workers,
+        "requests": int(latencies.size),
+        "errors": sum(outcome[1] for outcome in outcomes),
+        "requests_per_second": latencies.size / args.seconds,
+        "latency_p50_ms": float(np.percentile(latencies, 50)) if latencies.size else None,
+        "latency_p99_ms": float(np.percentile(latencies, 99)) if latencies.size else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API throughput per worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--clients", type=int, default=2, help="Load generator processes")
+    parser.add_argument("--concurrency", type=int, default=64, help="Connections per load generator")
+    parser.add_argument("--path", default="/api/accounts/balance")
+    parser.add_argument("--no-auth", dest="auth", action="store_false", help="Skip login (for unauthenticated paths)")
+    args = parser.parse_args()
+
+    print(json.dumps({
+        "cpus": os.cpu_count(),
+        "path": args.path,
+        "clients": args.clients,
+        "concurrency": args.concurrency,
+        "results": [measure(workers, args) for workers in sorted(set(args.workers))],
+    }, indent=2))
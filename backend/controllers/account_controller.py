@@ -1,22 +1,27 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import List
-from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from datetime import datetime
+from bson.errors import InvalidId
 
 from ..models.user import User
-from ..models.account import Account, CreditCard, AccountResponse, CreditCardResponse
-from ..controllers.auth_controller import get_current_user
-from ..database import get_database
+from ..models.account import (
+    Account, AccountResponse, CreditCardResponse,
+    CardPurchase, CardPurchaseResponse, InvoiceResponse
+)
+from ..controllers.auth_controller import get_current_user, get_user_repositories
+from ..repositories import Repositories
+from ..services.cards import CREDIT_CARD_PROJECTION
+from ..services.billing import CardLimitExceeded, post_card_purchase
+from ..services.ledger import BALANCE_PROJECTION
 
 router = APIRouter(prefix="/accounts", tags=["accounts"])
 
 @router.get("/", response_model=List[AccountResponse])
 async def get_user_accounts(
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
-    accounts = await db.accounts.find({"user_id": current_user.id}).to_list(100)
+    accounts = await repos.accounts.list_for_user(current_user.id, 100)
     return [
         AccountResponse(
             id=str(account["_id"]),
@@ -32,9 +37,10 @@ async def get_user_accounts(
 @router.get("/balance")
 async def get_account_balance(
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
-    account = await db.accounts.find_one({"user_id": current_user.id})
+    # Served by the balance cache when it has a fresh entry
+    account = await repos.accounts.get_for_user(current_user.id, BALANCE_PROJECTION)
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
     
@@ -47,31 +53,10 @@ async def get_account_balance(
 @router.get("/credit-cards", response_model=List[CreditCardResponse])
 async def get_credit_cards(
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
-    # Create a mock credit card if none exists
-    existing_card = await db.credit_cards.find_one({"user_id": current_user.id})
-    
-    if not existing_card:
-        from datetime import datetime, timedelta
-        import random
-        
-        mock_card = CreditCard(
-            user_id=current_user.id,
-            card_number=f"**** **** **** {random.randint(1000, 9999)}",
-            card_name="BankSys Platinum",
-            credit_limit=5000.0,
-            available_limit=4200.0,
-            current_balance=800.0,
-            due_date=datetime.now() + timedelta(days=15),
-            minimum_payment=40.0
-        )
-        
-        await db.credit_cards.insert_one(mock_card.dict(by_alias=True))
-        existing_card = mock_card.dict(by_alias=True)
-        existing_card["_id"] = mock_card.id
-    
-    cards = await db.credit_cards.find({"user_id": current_user.id}).to_list(10)
+    # Cards are provisioned at registration, so reads are a single projected query
+    cards = await repos.cards.list_for_user(current_user.id, CREDIT_CARD_PROJECTION, 10)
     
     return [
         CreditCardResponse(
@@ -87,36 +72,86 @@ async def get_credit_cards(
         for card in cards
     ]
 
+@router.post("/credit-cards/{card_id}/purchases", response_model=CardPurchaseResponse)
+async def create_card_purchase(
+    card_id: str,
+    purchase: CardPurchase,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_user_repositories)
+):
+    try:
+        card_object_id = ObjectId(card_id)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Card not found")
+    try:
+        transaction = await post_card_purchase(
+            repos,
+            current_user.id,
+            card_object_id,
+            purchase.amount,
+            purchase.description,
+            merchant_name=purchase.merchant_name,
+            category=purchase.category
+        )
+    except CardLimitExceeded:
+        raise HTTPException(status_code=400, detail="Card not found or insufficient credit limit")
+    
+    return CardPurchaseResponse(
+        id=str(transaction["_id"]),
+        card_id=card_id,
+        amount=transaction["amount"],
+        description=transaction["description"],
+        merchant_name=transaction["merchant_name"],
+        transaction_date=transaction["transaction_date"],
+        current_balance=transaction["card"]["current_balance"],
+        available_limit=transaction["card"]["available_limit"]
+    )
+
+@router.get("/credit-cards/{card_id}/invoices", response_model=List[InvoiceResponse])
+async def get_card_invoices(
+    card_id: str,
+    limit: int = Query(12, le=36),
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_user_repositories)
+):
+    try:
+        invoices = await repos.cards.invoices(ObjectId(card_id), current_user.id, limit)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Card not found")
+    
+    return [
+        InvoiceResponse(
+            id=str(invoice["_id"]),
+            card_id=card_id,
+            period_start=invoice.get("period_start"),
+            period_end=invoice["period_end"],
+            total=invoice["total"],
+            minimum_payment=invoice["minimum_payment"],
+            due_date=invoice["due_date"],
+            status=invoice["status"]
+        )
+        for invoice in invoices
+    ]
+
 @router.post("/update-balance")
 async def update_balance(
     amount: float,
     operation: str,  # "add" or "subtract"
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
-    account = await db.accounts.find_one({"user_id": current_user.id})
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
-    
-    new_balance = account["balance"]
     if operation == "add":
-        new_balance += amount
+        delta, minimum_balance = amount, None
     elif operation == "subtract":
-        if account["balance"] < amount:
-            raise HTTPException(status_code=400, detail="Insufficient funds")
-        new_balance -= amount
+        delta, minimum_balance = -amount, amount
     else:
         raise HTTPException(status_code=400, detail="Invalid operation")
     
-    await db.accounts.update_one(
-        {"user_id": current_user.id},
-        {
-            "$set": {
-                "balance": new_balance,
-                "available_balance": new_balance,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    # One conditional update, like the ledger: no lost updates, and the balance cache is written through
+    account = await repos.accounts.apply_delta(current_user.id, delta, minimum_balance)
+    if account is None:
+        if minimum_balance is not None and await repos.accounts.get_for_user(current_user.id, {"_id": 1}):
+            raise HTTPException(status_code=400, detail="Insufficient funds")
+        raise HTTPException(status_code=404, detail="Account not found")
     
-    return {"new_balance": new_balance}
\ No newline at end of file
+    return {"new_balance": account["balance"]}
\ No newline at end of file
@@ -0,0 +1,159 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
+
+from ..models.user import User
+from ..models.profiling import ProfilingRequest, ProfilingStatus, ProfileSummary, ProfileResponse, StackKind
+from ..models.slow_command import SlowCommandShape, SlowCommandSample
+from ..controllers.auth_controller import get_admin_user
+from ..database import get_database
+from ..profiling import SETTINGS_ID, apply_settings, folded, save_settings
+from ..slow_queries import OWN_COLLECTION as SLOW_COMMANDS, by_shape_pipeline
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+def to_summary(profile: dict) -> dict:
+    return {
+        "id": str(profile["_id"]),
+        "method": profile["method"],
+        "path": profile["path"],
+        "route": profile.get("route"),
+        "user_id": profile.get("user_id"),
+        "status": profile["status"],
+        "started_at": profile["started_at"],
+        "wall_ms": profile["wall_ms"],
+        "cpu_ms": profile["cpu_ms"],
+        "mongo_commands": len(profile.get("mongo_commands", [])),
+    }
+
+@router.get("/profiling", response_model=ProfilingStatus)
+async def get_profiling(
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    settings = await db.profiling_settings.find_one({"_id": SETTINGS_ID})
+    if not settings:
+        return ProfilingStatus(enabled=False)
+    return ProfilingStatus(**settings)
+
+@router.put("/profiling", response_model=ProfilingStatus)
+async def enable_profiling(
+    request: Request,
+    profiling: ProfilingRequest,
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Profile a sample of requests until ``duration_minutes`` from now; other workers follow within seconds"""
+    if profiling.route and not any(getattr(route, "path", None) == profiling.route for route in request.app.router.routes):
+        raise HTTPException(status_code=400, detail="Unknown route")
+
+    settings = await save_settings(db, True, **profiling.dict())
+    apply_settings(request.app, db, settings)
+    return ProfilingStatus(**settings)
+
+@router.delete("/profiling", response_model=ProfilingStatus)
+async def disable_profiling(
+    request: Request,
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    settings = await save_settings(db, False)
+    apply_settings(request.app, db, settings)
+    return ProfilingStatus(enabled=False)
+
+@router.get("/profiles", response_model=List[ProfileSummary])
+async def get_profiles(
+    route: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    query = {"route": route} if route else {}
+    profiles = await db.request_profiles.find(query, {"wall_stacks": 0, "cpu_stacks": 0}).sort("started_at", -1).to_list(limit)
+    return [to_summary(profile) for profile in profiles]
+
+@router.get("/profiles/flamegraph", response_class=PlainTextResponse)
+async def get_flamegraph(
+    route: Optional[str] = None,
+    kind: StackKind = StackKind.WALL,
+    limit: int = Query(1000, ge=1, le=10000),
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Stacks of the latest ``limit`` profiles merged, as folded text (flamegraph.pl, speedscope, inferno)"""
+    field = f"{kind.value}_stacks"
+    pipeline = [
+        {"$match": {"route": route} if route else {}},
+        {"$sort": {"started_at": -1}},
+        {"$limit": limit},
+        {"$unwind": f"${field}"},
+        {"$group": {"_id": f"${field}.stack", "count": {"$sum": f"${field}.count"}}},
+    ]
+    stacks = await db.request_profiles.aggregate(pipeline).to_list(None)
+    return PlainTextResponse(folded([{"stack": item["_id"], "count": item["count"]} for item in stacks]))
+
+@router.get("/profiles/{profile_id}", response_model=ProfileResponse)
+async def get_profile(
+    profile_id: str,
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    try:
+        profile = await db.request_profiles.find_one({"_id": ObjectId(profile_id)})
+    except InvalidId:
+        profile = None
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    return ProfileResponse(
+        **to_summary(profile),
+        loop_cpu_ms=profile["loop_cpu_ms"],
+        interval_ms=profile["interval_ms"],
+        commands=profile.get("mongo_commands", [])
+    )
+
+@router.get("/profiles/{profile_id}/flamegraph", response_class=PlainTextResponse)
+async def get_profile_flamegraph(
+    profile_id: str,
+    kind: StackKind = StackKind.WALL,
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    try:
+        profile = await db.request_profiles.find_one({"_id": ObjectId(profile_id)}, {f"{kind.value}_stacks": 1})
+    except InvalidId:
+        profile = None
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    return PlainTextResponse(folded(profile[f"{kind.value}_stacks"]))
+
+@router.get("/slow-commands", response_model=List[SlowCommandShape])
+async def get_slow_commands(
+    hours: int = Query(24, ge=1, le=168),
+    route: Optional[str] = Query(None, description='e.g. "GET /api/transactions/"'),
+    limit: int = Query(50, ge=1, le=500),
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Slow commands grouped by shape, the most total time first, with their latest plan"""
+    pipeline = by_shape_pipeline(datetime.utcnow() - timedelta(hours=hours), route, limit)
+    shapes = await db[SLOW_COMMANDS].aggregate(pipeline).to_list(None)
+    return [SlowCommandShape(shape_id=shape.pop("_id"), **shape) for shape in shapes]
+
+@router.get("/slow-commands/{shape_id}", response_model=List[SlowCommandSample])
+async def get_slow_command_samples(
+    shape_id: str,
+    limit: int = Query(50, ge=1, le=500),
+    admin: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    samples = await db[SLOW_COMMANDS].find({"shape_id": shape_id}).sort("at", -1).to_list(limit)
+    if not samples:
+        raise HTTPException(status_code=404, detail="Shape not found")
+
+    return [SlowCommandSample(id=str(sample.pop("_id")), **sample) for sample in samples]
@@ -5,15 +5,16 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
 import os
-from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+import random
 
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-from models.user import User, UserCreate, UserLogin, UserResponse
-from database import get_database
+from ..models.user import User, UserCreate, UserLogin, UserResponse
+from ..models.account import Account
+from ..database import analytics, get_shards
+from ..sharding import ShardMap
+from .. import repositories
+from ..repositories import Repositories, get_repositories
+from ..services.cards import provision_credit_card
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 security = HTTPBearer()
@@ -22,6 +23,7 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "banksys-secret-key-2025")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+SHARD_MOVE_RETRY_SECONDS = 10
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -39,7 +41,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncIOMotorDatabase = Depends(get_database)):
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), repos: Repositories = Depends(get_repositories)):
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
@@ -53,19 +55,53 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise credentials_exception
     
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    user = await repos.users.get(ObjectId(user_id))
     if user is None:
         raise credentials_exception
     return User(**user)
 
+def _user_shard(user: User) -> Optional[str]:
+    if user.moving_to:
+        raise HTTPException(
+            status_code=503,
+            detail="Account data is being moved; retry shortly",
+            headers={"Retry-After": str(SHARD_MOVE_RETRY_SECONDS)},
+        )
+    return user.shard
+
+async def get_user_repositories(current_user: User = Depends(get_current_user)) -> Repositories:
+    """Repositories of the shard holding the current user's accounts, cards and investments"""
+    return repositories.for_shard(_user_shard(current_user))
+
+async def get_user_analytics_repositories(current_user: User = Depends(get_current_user)) -> Repositories:
+    return repositories.for_shard(_user_shard(current_user), analytics=True)
+
+def _shard_database(shards: ShardMap, user: User):
+    try:
+        return shards.database(_user_shard(user))
+    except LookupError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+async def get_user_database(current_user: User = Depends(get_current_user), shards: ShardMap = Depends(get_shards)):
+    """The current user's shard, for features built directly on MongoDB"""
+    return _shard_database(shards, current_user)
+
+async def get_user_analytics_database(current_user: User = Depends(get_current_user), shards: ShardMap = Depends(get_shards)):
+    return analytics(_shard_database(shards, current_user))
+
+async def get_admin_user(current_user: User = Depends(get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return current_user
+
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def register(user_data: UserCreate, repos: Repositories = Depends(get_repositories)):
     # Check if user already exists
-    existing_user = await db.users.find_one({"cpf": user_data.cpf})
+    existing_user = await repos.users.find_by_cpf(user_data.cpf)
     if existing_user:
         raise HTTPException(status_code=400, detail="CPF already registered")
     
-    existing_email = await db.users.find_one({"email": user_data.email})
+    existing_email = await repos.users.find_by_email(user_data.email)
     if existing_email:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -76,24 +112,27 @@ async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get
     user_dict = user_data.dict()
     user_dict["password"] = hashed_password
     user = User(**user_dict)
+    user.shard = repositories.placement(user.id)
     
-    result = await db.users.insert_one(user.dict(by_alias=True))
+    user_id = await repos.users.insert(user.dict(by_alias=True))
+    # The account and card go to the user's shard; the directory entry above stays on home
+    repos = repositories.for_shard(user.shard)
     
     # Create default account for user
-    from ..models.account import Account
-    import random
-    
     account = Account(
-        user_id=result.inserted_id,
+        user_id=user_id,
         account_number=f"0001-{random.randint(10000, 99999)}",
         balance=1000.0,  # Starting balance
         available_balance=1000.0
     )
-    await db.accounts.insert_one(account.dict(by_alias=True))
+    await repos.accounts.insert(account.dict(by_alias=True))
+    
+    # Issue the default credit card as part of onboarding
+    await provision_credit_card(repos, user_id)
     
     # Return user response
     user_response = UserResponse(
-        id=str(result.inserted_id),
+        id=str(user_id),
         cpf=user.cpf,
         full_name=user.full_name,
         email=user.email,
@@ -106,9 +145,9 @@ async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get
     return user_response
 
 @router.post("/login")
-async def login(user_credentials: UserLogin, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def login(user_credentials: UserLogin, repos: Repositories = Depends(get_repositories)):
     # Find user by CPF
-    user_doc = await db.users.find_one({"cpf": user_credentials.cpf})
+    user_doc = await repos.users.find_by_cpf(user_credentials.cpf)
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid CPF or password")
     
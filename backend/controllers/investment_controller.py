@@ -1,93 +1,53 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from typing import List
+import asyncio
+import logging
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-import random
-from datetime import datetime
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
 
 from ..models.user import User
 from ..models.investment import (
     Investment, InvestmentCreate, InvestmentResponse, 
-    PortfolioSummary, CryptoCurrency, CDBOption, InvestmentType
+    PortfolioSummary, CryptoCurrency, CDBOption, CDBSimulation, InvestmentType,
+    PerformancePoint, PortfolioPerformance, RiskMetrics,
+    SellRequest, SellResponse, LotResponse
 )
-from ..controllers.auth_controller import get_current_user
-from ..database import get_database
+from ..models.job import JobAccepted
+from ..models.transaction import Transaction, TransactionType, TransactionCategory
+from ..controllers.auth_controller import get_current_user, get_user_analytics_database, get_user_repositories
+from ..database import fan_out, get_analytics_database, get_database, user_database
+from ..repositories import Repositories, get_repositories
+from ..repositories.mongo import mongo_repositories
+from ..services.cdb import CDB_OPTIONS_BY_ID, MOCK_CDB_OPTIONS, accrue_all, cdb_terms, simulate_returns
+from ..services.jobs import enqueue_job, job_handler
+from ..services.ledger import AccountNotFound, InsufficientFunds, post_transaction, posting_applied
+from ..services.positions import (
+    LOT_PROJECTION, InsufficientQuantity, PositionNotFound, buy, cancel_sale, position_movements, sell
+)
+from ..services.price_history import RESOLUTIONS, portfolio_performance
+from ..services.pricing import get_price_feed, market_tick
+from ..services.quote_hub import InvalidSubscription, encode_batch, get_price_hub
+from ..services.risk import CONFIDENCE, LOOKBACK_DAYS, get_user_risk
+from ..services.valuation import HOLDING_PROJECTION, get_price_snapshot, summarize_portfolio, value_holdings
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/investments", tags=["investments"])
 
-# Mock cryptocurrency data
-MOCK_CRYPTO_DATA = [
-    {"symbol": "BTC", "name": "Bitcoin", "current_price": 98500.0, "price_change_24h": 1250.0, "price_change_percentage_24h": 1.28, "market_cap": 1950000000000, "volume_24h": 32000000000},
-    {"symbol": "ETH", "name": "Ethereum", "current_price": 3850.0, "price_change_24h": -45.0, "price_change_percentage_24h": -1.15, "market_cap": 463000000000, "volume_24h": 18500000000},
-    {"symbol": "ADA", "name": "Cardano", "current_price": 1.25, "price_change_24h": 0.08, "price_change_percentage_24h": 6.84, "market_cap": 44500000000, "volume_24h": 1200000000},
-    {"symbol": "SOL", "name": "Solana", "current_price": 245.0, "price_change_24h": 12.5, "price_change_percentage_24h": 5.38, "market_cap": 115000000000, "volume_24h": 3500000000},
-]
+MAX_PERFORMANCE_POINTS = 5000
+STREAM_HEARTBEAT_SECONDS = 15.0
 
-# Mock CDB options
-MOCK_CDB_OPTIONS = [
-    {"id": "cdb_001", "name": "CDB Prefixado 100% CDI", "bank_name": "BankSys", "interest_rate": 12.5, "minimum_investment": 1000.0, "maturity_months": 12, "type": "prefixed", "description": "Rendimento garantido de 12,5% ao ano"},
-    {"id": "cdb_002", "name": "CDB Pós-fixado 110% CDI", "bank_name": "BankSys", "interest_rate": 13.75, "minimum_investment": 5000.0, "maturity_months": 24, "type": "postfixed", "description": "Rendimento atrelado a 110% do CDI"},
-    {"id": "cdb_003", "name": "CDB Premium 120% CDI", "bank_name": "BankSys", "interest_rate": 15.0, "minimum_investment": 10000.0, "maturity_months": 36, "type": "postfixed", "description": "Nosso melhor CDB com 120% do CDI"},
-]
+def _symbols(symbols: str) -> List[str]:
+    return [symbol.strip().upper() for symbol in symbols.split(",") if symbol.strip()]
 
-@router.get("/portfolio", response_model=PortfolioSummary)
-async def get_portfolio_summary(
-    current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
-):
-    investments = await db.investments.find({"user_id": current_user.id, "is_active": True}).to_list(100)
-    
+def to_responses(investments: list, snapshot) -> List[InvestmentResponse]:
     if not investments:
-        return PortfolioSummary(
-            total_invested=0.0,
-            current_value=0.0,
-            total_profit_loss=0.0,
-            total_profit_loss_percentage=0.0,
-            investments_by_type=[]
-        )
-    
-    total_invested = sum(inv["total_invested"] for inv in investments)
-    current_value = sum(inv["current_value"] for inv in investments)
-    total_profit_loss = current_value - total_invested
-    total_profit_loss_percentage = (total_profit_loss / total_invested * 100) if total_invested > 0 else 0
-    
-    # Group by investment type
-    investments_by_type = {}
-    for inv in investments:
-        inv_type = inv["investment_type"]
-        if inv_type not in investments_by_type:
-            investments_by_type[inv_type] = {"invested": 0, "current_value": 0, "count": 0}
-        investments_by_type[inv_type]["invested"] += inv["total_invested"]
-        investments_by_type[inv_type]["current_value"] += inv["current_value"]
-        investments_by_type[inv_type]["count"] += 1
-    
-    investments_by_type_list = [
-        {
-            "type": k, 
-            "invested": v["invested"], 
-            "current_value": v["current_value"], 
-            "count": v["count"],
-            "profit_loss": v["current_value"] - v["invested"],
-            "profit_loss_percentage": ((v["current_value"] - v["invested"]) / v["invested"] * 100) if v["invested"] > 0 else 0
-        }
-        for k, v in investments_by_type.items()
-    ]
-    
-    return PortfolioSummary(
-        total_invested=total_invested,
-        current_value=current_value,
-        total_profit_loss=total_profit_loss,
-        total_profit_loss_percentage=total_profit_loss_percentage,
-        investments_by_type=investments_by_type_list
-    )
-
-@router.get("/", response_model=List[InvestmentResponse])
-async def get_investments(
-    current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
-):
-    investments = await db.investments.find({"user_id": current_user.id, "is_active": True}).sort("created_at", -1).to_list(100)
+        return []
     
+    valued = value_holdings(investments, snapshot)
     return [
         InvestmentResponse(
             id=str(investment["_id"]),
@@ -96,155 +56,390 @@ async def get_investments(
             symbol=investment.get("symbol"),
             quantity=investment["quantity"],
             purchase_price=investment["purchase_price"],
-            current_price=investment["current_price"],
-            current_value=investment["current_value"],
-            profit_loss=investment["profit_loss"],
-            profit_loss_percentage=investment["profit_loss_percentage"],
+            current_price=current_price,
+            current_value=current_value,
+            profit_loss=profit_loss,
+            profit_loss_percentage=profit_loss_percentage,
             purchase_date=investment["purchase_date"]
         )
-        for investment in investments
+        for investment, current_price, current_value, profit_loss, profit_loss_percentage in zip(
+            investments,
+            valued["current_price"].tolist(),
+            valued["current_value"].tolist(),
+            valued["profit_loss"].tolist(),
+            valued["profit_loss_percentage"].tolist()
+        )
     ]
 
+@router.get("/portfolio", response_model=PortfolioSummary)
+async def get_portfolio_summary(
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_user_repositories)
+):
+    # Valued on read from the shared price snapshot and summarized by the repository (one pipeline on MongoDB)
+    snapshot = await get_price_snapshot(repos.market)
+    return PortfolioSummary(**await summarize_portfolio(repos, current_user.id, snapshot))
+
+@router.get("/performance", response_model=PortfolioPerformance)
+async def get_portfolio_performance(
+    days: int = Query(365, ge=1, le=3650),
+    resolution: str = Query("1d", regex="^(1m|1h|1d)$"),
+    current_user: User = Depends(get_current_user),
+    shard_db: AsyncIOMotorDatabase = Depends(get_user_analytics_database),
+    db: AsyncIOMotorDatabase = Depends(get_analytics_database)
+):
+    """Portfolio value over time, from holdings and downsampled price history"""
+    step = RESOLUTIONS[resolution][2]
+    if timedelta(days=days) / step > MAX_PERFORMANCE_POINTS:
+        raise HTTPException(status_code=400, detail=f"Too many points; use a coarser resolution than {resolution} for {days} days")
+    
+    end = datetime.utcnow()
+    start = end - timedelta(days=days)
+    # Lots carry every buy and sale, so closed positions still show in the history
+    movements = await position_movements(shard_db, current_user.id)
+    
+    series = await portfolio_performance(db, movements, start, end, resolution)
+    return PortfolioPerformance(
+        resolution=resolution,
+        start=start,
+        end=end,
+        points=[
+            PerformancePoint(timestamp=timestamp, value=value, invested=invested)
+            for timestamp, value, invested in zip(series["timestamps"], series["values"], series["invested"])
+        ]
+    )
+
+@router.get("/risk", response_model=RiskMetrics)
+async def get_portfolio_risk(
+    lookback_days: int = Query(LOOKBACK_DAYS, ge=30, le=1825),
+    confidence: float = Query(CONFIDENCE, ge=0.9, le=0.999),
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_user_repositories),
+    shard_db: AsyncIOMotorDatabase = Depends(get_user_analytics_database),
+    db: AsyncIOMotorDatabase = Depends(get_analytics_database)
+):
+    """Volatility, historical VaR/CVaR and max drawdown of the current positions (cached per day)"""
+    snapshot = await get_price_snapshot(repos.market)
+    return RiskMetrics(**await get_user_risk(shard_db, current_user.id, snapshot, lookback_days, confidence, history=db))
+
+@router.get("/", response_model=List[InvestmentResponse])
+async def get_investments(
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_user_repositories)
+):
+    investments = await repos.investments.list_active(current_user.id, HOLDING_PROJECTION, 100)
+    
+    snapshot = await get_price_snapshot(repos.market)
+    return to_responses(investments, snapshot)
+
 @router.post("/", response_model=InvestmentResponse)
 async def create_investment(
     investment_data: InvestmentCreate,
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
-    # Check if user has sufficient balance
-    account = await db.accounts.find_one({"user_id": current_user.id})
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
+    price = investment_data.purchase_price
+    if investment_data.symbol:
+        # Listed assets trade at the market price, never at one the client names
+        price = (await get_price_snapshot(repos.market)).price_of(investment_data.symbol)
+        if price is None:
+            raise HTTPException(status_code=400, detail=f"No market price for {investment_data.symbol}")
+    elif price is None:
+        raise HTTPException(status_code=400, detail="purchase_price is required for assets without a symbol")
+    total_cost = investment_data.quantity * price
+    purchase_date = datetime.utcnow()
+    terms = {}
+    if investment_data.investment_type == InvestmentType.CDB and investment_data.cdb_option_id:
+        option = CDB_OPTIONS_BY_ID.get(investment_data.cdb_option_id)
+        if not option:
+            raise HTTPException(status_code=404, detail="CDB option not found")
+        if total_cost < option["minimum_investment"]:
+            raise HTTPException(status_code=400, detail=f"Minimum investment is {option['minimum_investment']:.2f}")
+        terms = {**cdb_terms(option["id"], purchase_date), "accrued_value": total_cost, "accrued_at": purchase_date}
     
-    total_cost = investment_data.quantity * investment_data.purchase_price
-    if account["balance"] < total_cost:
+    # Debit first: the funds check and balance change are one atomic update
+    transaction = Transaction(
+        user_id=current_user.id,
+        transaction_type=TransactionType.INVESTMENT,
+        category=TransactionCategory.INVESTMENT,
+        amount=total_cost,
+        description=f"Investment in {investment_data.asset_name}",
+        merchant_name="BankSys Investments"
+    ).dict(by_alias=True)
+    # Keys the debit, so a purchase that fails after it can be refunded exactly once
+    transaction["posting_key"] = f"purchase:{ObjectId()}"
+    try:
+        await post_transaction(repos, transaction)
+    except AccountNotFound:
+        raise HTTPException(status_code=404, detail="Account not found")
+    except InsufficientFunds:
         raise HTTPException(status_code=400, detail="Insufficient funds")
+    except Exception:
+        if not await posting_applied(repos, current_user.id, transaction["posting_key"]):
+            raise
+        # Failed after the debit landed
+        await _refund_purchase(repos, transaction)
+        raise HTTPException(status_code=503, detail="The purchase could not be completed and was refunded; try again")
     
-    # Create investment
-    current_price = investment_data.purchase_price
-    # Add some random variation for current price (simulating market changes)
-    if investment_data.investment_type == InvestmentType.CRYPTOCURRENCY:
-        price_variation = random.uniform(-0.1, 0.15)  # -10% to +15%
-        current_price = investment_data.purchase_price * (1 + price_variation)
-    elif investment_data.investment_type == InvestmentType.CDB:
-        # CDB typically doesn't fluctuate much, just slight appreciation
-        current_price = investment_data.purchase_price * 1.001  # Small appreciation
-    
-    current_value = investment_data.quantity * current_price
-    profit_loss = current_value - total_cost
-    profit_loss_percentage = (profit_loss / total_cost * 100) if total_cost > 0 else 0
+    try:
+        investment = await _record_purchase(repos, current_user.id, investment_data, price, total_cost, purchase_date, terms)
+    except Exception:
+        logger.exception(f"Recording purchase {transaction['posting_key']} failed; refunding it")
+        await _refund_purchase(repos, transaction)
+        raise
     
+    snapshot = await get_price_snapshot(repos.market)
+    return to_responses([investment], snapshot)[0]
+
+async def _refund_purchase(repos, debit: dict):
+    """Credit back a purchase debit; keyed on the debit's key, so it is refunded at most once"""
+    refund = Transaction(
+        user_id=debit["user_id"],
+        transaction_type=TransactionType.INVESTMENT_REDEMPTION,
+        category=TransactionCategory.INVESTMENT,
+        amount=debit["amount"],
+        description=f"Refund: {debit['description']}",
+        merchant_name="BankSys Investments"
+    ).dict(by_alias=True)
+    refund["posting_key"] = f"refund:{debit['posting_key']}"
+    await post_transaction(repos, refund)
+
+async def _record_purchase(repos, user_id, investment_data: InvestmentCreate, price: float, total_cost: float,
+                           purchase_date: datetime, terms: dict) -> dict:
+    if investment_data.symbol:
+        # Added to the user's single position in this symbol, as a new FIFO lot
+        return await buy(
+            repos,
+            user_id,
+            investment_data.investment_type.value,
+            investment_data.asset_name,
+            investment_data.symbol,
+            investment_data.quantity,
+            price,
+            purchase_date
+        )
+    # Symbol-less holdings (CDB contracts) keep one document per purchase
     investment = Investment(
-        user_id=current_user.id,
+        user_id=user_id,
         investment_type=investment_data.investment_type,
         asset_name=investment_data.asset_name,
         symbol=investment_data.symbol,
         quantity=investment_data.quantity,
-        purchase_price=investment_data.purchase_price,
-        current_price=current_price,
+        purchase_price=price,
         total_invested=total_cost,
-        current_value=current_value,
-        profit_loss=profit_loss,
-        profit_loss_percentage=profit_loss_percentage,
-        purchase_date=datetime.utcnow()
-    )
+        purchase_date=purchase_date,
+        **terms
+    ).dict(by_alias=True)
+    await repos.investments.insert(investment)
+    return investment
+
+@router.post("/{investment_id}/sell", response_model=SellResponse)
+async def sell_investment(
+    investment_id: str,
+    sale: SellRequest,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_user_repositories)
+):
+    """Sell a position (FIFO lots) or redeem a CDB; proceeds are credited to the account"""
+    try:
+        holding = await repos.investments.get_active(ObjectId(investment_id), current_user.id, {"symbol": 1, "asset_name": 1})
+    except InvalidId:
+        holding = None
+    if not holding:
+        raise HTTPException(status_code=404, detail="Investment not found")
     
-    result = await db.investments.insert_one(investment.dict(by_alias=True))
+    # Positions sell at the market price; symbol-less holdings at their accrued (CDB) or purchase price
+    market_price = None
+    if holding.get("symbol"):
+        snapshot = await get_price_snapshot(repos.market)
+        market_price = snapshot.price_of(holding["symbol"])
+        if market_price is None:
+            raise HTTPException(status_code=400, detail=f"No market price for {holding['symbol']}; try again later")
     
-    # Update account balance
-    await db.accounts.update_one(
-        {"_id": account["_id"]},
-        {
-            "$set": {
-                "balance": account["balance"] - total_cost,
-                "available_balance": account["available_balance"] - total_cost,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    # Tags the lot draws and the credit, so an interrupted sale can be undone or reconciled
+    redemption = str(ObjectId())
+    try:
+        result = await sell(repos, current_user.id, holding["_id"], sale.quantity, market_price, redemption=redemption)
+    except PositionNotFound:
+        raise HTTPException(status_code=404, detail="Investment not found")
+    except InsufficientQuantity:
+        raise HTTPException(status_code=400, detail="Insufficient quantity")
     
-    # Create transaction record
-    from ..models.transaction import Transaction, TransactionType, TransactionCategory
     transaction = Transaction(
         user_id=current_user.id,
-        account_id=account["_id"],
-        transaction_type=TransactionType.INVESTMENT,
+        transaction_type=TransactionType.INVESTMENT_REDEMPTION,
         category=TransactionCategory.INVESTMENT,
-        amount=total_cost,
-        description=f"Investment in {investment_data.asset_name}",
-        merchant_name="BankSys Investments",
-        balance_after=account["balance"] - total_cost
-    )
-    await db.transactions.insert_one(transaction.dict(by_alias=True))
+        amount=result["proceeds"],
+        description=f"Sale of {holding['asset_name']}",
+        merchant_name="BankSys Investments"
+    ).dict(by_alias=True)
+    transaction["posting_key"] = f"redemption:{redemption}"
+    try:
+        posted = await post_transaction(repos, dict(transaction))
+    except Exception as e:
+        if not isinstance(e, AccountNotFound) and await posting_applied(repos, current_user.id, transaction["posting_key"]):
+            # Failed after the credit landed; posting again returns (or finishes) it
+            posted = await post_transaction(repos, transaction)
+        else:
+            logger.exception(f"Crediting sale {redemption} of {holding['_id']} failed; undoing the sale")
+            await cancel_sale(repos, holding["_id"], result)
+            if isinstance(e, AccountNotFound):
+                raise HTTPException(status_code=404, detail="Account not found")
+            raise HTTPException(status_code=503, detail="The sale could not be settled and was undone; try again")
     
-    return InvestmentResponse(
-        id=str(result.inserted_id),
-        investment_type=investment.investment_type,
-        asset_name=investment.asset_name,
-        symbol=investment.symbol,
-        quantity=investment.quantity,
-        purchase_price=investment.purchase_price,
-        current_price=investment.current_price,
-        current_value=investment.current_value,
-        profit_loss=investment.profit_loss,
-        profit_loss_percentage=investment.profit_loss_percentage,
-        purchase_date=investment.purchase_date
+    snapshot = await get_price_snapshot(repos.market)
+    return SellResponse(
+        investment=to_responses([result["position"]], snapshot)[0],
+        quantity=result["quantity"],
+        proceeds=result["proceeds"],
+        income_tax=result["income_tax"],
+        cost_basis=result["cost_basis"],
+        realized_profit_loss=result["realized_profit_loss"],
+        balance_after=posted["balance_after"]
     )
 
+@router.get("/{investment_id}/lots", response_model=List[LotResponse])
+async def get_investment_lots(
+    investment_id: str,
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_user_repositories)
+):
+    try:
+        lots = await repos.investments.lots(ObjectId(investment_id), current_user.id, LOT_PROJECTION)
+    except InvalidId:
+        raise HTTPException(status_code=404, detail="Investment not found")
+    return [
+        LotResponse(
+            id=str(lot["_id"]),
+            symbol=lot["symbol"],
+            quantity=lot["quantity"],
+            remaining=lot["remaining"],
+            price=lot["price"],
+            purchase_date=lot["purchase_date"]
+        )
+        for lot in lots
+    ]
+
 @router.get("/cryptocurrencies", response_model=List[CryptoCurrency])
-async def get_cryptocurrencies():
-    return [CryptoCurrency(**crypto) for crypto in MOCK_CRYPTO_DATA]
+async def get_cryptocurrencies(repos: Repositories = Depends(get_repositories)):
+    quotes = await repos.market.quotes()
+    if not quotes:
+        await repos.market.seed()
+        quotes = await repos.market.quotes()
+    return [CryptoCurrency(**quote) for quote in quotes.values()]
+
+@router.get("/quotes/stream")
+async def stream_quotes(
+    request: Request,
+    symbols: str = Query(..., description="Comma-separated symbols, e.g. BTC,ETH"),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Server-sent events with the latest quote of each subscribed symbol"""
+    try:
+        subscription = get_price_hub(repos.market).subscribe(_symbols(symbols))
+    except InvalidSubscription as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    batch = await asyncio.wait_for(subscription.next_batch(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {encode_batch(batch)}\n\n"
+        finally:
+            subscription.close()
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.websocket("/quotes/ws")
+async def quotes_websocket(
+    websocket: WebSocket,
+    symbols: str = Query(""),
+    repos: Repositories = Depends(get_repositories)
+):
+    """Quote stream; send {"subscribe": [...]} / {"unsubscribe": [...]} to change symbols"""
+    await websocket.accept()
+    try:
+        subscription = get_price_hub(repos.market).subscribe(_symbols(symbols))
+    except InvalidSubscription as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    
+    async def send():
+        while True:
+            await websocket.send_text(encode_batch(await subscription.next_batch()))
+    
+    async def receive():
+        while True:
+            message = await websocket.receive_json()
+            subscription.unsubscribe(_symbols(",".join(message.get("unsubscribe", []))))
+            try:
+                subscription.subscribe(_symbols(",".join(message.get("subscribe", []))))
+            except InvalidSubscription as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    
+    tasks = [asyncio.create_task(send()), asyncio.create_task(receive())]
+    try:
+        # Either side ending (client gone, send failure) ends the stream
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        subscription.close()
 
 @router.get("/cdb-options", response_model=List[CDBOption])
 async def get_cdb_options():
     return [CDBOption(**cdb) for cdb in MOCK_CDB_OPTIONS]
 
-@router.post("/update-prices")
-async def update_investment_prices(
-    current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+@router.get("/cdb-options/simulate", response_model=List[CDBSimulation])
+async def simulate_cdb_returns(
+    amount: float = Query(..., gt=0),
+    months: int = Query(12, ge=1, le=120)
 ):
-    """Update current prices for user's investments (simulate market changes)"""
-    
-    investments = await db.investments.find({"user_id": current_user.id, "is_active": True}).to_list(100)
-    
-    updated_count = 0
-    for investment in investments:
-        # Simulate price changes
-        if investment["investment_type"] == InvestmentType.CRYPTOCURRENCY:
-            price_change = random.uniform(-0.05, 0.08)  # -5% to +8%
-        elif investment["investment_type"] == InvestmentType.CDB:
-            price_change = random.uniform(0.0001, 0.002)  # Small positive changes for CDB
-        else:
-            price_change = random.uniform(-0.03, 0.05)  # -3% to +5%
-        
-        new_price = investment["purchase_price"] * (1 + price_change)
-        new_current_value = investment["quantity"] * new_price
-        new_profit_loss = new_current_value - investment["total_invested"]
-        new_profit_loss_percentage = (new_profit_loss / investment["total_invested"] * 100) if investment["total_invested"] > 0 else 0
-        
-        await db.investments.update_one(
-            {"_id": investment["_id"]},
-            {
-                "$set": {
-                    "current_price": new_price,
-                    "current_value": new_current_value,
-                    "profit_loss": new_profit_loss,
-                    "profit_loss_percentage": new_profit_loss_percentage,
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
-        updated_count += 1
+    """Projected gross and net (after income tax) value of every CDB option"""
+    return [CDBSimulation(**simulation) for simulation in simulate_returns(amount, months)]
+
+@job_handler("investments.accrue_cdbs")
+async def accrue_cdbs_job(db, user_id, payload: dict) -> dict:
+    """Store today's accrued value on every active CDB, on every shard"""
+    updated = sum((await fan_out(accrue_all)).values())
+    return {"message": f"Accrued {updated} CDB holdings"}
+
+@job_handler("investments.update_prices")
+async def update_prices_job(db, user_id, payload: dict) -> dict:
+    """Advance the shared market one tick (simulate market changes); bank-wide, so admins only"""
     
-    return {"message": f"Updated prices for {updated_count} investments"}
+    prices = await market_tick(db, get_price_feed())
+    return {"message": f"Updated prices for {len(prices)} assets"}
 
-@router.post("/seed-data")
-async def seed_investment_data(
+@router.post("/update-prices", response_model=List[InvestmentResponse])
+async def update_investment_prices(
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
+    """Re-read market prices and value the user's holdings at them.
+
+    The market itself is only moved by the price engine (or an admin's
+    ``investments.update_prices`` job); trades are priced from it.
+    """
+    investments = await repos.investments.list_active(current_user.id, HOLDING_PROJECTION, 100)
+    snapshot = await get_price_snapshot(repos.market)
+    return to_responses(investments, snapshot)
+
+@job_handler("investments.seed_data", per_user=True)
+async def seed_investments_job(db, user_id, payload: dict) -> dict:
     """Create sample investment data for demonstration"""
+    user_doc = await db.users.find_one({"_id": ObjectId(user_id)})
+    if not user_doc:
+        raise LookupError("User not found")
+    current_user = User(**user_doc)
+    shard_db = await user_database(current_user.id)
     
     sample_investments = [
         {
@@ -266,7 +461,8 @@ async def seed_investment_data(
             "asset_name": "CDB Prefixado 100% CDI",
             "symbol": None,
             "quantity": 1,
-            "purchase_price": 5000.0
+            "purchase_price": 5000.0,
+            "cdb_option_id": "cdb_001"
         }
     ]
     
@@ -274,10 +470,19 @@ async def seed_investment_data(
     for sample in sample_investments:
         try:
             investment_data = InvestmentCreate(**sample)
-            await create_investment(investment_data, current_user, db)
+            await create_investment(investment_data, current_user, mongo_repositories(shard_db, home=db))
             created_count += 1
         except HTTPException:
             # Skip if insufficient funds
             continue
     
-    return {"message": f"Created {created_count} sample investments"}
\ No newline at end of file
+    return {"message": f"Created {created_count} sample investments"}
+
+@router.post("/seed-data", response_model=JobAccepted, status_code=202)
+async def seed_investment_data(
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Queue creation of sample investment data for demonstration"""
+    job_id = await enqueue_job(db, "investments.seed_data", user_id=current_user.id)
+    return JobAccepted(job_id=str(job_id))
\ No newline at end of file
@@ -0,0 +1,64 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from ..models.user import User
+from ..models.job import JobCreate, JobAccepted, JobResponse
+from ..controllers.auth_controller import get_admin_user, get_current_user
+from ..database import get_database
+from ..services.jobs import JOB_HANDLERS, USER_JOB_KINDS, enqueue_job
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+def to_response(job: dict) -> JobResponse:
+    return JobResponse(
+        id=str(job["_id"]),
+        kind=job["kind"],
+        status=job["status"],
+        priority=job["priority"],
+        attempts=job["attempts"],
+        result=job.get("result"),
+        error=job.get("error"),
+        created_at=job["created_at"],
+        finished_at=job.get("finished_at")
+    )
+
+@router.post("/", response_model=JobAccepted, status_code=202)
+async def create_job(
+    job_data: JobCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    if job_data.kind not in JOB_HANDLERS:
+        raise HTTPException(status_code=400, detail="Unknown job kind")
+    if job_data.kind not in USER_JOB_KINDS:
+        # Bank-wide jobs (CDB accrual, market ticks) act on every customer's data
+        await get_admin_user(current_user)
+    
+    job_id = await enqueue_job(db, job_data.kind, job_data.payload, user_id=current_user.id, priority=job_data.priority)
+    return JobAccepted(job_id=str(job_id))
+
+@router.get("/", response_model=List[JobResponse])
+async def get_jobs(
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    jobs = await db.jobs.find({"user_id": current_user.id}).sort("created_at", -1).to_list(20)
+    return [to_response(job) for job in jobs]
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    try:
+        job = await db.jobs.find_one({"_id": ObjectId(job_id), "user_id": current_user.id})
+    except InvalidId:
+        job = None
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return to_response(job)
@@ -0,0 +1,93 @@
+from fastapi import APIRouter, HTTPException, Depends
+from typing import List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime
+
+from ..models.user import User
+from ..models.transaction import TransactionType
+from ..models.schedule import (
+    ScheduledPayment, ScheduledPaymentCreate, ScheduledPaymentResponse,
+    ScheduleStatus, SchedulerLag
+)
+from ..controllers.auth_controller import get_admin_user, get_current_user
+from ..database import get_database
+from ..services.scheduler import scheduler_lag
+
+router = APIRouter(prefix="/schedules", tags=["schedules"])
+
+SCHEDULABLE_TYPES = [TransactionType.PIX_SENT, TransactionType.BILL_PAYMENT]
+
+def to_response(schedule: dict) -> ScheduledPaymentResponse:
+    return ScheduledPaymentResponse(
+        id=str(schedule["_id"]),
+        transaction_type=schedule["transaction_type"],
+        category=schedule["category"],
+        amount=schedule["amount"],
+        description=schedule["description"],
+        recipient_name=schedule.get("recipient_name"),
+        merchant_name=schedule.get("merchant_name"),
+        frequency=schedule["frequency"],
+        next_run_at=schedule["next_run_at"],
+        status=schedule["status"],
+        attempts=schedule.get("attempts", 0),
+        last_run_at=schedule.get("last_run_at"),
+        last_error=schedule.get("last_error")
+    )
+
+@router.post("/", response_model=ScheduledPaymentResponse)
+async def create_schedule(
+    schedule_data: ScheduledPaymentCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    if schedule_data.transaction_type not in SCHEDULABLE_TYPES:
+        raise HTTPException(status_code=400, detail="Only PIX and bill payments can be scheduled")
+    if schedule_data.transaction_type == TransactionType.PIX_SENT and not schedule_data.pix_key:
+        raise HTTPException(status_code=400, detail="PIX key is required")
+    
+    payment_data = schedule_data.dict(exclude={"start_at"})
+    schedule = ScheduledPayment(
+        user_id=current_user.id,
+        anchor_day=schedule_data.start_at.day,
+        next_run_at=schedule_data.start_at,
+        **payment_data
+    )
+    
+    await db.scheduled_payments.insert_one(schedule.dict(by_alias=True))
+    return to_response(schedule.dict(by_alias=True))
+
+@router.get("/", response_model=List[ScheduledPaymentResponse])
+async def get_schedules(
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    schedules = await db.scheduled_payments.find({"user_id": current_user.id}).sort("next_run_at", 1).to_list(100)
+    return [to_response(schedule) for schedule in schedules]
+
+@router.delete("/{schedule_id}")
+async def cancel_schedule(
+    schedule_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    try:
+        result = await db.scheduled_payments.update_one(
+            {"_id": ObjectId(schedule_id), "user_id": current_user.id, "status": ScheduleStatus.ACTIVE},
+            {"$set": {"status": ScheduleStatus.CANCELLED, "updated_at": datetime.utcnow()}}
+        )
+    except InvalidId:
+        result = None
+    if result is None or result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Active schedule not found")
+    
+    return {"message": "Schedule cancelled"}
+
+@router.get("/lag", response_model=SchedulerLag)
+async def get_scheduler_lag(
+    current_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Backlog of due payments across all scheduler workers (admins; also exported to /metrics)"""
+    return SchedulerLag(**await scheduler_lag(db))
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
@@ -10,59 +11,56 @@ from ..models.transaction import (
     Transaction, TransactionCreate, TransactionResponse, 
     PixPayment, TransactionType, TransactionCategory, TransactionAnalytics
 )
-from ..controllers.auth_controller import get_current_user
-from ..database import get_database
+from ..models.job import JobAccepted
+from ..controllers.auth_controller import get_current_user, get_user_analytics_repositories, get_user_repositories
+from ..database import analytics, get_database, user_database
+from ..repositories import Repositories
+from ..repositories.mongo import MongoTransactionRepository
+from ..services.jobs import enqueue_job, job_handler
+from ..services.ledger import AccountNotFound, InsufficientFunds, post_transaction
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
+# Analytics over longer ranges is handed to the job queue
+ANALYTICS_INLINE_MONTHS = 6
+
+def to_response(transaction: dict) -> TransactionResponse:
+    return TransactionResponse(
+        id=str(transaction["_id"]),
+        transaction_type=transaction["transaction_type"],
+        category=transaction["category"],
+        amount=transaction["amount"],
+        description=transaction["description"],
+        merchant_name=transaction.get("merchant_name"),
+        recipient_name=transaction.get("recipient_name"),
+        transaction_date=transaction["transaction_date"],
+        status=transaction["status"],
+        balance_after=transaction.get("balance_after")
+    )
+
 @router.post("/", response_model=TransactionResponse)
 async def create_transaction(
     transaction_data: TransactionCreate,
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
-    # Get user's account
-    account = await db.accounts.find_one({"user_id": current_user.id})
-    if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
-    
-    # Check balance for debit transactions
-    if transaction_data.transaction_type in [TransactionType.DEBIT, TransactionType.PIX_SENT, TransactionType.BILL_PAYMENT]:
-        if account["balance"] < transaction_data.amount:
-            raise HTTPException(status_code=400, detail="Insufficient funds")
-    
-    # Create transaction
     transaction = Transaction(
         user_id=current_user.id,
-        account_id=account["_id"],
         **transaction_data.dict()
     )
     
-    # Calculate new balance
-    if transaction_data.transaction_type in [TransactionType.CREDIT, TransactionType.PIX_RECEIVED]:
-        new_balance = account["balance"] + transaction_data.amount
-    else:
-        new_balance = account["balance"] - transaction_data.amount
-    
-    transaction.balance_after = new_balance
-    
-    # Insert transaction
-    result = await db.transactions.insert_one(transaction.dict(by_alias=True))
-    
-    # Update account balance
-    await db.accounts.update_one(
-        {"_id": account["_id"]},
-        {
-            "$set": {
-                "balance": new_balance,
-                "available_balance": new_balance,
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    # Funds check, balance update and insert happen in the shared posting path
+    try:
+        posted = await post_transaction(repos, transaction.dict(by_alias=True))
+    except AccountNotFound:
+        raise HTTPException(status_code=404, detail="Account not found")
+    except InsufficientFunds:
+        raise HTTPException(status_code=400, detail="Insufficient funds")
+    
+    transaction.balance_after = posted["balance_after"]
     
     return TransactionResponse(
-        id=str(result.inserted_id),
+        id=str(posted["_id"]),
         transaction_type=transaction.transaction_type,
         category=transaction.category,
         amount=transaction.amount,
@@ -81,38 +79,17 @@ async def get_transactions(
     category: Optional[TransactionCategory] = None,
     transaction_type: Optional[TransactionType] = None,
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
-    # Build filter
-    filter_dict = {"user_id": current_user.id}
-    if category:
-        filter_dict["category"] = category
-    if transaction_type:
-        filter_dict["transaction_type"] = transaction_type
-    
-    transactions = await db.transactions.find(filter_dict).sort("transaction_date", -1).skip(skip).limit(limit).to_list(limit)
-    
-    return [
-        TransactionResponse(
-            id=str(transaction["_id"]),
-            transaction_type=transaction["transaction_type"],
-            category=transaction["category"],
-            amount=transaction["amount"],
-            description=transaction["description"],
-            merchant_name=transaction.get("merchant_name"),
-            recipient_name=transaction.get("recipient_name"),
-            transaction_date=transaction["transaction_date"],
-            status=transaction["status"],
-            balance_after=transaction.get("balance_after")
-        )
-        for transaction in transactions
-    ]
+    transactions = await repos.transactions.list_for_user(current_user.id, skip, limit, category, transaction_type)
+    
+    return [to_response(transaction) for transaction in transactions]
 
 @router.post("/pix")
 async def send_pix(
     pix_data: PixPayment,
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_repositories)
 ):
     # Create PIX transaction
     transaction_data = TransactionCreate(
@@ -124,24 +101,19 @@ async def send_pix(
         recipient_name=pix_data.recipient_name
     )
     
-    return await create_transaction(transaction_data, current_user, db)
+    return await create_transaction(transaction_data, current_user, repos)
 
-@router.get("/analytics", response_model=TransactionAnalytics)
-async def get_transaction_analytics(
-    months: int = Query(6, ge=1, le=12),
-    current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
-):
+async def compute_transaction_analytics(transactions_repository, user_id, months: int) -> dict:
     # Calculate date range
     end_date = datetime.now()
     start_date = end_date - timedelta(days=months * 30)
     
     # Get transactions in date range
-    transactions = await db.transactions.find({
-        "user_id": current_user.id,
-        "transaction_date": {"$gte": start_date, "$lte": end_date}
-    }).to_list(1000)
+    transactions = await transactions_repository.in_range(user_id, start_date, end_date, 1000)
     
+    return summarize_transactions(transactions)
+
+def summarize_transactions(transactions: list) -> dict:
     # Calculate analytics
     total_income = sum(t["amount"] for t in transactions if t["transaction_type"] in ["credit", "pix_received"])
     total_expenses = sum(t["amount"] for t in transactions if t["transaction_type"] in ["debit", "pix_sent", "bill_payment"])
@@ -179,19 +151,34 @@ async def get_transaction_analytics(
     
     top_merchants = [{"merchant": k, "amount": v} for k, v in sorted(merchant_spending.items(), key=lambda x: x[1], reverse=True)[:5]]
     
-    return TransactionAnalytics(
-        total_income=total_income,
-        total_expenses=total_expenses,
-        monthly_spending=monthly_spending_list,
-        category_breakdown=category_breakdown_list,
-        top_merchants=top_merchants
-    )
+    return {
+        "total_income": total_income,
+        "total_expenses": total_expenses,
+        "monthly_spending": monthly_spending_list,
+        "category_breakdown": category_breakdown_list,
+        "top_merchants": top_merchants
+    }
 
-@router.post("/seed-data")
-async def seed_transaction_data(
+@job_handler("transactions.analytics", per_user=True)
+async def transaction_analytics_job(db, user_id, payload: dict) -> dict:
+    transactions = MongoTransactionRepository(analytics(await user_database(user_id)))
+    return await compute_transaction_analytics(transactions, user_id, payload.get("months", 6))
+
+@router.get("/analytics", response_model=TransactionAnalytics)
+async def get_transaction_analytics(
+    months: int = Query(6, ge=1, le=12),
     current_user: User = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_database)
+    repos: Repositories = Depends(get_user_analytics_repositories)
 ):
+    # Long ranges are computed by the job worker; poll GET /jobs/{job_id} for the result
+    if months > ANALYTICS_INLINE_MONTHS:
+        job_id = await enqueue_job(await get_database(), "transactions.analytics", {"months": months}, user_id=current_user.id)
+        return JSONResponse(status_code=202, content=JobAccepted(job_id=str(job_id)).dict())
+    
+    return TransactionAnalytics(**await compute_transaction_analytics(repos.transactions, current_user.id, months))
+
+@job_handler("transactions.seed_data", per_user=True)
+async def seed_transactions_job(db, user_id, payload: dict) -> dict:
     """Create sample transaction data for demonstration"""
     
     sample_transactions = [
@@ -208,15 +195,17 @@ async def seed_transaction_data(
         {"type": TransactionType.DEBIT, "category": TransactionCategory.HEALTH, "amount": 120.00, "description": "Pharmacy", "merchant": "Pharmacy ABC", "days_ago": 12},
     ]
     
-    account = await db.accounts.find_one({"user_id": current_user.id})
+    shard_db = await user_database(user_id)
+    account = await shard_db.accounts.find_one({"user_id": user_id}, {"_id": 1})
     if not account:
-        raise HTTPException(status_code=404, detail="Account not found")
+        raise LookupError("Account not found")
     
+    transactions = []
     for sample in sample_transactions:
         transaction_date = datetime.now() - timedelta(days=sample["days_ago"])
         
         transaction = Transaction(
-            user_id=current_user.id,
+            user_id=user_id,
             account_id=account["_id"],
             transaction_type=sample["type"],
             category=sample["category"],
@@ -228,6 +217,21 @@ async def seed_transaction_data(
             status="completed"
         )
         
-        await db.transactions.insert_one(transaction.dict(by_alias=True))
+        transactions.append(transaction.dict(by_alias=True))
+    
+    await shard_db.transactions.insert_many(transactions)
+    return {"message": f"Created {len(sample_transactions)} sample transactions"}
+
+@router.post("/seed-data", response_model=JobAccepted, status_code=202)
+async def seed_transaction_data(
+    current_user: User = Depends(get_current_user),
+    repos: Repositories = Depends(get_user_repositories),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Queue creation of sample transaction data for demonstration"""
+    account = await repos.accounts.get_for_user(current_user.id, {"_id": 1})
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
     
-    return {"message": f"Created {len(sample_transactions)} sample transactions"}
\ No newline at end of file
+    job_id = await enqueue_job(db, "transactions.seed_data", user_id=current_user.id)
+    return JobAccepted(job_id=str(job_id))
\ No newline at end of file
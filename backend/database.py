@@ -1,19 +1,217 @@
+from fastapi import HTTPException
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
+from pymongo.read_preferences import ReadPreference, SecondaryPreferred
+from typing import Optional
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+from .metrics import command_metrics
+from .profiling import command_recorder, create_profiling_indexes
+from .rate_limit import create_rate_limit_indexes
+from .sharding import HOME_SHARD, ShardMap, parse_shards, ring_from_env
+from .slow_queries import create_slow_command_indexes, slow_command_recorder
+
 load_dotenv()
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'banksys')]
+# Analytics, history and batch scans may read from secondaries at most this far behind
+# (MongoDB's lower bound is 90 seconds)
+ANALYTICS_MAX_STALENESS_SECONDS = int(os.environ.get("MONGO_ANALYTICS_MAX_STALENESS_SECONDS", "120"))
+ANALYTICS_READ_PREFERENCE = SecondaryPreferred(max_staleness=ANALYTICS_MAX_STALENESS_SECONDS)
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection pool usage per server, for saturation and capacity planning.
+
+    Listeners run synchronously on the driver's threads, so counters are
+    updated under a lock; checkout wait is timed per thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.local = threading.local()
+
+    def _pool(self, address) -> dict:
+        key = f"{address[0]}:{address[1]}"
+        if key not in self.pools:
+            self.pools[key] = {
+                "open": 0,
+                "checked_out": 0,
+                "waiting": 0,
+                "peak_checked_out": 0,
+                "peak_waiting": 0,
+                "checkouts": 0,
+                "checkout_failures": 0,
+                "checkout_timeouts": 0,
+                "wait_ms_total": 0.0,
+                "wait_ms_max": 0.0,
+            }
+        return self.pools[key]
+
+    def connection_check_out_started(self, event):
+        self.local.started = time.perf_counter()
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["waiting"] += 1
+            pool["peak_waiting"] = max(pool["peak_waiting"], pool["waiting"])
+
+    def connection_checked_out(self, event):
+        waited = (time.perf_counter() - getattr(self.local, "started", time.perf_counter())) * 1000
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(pool["waiting"] - 1, 0)
+            pool["checked_out"] += 1
+            pool["checkouts"] += 1
+            pool["peak_checked_out"] = max(pool["peak_checked_out"], pool["checked_out"])
+            pool["wait_ms_total"] += waited
+            pool["wait_ms_max"] = max(pool["wait_ms_max"], waited)
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["waiting"] = max(pool["waiting"] - 1, 0)
+            pool["checkout_failures"] += 1
+            if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+                pool["checkout_timeouts"] += 1
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["checked_out"] = max(pool["checked_out"] - 1, 0)
+
+    def connection_created(self, event):
+        with self.lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            pool = self._pool(event.address)
+            pool["open"] = max(pool["open"] - 1, 0)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self, max_pool_size: int) -> dict:
+        with self.lock:
+            pools = {address: dict(pool) for address, pool in self.pools.items()}
+        for pool in pools.values():
+            pool["saturation"] = pool["checked_out"] / max_pool_size if max_pool_size else 0.0
+            pool["wait_ms_avg"] = pool["wait_ms_total"] / pool["checkouts"] if pool["checkouts"] else 0.0
+        return {"max_pool_size": max_pool_size, "pools": pools}
+
+pool_metrics = PoolMetrics()
+
+# MongoDB connection, opened by connect() (the app lifespan or a CLI entry point)
+client: Optional[AsyncIOMotorClient] = None
+db: Optional[AsyncIOMotorDatabase] = None
+# Every shard, home (db) included; see backend.sharding
+shards: Optional[ShardMap] = None
+_shard_clients = {}
+
+def client_options() -> dict:
+    """Motor client tuning, from the environment"""
+    options = {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", "10")),
+        "maxIdleTimeMS": int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "300000")),
+        "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+        "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        "appname": os.environ.get("MONGO_APP_NAME", "banksys-api"),
+    }
+    # Wire compression, e.g. "zstd,snappy,zlib" (zstd and snappy need their Python packages)
+    compressors = os.environ.get("MONGO_COMPRESSORS")
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+def _client(mongo_url: str) -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(mongo_url, event_listeners=[pool_metrics, command_metrics, command_recorder, slow_command_recorder], **client_options())
+
+def connect(mongo_url: Optional[str] = None, db_name: Optional[str] = None) -> AsyncIOMotorDatabase:
+    """Open the home database and the ``MONGO_SHARDS`` (one client per distinct URL); returns home"""
+    global client, db, shards
+    if db is None:
+        mongo_url = mongo_url or os.environ['MONGO_URL']
+        client = _client(mongo_url)
+        # Ledger reads stay on the primary whatever the connection string says
+        db_name = db_name or os.environ.get('DB_NAME', 'banksys')
+        db = client.get_database(db_name, read_preference=ReadPreference.PRIMARY)
+        databases = {HOME_SHARD: db}
+        for name, (shard_url, shard_db_name) in parse_shards(os.environ.get("MONGO_SHARDS"), (mongo_url, db_name)).items():
+            shard_client = client if shard_url == mongo_url else _shard_clients.get(shard_url)
+            if shard_client is None:
+                shard_client = _shard_clients[shard_url] = _client(shard_url)
+            databases[name] = shard_client.get_database(shard_db_name, read_preference=ReadPreference.PRIMARY)
+        shards = ShardMap(databases, ring_from_env(databases))
+    return db
+
+def close():
+    global client, db, shards
+    for shard_client in _shard_clients.values():
+        shard_client.close()
+    _shard_clients.clear()
+    if client is not None:
+        client.close()
+    client, db, shards = None, None, None
+
+def analytics(database):
+    """The same database with reads routed to secondaries within ``ANALYTICS_MAX_STALENESS_SECONDS``.
+
+    For reports, history and batch scans only; writes still go to the primary.
+    """
+    return database.with_options(read_preference=ANALYTICS_READ_PREFERENCE)
+
+def pool_stats() -> dict:
+    return pool_metrics.snapshot(client_options()["maxPoolSize"])
 
 async def get_database() -> AsyncIOMotorDatabase:
+    if db is None:
+        if os.environ.get("STORAGE_BACKEND") == "memory":
+            # Jobs, schedules, risk, price history and admin have no memory implementation
+            raise HTTPException(status_code=503, detail="Not available with STORAGE_BACKEND=memory")
+        raise HTTPException(status_code=503, detail="MongoDB not connected")
     return db
 
+async def get_analytics_database() -> AsyncIOMotorDatabase:
+    return analytics(await get_database())
+
+async def get_shards() -> ShardMap:
+    await get_database()
+    return shards
+
+def _connected_shards() -> ShardMap:
+    if shards is None:
+        raise RuntimeError("MongoDB not connected; call database.connect() first")
+    return shards
+
+async def user_database(user_id) -> AsyncIOMotorDatabase:
+    """Database holding the user's accounts, cards and investments, for jobs and workers.
+
+    Raises ``ShardMoving`` while the user is being moved to another shard.
+    """
+    return await _connected_shards().database_for(user_id)
+
+async def fan_out(func, *args, **kwargs) -> dict:
+    """Run ``func(db, ...)`` on every shard (batch jobs); {shard: result}"""
+    return await _connected_shards().fan_out(func, *args, **kwargs)
+
 # Create indexes for better performance
-async def create_indexes():
+async def create_indexes(db: AsyncIOMotorDatabase):
     # User indexes
     await db.users.create_index("cpf", unique=True)
     await db.users.create_index("email", unique=True)
@@ -22,11 +220,54 @@ async def create_indexes():
     await db.transactions.create_index([("user_id", 1), ("transaction_date", -1)])
     await db.transactions.create_index("transaction_type")
     await db.transactions.create_index("category")
+    # Idempotent postings (scheduled payments, sales); most transactions have no key
+    await db.transactions.create_index(
+        "posting_key", unique=True, partialFilterExpression={"posting_key": {"$type": "string"}}
+    )
     
     # Account indexes
     await db.accounts.create_index("user_id")
     await db.accounts.create_index("account_number", unique=True)
     
+    # Credit card indexes (unique per user and product)
+    await db.credit_cards.create_index([("user_id", 1), ("card_name", 1)], unique=True)
+    await db.credit_cards.create_index("next_closing_date")
+    
+    # Invoice indexes
+    await db.invoices.create_index([("card_id", 1), ("period_end", 1)], unique=True)
+    await db.invoices.create_index([("user_id", 1), ("period_end", -1)])
+    
+    # Scheduled payment indexes
+    await db.scheduled_payments.create_index([("status", 1), ("next_run_at", 1)])
+    await db.scheduled_payments.create_index("user_id")
+    await db.scheduled_payments.create_index("lease_token", sparse=True)
+    
+    # Job queue indexes
+    await db.jobs.create_index([("status", 1), ("priority", -1), ("run_at", 1)])
+    await db.jobs.create_index([("user_id", 1), ("created_at", -1)])
+    
     # Investment indexes
-    await db.investments.create_index("user_id")
-    await db.investments.create_index("investment_type")
\ No newline at end of file
+    await db.investments.create_index([("user_id", 1), ("is_active", 1)])
+    await db.investments.create_index("investment_type")
+    # One position per (user_id, symbol), FIFO lots alongside
+    await db.investments.create_index(
+        [("user_id", 1), ("symbol", 1)], unique=True, partialFilterExpression={"symbol": {"$type": "string"}}
+    )
+    await db.investment_lots.create_index([("position_id", 1), ("purchase_date", 1)])
+    await db.investment_lots.create_index("user_id")
+    
+    # Risk metrics cache (one document per user per day)
+    await db.risk_metrics.create_index([("user_id", 1), ("as_of", -1)], unique=True)
+    
+    # Request profiles (expire after a week)
+    await create_profiling_indexes(db)
+    
+    # Slow command log (expires after a week)
+    await create_slow_command_indexes(db)
+    
+    # Shared rate limit buckets (expire once refilled)
+    await create_rate_limit_indexes(db)
+    
+    # Price history (time-series collections, with their own indexes and retention)
+    from .services.price_history import create_price_history_collections
+    await create_price_history_collections(db)
\ No newline at end of file
@@ -0,0 +1,7 @@
+"""Log setup shared by the API launchers and the service command lines."""
+import logging
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def setup_logging(level: int = logging.INFO):
+    logging.basicConfig(level=level, format=LOG_FORMAT)
@@ -0,0 +1,277 @@
+"""Process metrics in the Prometheus text format.
+
+- ``http_request_duration_seconds`` / ``http_requests_total`` per route
+  template (never the raw path, to bound cardinality), method and status,
+  and ``http_requests_in_flight``, from an ASGI middleware
+- ``mongodb_command_duration_seconds`` per collection and command, from a
+  pymongo ``CommandListener`` on the app's client
+- ``event_loop_lag_seconds``: how late a periodic wake-up fires
+- connection pool gauges, read at scrape time
+- ``scheduler_*``: the scheduled-payment backlog shared by all scheduler
+  workers (``services.scheduler.scheduler_lag``), read at scrape time
+
+With several workers (``backend.serve``) each worker writes a snapshot to
+``METRICS_DIR`` and a scrape merges them, so any worker returns the
+totals. Counters and histograms of exited workers are kept; their gauges
+are dropped. Shared gauges hold a bank-wide value that every worker reads
+alike, so a scrape returns its own worker's instead of a sum.
+"""
+from bisect import bisect_left
+from typing import Optional
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+LAG_INTERVAL_SECONDS = 0.5
+SNAPSHOT_INTERVAL_SECONDS = 5.0
+
+class Metric:
+    kind = ""
+    shared = False
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def dump(self) -> list:
+        with self.lock:
+            return [[list(key), value] for key, value in self.series.items()]
+
+    def merge(self, into: dict, series: list):
+        for key, value in series:
+            key = tuple(key)
+            into[key] = into.get(key, 0.0) + value
+
+    def lines(self, series: dict) -> list:
+        return [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in series.items()]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, key: tuple = (), amount: float = 1.0):
+        with self.lock:
+            self.series[key] = self.series.get(key, 0.0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), shared: bool = False):
+        super().__init__(name, help, labels)
+        self.shared = shared
+
+    def set(self, value: float, key: tuple = ()):
+        with self.lock:
+            self.series[key] = value
+
+    def inc(self, key: tuple = (), amount: float = 1.0):
+        with self.lock:
+            self.series[key] = self.series.get(key, 0.0) + amount
+
+    def dec(self, key: tuple = (), amount: float = 1.0):
+        self.inc(key, -amount)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, key: tuple = ()):
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then the sum
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def dump(self) -> list:
+        with self.lock:
+            return [[list(key), list(value)] for key, value in self.series.items()]
+
+    def merge(self, into: dict, series: list):
+        for key, value in series:
+            key = tuple(key)
+            current = into.get(key)
+            into[key] = value if current is None else [a + b for a, b in zip(current, value)]
+
+    def lines(self, series: dict) -> list:
+        lines = []
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        for key, value in series.items():
+            cumulative = 0
+            for bound, count in zip(bounds, value):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(value[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+REQUESTS = Counter("http_requests_total", "HTTP requests by status", ("method", "route", "status"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served")
+MONGO_LATENCY = Histogram("mongodb_command_duration_seconds", "MongoDB command latency", ("collection", "command"), MONGO_BUCKETS)
+MONGO_FAILURES = Counter("mongodb_command_failures_total", "Failed MongoDB commands", ("collection", "command"))
+LOOP_LAG = Histogram("event_loop_lag_seconds", "Delay of a periodic event loop wake-up", (), LAG_BUCKETS)
+POOL_CHECKED_OUT = Gauge("mongodb_pool_checked_out_connections", "Connections in use", ("address",))
+POOL_WAITING = Gauge("mongodb_pool_waiting_checkouts", "Checkouts waiting for a connection", ("address",))
+POOL_OPEN = Gauge("mongodb_pool_open_connections", "Open connections", ("address",))
+POOL_TIMEOUTS = Gauge("mongodb_pool_checkout_timeouts", "Checkouts that timed out waiting", ("address",))
+BALANCE_CACHE_LOOKUPS = Counter("balance_cache_lookups_total", "Account reads by cache result (hit, miss, bypass)", ("result",))
+BALANCE_CACHE_INVALIDATIONS = Counter("balance_cache_invalidations_total", "Cached balances dropped on a change from elsewhere")
+RATE_LIMITED = Counter("http_rate_limited_total", "Requests rejected with 429 by route class", ("route_class",))
+SCHEDULER_DUE = Gauge("scheduler_due_payments", "Active scheduled payments due now", shared=True)
+SCHEDULER_LEASED = Gauge("scheduler_leased_payments", "Due scheduled payments leased by a worker", shared=True)
+SCHEDULER_LAG = Gauge("scheduler_lag_seconds", "Age of the oldest due scheduled payment", shared=True)
+
+METRICS = [
+    REQUEST_LATENCY, REQUESTS, IN_FLIGHT,
+    MONGO_LATENCY, MONGO_FAILURES, LOOP_LAG,
+    POOL_CHECKED_OUT, POOL_WAITING, POOL_OPEN, POOL_TIMEOUTS,
+    BALANCE_CACHE_LOOKUPS, BALANCE_CACHE_INVALIDATIONS, RATE_LIMITED,
+    SCHEDULER_DUE, SCHEDULER_LEASED, SCHEDULER_LAG,
+]
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec()
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_LATENCY.observe(elapsed, (scope["method"], path))
+            REQUESTS.inc((scope["method"], path, str(status)))
+
+class CommandMetrics(monitoring.CommandListener):
+    """Command latency by collection; runs on the driver's threads"""
+
+    def __init__(self):
+        self.collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        self.collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def succeeded(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), "")
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, (collection, event.command_name))
+
+    def failed(self, event):
+        collection = self.collections.pop((event.connection_id, event.request_id), "")
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, (collection, event.command_name))
+        MONGO_FAILURES.inc((collection, event.command_name))
+
+command_metrics = CommandMetrics()
+
+def set_pool_gauges(pool_stats: dict):
+    for address, pool in pool_stats["pools"].items():
+        POOL_CHECKED_OUT.set(pool["checked_out"], (address,))
+        POOL_WAITING.set(pool["waiting"], (address,))
+        POOL_OPEN.set(pool["open"], (address,))
+        POOL_TIMEOUTS.set(pool["checkout_timeouts"], (address,))
+
+def set_scheduler_gauges(lag: dict):
+    SCHEDULER_DUE.set(lag["due_count"])
+    SCHEDULER_LEASED.set(lag["leased_count"])
+    SCHEDULER_LAG.set(lag["lag_seconds"])
+
+def _metrics_dir() -> Optional[str]:
+    return os.environ.get("METRICS_DIR")
+
+def write_snapshot(directory: str):
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump({metric.name: metric.dump() for metric in METRICS}, f)
+    os.replace(path + ".tmp", path)
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+def render() -> str:
+    """All metrics, merged across workers when ``METRICS_DIR`` is set"""
+    directory = _metrics_dir()
+    merged = {metric.name: {} for metric in METRICS}
+    if directory:
+        write_snapshot(directory)
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _alive(int(os.path.basename(path)[:-5]))
+            for metric in METRICS:
+                if metric.shared or (metric.kind == "gauge" and not alive):
+                    continue
+                metric.merge(merged[metric.name], snapshot.get(metric.name, []))
+    for metric in METRICS:
+        if metric.shared or not directory:
+            metric.merge(merged[metric.name], metric.dump())
+
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.lines(merged[metric.name]))
+    return "\n".join(lines) + "\n"
+
+async def monitor_event_loop(interval: float = LAG_INTERVAL_SECONDS):
+    """Record loop lag; also writes this worker's snapshot for multi-worker scrapes"""
+    loop = asyncio.get_running_loop()
+    directory = _metrics_dir()
+    last_snapshot = loop.time()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(loop.time() - expected, 0.0))
+        if directory and loop.time() - last_snapshot >= SNAPSHOT_INTERVAL_SECONDS:
+            write_snapshot(directory)
+            last_snapshot = loop.time()
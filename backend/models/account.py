@@ -28,9 +28,13 @@ class CreditCard(BaseModel):
     card_name: str
     credit_limit: float
     available_limit: float
-    current_balance: float = 0.0
+    current_balance: float = 0.0  # Open invoice total, maintained with $inc on each purchase
+    statement_balance: float = 0.0  # Total of the last closed invoice
     due_date: datetime
     minimum_payment: float = 0.0
+    closing_day: int = 5
+    cycle_start: Optional[datetime] = None
+    next_closing_date: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
 
@@ -55,4 +59,30 @@ class CreditCardResponse(BaseModel):
     available_limit: float
     current_balance: float
     due_date: datetime
-    minimum_payment: float
\ No newline at end of file
+    minimum_payment: float
+
+class CardPurchase(BaseModel):
+    amount: float = Field(gt=0)
+    description: str
+    merchant_name: Optional[str] = None
+    category: str = "other"
+
+class CardPurchaseResponse(BaseModel):
+    id: str
+    card_id: str
+    amount: float
+    description: str
+    merchant_name: Optional[str] = None
+    transaction_date: datetime
+    current_balance: float
+    available_limit: float
+
+class InvoiceResponse(BaseModel):
+    id: str
+    card_id: str
+    period_start: Optional[datetime] = None
+    period_end: datetime
+    total: float
+    minimum_payment: float
+    due_date: datetime
+    status: str
\ No newline at end of file
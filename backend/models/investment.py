@@ -19,14 +19,13 @@ class Investment(BaseModel):
     symbol: Optional[str] = None  # For crypto/stocks
     quantity: float
     purchase_price: float
-    current_price: float
-    total_invested: float
-    current_value: float
-    profit_loss: float
-    profit_loss_percentage: float
+    total_invested: float  # Cost basis; market value and P&L are computed on read
     purchase_date: datetime
     maturity_date: Optional[datetime] = None  # For CDB
-    interest_rate: Optional[float] = None  # For CDB
+    interest_rate: Optional[float] = None  # For CDB, % a.a.
+    cdi_percentage: Optional[float] = None  # For postfixed CDB, % of CDI
+    accrued_value: Optional[float] = None  # For CDB, refreshed by the daily accrual
+    accrued_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
@@ -50,17 +49,31 @@ class CDBOption(BaseModel):
     name: str
     bank_name: str = "BankSys"
     interest_rate: float
+    cdi_percentage: Optional[float] = None
     minimum_investment: float
     maturity_months: int
     type: str = "prefixed"  # prefixed, postfixed
     description: str
 
+class CDBSimulation(BaseModel):
+    option_id: str
+    name: str
+    amount: float
+    months: int
+    business_days: int
+    gross_value: float
+    income_tax: float
+    net_value: float
+    net_return_percentage: float
+    eligible: bool  # amount meets the option's minimum investment
+
 class InvestmentCreate(BaseModel):
     investment_type: InvestmentType
     asset_name: str
     symbol: Optional[str] = None
-    quantity: float
-    purchase_price: float
+    quantity: float = Field(gt=0)
+    purchase_price: Optional[float] = Field(None, gt=0)  # Ignored for symbols, which are bought at the market price
+    cdb_option_id: Optional[str] = None  # For CDB, one of /investments/cdb-options
 
 class InvestmentResponse(BaseModel):
     id: str
@@ -80,4 +93,47 @@ class PortfolioSummary(BaseModel):
     current_value: float
     total_profit_loss: float
     total_profit_loss_percentage: float
-    investments_by_type: List[dict]
\ No newline at end of file
+    investments_by_type: List[dict]
+
+class SellRequest(BaseModel):
+    quantity: Optional[float] = Field(None, gt=0)  # Everything when omitted
+
+class SellResponse(BaseModel):
+    investment: InvestmentResponse
+    quantity: float
+    proceeds: float  # Net of income tax withheld
+    income_tax: float
+    cost_basis: float  # FIFO cost of the lots sold
+    realized_profit_loss: float
+    balance_after: float
+
+class LotResponse(BaseModel):
+    id: str
+    symbol: str
+    quantity: float
+    remaining: float
+    price: float
+    purchase_date: datetime
+
+class PerformancePoint(BaseModel):
+    timestamp: datetime
+    value: float
+    invested: float
+
+class PortfolioPerformance(BaseModel):
+    resolution: str
+    start: datetime
+    end: datetime
+    points: List[PerformancePoint]
+
+class RiskMetrics(BaseModel):
+    as_of: datetime
+    lookback_days: int
+    confidence: float
+    observations: int  # Daily returns the metrics were computed from
+    portfolio_value: float
+    annualized_volatility: float
+    value_at_risk: float  # One-day historical VaR, in BRL
+    conditional_value_at_risk: float  # Mean loss beyond VaR, in BRL
+    max_drawdown: float  # Fraction of peak value
+    computed_at: datetime
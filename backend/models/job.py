@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Any
+from datetime import datetime
+from enum import Enum
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    DEAD = "dead"  # Dead-lettered after exhausting its attempts
+
+class JobCreate(BaseModel):
+    kind: str
+    payload: dict = Field(default_factory=dict)
+    priority: int = Field(0, ge=-10, le=10)
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: JobStatus = JobStatus.QUEUED
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: JobStatus
+    priority: int
+    attempts: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,46 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+from enum import Enum
+
+class StackKind(str, Enum):
+    WALL = "wall"
+    CPU = "cpu"
+
+class ProfilingRequest(BaseModel):
+    sample_rate: float = Field(0.01, gt=0, le=1)  # Fraction of (matching) requests profiled
+    route: Optional[str] = None  # Route template, e.g. "/api/transactions/analytics"
+    user_id: Optional[str] = None
+    interval_ms: int = Field(5, ge=1, le=100)
+    duration_minutes: int = Field(15, ge=1, le=240)
+
+class ProfilingStatus(BaseModel):
+    enabled: bool
+    sample_rate: float = 0.0
+    route: Optional[str] = None
+    user_id: Optional[str] = None
+    interval_ms: int = 5
+    expires_at: Optional[datetime] = None
+
+class MongoCommand(BaseModel):
+    command: str
+    collection: Optional[str] = None
+    duration_ms: float
+    ok: bool
+
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    route: Optional[str] = None
+    user_id: Optional[str] = None
+    status: int
+    started_at: datetime
+    wall_ms: float
+    cpu_ms: float
+    mongo_commands: int
+
+class ProfileResponse(ProfileSummary):
+    loop_cpu_ms: float
+    interval_ms: float
+    commands: List[MongoCommand]
@@ -0,0 +1,78 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+from bson import ObjectId
+from .user import PyObjectId
+from .transaction import TransactionType, TransactionCategory
+from enum import Enum
+
+class ScheduleFrequency(str, Enum):
+    ONCE = "once"
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+
+class ScheduleStatus(str, Enum):
+    ACTIVE = "active"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class ScheduledPayment(BaseModel):
+    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
+    user_id: PyObjectId
+    transaction_type: TransactionType
+    category: TransactionCategory = TransactionCategory.OTHER
+    amount: float
+    description: str
+    pix_key: Optional[str] = None
+    recipient_name: Optional[str] = None
+    merchant_name: Optional[str] = None
+    frequency: ScheduleFrequency = ScheduleFrequency.ONCE
+    anchor_day: int  # Day of month monthly schedules stick to
+    next_run_at: datetime
+    status: ScheduleStatus = ScheduleStatus.ACTIVE
+    attempts: int = 0  # Failed attempts for the current occurrence
+    last_run_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    lease_owner: Optional[str] = None
+    lease_token: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Config:
+        allow_population_by_field_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+class ScheduledPaymentCreate(BaseModel):
+    transaction_type: TransactionType  # pix_sent or bill_payment
+    category: TransactionCategory = TransactionCategory.OTHER
+    amount: float = Field(gt=0)
+    description: str
+    pix_key: Optional[str] = None
+    recipient_name: Optional[str] = None
+    merchant_name: Optional[str] = None
+    frequency: ScheduleFrequency = ScheduleFrequency.ONCE
+    start_at: datetime
+
+class ScheduledPaymentResponse(BaseModel):
+    id: str
+    transaction_type: TransactionType
+    category: TransactionCategory
+    amount: float
+    description: str
+    recipient_name: Optional[str] = None
+    merchant_name: Optional[str] = None
+    frequency: ScheduleFrequency
+    next_run_at: datetime
+    status: ScheduleStatus
+    attempts: int
+    last_run_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+
+class SchedulerLag(BaseModel):
+    due_count: int
+    oldest_due_at: Optional[datetime] = None
+    lag_seconds: float
+    leased_count: int
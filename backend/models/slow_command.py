@@ -0,0 +1,30 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+class SlowCommandShape(BaseModel):
+    shape_id: str
+    shape: str  # JSON, values redacted
+    command: str
+    collection: Optional[str] = None
+    count: int
+    total_ms: float
+    avg_ms: float
+    max_ms: float
+    max_skip: Optional[int] = None
+    failures: int
+    routes: List[str]
+    plan_summary: Optional[str] = None  # e.g. "FETCH > IXSCAN(user_id_1_transaction_date_-1)"
+    collscan: Optional[bool] = None
+    last_seen: datetime
+
+class SlowCommandSample(BaseModel):
+    id: str
+    shape_id: str
+    route: str
+    duration_ms: float
+    ok: bool
+    skip: Optional[int] = None
+    at: datetime
+    plan_summary: Optional[str] = None
+    plan: Optional[dict] = None
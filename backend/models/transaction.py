@@ -14,7 +14,9 @@ class TransactionType(str, Enum):
     TRANSFER = "transfer"
     MOBILE_TOPUP = "mobile_topup"
     INVESTMENT = "investment"
+    INVESTMENT_REDEMPTION = "investment_redemption"
     LOAN_PAYMENT = "loan_payment"
+    CARD_PURCHASE = "card_purchase"
 
 class TransactionCategory(str, Enum):
     FOOD = "food"
@@ -32,6 +34,7 @@ class Transaction(BaseModel):
     id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     user_id: PyObjectId
     account_id: Optional[PyObjectId] = None
+    card_id: Optional[PyObjectId] = None  # For credit card purchases
     transaction_type: TransactionType
     category: TransactionCategory = TransactionCategory.OTHER
     amount: float
@@ -2,9 +2,32 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from bson import ObjectId
+from pydantic_core import core_schema
+
+class PyObjectId(ObjectId):
+    """ObjectId field: accepts an ObjectId or its hex string, serialized as a string in JSON"""
+
+    @classmethod
+    def validate(cls, value):
+        if isinstance(value, ObjectId):
+            return value
+        if isinstance(value, str) and ObjectId.is_valid(value):
+            return ObjectId(value)
+        raise ValueError("Invalid ObjectId")
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type, handler):
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(str, when_used="json")
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, schema, handler):
+        return {"type": "string"}
 
 class User(BaseModel):
-    id: Optional[str] = Field(default=None, alias="_id")
+    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
     cpf: str
     password: str
     full_name: str
@@ -15,6 +38,9 @@ class User(BaseModel):
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
     biometric_enabled: bool = False
+    is_admin: bool = False  # Operational endpoints (/api/admin)
+    shard: Optional[str] = None  # Shard holding the user's accounts, cards and investments (None: home)
+    moving_to: Optional[str] = None  # Set while the rebalancer moves the user's data
 
     class Config:
         allow_population_by_field_name = True
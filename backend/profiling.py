@@ -0,0 +1,296 @@
+"""On-demand request profiling.
+
+An admin turns profiling on for a sample of requests (optionally only
+one route or one user) for a limited time; the setting lives in
+``profiling_settings`` and every worker picks it up within
+``POLL_INTERVAL_SECONDS``. While it is on, the worker wraps its ASGI
+stack with ``ProfilingMiddleware`` and runs a sampler thread that, every
+``interval_ms``, records for each profiled request:
+
+- a CPU sample (the event loop thread's stack) when the request's task
+  is the one running
+- a wall sample, either that same stack or, while the request is
+  suspended, the chain of coroutines it is awaiting in
+
+Mongo commands issued by the request are captured by a command listener
+through a context variable (Motor copies the context into its executor).
+Profiles are stored in ``request_profiles`` with stacks in the folded
+format read by flamegraph.pl, speedscope and similar tools.
+
+When profiling is off nothing is installed on the request path: the
+middleware is removed from the stack and the sampler thread is stopped.
+"""
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+
+from pymongo import monitoring
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_ID = "request_profiling"
+POLL_INTERVAL_SECONDS = 5.0
+PROFILE_RETENTION_SECONDS = 7 * 24 * 3600
+MAX_STACK_DEPTH = 80
+MAX_COMMANDS = 500
+
+_settings: Optional[dict] = None
+_sampler: Optional["Sampler"] = None
+_route = None
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+_pending_writes = set()
+
+class RequestProfile:
+    __slots__ = ("method", "path", "route", "user_id", "wall", "cpu", "commands", "pending", "started_at",
+                 "started", "cpu_started", "cpu_seconds", "root")
+
+    def __init__(self, method: str, path: str, user_id: Optional[str], root):
+        self.method = method
+        self.path = path
+        self.route = None
+        self.user_id = user_id
+        self.wall = {}
+        self.cpu = {}
+        self.commands = []
+        self.pending = {}
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+        self.cpu_seconds = 0.0
+        self.root = root
+
+    def add(self, stack: str, on_cpu: bool, elapsed: float):
+        self.wall[stack] = self.wall.get(stack, 0) + 1
+        if on_cpu:
+            self.cpu[stack] = self.cpu.get(stack, 0) + 1
+            self.cpu_seconds += elapsed
+
+    def document(self, status: int, interval_ms: float) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "user_id": self.user_id,
+            "status": status,
+            "started_at": self.started_at,
+            "wall_ms": (time.perf_counter() - self.started) * 1000,
+            # Loop-thread CPU while the request was in flight, shared with concurrent requests
+            "loop_cpu_ms": (time.thread_time() - self.cpu_started) * 1000,
+            "cpu_ms": self.cpu_seconds * 1000,
+            "interval_ms": interval_ms,
+            "wall_stacks": [{"stack": stack, "count": count} for stack, count in self.wall.items()],
+            "cpu_stacks": [{"stack": stack, "count": count} for stack, count in self.cpu.items()],
+            "mongo_commands": self.commands,
+        }
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"
+
+def _running_stack(frame, root) -> str:
+    """Stack of the loop thread, from the request task's coroutine down to the running frame"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        if frame is root:
+            break
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def _awaiting_stack(task: asyncio.Task) -> str:
+    """Where a suspended task is waiting: its chain of awaited coroutines"""
+    names = []
+    coro = task.get_coro()
+    while coro is not None and len(names) < MAX_STACK_DEPTH:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        names.append(_frame_name(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    names.append("<awaiting>")
+    return ";".join(names)
+
+class Sampler(threading.Thread):
+    def __init__(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.loop = loop
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def add(self, task: asyncio.Task, profile: RequestProfile):
+        with self.lock:
+            self.profiles[task] = profile
+
+    def remove(self, task: asyncio.Task):
+        with self.lock:
+            self.profiles.pop(task, None)
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(self.interval):
+            # A busy loop thread holds the GIL for up to sys.getswitchinterval(), so ticks can be late;
+            # CPU time is credited with the real time since the previous tick
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            with self.lock:
+                if not self.profiles:
+                    continue
+                running = asyncio.current_task(self.loop)
+                frame = sys._current_frames().get(self.loop_thread_id)
+                for task, profile in self.profiles.items():
+                    if task is running and frame is not None:
+                        profile.add(_running_stack(frame, profile.root), True, elapsed)
+                    else:
+                        profile.add(_awaiting_stack(task), False, elapsed)
+
+    def stop(self):
+        self.stopped.set()
+
+def _selected(scope, settings: dict) -> bool:
+    if _route is not None and _route.matches(scope)[0] != Match.FULL:
+        return False
+    if settings.get("user_id") and _user_id(scope) != settings["user_id"]:
+        return False
+    return random.random() < settings["sample_rate"]
+
+def _user_id(scope) -> Optional[str]:
+    from jose import JWTError, jwt
+    from .controllers.auth_controller import ALGORITHM, SECRET_KEY
+
+    for name, value in scope["headers"]:
+        if name == b"authorization" and value[:7].lower() == b"bearer ":
+            try:
+                return jwt.decode(value[7:].decode(), SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+            except JWTError:
+                return None
+    return None
+
+class ProfilingMiddleware:
+    """Outermost ASGI layer, present only while profiling is enabled"""
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+
+    async def __call__(self, scope, receive, send):
+        settings, sampler = _settings, _sampler
+        if scope["type"] != "http" or settings is None or sampler is None or not _selected(scope, settings):
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        task = asyncio.current_task()
+        profile = RequestProfile(scope["method"], scope["path"], settings.get("user_id") or None, sys._getframe())
+        token = _current.set(profile)
+        sampler.add(task, profile)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            sampler.remove(task)
+            _current.reset(token)
+            profile.route = getattr(scope.get("route"), "path", None)
+            write = asyncio.create_task(self.db.request_profiles.insert_one(profile.document(status, sampler.interval * 1000)))
+            _pending_writes.add(write)
+            write.add_done_callback(_pending_writes.discard)
+
+class CommandRecorder(monitoring.CommandListener):
+    """Mongo commands of the request being profiled; a context lookup otherwise"""
+
+    def started(self, event):
+        profile = _current.get()
+        if profile is None:
+            return
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        profile.pending[(event.connection_id, event.request_id)] = target if isinstance(target, str) else None
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+    def _finish(self, event, ok: bool):
+        profile = _current.get()
+        if profile is None or len(profile.commands) >= MAX_COMMANDS:
+            return
+        profile.commands.append({
+            "command": event.command_name,
+            "collection": profile.pending.pop((event.connection_id, event.request_id), None),
+            "duration_ms": event.duration_micros / 1000,
+            "ok": ok,
+        })
+
+command_recorder = CommandRecorder()
+
+def apply_settings(app, db, settings: Optional[dict]):
+    """Install or remove profiling in this worker to match ``settings``"""
+    global _settings, _sampler, _route
+    active = settings is not None and settings.get("enabled") and settings["expires_at"] > datetime.utcnow()
+    if not active:
+        if _settings is not None:
+            _sampler.stop()
+            _settings, _sampler, _route = None, None, None
+            if isinstance(app.middleware_stack, ProfilingMiddleware):
+                app.middleware_stack = app.middleware_stack.app
+            logger.info("Request profiling disabled")
+        return
+
+    interval = settings["interval_ms"] / 1000
+    if _sampler is None or _sampler.interval != interval:
+        if _sampler is not None:
+            _sampler.stop()
+        _sampler = Sampler(asyncio.get_running_loop(), threading.get_ident(), interval)
+        _sampler.start()
+    _route = next((route for route in app.router.routes if getattr(route, "path", None) == settings.get("route")), None)
+    if _settings is None:
+        app.middleware_stack = ProfilingMiddleware(app.middleware_stack or app.build_middleware_stack(), db)
+        logger.info(f"Request profiling enabled: {settings}")
+    _settings = settings
+
+async def create_profiling_indexes(db):
+    await db.request_profiles.create_index("started_at", expireAfterSeconds=PROFILE_RETENTION_SECONDS)
+    await db.request_profiles.create_index([("route", 1), ("started_at", -1)])
+
+async def save_settings(db, enabled: bool, sample_rate: float = 0.0, route: Optional[str] = None, user_id: Optional[str] = None,
+                        interval_ms: int = 5, duration_minutes: int = 15) -> dict:
+    settings = {
+        "enabled": enabled,
+        "sample_rate": sample_rate,
+        "route": route,
+        "user_id": user_id,
+        "interval_ms": interval_ms,
+        "expires_at": datetime.utcnow() + timedelta(minutes=duration_minutes),
+        "updated_at": datetime.utcnow(),
+    }
+    await db.profiling_settings.replace_one({"_id": SETTINGS_ID}, settings, upsert=True)
+    return settings
+
+async def watch_settings(app, db, interval: float = POLL_INTERVAL_SECONDS):
+    """Keep this worker's profiling in line with the shared setting (and its expiry)"""
+    while True:
+        try:
+            apply_settings(app, db, await db.profiling_settings.find_one({"_id": SETTINGS_ID}))
+        except Exception as e:
+            logger.warning(f"Profiling settings poll failed: {e}")
+        await asyncio.sleep(interval)
+
+def folded(stacks: list) -> str:
+    """Folded stacks (``frame;frame;frame count`` per line)"""
+    return "".join(f"{item['stack']} {item['count']}\n" for item in stacks)
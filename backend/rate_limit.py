@@ -0,0 +1,260 @@
+"""Token-bucket rate limiting per user and route class.
+
+Every API request takes a token from the bucket of its (subject, route
+class) pair; when the bucket is empty the request is answered ``429``
+with ``Retry-After`` and never reaches the router. The subject is the
+``sub`` of a valid bearer token, else the client address (behind a proxy,
+from ``X-Forwarded-For`` when the proxy is in ``FORWARDED_ALLOW_IPS``).
+
+Route classes group endpoints by cost (``ROUTE_CLASSES``, else by
+method): ``auth`` (login and register), ``analytics`` (reports computed
+per request), ``market`` (price refreshes and seed jobs), ``write`` and
+``read``. Each has a refill rate (tokens per second) and a burst
+(bucket size), overridable with ``RATE_LIMITS``::
+
+    RATE_LIMITS="analytics=1/10,market=0.1/2"
+
+``RATE_LIMIT_BACKEND`` selects where buckets live:
+
+- ``memory`` (default): a dict in the worker. No I/O, so it adds a few
+  microseconds per request, but each worker enforces the limits on its
+  own (a client can get up to one burst per worker).
+- ``mongo``: one document per bucket in ``rate_limits``, refilled and
+  taken from in a single atomic update against the server clock, so the
+  limits hold across workers and hosts at the cost of a round trip.
+  Buckets expire (TTL index) once they would be full again. If MongoDB
+  cannot be reached, requests are let through.
+
+The per-request cost is measured by ``python -m backend.benchmarks.rate_limit_benchmark``.
+"""
+from math import ceil
+from typing import Dict, Optional, Tuple
+import json
+import logging
+import os
+import time
+
+from pymongo import ReturnDocument
+
+from .metrics import RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get("RATE_LIMIT_MAX_BUCKETS", "100000"))
+SUBJECT_CACHE_SIZE = 10000
+WARNING_INTERVAL_SECONDS = 60.0
+OWN_COLLECTION = "rate_limits"
+
+# Route class -> (tokens per second, burst)
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "auth": (0.2, 10),
+    "analytics": (0.5, 5),
+    "market": (0.05, 3),
+    "write": (5, 20),
+    "read": (20, 60),
+}
+
+# (method, path without trailing slash) -> class; other requests are "read" or "write" by method
+ROUTE_CLASSES = {
+    ("POST", "/api/auth/login"): "auth",
+    ("POST", "/api/auth/register"): "auth",
+    ("GET", "/api/transactions/analytics"): "analytics",
+    ("GET", "/api/investments/performance"): "analytics",
+    ("GET", "/api/investments/risk"): "analytics",
+    ("POST", "/api/investments/update-prices"): "market",
+    ("POST", "/api/investments/seed-data"): "market",
+    ("POST", "/api/transactions/seed-data"): "market",
+    ("POST", "/api/jobs"): "market",
+}
+
+# Never limited: probes, scrapes and long-lived quote streams
+EXEMPT_PREFIXES = ("/api/health", "/api/investments/quotes/")
+
+TOO_MANY_REQUESTS = json.dumps({"detail": "Too many requests"}).encode()
+
+def parse_limits(spec: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    """``DEFAULT_LIMITS`` with the ``class=rate/burst`` overrides of ``spec`` applied"""
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            limit = (float(rate), float(burst))
+        except ValueError:
+            limit = None
+        if name not in limits or limit is None or limit[0] <= 0 or limit[1] < 1:
+            raise ValueError(f"Bad RATE_LIMITS entry {item!r}; expected <class>=<rate>/<burst> with class in "
+                             f"{', '.join(limits)}, rate > 0 and burst >= 1")
+        limits[name] = limit
+    return limits
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Class of a request, or None when it is not limited"""
+    if method == "OPTIONS" or not path.startswith("/api/") or path.startswith(EXEMPT_PREFIXES):
+        return None
+    found = ROUTE_CLASSES.get((method, path.rstrip("/")))
+    if found is not None:
+        return found
+    return "read" if method in ("GET", "HEAD") else "write"
+
+_subjects: Dict[bytes, Tuple[Optional[str], float]] = {}
+
+def _token_subject(token: bytes) -> Optional[str]:
+    """``sub`` of a bearer token; the signature is checked once per token, then cached until it expires"""
+    cached = _subjects.get(token)
+    if cached is not None:
+        if cached[1] > time.time():
+            return cached[0]
+        del _subjects[token]
+        return None
+
+    from jose import JWTError, jwt
+    from .controllers.auth_controller import ALGORITHM, SECRET_KEY
+
+    try:
+        payload = jwt.decode(token.decode(), SECRET_KEY, algorithms=[ALGORITHM])
+    except (JWTError, UnicodeDecodeError):
+        return None
+    subject, expires = payload.get("sub"), payload.get("exp")
+    if subject is None or expires is None:
+        return None
+    if len(_subjects) >= SUBJECT_CACHE_SIZE:
+        _subjects.clear()
+    _subjects[token] = (subject, float(expires))
+    return subject
+
+def request_subject(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            if value[:7].lower() == b"bearer ":
+                subject = _token_subject(value[7:])
+                if subject is not None:
+                    return "user:" + subject
+            break
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+class RateLimitBackend:
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """Take a token from bucket ``key``: 0 if one was available, else seconds until one is"""
+        raise NotImplementedError
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    def __init__(self, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self.buckets = {}  # key -> [tokens, updated_at, full_at]
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_buckets:
+                self._sweep(now)
+            bucket = self.buckets[key] = [burst, now, now]
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / rate
+        bucket[0], bucket[1], bucket[2] = tokens, now, now + (burst - tokens) / rate
+        return wait
+
+    def _sweep(self, now: float):
+        """Drop buckets that have refilled (the same as absent); all of them if none has"""
+        for key in [key for key, bucket in self.buckets.items() if bucket[2] <= now]:
+            del self.buckets[key]
+        if len(self.buckets) >= self.max_buckets:
+            logger.warning(f"{len(self.buckets)} rate limit buckets active, resetting them")
+            self.buckets.clear()
+
+class MongoRateLimitBackend(RateLimitBackend):
+    def __init__(self, db):
+        self.buckets = db[OWN_COLLECTION]
+        self.warned_at = float("-inf")
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        elapsed = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+        try:
+            bucket = await self.buckets.find_one_and_update(
+                {"_id": key},
+                [
+                    {"$set": {
+                        "tokens": {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed, rate]}]}]},
+                        "updated_at": "$$NOW",
+                    }},
+                    {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                    {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+                    # Once refilled the bucket is the same as absent, so the TTL index may drop it
+                    {"$set": {"expires_at": {"$add": ["$$NOW", {"$multiply": [{"$subtract": [burst, "$tokens"]}, 1000 / rate]}]}}},
+                ],
+                projection={"tokens": 1, "allowed": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            # Fail open: losing the limiter must not take the API down with it
+            if time.monotonic() - self.warned_at >= WARNING_INTERVAL_SECONDS:
+                self.warned_at = time.monotonic()
+                logger.warning(f"Rate limit store unavailable, requests not limited: {e}")
+            return 0.0
+        return 0.0 if bucket["allowed"] else (1 - bucket["tokens"]) / rate
+
+RATE_LIMIT_BACKENDS = {
+    "memory": lambda db: MemoryRateLimitBackend(),
+    "mongo": lambda db: MongoRateLimitBackend(db),
+}
+
+async def create_rate_limit_indexes(db):
+    await db[OWN_COLLECTION].create_index("expires_at", expireAfterSeconds=0)
+
+# Set by the app lifespan; the middleware lets everything through while it is None
+_backend: Optional[RateLimitBackend] = None
+_limits: Dict[str, Tuple[float, float]] = DEFAULT_LIMITS
+
+def start(db=None, backend: Optional[str] = None):
+    """Install the backend (default ``RATE_LIMIT_BACKEND``, ``memory``) and the ``RATE_LIMITS`` in effect"""
+    global _backend, _limits
+    backend = backend or os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    if backend not in RATE_LIMIT_BACKENDS:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND {backend!r}; expected one of {', '.join(RATE_LIMIT_BACKENDS)}")
+    if backend == "mongo" and db is None:
+        raise ValueError("RATE_LIMIT_BACKEND=mongo needs MongoDB (STORAGE_BACKEND=mongo)")
+    _limits = parse_limits(os.environ.get("RATE_LIMITS"))
+    _backend = RATE_LIMIT_BACKENDS[backend](db)
+
+def stop():
+    global _backend
+    _backend = None
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware; rejected requests are answered here, before routing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        backend = _backend
+        if scope["type"] != "http" or backend is None:
+            return await self.app(scope, receive, send)
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        rate, burst = _limits[name]
+        wait = await backend.take(f"{name}:{request_subject(scope)}", rate, burst)
+        if not wait:
+            return await self.app(scope, receive, send)
+
+        RATE_LIMITED.inc((name,))
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(TOO_MANY_REQUESTS)).encode()),
+                (b"retry-after", str(max(1, ceil(wait))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": TOO_MANY_REQUESTS})
@@ -0,0 +1,93 @@
+"""Data access for the request path: users, accounts, transactions, cards,
+investments and market prices.
+
+Controllers and the services they call go through ``Repositories``
+instead of collections, so a storage backend can be swapped in one place.
+``STORAGE_BACKEND`` selects it at startup:
+
+- ``mongo`` (default): Motor, see ``repositories.mongo``
+- ``memory``: in-process store with the same semantics, for CI and for
+  benchmarks that isolate Python-side cost; see ``repositories.memory``
+
+With ``MONGO_SHARDS`` (see ``backend.sharding``) there is one set of
+repositories per shard; ``for_shard`` picks the one holding a user's
+data, and ``users`` and ``market`` are the home shard's on all of them.
+
+``repositories.balance_cache`` wraps the account repository of either
+backend with a write-through balance cache (``BALANCE_CACHE_TTL_SECONDS=0``
+turns it off).
+
+Features built directly on MongoDB keep using ``get_database`` (or, for a
+user's data, ``auth_controller.get_user_database``) and answer 503 on
+memory: the job queue and everything queued on it (seed-data,
+transaction analytics), scheduled payments, risk and performance history
+(aggregation pipelines) and admin.
+"""
+from typing import Dict, Optional, Tuple
+import os
+
+from fastapi import HTTPException
+
+from ..sharding import HOME_SHARD, HashRing
+
+from .base import (
+    AccountRepository, CardRepository, InvestmentRepository, MarketRepository, Repositories, TransactionRepository,
+    UserRepository
+)
+from .memory import memory_repositories
+from .mongo import mongo_repositories
+
+STORAGE_BACKENDS = ("mongo", "memory")
+
+# Set by the app lifespan (set_repositories) for the process
+_repositories: Optional[Repositories] = None
+_analytics_repositories: Optional[Repositories] = None
+_shards: Dict[str, Tuple[Repositories, Repositories]] = {}
+_ring: Optional[HashRing] = None
+
+def storage_backend() -> str:
+    backend = os.environ.get("STORAGE_BACKEND", "mongo")
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected one of {', '.join(STORAGE_BACKENDS)}")
+    return backend
+
+def set_repositories(repositories: Repositories, analytics: Optional[Repositories] = None,
+                     shards: Optional[Dict[str, Tuple[Repositories, Repositories]]] = None,
+                     ring: Optional[HashRing] = None):
+    """Install the process-wide repositories.
+
+    ``repositories`` are the home shard's and ``analytics`` (default: the
+    same) serve its report reads; ``shards`` maps the other shard names to
+    their (repositories, analytics) pair, and ``ring`` places new users
+    (default: all on home).
+    """
+    global _repositories, _analytics_repositories, _shards, _ring
+    _repositories, _analytics_repositories = repositories, analytics or repositories
+    _shards = {HOME_SHARD: (_repositories, _analytics_repositories), **(shards or {})}
+    _ring = ring
+
+def clear_repositories():
+    global _repositories, _analytics_repositories, _shards, _ring
+    _repositories, _analytics_repositories, _shards, _ring = None, None, {}, None
+
+def for_shard(name: Optional[str], analytics: bool = False) -> Repositories:
+    """Repositories of shard ``name`` (None: home)"""
+    try:
+        pair = _shards[name or HOME_SHARD]
+    except KeyError:
+        raise HTTPException(status_code=503, detail="Storage not initialized" if not _shards else f"Unknown shard {name!r}")
+    return pair[1] if analytics else pair[0]
+
+def placement(user_id) -> str:
+    """Shard a new user's data goes to"""
+    return HOME_SHARD if _ring is None else _ring.owner(user_id)
+
+async def get_repositories() -> Repositories:
+    if _repositories is None:
+        raise HTTPException(status_code=503, detail="Storage not initialized")
+    return _repositories
+
+async def get_analytics_repositories() -> Repositories:
+    if _analytics_repositories is None:
+        raise HTTPException(status_code=503, detail="Storage not initialized")
+    return _analytics_repositories
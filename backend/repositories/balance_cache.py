@@ -0,0 +1,271 @@
+"""Write-through cache of account balances, per worker.
+
+``CachedAccountRepository`` sits in front of an ``AccountRepository``.
+Balance reads (``get_for_user`` with a projection of ``BALANCE_FIELDS``)
+are served from the cache and fall back to storage on a miss. Every
+posting path goes through ``apply_delta``, which stores the account as
+returned by the write.
+
+Writes made by other workers and processes (scheduler, jobs, other API
+workers) arrive through a ``BalanceChannel``:
+
+- ``change_stream``: a change stream on ``accounts`` (needs a replica set)
+- ``local``: in-process pub/sub, for the memory backend and tests
+
+A change invalidates the user's entry unless it carries exactly the
+balances already cached (the worker's own write, seen again).
+
+Staleness is bounded strictly:
+
+- Entries expire ``BALANCE_CACHE_TTL_SECONDS`` after they were stored,
+  even if a notification was lost.
+- While the channel is down, the cache is emptied and bypassed.
+- A fill that raced with a write or a change is dropped. Each entry has
+  a version that every write and invalidation bumps, and a fill only
+  lands if the version is unchanged since its read began.
+"""
+from collections import OrderedDict
+from typing import List, Optional
+import asyncio
+import logging
+import os
+import time
+
+from ..metrics import BALANCE_CACHE_INVALIDATIONS, BALANCE_CACHE_LOOKUPS
+from ..services.ledger import BALANCE_FIELDS, BALANCE_PROJECTION
+from .base import AccountRepository, Repositories
+
+logger = logging.getLogger(__name__)
+
+BALANCE_CACHE_TTL_SECONDS = float(os.environ.get("BALANCE_CACHE_TTL_SECONDS", "2"))
+BALANCE_CACHE_MAX_ENTRIES = int(os.environ.get("BALANCE_CACHE_MAX_ENTRIES", "100000"))
+CHANNEL_RETRY_SECONDS = 5.0
+
+class _Entry:
+    __slots__ = ("account", "account_id", "stored_at", "version")
+
+    def __init__(self):
+        self.account = None  # {"_id", *BALANCE_FIELDS}, or None when invalidated
+        self.account_id = None  # Once known, changes to this account are attributed to the user
+        self.stored_at = 0.0
+        self.version = 0
+
+class BalanceCache:
+    def __init__(self, ttl: float = BALANCE_CACHE_TTL_SECONDS, max_entries: int = BALANCE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # user_id -> _Entry, least recently used first
+        self.owners = {}  # account _id -> user_id, for changes that only name the account
+        self.unattributed = 0  # changes for accounts not in owners
+        self.live = False
+
+    def get(self, user_id) -> Optional[dict]:
+        entry = self.entries.get(user_id)
+        if entry is None or entry.account is None or time.monotonic() - entry.stored_at >= self.ttl:
+            return None
+        self.entries.move_to_end(user_id)
+        return entry.account
+
+    def _entry(self, user_id) -> _Entry:
+        entry = self.entries.get(user_id)
+        if entry is None:
+            entry = self.entries[user_id] = _Entry()
+            if len(self.entries) > self.max_entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.owners.pop(evicted.account_id, None)
+        return entry
+
+    def begin(self, user_id) -> tuple:
+        """Token for a fill; a write or invalidation of this user before ``fill`` voids it"""
+        entry = self._entry(user_id)
+        # Until the user's account is known, any change for an unknown account may be theirs
+        return entry.version, None if entry.account_id is not None else self.unattributed
+
+    def begin_write(self, user_id) -> tuple:
+        self.invalidate(user_id)
+        return self.begin(user_id)
+
+    def fill(self, user_id, account: dict, token: tuple):
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return
+        if entry.account_id is None:
+            entry.account_id = account["_id"]
+            self.owners[account["_id"]] = user_id
+        version, unattributed = token
+        if not self.live or entry.version != version or entry.account_id != account["_id"]:
+            return
+        if unattributed is not None and unattributed != self.unattributed:
+            return
+        entry.account = {"_id": account["_id"], **{field: account.get(field) for field in BALANCE_FIELDS}}
+        entry.stored_at = time.monotonic()
+
+    def invalidate(self, user_id):
+        entry = self.entries.get(user_id)
+        if entry is not None:
+            entry.account = None
+            entry.version += 1
+
+    def on_change(self, change: dict):
+        """Apply a change notification (``account_id``, optional ``user_id`` and balances)"""
+        user_id = change.get("user_id") or self.owners.get(change["account_id"])
+        if user_id is None:
+            self.unattributed += 1
+            return
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return
+        cached = entry.account
+        if (cached is not None and cached["_id"] == change["account_id"]
+                and cached["balance"] == change.get("balance")
+                and cached["available_balance"] == change.get("available_balance")):
+            return
+        if cached is not None:
+            BALANCE_CACHE_INVALIDATIONS.inc()
+        self.invalidate(user_id)
+
+    def resume(self):
+        self.live = True
+
+    def suspend(self):
+        """Notifications may be missed from now on: drop everything and bypass the cache"""
+        self.live = False
+        for entry in self.entries.values():
+            entry.account = None
+            entry.version += 1
+
+class BalanceChannel:
+    async def listen(self, cache: BalanceCache):
+        """Feed changes to ``cache.on_change``, calling ``cache.resume()`` once live"""
+        raise NotImplementedError
+
+    def publish(self, change: dict):
+        """Announce a write made through this process (a no-op where the database publishes)"""
+
+class ChangeStreamChannel(BalanceChannel):
+    PIPELINE = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+        {"$project": {
+            "documentKey": 1,
+            "fullDocument.user_id": 1,
+            "fullDocument.balance": 1,
+            "fullDocument.available_balance": 1,
+            "updateDescription.updatedFields.balance": 1,
+            "updateDescription.updatedFields.available_balance": 1,
+        }},
+    ]
+
+    def __init__(self, db):
+        self.db = db
+
+    async def listen(self, cache: BalanceCache):
+        async with self.db.accounts.watch(self.PIPELINE) as stream:
+            cache.resume()
+            async for event in stream:
+                fields = event.get("fullDocument") or event.get("updateDescription", {}).get("updatedFields", {})
+                cache.on_change({
+                    "account_id": event["documentKey"]["_id"],
+                    "user_id": fields.get("user_id"),
+                    "balance": fields.get("balance"),
+                    "available_balance": fields.get("available_balance"),
+                })
+
+class LocalChannel(BalanceChannel):
+    """In-process pub/sub standing in for a change stream"""
+
+    def __init__(self):
+        self.queues = set()
+
+    async def listen(self, cache: BalanceCache):
+        queue = asyncio.Queue()
+        self.queues.add(queue)
+        try:
+            cache.resume()
+            while True:
+                cache.on_change(await queue.get())
+        finally:
+            self.queues.discard(queue)
+
+    def publish(self, change: dict):
+        for queue in self.queues:
+            queue.put_nowait(change)
+
+BALANCE_CHANNELS = {
+    "change_stream": lambda db: ChangeStreamChannel(db),
+    "local": lambda db: LocalChannel(),
+}
+
+async def watch_balance_changes(cache: BalanceCache, channel: BalanceChannel, retry: float = CHANNEL_RETRY_SECONDS):
+    """Keep the cache fed from ``channel``; while it is down the cache is bypassed"""
+    reported = False
+    while True:
+        try:
+            await channel.listen(cache)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if cache.live or not reported:
+                logger.warning(f"Balance change channel down, cache bypassed: {e}")
+            reported = True
+        cache.suspend()
+        await asyncio.sleep(retry)
+
+class CachedAccountRepository(AccountRepository):
+    def __init__(self, accounts: AccountRepository, cache: BalanceCache, channel: BalanceChannel):
+        self.accounts = accounts
+        self.cache = cache
+        self.channel = channel
+
+    async def insert(self, account: dict):
+        account_id = await self.accounts.insert(account)
+        self.cache.invalidate(account["user_id"])
+        return account_id
+
+    async def list_for_user(self, user_id, limit: int = 100) -> List[dict]:
+        return await self.accounts.list_for_user(user_id, limit)
+
+    async def get_for_user(self, user_id, projection: Optional[dict] = None) -> Optional[dict]:
+        fields = [field for field, include in (projection or {}).items() if include and field != "_id"]
+        if projection is None or not self.cache.live or not set(fields) <= set(BALANCE_FIELDS):
+            BALANCE_CACHE_LOOKUPS.inc(("bypass",))
+            return await self.accounts.get_for_user(user_id, projection)
+
+        account = self.cache.get(user_id)
+        if account is None:
+            BALANCE_CACHE_LOOKUPS.inc(("miss",))
+            token = self.cache.begin(user_id)
+            account = await self.accounts.get_for_user(user_id, BALANCE_PROJECTION)
+            if account is None:
+                return None
+            self.cache.fill(user_id, account, token)
+        else:
+            BALANCE_CACHE_LOOKUPS.inc(("hit",))
+        return {"_id": account["_id"], **{field: account[field] for field in fields}}
+
+    async def apply_delta(self, user_id, delta: float, minimum_balance: Optional[float] = None,
+                          posting_key: Optional[str] = None) -> Optional[dict]:
+        token = self.cache.begin_write(user_id)
+        account = await self.accounts.apply_delta(user_id, delta, minimum_balance, posting_key)
+        if account is not None:
+            self.cache.fill(user_id, account, token)
+            self.channel.publish({
+                "account_id": account["_id"],
+                "user_id": user_id,
+                "balance": account["balance"],
+                "available_balance": account["available_balance"],
+            })
+        return account
+
+def enable_balance_cache(repos: Repositories, db=None, channel: Optional[str] = None) -> Optional[asyncio.Task]:
+    """Put the cache in front of ``repos.accounts``; returns the task feeding it (None when disabled).
+
+    ``channel`` defaults to ``BALANCE_CACHE_CHANNEL``, else ``change_stream``
+    with a database and ``local`` without one.
+    """
+    if BALANCE_CACHE_TTL_SECONDS <= 0:
+        return None
+    channel = channel or os.environ.get("BALANCE_CACHE_CHANNEL") or ("change_stream" if db is not None else "local")
+    cache = BalanceCache()
+    listener = BALANCE_CHANNELS[channel](db)
+    repos.accounts = CachedAccountRepository(repos.accounts, cache, listener)
+    return asyncio.create_task(watch_balance_changes(cache, listener))
@@ -0,0 +1,172 @@
+from datetime import datetime
+from typing import List, Optional
+
+class UserRepository:
+    async def get(self, user_id) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def find_by_cpf(self, cpf: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def insert(self, user: dict):
+        """Store a user (``cpf`` and ``email`` are unique); returns its ``_id``"""
+        raise NotImplementedError
+
+class AccountRepository:
+    async def insert(self, account: dict):
+        """Store an account (``account_number`` is unique); returns its ``_id``"""
+        raise NotImplementedError
+
+    async def list_for_user(self, user_id, limit: int = 100) -> List[dict]:
+        raise NotImplementedError
+
+    async def get_for_user(self, user_id, projection: Optional[dict] = None) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def apply_delta(self, user_id, delta: float, minimum_balance: Optional[float] = None,
+                          posting_key: Optional[str] = None) -> Optional[dict]:
+        """Add ``delta`` to the balance of an account of the user holding at least ``minimum_balance``.
+
+        One atomic conditional update. Returns ``_id``, ``account_number``
+        and the new ``balance`` and ``available_balance``, or None when no
+        account matches. With ``posting_key`` the key is added to the
+        account's ``posting_keys`` (the last ``POSTING_KEYS_KEPT``) in the
+        same update, and an account already holding it does not match.
+        """
+        raise NotImplementedError
+
+class TransactionRepository:
+    async def insert(self, transaction: dict):
+        """Store a transaction; returns its ``_id``"""
+        raise NotImplementedError
+
+    async def list_for_user(self, user_id, skip: int = 0, limit: int = 50, category: Optional[str] = None,
+                            transaction_type: Optional[str] = None) -> List[dict]:
+        """Newest first"""
+        raise NotImplementedError
+
+    async def in_range(self, user_id, start: datetime, end: datetime, limit: int) -> List[dict]:
+        """Transactions dated within ``[start, end]``, at most ``limit``"""
+        raise NotImplementedError
+
+    async def find_by_posting_key(self, posting_key: str) -> Optional[dict]:
+        """The transaction posted with ``posting_key`` (unique), if any"""
+        raise NotImplementedError
+
+class CardRepository:
+    async def provision(self, card: dict):
+        """Store ``card`` unless the user already has one with that ``card_name``"""
+        raise NotImplementedError
+
+    async def list_for_user(self, user_id, projection: Optional[dict] = None, limit: int = 10) -> List[dict]:
+        raise NotImplementedError
+
+    async def charge(self, card_id, user_id, amount: float) -> Optional[dict]:
+        """Move ``amount`` from the available limit to the open invoice if the limit covers it.
+
+        One atomic conditional update. Returns ``_id``, ``current_balance``,
+        ``available_limit`` and ``next_closing_date`` after the charge, or
+        None when no active card of the user has the limit.
+        """
+        raise NotImplementedError
+
+    async def invoices(self, card_id, user_id, limit: int) -> List[dict]:
+        """Closed invoices of a card, newest first"""
+        raise NotImplementedError
+
+class InvestmentRepository:
+    """Holdings (positions and symbol-less holdings) and the FIFO lots of positions"""
+
+    async def get_active(self, investment_id, user_id, projection: Optional[dict] = None) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def list_active(self, user_id, projection: Optional[dict] = None, limit: int = 100) -> List[dict]:
+        """Newest first"""
+        raise NotImplementedError
+
+    async def insert(self, holding: dict):
+        """Store a symbol-less holding; returns its ``_id``"""
+        raise NotImplementedError
+
+    async def add_to_position(self, user_id, investment_type: str, asset_name: str, symbol: str, quantity: float,
+                              price: float, now: datetime) -> dict:
+        """Add quantity and cost to the user's position in ``symbol``, opening it if needed.
+
+        One atomic upsert; a position reopened after a full sale starts over
+        at this purchase. May raise ``DuplicateKeyError`` when a concurrent
+        buy opened the position first. Returns the position after the update.
+        """
+        raise NotImplementedError
+
+    async def reserve(self, investment_id, user_id, quantity: float, now: datetime) -> Optional[dict]:
+        """Take ``quantity`` off an active holding if it has that much, atomically.
+
+        Returns the holding as it was before, or None when none matches.
+        """
+        raise NotImplementedError
+
+    async def relieve_cost(self, investment_id, cost: float, purchase_date: Optional[datetime], now: datetime) -> dict:
+        """Take ``cost`` off the cost basis, closing the position if nothing is left.
+
+        ``purchase_date`` (the oldest open lot's, if any) becomes the
+        position's. Returns the holding after the update.
+        """
+        raise NotImplementedError
+
+    async def set_accrued_value(self, investment_id, accrued_value: float):
+        raise NotImplementedError
+
+    async def insert_lot(self, lot: dict):
+        raise NotImplementedError
+
+    async def oldest_open_lot(self, position_id) -> Optional[dict]:
+        """The open lot bought first, with ``remaining``, ``price`` and ``purchase_date``"""
+        raise NotImplementedError
+
+    async def draw_from_lot(self, lot_id, expected_remaining: float, disposal: dict) -> bool:
+        """Take ``disposal["quantity"]`` from a lot if it still has ``expected_remaining`` (compare-and-set)"""
+        raise NotImplementedError
+
+    async def restore_lots(self, position_id, redemption: str) -> float:
+        """Undo the lot draws tagged with ``redemption``; returns the quantity put back"""
+        raise NotImplementedError
+
+    async def restore_holding(self, investment_id, quantity: float, cost: float, accrued_value: Optional[float]):
+        """Add back quantity, cost basis and (CDBs) accrued value taken by a sale; ``relieve_cost`` then reopens it"""
+        raise NotImplementedError
+
+    async def lots(self, position_id, user_id, projection: Optional[dict] = None) -> List[dict]:
+        """All lots of a position, oldest first"""
+        raise NotImplementedError
+
+    async def portfolio_facets(self, user_id, snapshot) -> dict:
+        """``totals`` (zero or one row) and ``by_type`` rows of the user's active holdings valued at ``snapshot``"""
+        raise NotImplementedError
+
+class MarketRepository:
+    async def current_prices(self) -> dict:
+        """Symbol -> current price"""
+        raise NotImplementedError
+
+    async def quotes(self) -> dict:
+        """Symbol -> full quote"""
+        raise NotImplementedError
+
+    async def seed(self):
+        """Add the mock quotes for symbols not listed yet"""
+        raise NotImplementedError
+
+class Repositories:
+    """The repositories one storage backend provides, passed around as a unit"""
+
+    def __init__(self, users: UserRepository, accounts: AccountRepository, transactions: TransactionRepository,
+                 cards: CardRepository, investments: InvestmentRepository, market: MarketRepository):
+        self.users = users
+        self.accounts = accounts
+        self.transactions = transactions
+        self.cards = cards
+        self.investments = investments
+        self.market = market
@@ -0,0 +1,421 @@
+"""Repositories held in process memory, for CI and for benchmarks that
+should measure the Python side of a request without a database.
+
+They keep MongoDB's semantics where the request path relies on them:
+
+- Conditional updates are atomic. Every method does its reads and writes
+  without awaiting in between, so no other task on the event loop can
+  interleave; the state is per process, like a single ``mongod``.
+- Unique indexes (user CPF and email, account number, one card per
+  product, one position per symbol, transaction posting key) raise
+  ``DuplicateKeyError``.
+- Sorted reads walk ``SortedIndex`` keys instead of sorting on every call.
+- Documents are copied on the way in and out, so callers never share
+  state with the store, and ``str`` enums are stored as their values.
+
+Invoices are written by the billing close job, which runs on MongoDB
+only, so the memory store never has any.
+"""
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from ..services.ledger import BALANCE_PROJECTION, POSTING_KEYS_KEPT
+from ..services.positions import QUANTITY_EPSILON
+from ..services.pricing import MOCK_CRYPTO_DATA, mock_quote
+from ..services.valuation import value_holdings
+from .base import (
+    AccountRepository, CardRepository, InvestmentRepository, MarketRepository, Repositories, TransactionRepository,
+    UserRepository
+)
+
+# Upper bound for the ``_id`` half of index keys, for inclusive range ends
+_MAX_ID = ObjectId("f" * 24)
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def _project(document: dict, projection: Optional[dict]) -> dict:
+    """Copy of ``document`` with only the fields of an inclusion projection (and ``_id``)"""
+    if projection is None:
+        return _clone(document)
+    projected = {"_id": document["_id"]} if projection.get("_id", 1) else {}
+    for field, include in projection.items():
+        if include and field != "_id" and field in document:
+            projected[field] = _clone(document[field])
+    return projected
+
+def _stored(document: dict) -> dict:
+    """Copy of ``document`` to store, given an ``_id`` (set on the caller's dict too, as insert_one does)"""
+    if document.get("_id") is None:
+        document["_id"] = ObjectId()
+    return _clone(document)
+
+class SortedIndex:
+    """``(value, _id)`` keys kept sorted, for ordered and range scans"""
+
+    def __init__(self):
+        self.keys = []
+
+    def add(self, value, document_id):
+        insort(self.keys, (value, document_id))
+
+    def scan(self, low=None, high=None, reverse: bool = False):
+        """``_id`` of the entries with ``low <= value <= high``, in value order"""
+        start = 0 if low is None else bisect_left(self.keys, (low,))
+        end = len(self.keys) if high is None else bisect_right(self.keys, (high, _MAX_ID))
+        keys = self.keys[start:end]
+        return [document_id for _, document_id in (reversed(keys) if reverse else keys)]
+
+def _duplicate(index: str, key) -> DuplicateKeyError:
+    return DuplicateKeyError(f"E11000 duplicate key error index: {index} dup key: {key!r}", 11000)
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.users = {}
+        self.by_cpf = {}
+        self.by_email = {}
+
+    async def get(self, user_id) -> Optional[dict]:
+        user = self.users.get(user_id)
+        return None if user is None else _clone(user)
+
+    async def find_by_cpf(self, cpf: str) -> Optional[dict]:
+        return await self.get(self.by_cpf.get(cpf))
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        return await self.get(self.by_email.get(email))
+
+    async def insert(self, user: dict):
+        if user["cpf"] in self.by_cpf:
+            raise _duplicate("cpf_1", user["cpf"])
+        if user["email"] in self.by_email:
+            raise _duplicate("email_1", user["email"])
+        stored = _stored(user)
+        self.users[stored["_id"]] = stored
+        self.by_cpf[stored["cpf"]] = stored["_id"]
+        self.by_email[stored["email"]] = stored["_id"]
+        return stored["_id"]
+
+class MemoryAccountRepository(AccountRepository):
+    def __init__(self):
+        self.accounts = {}
+        self.by_user = {}
+        self.by_number = {}
+
+    def _for_user(self, user_id) -> List[dict]:
+        return [self.accounts[account_id] for account_id in self.by_user.get(user_id, ())]
+
+    async def insert(self, account: dict):
+        if account["account_number"] in self.by_number:
+            raise _duplicate("account_number_1", account["account_number"])
+        stored = _stored(account)
+        self.accounts[stored["_id"]] = stored
+        self.by_user.setdefault(stored["user_id"], []).append(stored["_id"])
+        self.by_number[stored["account_number"]] = stored["_id"]
+        return stored["_id"]
+
+    async def list_for_user(self, user_id, limit: int = 100) -> List[dict]:
+        return [_clone(account) for account in self._for_user(user_id)[:limit]]
+
+    async def get_for_user(self, user_id, projection: Optional[dict] = None) -> Optional[dict]:
+        accounts = self._for_user(user_id)
+        return _project(accounts[0], projection) if accounts else None
+
+    async def apply_delta(self, user_id, delta: float, minimum_balance: Optional[float] = None,
+                          posting_key: Optional[str] = None) -> Optional[dict]:
+        for account in self._for_user(user_id):
+            if minimum_balance is not None and account.get("balance", 0) < minimum_balance:
+                continue
+            if posting_key is not None and posting_key in account.get("posting_keys", ()):
+                continue
+            account["balance"] = account.get("balance", 0) + delta
+            account["available_balance"] = account.get("available_balance", 0) + delta
+            account["updated_at"] = datetime.utcnow()
+            if posting_key is not None:
+                account["posting_keys"] = (account.get("posting_keys", []) + [posting_key])[-POSTING_KEYS_KEPT:]
+            return _project(account, BALANCE_PROJECTION)
+        return None
+
+class MemoryTransactionRepository(TransactionRepository):
+    def __init__(self):
+        self.transactions = {}
+        # user_id -> transaction_date index, like {user_id: 1, transaction_date: -1}
+        self.by_user = {}
+        # Unique where set, like the partial index on posting_key
+        self.by_posting_key = {}
+
+    async def insert(self, transaction: dict):
+        posting_key = transaction.get("posting_key")
+        if posting_key is not None and posting_key in self.by_posting_key:
+            raise _duplicate("posting_key_1", posting_key)
+        stored = _stored(transaction)
+        self.transactions[stored["_id"]] = stored
+        if posting_key is not None:
+            self.by_posting_key[posting_key] = stored["_id"]
+        self.by_user.setdefault(stored["user_id"], SortedIndex()).add(stored["transaction_date"], stored["_id"])
+        return stored["_id"]
+
+    async def list_for_user(self, user_id, skip: int = 0, limit: int = 50, category: Optional[str] = None,
+                            transaction_type: Optional[str] = None) -> List[dict]:
+        index = self.by_user.get(user_id)
+        if index is None:
+            return []
+        found = []
+        for transaction_id in index.scan(reverse=True):
+            transaction = self.transactions[transaction_id]
+            if category and transaction["category"] != category:
+                continue
+            if transaction_type and transaction["transaction_type"] != transaction_type:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            found.append(_clone(transaction))
+            if len(found) == limit:
+                break
+        return found
+
+    async def in_range(self, user_id, start: datetime, end: datetime, limit: int) -> List[dict]:
+        index = self.by_user.get(user_id)
+        if index is None:
+            return []
+        return [_clone(self.transactions[transaction_id]) for transaction_id in index.scan(start, end)[:limit]]
+
+    async def find_by_posting_key(self, posting_key: str) -> Optional[dict]:
+        transaction_id = self.by_posting_key.get(posting_key)
+        return _clone(self.transactions[transaction_id]) if transaction_id is not None else None
+
+class MemoryCardRepository(CardRepository):
+    def __init__(self):
+        self.cards = {}
+        self.by_user = {}
+        self.by_product = {}
+
+    async def provision(self, card: dict):
+        key = (card["user_id"], card["card_name"])
+        if key in self.by_product:
+            return
+        stored = _stored(dict(card))
+        self.cards[stored["_id"]] = stored
+        self.by_user.setdefault(stored["user_id"], []).append(stored["_id"])
+        self.by_product[key] = stored["_id"]
+
+    async def list_for_user(self, user_id, projection: Optional[dict] = None, limit: int = 10) -> List[dict]:
+        return [_project(self.cards[card_id], projection) for card_id in self.by_user.get(user_id, ())[:limit]]
+
+    async def charge(self, card_id, user_id, amount: float) -> Optional[dict]:
+        card = self.cards.get(card_id)
+        if card is None or card["user_id"] != user_id or card.get("is_active") is not True or card.get("available_limit", 0) < amount:
+            return None
+        card["current_balance"] = card.get("current_balance", 0) + amount
+        card["available_limit"] -= amount
+        return _project(card, {"current_balance": 1, "available_limit": 1, "next_closing_date": 1})
+
+    async def invoices(self, card_id, user_id, limit: int) -> List[dict]:
+        return []
+
+class MemoryInvestmentRepository(InvestmentRepository):
+    def __init__(self):
+        self.investments = {}
+        self.by_user = {}
+        # (user_id, symbol) -> position, unique like the partial index on symbol strings
+        self.positions = {}
+        self.lots_by_id = {}
+        # position_id -> purchase_date index of its lots
+        self.lots_by_position = {}
+
+    def _active(self, investment_id, user_id) -> Optional[dict]:
+        holding = self.investments.get(investment_id)
+        if holding is None or holding["user_id"] != user_id or holding.get("is_active") is not True:
+            return None
+        return holding
+
+    def _store(self, holding: dict) -> dict:
+        symbol = holding.get("symbol")
+        if isinstance(symbol, str) and (holding["user_id"], symbol) in self.positions:
+            raise _duplicate("user_id_1_symbol_1", (holding["user_id"], symbol))
+        stored = _stored(holding)
+        self.investments[stored["_id"]] = stored
+        self.by_user.setdefault(stored["user_id"], []).append(stored["_id"])
+        if isinstance(symbol, str):
+            self.positions[(stored["user_id"], symbol)] = stored["_id"]
+        return stored
+
+    async def get_active(self, investment_id, user_id, projection: Optional[dict] = None) -> Optional[dict]:
+        holding = self._active(investment_id, user_id)
+        return None if holding is None else _project(holding, projection)
+
+    async def list_active(self, user_id, projection: Optional[dict] = None, limit: int = 100) -> List[dict]:
+        holdings = [self.investments[investment_id] for investment_id in self.by_user.get(user_id, ())]
+        holdings = [holding for holding in holdings if holding.get("is_active") is True]
+        holdings.sort(key=lambda holding: holding["created_at"], reverse=True)
+        return [_project(holding, projection) for holding in holdings[:limit]]
+
+    async def insert(self, holding: dict):
+        return self._store(holding)["_id"]
+
+    async def add_to_position(self, user_id, investment_type: str, asset_name: str, symbol: str, quantity: float,
+                              price: float, now: datetime) -> dict:
+        position_id = self.positions.get((user_id, symbol))
+        if position_id is None:
+            position = self._store({"user_id": user_id, "symbol": symbol})
+        else:
+            position = self.investments[position_id]
+        held = position.get("quantity") or 0
+        is_open = held > QUANTITY_EPSILON
+        position.update(
+            investment_type=_clone(investment_type),
+            asset_name=asset_name,
+            # A position reopened after a full sale starts over at this lot
+            purchase_date=position["purchase_date"] if is_open else now,
+            quantity=held + quantity,
+            total_invested=(position["total_invested"] if is_open else 0) + quantity * price,
+            created_at=position.get("created_at") or now,
+            updated_at=now,
+            is_active=True,
+        )
+        position["purchase_price"] = position["total_invested"] / position["quantity"]
+        return _clone(position)
+
+    async def reserve(self, investment_id, user_id, quantity: float, now: datetime) -> Optional[dict]:
+        holding = self._active(investment_id, user_id)
+        if holding is None or holding["quantity"] < quantity - QUANTITY_EPSILON:
+            return None
+        before = _clone(holding)
+        holding["quantity"] = max(holding["quantity"] - quantity, 0)
+        holding["updated_at"] = now
+        return before
+
+    async def relieve_cost(self, investment_id, cost: float, purchase_date: Optional[datetime], now: datetime) -> dict:
+        holding = self.investments.get(investment_id)
+        if holding is None:
+            return None
+        is_open = holding["quantity"] > QUANTITY_EPSILON
+        holding["total_invested"] = max(holding["total_invested"] - cost, 0) if is_open else 0
+        if purchase_date:
+            holding["purchase_date"] = purchase_date
+        holding["updated_at"] = now
+        holding["is_active"] = is_open
+        if is_open:
+            holding["purchase_price"] = holding["total_invested"] / holding["quantity"]
+        return _clone(holding)
+
+    async def set_accrued_value(self, investment_id, accrued_value: float):
+        if investment_id in self.investments:
+            self.investments[investment_id]["accrued_value"] = accrued_value
+
+    async def insert_lot(self, lot: dict):
+        stored = _stored(lot)
+        self.lots_by_id[stored["_id"]] = stored
+        self.lots_by_position.setdefault(stored["position_id"], SortedIndex()).add(stored["purchase_date"], stored["_id"])
+        return stored["_id"]
+
+    def _lots(self, position_id) -> List[dict]:
+        index = self.lots_by_position.get(position_id)
+        return [] if index is None else [self.lots_by_id[lot_id] for lot_id in index.scan()]
+
+    async def oldest_open_lot(self, position_id) -> Optional[dict]:
+        for lot in self._lots(position_id):
+            if lot["remaining"] > QUANTITY_EPSILON:
+                return _project(lot, {"remaining": 1, "price": 1, "purchase_date": 1})
+        return None
+
+    async def draw_from_lot(self, lot_id, expected_remaining: float, disposal: dict) -> bool:
+        lot = self.lots_by_id.get(lot_id)
+        if lot is None or lot["remaining"] != expected_remaining:
+            return False
+        lot["remaining"] -= disposal["quantity"]
+        lot.setdefault("disposals", []).append(_clone(disposal))
+        return True
+
+    async def restore_lots(self, position_id, redemption: str) -> float:
+        restored = 0.0
+        for lot in self._lots(position_id):
+            drawn = [d for d in lot.get("disposals", ()) if d.get("redemption") == redemption]
+            if drawn:
+                quantity = sum(d["quantity"] for d in drawn)
+                lot["remaining"] += quantity
+                lot["disposals"] = [d for d in lot["disposals"] if d.get("redemption") != redemption]
+                restored += quantity
+        return restored
+
+    async def restore_holding(self, investment_id, quantity: float, cost: float, accrued_value: Optional[float]):
+        holding = self.investments.get(investment_id)
+        if holding is None:
+            return
+        holding["quantity"] = holding.get("quantity", 0) + quantity
+        holding["total_invested"] = holding.get("total_invested", 0) + cost
+        if accrued_value is not None:
+            holding["accrued_value"] = holding.get("accrued_value", 0) + accrued_value
+
+    async def lots(self, position_id, user_id, projection: Optional[dict] = None) -> List[dict]:
+        return [_project(lot, projection) for lot in self._lots(position_id) if lot["user_id"] == user_id]
+
+    async def portfolio_facets(self, user_id, snapshot) -> dict:
+        holdings = [self.investments[investment_id] for investment_id in self.by_user.get(user_id, ())]
+        holdings = [holding for holding in holdings if holding.get("is_active") is True]
+        if not holdings:
+            return {"totals": [], "by_type": []}
+
+        valued = value_holdings(holdings, snapshot)
+        groups = {}
+        for holding, invested, current_value in zip(holdings, valued["invested"].tolist(), valued["current_value"].tolist()):
+            group = groups.setdefault(holding["investment_type"], {"invested": 0.0, "current_value": 0.0, "count": 0})
+            group["invested"] += invested
+            group["current_value"] += current_value
+            group["count"] += 1
+
+        def with_profit_loss(row: dict) -> dict:
+            row["profit_loss"] = row["current_value"] - row["invested"]
+            row["profit_loss_percentage"] = row["profit_loss"] / row["invested"] * 100 if row["invested"] > 0 else 0
+            return row
+
+        totals = {
+            "invested": sum(group["invested"] for group in groups.values()),
+            "current_value": sum(group["current_value"] for group in groups.values()),
+        }
+        return {
+            "totals": [with_profit_loss(totals)],
+            "by_type": [with_profit_loss({"type": name, **groups[name]}) for name in sorted(groups)],
+        }
+
+class MemoryMarketRepository(MarketRepository):
+    def __init__(self):
+        self.market_prices = {}
+        self._seed()
+
+    def _seed(self):
+        now = datetime.utcnow()
+        for crypto in MOCK_CRYPTO_DATA:
+            self.market_prices.setdefault(crypto["symbol"], {"_id": crypto["symbol"], **mock_quote(crypto, now)})
+
+    async def current_prices(self) -> dict:
+        return {symbol: quote["current_price"] for symbol, quote in self.market_prices.items()}
+
+    async def quotes(self) -> dict:
+        return {symbol: _clone(quote) for symbol, quote in self.market_prices.items()}
+
+    async def seed(self):
+        self._seed()
+
+def memory_repositories() -> Repositories:
+    """A fresh, empty store (apart from the mock market quotes)"""
+    return Repositories(
+        users=MemoryUserRepository(),
+        accounts=MemoryAccountRepository(),
+        transactions=MemoryTransactionRepository(),
+        cards=MemoryCardRepository(),
+        investments=MemoryInvestmentRepository(),
+        market=MemoryMarketRepository(),
+    )
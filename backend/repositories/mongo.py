@@ -0,0 +1,261 @@
+"""Repositories over MongoDB (Motor).
+
+Conditional updates are single ``find_one_and_update`` calls whose filter
+carries the condition, so they stay atomic across workers.
+"""
+from datetime import datetime
+from typing import List, Optional
+
+from pymongo import ReturnDocument
+
+from ..services.cards import provision_upsert
+from ..services.ledger import BALANCE_PROJECTION, POSTING_KEYS_KEPT
+from ..services.positions import QUANTITY_EPSILON
+from ..services.pricing import get_quotes, seed_price_table
+from ..services.valuation import portfolio_summary_pipeline
+from .base import (
+    AccountRepository, CardRepository, InvestmentRepository, MarketRepository, Repositories, TransactionRepository,
+    UserRepository
+)
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, db):
+        self.users = db.users
+
+    async def get(self, user_id) -> Optional[dict]:
+        return await self.users.find_one({"_id": user_id})
+
+    async def find_by_cpf(self, cpf: str) -> Optional[dict]:
+        return await self.users.find_one({"cpf": cpf})
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        return await self.users.find_one({"email": email})
+
+    async def insert(self, user: dict):
+        return (await self.users.insert_one(user)).inserted_id
+
+class MongoAccountRepository(AccountRepository):
+    def __init__(self, db):
+        self.accounts = db.accounts
+
+    async def insert(self, account: dict):
+        return (await self.accounts.insert_one(account)).inserted_id
+
+    async def list_for_user(self, user_id, limit: int = 100) -> List[dict]:
+        return await self.accounts.find({"user_id": user_id}).to_list(limit)
+
+    async def get_for_user(self, user_id, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.accounts.find_one({"user_id": user_id}, projection)
+
+    async def apply_delta(self, user_id, delta: float, minimum_balance: Optional[float] = None,
+                          posting_key: Optional[str] = None) -> Optional[dict]:
+        account_filter = {"user_id": user_id}
+        if minimum_balance is not None:
+            account_filter["balance"] = {"$gte": minimum_balance}
+        update = {
+            "$inc": {"balance": delta, "available_balance": delta},
+            "$set": {"updated_at": datetime.utcnow()}
+        }
+        if posting_key is not None:
+            account_filter["posting_keys"] = {"$ne": posting_key}
+            update["$push"] = {"posting_keys": {"$each": [posting_key], "$slice": -POSTING_KEYS_KEPT}}
+        return await self.accounts.find_one_and_update(
+            account_filter,
+            update,
+            projection=BALANCE_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+
+class MongoTransactionRepository(TransactionRepository):
+    def __init__(self, db):
+        self.transactions = db.transactions
+
+    async def insert(self, transaction: dict):
+        return (await self.transactions.insert_one(transaction)).inserted_id
+
+    async def list_for_user(self, user_id, skip: int = 0, limit: int = 50, category: Optional[str] = None,
+                            transaction_type: Optional[str] = None) -> List[dict]:
+        query = {"user_id": user_id}
+        if category:
+            query["category"] = category
+        if transaction_type:
+            query["transaction_type"] = transaction_type
+        return await self.transactions.find(query).sort("transaction_date", -1).skip(skip).limit(limit).to_list(limit)
+
+    async def in_range(self, user_id, start: datetime, end: datetime, limit: int) -> List[dict]:
+        return await self.transactions.find({
+            "user_id": user_id,
+            "transaction_date": {"$gte": start, "$lte": end}
+        }).to_list(limit)
+
+    async def find_by_posting_key(self, posting_key: str) -> Optional[dict]:
+        return await self.transactions.find_one({"posting_key": posting_key})
+
+class MongoCardRepository(CardRepository):
+    def __init__(self, db):
+        self.credit_cards = db.credit_cards
+        self.invoices_collection = db.invoices
+
+    async def provision(self, card: dict):
+        key, update = provision_upsert(card)
+        await self.credit_cards.update_one(key, update, upsert=True)
+
+    async def list_for_user(self, user_id, projection: Optional[dict] = None, limit: int = 10) -> List[dict]:
+        return await self.credit_cards.find({"user_id": user_id}, projection).to_list(limit)
+
+    async def charge(self, card_id, user_id, amount: float) -> Optional[dict]:
+        return await self.credit_cards.find_one_and_update(
+            {"_id": card_id, "user_id": user_id, "is_active": True, "available_limit": {"$gte": amount}},
+            {"$inc": {"current_balance": amount, "available_limit": -amount}},
+            projection={"current_balance": 1, "available_limit": 1, "next_closing_date": 1},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def invoices(self, card_id, user_id, limit: int) -> List[dict]:
+        return await self.invoices_collection.find(
+            {"card_id": card_id, "user_id": user_id}
+        ).sort("period_end", -1).limit(limit).to_list(limit)
+
+class MongoInvestmentRepository(InvestmentRepository):
+    def __init__(self, db):
+        self.investments = db.investments
+        self.investment_lots = db.investment_lots
+
+    async def get_active(self, investment_id, user_id, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.investments.find_one({"_id": investment_id, "user_id": user_id, "is_active": True}, projection)
+
+    async def list_active(self, user_id, projection: Optional[dict] = None, limit: int = 100) -> List[dict]:
+        return await self.investments.find(
+            {"user_id": user_id, "is_active": True}, projection
+        ).sort("created_at", -1).to_list(limit)
+
+    async def insert(self, holding: dict):
+        return (await self.investments.insert_one(holding)).inserted_id
+
+    async def add_to_position(self, user_id, investment_type: str, asset_name: str, symbol: str, quantity: float,
+                              price: float, now: datetime) -> dict:
+        cost = quantity * price
+        held = {"$ifNull": ["$quantity", 0]}
+        return await self.investments.find_one_and_update(
+            {"user_id": user_id, "symbol": symbol},
+            [
+                {"$set": {
+                    "investment_type": {"$literal": investment_type},
+                    "asset_name": {"$literal": asset_name},
+                    # A position reopened after a full sale starts over at this lot
+                    "purchase_date": {"$cond": [{"$gt": [held, QUANTITY_EPSILON]}, "$purchase_date", now]},
+                    "quantity": {"$add": [held, quantity]},
+                    "total_invested": {"$add": [{"$cond": [{"$gt": [held, QUANTITY_EPSILON]}, "$total_invested", 0]}, cost]},
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "updated_at": now,
+                    "is_active": True,
+                }},
+                {"$set": {"purchase_price": {"$divide": ["$total_invested", "$quantity"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def reserve(self, investment_id, user_id, quantity: float, now: datetime) -> Optional[dict]:
+        return await self.investments.find_one_and_update(
+            {"_id": investment_id, "user_id": user_id, "is_active": True, "quantity": {"$gte": quantity - QUANTITY_EPSILON}},
+            [{"$set": {"quantity": {"$max": [{"$subtract": ["$quantity", quantity]}, 0]}, "updated_at": now}}],
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def relieve_cost(self, investment_id, cost: float, purchase_date: Optional[datetime], now: datetime) -> dict:
+        is_open = {"$gt": ["$quantity", QUANTITY_EPSILON]}
+        return await self.investments.find_one_and_update(
+            {"_id": investment_id},
+            [
+                {"$set": {
+                    "total_invested": {"$cond": [is_open, {"$max": [{"$subtract": ["$total_invested", cost]}, 0]}, 0]},
+                    "purchase_date": purchase_date or "$purchase_date",
+                    "updated_at": now,
+                }},
+                {"$set": {
+                    "is_active": is_open,
+                    "purchase_price": {"$cond": [is_open, {"$divide": ["$total_invested", "$quantity"]}, "$purchase_price"]},
+                }}
+            ],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def set_accrued_value(self, investment_id, accrued_value: float):
+        await self.investments.update_one({"_id": investment_id}, {"$set": {"accrued_value": accrued_value}})
+
+    async def insert_lot(self, lot: dict):
+        return (await self.investment_lots.insert_one(lot)).inserted_id
+
+    async def oldest_open_lot(self, position_id) -> Optional[dict]:
+        return await self.investment_lots.find_one(
+            {"position_id": position_id, "remaining": {"$gt": QUANTITY_EPSILON}},
+            {"remaining": 1, "price": 1, "purchase_date": 1},
+            sort=[("purchase_date", 1), ("_id", 1)]
+        )
+
+    async def draw_from_lot(self, lot_id, expected_remaining: float, disposal: dict) -> bool:
+        result = await self.investment_lots.update_one(
+            {"_id": lot_id, "remaining": expected_remaining},
+            {"$inc": {"remaining": -disposal["quantity"]}, "$push": {"disposals": disposal}}
+        )
+        return result.modified_count > 0
+
+    async def restore_lots(self, position_id, redemption: str) -> float:
+        restored = 0.0
+        async for lot in self.investment_lots.find(
+            {"position_id": position_id, "disposals.redemption": redemption}, {"disposals": 1}
+        ):
+            quantity = sum(d["quantity"] for d in lot["disposals"] if d.get("redemption") == redemption)
+            # Matching on the tag makes a repeated restore a no-op
+            result = await self.investment_lots.update_one(
+                {"_id": lot["_id"], "disposals.redemption": redemption},
+                {"$inc": {"remaining": quantity}, "$pull": {"disposals": {"redemption": redemption}}}
+            )
+            restored += quantity * result.modified_count
+        return restored
+
+    async def restore_holding(self, investment_id, quantity: float, cost: float, accrued_value: Optional[float]):
+        increments = {"quantity": quantity, "total_invested": cost}
+        if accrued_value is not None:
+            increments["accrued_value"] = accrued_value
+        await self.investments.update_one({"_id": investment_id}, {"$inc": increments})
+
+    async def lots(self, position_id, user_id, projection: Optional[dict] = None) -> List[dict]:
+        return await self.investment_lots.find(
+            {"position_id": position_id, "user_id": user_id}, projection
+        ).sort("purchase_date", 1).to_list(None)
+
+    async def portfolio_facets(self, user_id, snapshot) -> dict:
+        # Valued and grouped server-side; only the summary rows come back
+        result = await self.investments.aggregate(portfolio_summary_pipeline(user_id, snapshot)).to_list(1)
+        return result[0] if result else {"totals": [], "by_type": []}
+
+class MongoMarketRepository(MarketRepository):
+    def __init__(self, db):
+        self.db = db
+
+    async def current_prices(self) -> dict:
+        quotes = await self.db.market_prices.find({}, {"current_price": 1}).to_list(None)
+        return {quote["_id"]: quote["current_price"] for quote in quotes}
+
+    async def quotes(self) -> dict:
+        return await get_quotes(self.db)
+
+    async def seed(self):
+        await seed_price_table(self.db)
+
+def mongo_repositories(db, home=None) -> Repositories:
+    """Repositories over shard ``db``, with users and market prices from ``home`` (default: ``db``).
+
+    Pass ``database.analytics(db)`` for secondary reads.
+    """
+    home = db if home is None else home
+    return Repositories(
+        users=MongoUserRepository(home),
+        accounts=MongoAccountRepository(db),
+        transactions=MongoTransactionRepository(db),
+        cards=MongoCardRepository(db),
+        investments=MongoInvestmentRepository(db),
+        market=MongoMarketRepository(home),
+    )
@@ -0,0 +1,192 @@
+"""Production server launcher.
+
+Runs a pool of uvicorn worker processes (one per CPU by default, or
+``WEB_CONCURRENCY``) on one listening socket bound by this supervisor.
+Workers use uvloop and httptools when they are installed. Each worker
+runs the app's lifespan (Mongo pool opened, price snapshot loaded)
+before it starts accepting connections.
+
+Signals:
+
+- ``HUP``: rolling reload. A new generation of workers is started and
+  only once every new worker is ready are the old ones asked to stop.
+- ``TERM`` / ``INT``: graceful stop. Workers stop accepting, finish
+  in-flight requests (up to ``--graceful-timeout``) and exit.
+
+Workers that die are replaced.
+
+    python -m backend.serve --host 0.0.0.0 --port 8001 --workers 4
+"""
+from importlib.util import find_spec
+from typing import List, Optional, Tuple
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+
+import uvicorn
+
+from .logs import setup_logging
+
+logger = logging.getLogger(__name__)
+
+APP = "backend.server:app"
+READY_TIMEOUT_SECONDS = 60.0
+RESPAWN_DELAY_SECONDS = 1.0
+
+# spawn, not fork: every worker (and every reload generation) imports the code afresh
+_context = multiprocessing.get_context("spawn")
+
+def default_workers() -> int:
+    return int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+def worker_config(args) -> dict:
+    return {
+        "loop": "uvloop" if find_spec("uvloop") else "asyncio",
+        "http": "httptools" if find_spec("httptools") else "h11",
+        "lifespan": "on",
+        "access_log": args.access_log,
+        "backlog": args.backlog,
+        "timeout_keep_alive": args.keep_alive,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+        "proxy_headers": True,
+        "forwarded_allow_ips": os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+    }
+
+class ReadyServer(uvicorn.Server):
+    """Signals the supervisor once lifespan startup is done and the socket is being served"""
+
+    def __init__(self, config: uvicorn.Config, ready):
+        super().__init__(config)
+        self.ready = ready
+
+    async def startup(self, sockets=None):
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            self.ready.set()
+
+def run_worker(config: dict, sock: socket.socket, ready):
+    server = ReadyServer(uvicorn.Config(APP, **config), ready)
+    server.run(sockets=[sock])
+
+class Supervisor:
+    def __init__(self, args):
+        self.args = args
+        self.config = worker_config(args)
+        self.sock: Optional[socket.socket] = None
+        self.workers: List[Tuple[multiprocessing.Process, object]] = []
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET6 if ":" in self.args.host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.args.host, self.args.port))
+        sock.listen(self.args.backlog)
+        sock.set_inheritable(True)
+        return sock
+
+    def spawn(self) -> Tuple[multiprocessing.Process, object]:
+        ready = _context.Event()
+        process = _context.Process(target=run_worker, args=(self.config, self.sock, ready), daemon=False)
+        process.start()
+        return process, ready
+
+    def wait_ready(self, workers: list, timeout: float = READY_TIMEOUT_SECONDS) -> bool:
+        deadline = time.monotonic() + timeout
+        for process, ready in workers:
+            while not ready.wait(0.1):
+                if not process.is_alive() or time.monotonic() > deadline or self.stop_requested:
+                    return False
+        return True
+
+    def stop(self, workers: list, timeout: Optional[float] = None):
+        """SIGTERM, so uvicorn drains in-flight requests; kill whatever is left after the grace period"""
+        timeout = self.args.graceful_timeout + 5 if timeout is None else timeout
+        for process, _ in workers:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process, _ in workers:
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"Worker {process.pid} did not drain in time; killing it")
+                process.kill()
+                process.join()
+
+    def reload(self):
+        logger.info(f"Reloading: starting {self.args.workers} new workers")
+        new = [self.spawn() for _ in range(self.args.workers)]
+        if not self.wait_ready(new):
+            logger.error("New workers failed to become ready; keeping the current generation")
+            self.stop(new, timeout=5)
+            return
+        old, self.workers = self.workers, new
+        self.stop(old)
+        logger.info("Reload complete")
+
+    def reap(self):
+        for i, (process, ready) in enumerate(self.workers):
+            if not process.is_alive() and not self.stop_requested:
+                logger.warning(f"Worker {process.pid} exited with {process.exitcode}; replacing it")
+                time.sleep(RESPAWN_DELAY_SECONDS)
+                self.workers[i] = self.spawn()
+
+    def run(self):
+        self.sock = self.bind()
+        # Workers share metrics through snapshot files (see backend.metrics)
+        metrics_dir = os.environ.get("METRICS_DIR")
+        own_metrics_dir = not metrics_dir
+        if own_metrics_dir:
+            metrics_dir = os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="banksys-metrics-")
+        else:
+            os.makedirs(metrics_dir, exist_ok=True)
+            for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+                os.remove(path)
+        signal.signal(signal.SIGHUP, lambda *_: setattr(self, "reload_requested", True))
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, "stop_requested", True))
+        signal.signal(signal.SIGINT, lambda *_: setattr(self, "stop_requested", True))
+
+        started = time.perf_counter()
+        self.workers = [self.spawn() for _ in range(self.args.workers)]
+        if self.wait_ready(self.workers):
+            logger.info(
+                f"{self.args.workers} workers ready on {self.args.host}:{self.args.port} "
+                f"in {time.perf_counter() - started:.1f}s (loop={self.config['loop']}, http={self.config['http']})"
+            )
+
+        while not self.stop_requested:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+            self.reap()
+            time.sleep(0.5)
+
+        logger.info("Stopping workers")
+        self.stop(self.workers)
+        self.sock.close()
+        if own_metrics_dir:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API on a pool of worker processes")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5, help="Idle keep-alive timeout in seconds")
+    parser.add_argument("--graceful-timeout", type=int, default=30, help="Seconds a stopping worker may spend draining")
+    parser.add_argument("--access-log", action="store_true")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    Supervisor(args).run()
+
+if __name__ == "__main__":
+    main()
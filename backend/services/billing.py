@@ -0,0 +1,195 @@
+from datetime import datetime, timedelta
+from typing import Optional
+import argparse
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLOSING_DAY = 5
+DUE_DAYS_AFTER_CLOSING = 10
+MINIMUM_PAYMENT_RATE = 0.15  # 15% of the closed invoice
+MINIMUM_PAYMENT_FLOOR = 25.0
+
+CLOSE_CHUNK_SIZE = 5000
+CLOSE_CONCURRENCY = 8
+
+class CardLimitExceeded(Exception):
+    pass
+
+def next_closing_date(after: datetime, closing_day: int = DEFAULT_CLOSING_DAY) -> datetime:
+    """First closing date (midnight of ``closing_day``) strictly after ``after``"""
+    closing_day = min(max(closing_day, 1), 28)
+    candidate = datetime(after.year, after.month, closing_day)
+    if candidate <= after:
+        year, month = (after.year + 1, 1) if after.month == 12 else (after.year, after.month + 1)
+        candidate = datetime(year, month, closing_day)
+    return candidate
+
+def minimum_payment(invoice_total: float) -> float:
+    if invoice_total <= 0:
+        return 0.0
+    return round(min(invoice_total, max(invoice_total * MINIMUM_PAYMENT_RATE, MINIMUM_PAYMENT_FLOOR)), 2)
+
+def billing_fields(now: datetime, closing_day: int = DEFAULT_CLOSING_DAY) -> dict:
+    """Initial billing state for a freshly issued card"""
+    closing = next_closing_date(now, closing_day)
+    return {
+        "current_balance": 0.0,
+        "statement_balance": 0.0,
+        "minimum_payment": 0.0,
+        "closing_day": closing_day,
+        "cycle_start": now,
+        "next_closing_date": closing,
+        "due_date": closing + timedelta(days=DUE_DAYS_AFTER_CLOSING),
+    }
+
+async def create_billing_indexes(db):
+    await db.credit_cards.create_index("next_closing_date")
+    await db.invoices.create_index([("card_id", 1), ("period_end", 1)], unique=True)
+    await db.invoices.create_index([("user_id", 1), ("period_end", -1)])
+    await db.transactions.create_index([("card_id", 1), ("transaction_date", -1)], sparse=True)
+
+async def post_card_purchase(
+    repos,
+    user_id,
+    card_id,
+    amount: float,
+    description: str,
+    merchant_name: Optional[str] = None,
+    category: str = "other"
+) -> dict:
+    """Charge a purchase to a card's open invoice.
+
+    The limit check and the invoice total update are one conditional
+    update (``CardRepository.charge``), so concurrent purchases can never
+    overdraw the limit.
+    """
+    now = datetime.utcnow()
+    card = await repos.cards.charge(card_id, user_id, amount)
+    if card is None:
+        raise CardLimitExceeded()
+
+    transaction = {
+        "user_id": user_id,
+        "card_id": card_id,
+        "transaction_type": "card_purchase",
+        "category": category,
+        "amount": amount,
+        "description": description,
+        "merchant_name": merchant_name,
+        "transaction_date": now,
+        "created_at": now,
+        "status": "completed",
+        "invoice_closing_date": card.get("next_closing_date"),
+    }
+    transaction["_id"] = await repos.transactions.insert(transaction)
+    transaction["card"] = card
+    return transaction
+
+def _close_operations(cards: list, as_of: datetime):
+    invoice_ops = []
+    card_ops = []
+    for card in cards:
+        period_end = card["next_closing_date"]
+        total = round(card.get("current_balance", 0.0), 2)
+        minimum = minimum_payment(total)
+        due_date = period_end + timedelta(days=DUE_DAYS_AFTER_CLOSING)
+
+        invoice_ops.append(UpdateOne(
+            {"card_id": card["_id"], "period_end": period_end},
+            {"$setOnInsert": {
+                "user_id": card["user_id"],
+                "period_start": card.get("cycle_start"),
+                "total": total,
+                "minimum_payment": minimum,
+                "due_date": due_date,
+                "status": "closed",
+                "created_at": as_of,
+            }},
+            upsert=True
+        ))
+        # Guarded by the closing date so a re-run never closes the same cycle twice;
+        # $inc (not $set 0) keeps purchases that raced with the close in the next cycle.
+        card_ops.append(UpdateOne(
+            {"_id": card["_id"], "next_closing_date": period_end},
+            {
+                "$inc": {"current_balance": -total},
+                "$set": {
+                    "statement_balance": total,
+                    "minimum_payment": minimum,
+                    "due_date": due_date,
+                    "cycle_start": period_end,
+                    "next_closing_date": next_closing_date(period_end, card.get("closing_day", DEFAULT_CLOSING_DAY)),
+                },
+            }
+        ))
+    return invoice_ops, card_ops
+
+async def _close_chunk(db, cards: list, as_of: datetime, semaphore: asyncio.Semaphore) -> int:
+    try:
+        invoice_ops, card_ops = _close_operations(cards, as_of)
+        await db.invoices.bulk_write(invoice_ops, ordered=False)
+        result = await db.credit_cards.bulk_write(card_ops, ordered=False)
+        return result.modified_count
+    finally:
+        semaphore.release()
+
+async def close_billing_cycles(
+    db,
+    as_of: Optional[datetime] = None,
+    chunk_size: int = CLOSE_CHUNK_SIZE,
+    concurrency: int = CLOSE_CONCURRENCY
+) -> int:
+    """Close every card cycle due on or before ``as_of``.
+
+    Due cards are streamed with a narrow projection and closed in chunks;
+    each chunk is two unordered bulk writes and up to ``concurrency``
+    chunks are in flight at once.
+    """
+    as_of = as_of or datetime.utcnow()
+    semaphore = asyncio.Semaphore(concurrency)
+    cursor = db.credit_cards.find(
+        {"next_closing_date": {"$lte": as_of}, "is_active": True},
+        {"user_id": 1, "current_balance": 1, "cycle_start": 1, "next_closing_date": 1, "closing_day": 1},
+        batch_size=chunk_size
+    )
+
+    tasks = []
+    chunk = []
+    async for card in cursor:
+        chunk.append(card)
+        if len(chunk) >= chunk_size:
+            # Acquiring before spawning bounds memory: the cursor waits for a free slot
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(_close_chunk(db, chunk, as_of, semaphore)))
+            chunk = []
+    if chunk:
+        await semaphore.acquire()
+        tasks.append(asyncio.create_task(_close_chunk(db, chunk, as_of, semaphore)))
+
+    closed = sum(await asyncio.gather(*tasks))
+    logger.info(f"Closed {closed} billing cycles due by {as_of.isoformat()}")
+    return closed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Close credit card billing cycles due by a given date")
+    parser.add_argument("--date", type=datetime.fromisoformat, default=None, help="ISO date, defaults to now")
+    parser.add_argument("--chunk-size", type=int, default=CLOSE_CHUNK_SIZE)
+    parser.add_argument("--concurrency", type=int, default=CLOSE_CONCURRENCY)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from ..database import connect, fan_out
+    connect()
+
+    async def main():
+        # Cards and invoices live on the shard of their user
+        await fan_out(create_billing_indexes)
+        await fan_out(close_billing_cycles, args.date, args.chunk_size, args.concurrency)
+
+    asyncio.run(main())
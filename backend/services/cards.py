@@ -0,0 +1,107 @@
+from datetime import datetime
+import argparse
+import asyncio
+import logging
+import random
+
+from pymongo import UpdateOne
+
+from .billing import billing_fields, create_billing_indexes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CARD_NAME = "BankSys Platinum"
+DEFAULT_CREDIT_LIMIT = 5000.0
+
+# Fields returned by the card read path (keeps documents small on the wire)
+CREDIT_CARD_PROJECTION = {
+    "card_number": 1,
+    "card_name": 1,
+    "credit_limit": 1,
+    "available_limit": 1,
+    "current_balance": 1,
+    "due_date": 1,
+    "minimum_payment": 1,
+}
+
+def default_credit_card(user_id) -> dict:
+    """Build the default card issued to every new customer"""
+    now = datetime.utcnow()
+    return {
+        "user_id": user_id,
+        "card_number": f"**** **** **** {random.randint(1000, 9999)}",
+        "card_name": DEFAULT_CARD_NAME,
+        "credit_limit": DEFAULT_CREDIT_LIMIT,
+        "available_limit": DEFAULT_CREDIT_LIMIT,
+        "created_at": now,
+        "is_active": True,
+        **billing_fields(now)
+    }
+
+def provision_upsert(card: dict):
+    """Filter/update pair inserting ``card`` unless present, keyed by (user_id, card_name)"""
+    card = dict(card)
+    key = {"user_id": card.pop("user_id"), "card_name": card.pop("card_name")}
+    return key, {"$setOnInsert": card}
+
+async def provision_credit_card(repos, user_id):
+    """Provision the default card for a user; safe to call more than once"""
+    await repos.cards.provision(default_credit_card(user_id))
+
+async def create_credit_card_indexes(db):
+    # Uniqueness guard: concurrent provisioning can never create duplicate cards
+    await db.credit_cards.create_index([("user_id", 1), ("card_name", 1)], unique=True)
+    await create_billing_indexes(db)
+
+async def backfill_credit_cards(db, batch_size: int = 1000, shards=None) -> int:
+    """Provision the default card for every existing user, in batches.
+
+    Users are walked in ``_id`` order so the scan can resume cheaply and
+    each batch is one unordered ``bulk_write`` of upserts per shard
+    (``shards``, a ``ShardMap``; default: everything on ``db``). Users
+    being moved between shards are skipped; run the backfill again after
+    the rebalance.
+    """
+    databases = shards.databases if shards is not None else {None: db}
+    for shard_db in databases.values():
+        await create_credit_card_indexes(shard_db)
+
+    provisioned = 0
+    last_id = None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        users = await db.users.find(query, {"_id": 1, "shard": 1, "moving_to": 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not users:
+            break
+
+        by_shard = {}
+        for user in users:
+            if user.get("moving_to"):
+                logger.info(f"Skipping user {user['_id']}, moving to shard {user['moving_to']}")
+                continue
+            shard_db = shards.database(user.get("shard")) if shards is not None else db
+            by_shard.setdefault(id(shard_db), (shard_db, []))[1].append(
+                UpdateOne(*provision_upsert(default_credit_card(user["_id"])), upsert=True)
+            )
+        created = 0
+        for shard_db, requests in by_shard.values():
+            created += (await shard_db.credit_cards.bulk_write(requests, ordered=False)).upserted_count
+        provisioned += created
+        last_id = users[-1]["_id"]
+        logger.info(f"Backfill batch done: {len(users)} users scanned, {created} cards created")
+
+    return provisioned
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Provision default credit cards for existing users")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from .. import database
+    db = database.connect()
+
+    created = asyncio.run(backfill_credit_cards(db, batch_size=args.batch_size, shards=database.shards))
+    logger.info(f"Backfill complete: {created} credit cards provisioned")
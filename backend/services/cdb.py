@@ -0,0 +1,195 @@
+"""CDB interest accrual.
+
+Accrued value is computed in closed form from the business days elapsed
+since purchase (B3 calendar: weekends and national holidays), so a
+holding can be valued on any date without replaying daily steps:
+
+- prefixed: ``principal * (1 + rate) ** (du / 252)``
+- postfixed: ``principal * (1 + pct * ((1 + cdi) ** (1 / 252) - 1)) ** du``
+
+The daily job stores the result on every active CDB with bulk writes:
+
+    python -m backend.services.cdb
+"""
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Optional
+import argparse
+import asyncio
+import calendar
+import logging
+import os
+
+import numpy as np
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+BUSINESS_DAYS_PER_YEAR = 252
+CDI_ANNUAL_RATE = float(os.environ.get("CDI_ANNUAL_RATE", "12.5"))  # % a.a.
+ACCRUAL_BATCH_SIZE = 5000
+
+# Offered CDBs; cdi_percentage is set for postfixed products only
+MOCK_CDB_OPTIONS = [
+    {"id": "cdb_001", "name": "CDB Prefixado 100% CDI", "bank_name": "BankSys", "interest_rate": 12.5, "cdi_percentage": None, "minimum_investment": 1000.0, "maturity_months": 12, "type": "prefixed", "description": "Rendimento garantido de 12,5% ao ano"},
+    {"id": "cdb_002", "name": "CDB Pós-fixado 110% CDI", "bank_name": "BankSys", "interest_rate": 13.75, "cdi_percentage": 110.0, "minimum_investment": 5000.0, "maturity_months": 24, "type": "postfixed", "description": "Rendimento atrelado a 110% do CDI"},
+    {"id": "cdb_003", "name": "CDB Premium 120% CDI", "bank_name": "BankSys", "interest_rate": 15.0, "cdi_percentage": 120.0, "minimum_investment": 10000.0, "maturity_months": 36, "type": "postfixed", "description": "Nosso melhor CDB com 120% do CDI"},
+]
+CDB_OPTIONS_BY_ID = {option["id"]: option for option in MOCK_CDB_OPTIONS}
+
+# Regressive income tax on fixed income: (max calendar days held, rate)
+INCOME_TAX_BRACKETS = [(180, 0.225), (360, 0.20), (720, 0.175), (None, 0.15)]
+
+ACCRUAL_PROJECTION = {
+    "total_invested": 1,
+    "purchase_date": 1,
+    "maturity_date": 1,
+    "interest_rate": 1,
+    "cdi_percentage": 1,
+}
+
+def _easter(year: int) -> date:
+    # Anonymous Gregorian algorithm
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def national_holidays(first_year: int, last_year: int) -> list:
+    holidays = []
+    for year in range(first_year, last_year + 1):
+        easter = _easter(year)
+        holidays += [date(year, month, day) for month, day in ((1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (12, 25))]
+        if year >= 2024:
+            holidays.append(date(year, 11, 20))
+        holidays += [easter - timedelta(days=48), easter - timedelta(days=47), easter - timedelta(days=2), easter + timedelta(days=60)]
+    return holidays
+
+@lru_cache(maxsize=None)
+def business_calendar() -> np.busdaycalendar:
+    # Built on first use rather than at import, to keep app startup short
+    return np.busdaycalendar(holidays=np.array(national_holidays(2000, 2100), dtype="datetime64[D]"))
+
+def business_days(start, end) -> np.ndarray:
+    """Business days in ``[start, end)``; arrays of dates or datetimes, vectorized"""
+    start = np.asarray(start, dtype="datetime64[D]")
+    end = np.asarray(end, dtype="datetime64[D]")
+    return np.busday_count(start, np.maximum(start, end), busdaycal=business_calendar())
+
+def accrual_factor(days: np.ndarray, interest_rate: np.ndarray, cdi_percentage: np.ndarray, cdi_rate: float = CDI_ANNUAL_RATE) -> np.ndarray:
+    """Gross growth factor after ``days`` business days.
+
+    Rates are percentages; ``cdi_percentage`` is NaN for prefixed CDBs,
+    which accrue at ``interest_rate`` a.a. instead.
+    """
+    days = np.asarray(days, dtype=float)
+    prefixed = np.isnan(cdi_percentage)
+    daily_cdi = (1 + cdi_rate / 100) ** (1 / BUSINESS_DAYS_PER_YEAR) - 1
+    with np.errstate(invalid="ignore"):
+        pre = (1 + np.nan_to_num(interest_rate) / 100) ** (days / BUSINESS_DAYS_PER_YEAR)
+        post = (1 + daily_cdi * np.nan_to_num(cdi_percentage) / 100) ** days
+    return np.where(prefixed, pre, post)
+
+def income_tax_rate(calendar_days: np.ndarray) -> np.ndarray:
+    calendar_days = np.asarray(calendar_days)
+    limits = np.array([limit for limit, _ in INCOME_TAX_BRACKETS[:-1]])
+    rates = np.array([rate for _, rate in INCOME_TAX_BRACKETS])
+    return rates[np.searchsorted(limits, calendar_days, side="left")]
+
+def add_months(moment: datetime, months: int) -> datetime:
+    year, month = divmod(moment.month - 1 + months, 12)
+    year, month = moment.year + year, month + 1
+    return moment.replace(year=year, month=month, day=min(moment.day, calendar.monthrange(year, month)[1]))
+
+def cdb_terms(option_id: str, purchase_date: datetime) -> dict:
+    """Fields stored on a CDB holding bought from one of the offered options"""
+    option = CDB_OPTIONS_BY_ID[option_id]
+    return {
+        "interest_rate": option["interest_rate"],
+        "cdi_percentage": option["cdi_percentage"],
+        "maturity_date": add_months(purchase_date, option["maturity_months"]),
+    }
+
+def accrue(holdings: list, as_of: datetime) -> np.ndarray:
+    """Accrued gross value of each CDB holding on ``as_of`` (accrual stops at maturity)"""
+    n = len(holdings)
+    principal = np.fromiter((h["total_invested"] for h in holdings), dtype=float, count=n)
+    purchased = np.array([h["purchase_date"] for h in holdings], dtype="datetime64[D]")
+    maturity = np.array([h.get("maturity_date") or as_of for h in holdings], dtype="datetime64[D]")
+    rate = np.array([h.get("interest_rate") for h in holdings], dtype=float)
+    pct = np.array([h.get("cdi_percentage") for h in holdings], dtype=float)
+    # Holdings without terms accrue at the prefixed rate of the base product
+    rate = np.where(np.isnan(rate) & np.isnan(pct), MOCK_CDB_OPTIONS[0]["interest_rate"], rate)
+
+    days = business_days(purchased, np.minimum(maturity, np.datetime64(as_of, "D")))
+    return principal * accrual_factor(days, rate, pct)
+
+async def accrue_all(db, as_of: Optional[datetime] = None, batch_size: int = ACCRUAL_BATCH_SIZE) -> int:
+    """Store today's accrued value on every active CDB, one bulk write per batch"""
+    as_of = as_of or datetime.utcnow()
+    updated = 0
+    cursor = db.investments.find({"investment_type": "cdb", "is_active": True}, ACCRUAL_PROJECTION).batch_size(batch_size)
+    batch = []
+    async for holding in cursor:
+        batch.append(holding)
+        if len(batch) >= batch_size:
+            updated += await _write_accruals(db, batch, as_of)
+            batch = []
+    if batch:
+        updated += await _write_accruals(db, batch, as_of)
+    return updated
+
+async def _write_accruals(db, holdings: list, as_of: datetime) -> int:
+    values = accrue(holdings, as_of).tolist()
+    result = await db.investments.bulk_write([
+        UpdateOne({"_id": h["_id"]}, {"$set": {"accrued_value": value, "accrued_at": as_of}})
+        for h, value in zip(holdings, values)
+    ], ordered=False)
+    return result.modified_count
+
+def simulate_returns(amount: float, months: int, start: Optional[datetime] = None) -> list:
+    """Projected gross and net (after income tax) outcome of every option, vectorized"""
+    start = start or datetime.utcnow()
+    end = add_months(start, months)
+    rate = np.array([option["interest_rate"] for option in MOCK_CDB_OPTIONS], dtype=float)
+    pct = np.array([option["cdi_percentage"] for option in MOCK_CDB_OPTIONS], dtype=float)
+    days = int(business_days(start, end))
+
+    gross = amount * accrual_factor(np.full(len(rate), days), rate, pct)
+    tax = (gross - amount) * income_tax_rate((end - start).days)
+    net = gross - tax
+    return [
+        {
+            "option_id": option["id"],
+            "name": option["name"],
+            "amount": amount,
+            "months": months,
+            "business_days": days,
+            "gross_value": gross_value,
+            "income_tax": income_tax,
+            "net_value": net_value,
+            "net_return_percentage": (net_value - amount) / amount * 100 if amount else 0.0,
+            "eligible": amount >= option["minimum_investment"],
+        }
+        for option, gross_value, income_tax, net_value in zip(MOCK_CDB_OPTIONS, gross.tolist(), tax.tolist(), net.tolist())
+    ]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accrue interest on every active CDB")
+    parser.add_argument("--batch-size", type=int, default=ACCRUAL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from ..database import connect, fan_out
+    connect()
+
+    updated = sum(asyncio.run(fan_out(accrue_all, batch_size=args.batch_size)).values())
+    logger.info(f"Accrued {updated} CDB holdings")
@@ -0,0 +1,212 @@
+"""Bank-wide portfolio revaluation and exposure report.
+
+Streams every active holding in projected raw batches, revalues them in
+vectorized form against one price snapshot and aggregates exposure per
+symbol, per ``InvestmentType`` and per user. The ``investments``
+collection of every shard is split into ``_id`` ranges scanned in
+parallel by a process pool; each worker keeps only running aggregates,
+so memory is bounded by the chunk size and the number of customers, not
+by the number of holdings.
+
+    python -m backend.services.exposure --processes 8
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional
+import argparse
+import logging
+import multiprocessing
+import os
+import time
+
+import bson
+import numpy as np
+import pandas as pd
+from pymongo import MongoClient
+
+from ..database import analytics
+from ..sharding import shard_addresses
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 100_000
+SAMPLE_SIZE = 2000  # _id sample used to cut the collection into even ranges
+USER_EXPOSURE_WRITE_BATCH = 10_000
+
+HOLDING_FIELDS = ("user_id", "investment_type", "symbol", "quantity", "purchase_price", "total_invested", "accrued_value")
+SUM_COLUMNS = ["quantity", "invested", "current_value", "holdings"]
+
+def _partition_bounds(collection, partitions: int) -> list:
+    """(lo, hi) ``_id`` ranges of roughly equal size, from a random sample"""
+    if partitions <= 1:
+        return [(None, None)]
+    sample = sorted(doc["_id"] for doc in collection.aggregate([
+        {"$match": {"is_active": True}},
+        {"$sample": {"size": SAMPLE_SIZE}},
+        {"$project": {"_id": 1}}
+    ]))
+    if not sample:
+        return [(None, None)]
+    cuts = [sample[len(sample) * i // partitions] for i in range(1, partitions)]
+    edges = [None] + sorted(set(cuts)) + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def _frame(docs: list, prices: dict) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(docs, columns=["_id", *HOLDING_FIELDS])
+    market_price = frame["symbol"].map(prices)
+    # Holdings without a market price are carried at their accrued (CDB) or purchase price
+    book_price = (frame["accrued_value"].astype(float) / frame["quantity"]).fillna(frame["purchase_price"])
+    current_price = market_price.fillna(book_price).to_numpy(dtype=float)
+    return pd.DataFrame({
+        "user_id": frame["user_id"],
+        "investment_type": frame["investment_type"].astype("category"),
+        "symbol": frame["symbol"].fillna("").astype("category"),
+        "quantity": frame["quantity"].to_numpy(dtype=float),
+        "invested": frame["total_invested"].to_numpy(dtype=float),
+        "current_value": frame["quantity"].to_numpy(dtype=float) * current_price,
+        "holdings": np.ones(len(frame), dtype=np.int64),
+    })
+
+def _aggregate(frame: pd.DataFrame, key: str) -> pd.DataFrame:
+    return frame.groupby(key, observed=True, sort=False)[SUM_COLUMNS].sum()
+
+def _combine(parts: list, key: str) -> pd.DataFrame:
+    if not parts:
+        return pd.DataFrame(columns=SUM_COLUMNS)
+    return pd.concat(parts).groupby(level=0, sort=False)[SUM_COLUMNS].sum().rename_axis(key)
+
+def _scan_partition(mongo_url: str, db_name: str, lo, hi, prices: dict, chunk_size: int) -> dict:
+    """Scan one ``_id`` range; returns partial aggregates (runs in a pool process)"""
+    client = MongoClient(mongo_url)
+    query = {"is_active": True}
+    id_range = {}
+    if lo is not None:
+        id_range["$gte"] = lo
+    if hi is not None:
+        id_range["$lt"] = hi
+    if id_range:
+        query["_id"] = id_range
+
+    by_symbol, by_type, by_user = [], [], []
+    cursor = analytics(client[db_name]).investments.find_raw_batches(
+        query, {field: 1 for field in HOLDING_FIELDS}, batch_size=chunk_size
+    )
+    pending = []
+    for raw_batch in cursor:
+        pending.extend(bson.decode_all(raw_batch))
+        if len(pending) >= chunk_size:
+            frame = _frame(pending, prices)
+            pending = []
+            by_symbol.append(_aggregate(frame, "symbol"))
+            by_type.append(_aggregate(frame, "investment_type"))
+            # Compact per-user partials as we go to keep memory flat
+            by_user = [_combine(by_user + [_aggregate(frame, "user_id")], "user_id")]
+    if pending:
+        frame = _frame(pending, prices)
+        by_symbol.append(_aggregate(frame, "symbol"))
+        by_type.append(_aggregate(frame, "investment_type"))
+        by_user.append(_aggregate(frame, "user_id"))
+
+    client.close()
+    return {
+        "symbol": _combine(by_symbol, "symbol"),
+        "investment_type": _combine(by_type, "investment_type"),
+        "user_id": _combine(by_user, "user_id"),
+    }
+
+def _with_profit_loss(frame: pd.DataFrame) -> pd.DataFrame:
+    frame = frame.copy()
+    frame["profit_loss"] = frame["current_value"] - frame["invested"]
+    invested = frame["invested"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame["profit_loss_percentage"] = np.where(invested > 0, frame["profit_loss"].to_numpy(dtype=float) / invested * 100, 0.0)
+    frame["holdings"] = frame["holdings"].astype(np.int64)
+    return frame
+
+def _records(frame: pd.DataFrame, key: str) -> list:
+    # NumPy scalars are not BSON-encodable; unwrap them to plain Python values
+    return [
+        {column: value.item() if isinstance(value, np.generic) else value for column, value in row.items()}
+        for row in frame.reset_index().rename(columns={"index": key}).to_dict("records")
+    ]
+
+def build_exposure_report(
+    mongo_url: str,
+    db_name: str,
+    processes: int = os.cpu_count() or 1,
+    chunk_size: int = CHUNK_SIZE,
+    report_date: Optional[datetime] = None
+) -> dict:
+    """Revalue every active holding of every shard and store the per-symbol/type/user aggregates on home"""
+    started = time.perf_counter()
+    report_date = report_date or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    client = MongoClient(mongo_url)
+    db = analytics(client[db_name])
+
+    # One snapshot for the whole run so every holding is valued at the same prices
+    prices = {quote["_id"]: quote["current_price"] for quote in db.market_prices.find({}, {"current_price": 1})}
+    args = []
+    for shard_url, shard_db_name in shard_addresses(mongo_url, db_name).values():
+        shard_client = MongoClient(shard_url)
+        bounds = _partition_bounds(analytics(shard_client[shard_db_name]).investments, processes)
+        shard_client.close()
+        args += [(shard_url, shard_db_name, lo, hi, prices, chunk_size) for lo, hi in bounds]
+
+    if processes > 1:
+        # spawn, not fork: the parent already holds a MongoClient, which is not fork-safe
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            partials = list(pool.map(_scan_partition, *zip(*args)))
+    else:
+        partials = [_scan_partition(*arg) for arg in args]
+
+    by_symbol = _with_profit_loss(_combine([p["symbol"] for p in partials], "symbol"))
+    by_type = _with_profit_loss(_combine([p["investment_type"] for p in partials], "investment_type"))
+    by_user = _with_profit_loss(_combine([p["user_id"] for p in partials], "user_id"))
+
+    totals = by_type[SUM_COLUMNS].sum()
+    report = {
+        "report_date": report_date,
+        "generated_at": datetime.utcnow(),
+        "prices": prices,
+        "holdings": int(totals.get("holdings", 0)),
+        "customers": len(by_user),
+        "total_invested": float(totals.get("invested", 0.0)),
+        "current_value": float(totals.get("current_value", 0.0)),
+        "by_symbol": _records(by_symbol[by_symbol.index != ""], "symbol"),
+        "by_type": _records(by_type, "investment_type"),
+    }
+    db.exposure_reports.replace_one({"report_date": report_date}, report, upsert=True)
+
+    # Per-user rows go to their own collection; they can be millions
+    db.user_exposures.delete_many({"report_date": report_date})
+    rows = _records(by_user, "user_id")
+    for start in range(0, len(rows), USER_EXPOSURE_WRITE_BATCH):
+        db.user_exposures.insert_many(
+            [{"report_date": report_date, **row} for row in rows[start:start + USER_EXPOSURE_WRITE_BATCH]],
+            ordered=False
+        )
+    db.user_exposures.create_index([("report_date", 1), ("user_id", 1)])
+    client.close()
+
+    report["elapsed_seconds"] = time.perf_counter() - started
+    logger.info(f"Exposure report: {report['holdings']} holdings, {report['customers']} customers in {report['elapsed_seconds']:.1f}s")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the bank-wide exposure report")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    build_exposure_report(
+        os.environ['MONGO_URL'],
+        os.environ.get('DB_NAME', 'banksys'),
+        processes=args.processes,
+        chunk_size=args.chunk_size
+    )
@@ -0,0 +1,263 @@
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
+from typing import Optional
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import socket
+
+from pymongo import ReturnDocument
+
+from ..sharding import ShardMoving
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 0
+DEFAULT_MAX_ATTEMPTS = 3
+LEASE_SECONDS = 120
+POLL_INTERVAL_SECONDS = 1.0
+RETRY_BACKOFF = timedelta(seconds=30)  # Doubled on every further attempt
+MOVE_RETRY_DELAY = timedelta(seconds=10)  # While the job's user is being moved to another shard
+
+# Modules that register job handlers; imported by workers (and pool children) on start
+HANDLER_MODULES = (
+    "..controllers.investment_controller",
+    "..controllers.transaction_controller",
+)
+
+JOB_HANDLERS = {}
+# Kinds that only act on the submitting user's own data; any other kind is bank-wide (admins only)
+USER_JOB_KINDS = set()
+
+def job_handler(kind: str, per_user: bool = False):
+    """Register ``async def handler(db, user_id, payload) -> dict`` for a job kind.
+
+    ``per_user`` kinds may be submitted by any customer through ``POST /jobs``.
+    """
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        if per_user:
+            USER_JOB_KINDS.add(kind)
+        return func
+    return register
+
+def load_handlers():
+    for module in HANDLER_MODULES:
+        importlib.import_module(module, __package__)
+
+async def create_job_indexes(db):
+    # Claim order: highest priority first, then oldest run_at
+    await db.jobs.create_index([("status", 1), ("priority", -1), ("run_at", 1)])
+    await db.jobs.create_index([("user_id", 1), ("created_at", -1)])
+
+async def enqueue_job(
+    db,
+    kind: str,
+    payload: Optional[dict] = None,
+    user_id=None,
+    priority: int = DEFAULT_PRIORITY,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+):
+    now = datetime.utcnow()
+    job = {
+        "kind": kind,
+        "payload": payload or {},
+        "user_id": user_id,
+        "priority": priority,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": now,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+        "finished_at": None
+    }
+    result = await db.jobs.insert_one(job)
+    return result.inserted_id
+
+_ATTEMPTS_LEFT = {"$lt": ["$attempts", {"$ifNull": ["$max_attempts", DEFAULT_MAX_ATTEMPTS]}]}
+
+async def claim_job(db, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> Optional[dict]:
+    """Atomically lease the next runnable job (queued, or running with an expired lease).
+
+    A job whose lease expired on its last attempt (its worker crashed or
+    hung) is dead-lettered instead of being taken over again.
+    """
+    now = datetime.utcnow()
+    await db.jobs.update_many(
+        {"status": "running", "lease_expires_at": {"$lte": now}, "$expr": {"$not": [_ATTEMPTS_LEFT]}},
+        {"$set": {"status": "dead", "error": "Lease expired on the last attempt",
+                  "lease_expires_at": None, "finished_at": now, "updated_at": now}}
+    )
+    return await db.jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_at": {"$lte": now}},
+            {"status": "running", "lease_expires_at": {"$lte": now}, "$expr": _ATTEMPTS_LEFT}
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "lease_owner": worker_id,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("priority", -1), ("run_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def renew_lease(db, job: dict, lease_seconds: int = LEASE_SECONDS):
+    await db.jobs.update_one(
+        {"_id": job["_id"], "lease_owner": job["lease_owner"], "status": "running"},
+        {"$set": {"lease_expires_at": datetime.utcnow() + timedelta(seconds=lease_seconds)}}
+    )
+
+async def complete_job(db, job: dict, result: Optional[dict]):
+    now = datetime.utcnow()
+    await db.jobs.update_one(
+        {"_id": job["_id"], "lease_owner": job["lease_owner"]},
+        {"$set": {"status": "succeeded", "result": result, "error": None,
+                  "lease_expires_at": None, "finished_at": now, "updated_at": now}}
+    )
+
+async def fail_job(db, job: dict, error: str):
+    """Requeue with backoff, or dead-letter once ``max_attempts`` is exhausted"""
+    now = datetime.utcnow()
+    if job["attempts"] >= job.get("max_attempts", DEFAULT_MAX_ATTEMPTS):
+        update = {"status": "dead", "finished_at": now}
+    else:
+        update = {"status": "queued", "run_at": now + RETRY_BACKOFF * (2 ** (job["attempts"] - 1))}
+    update.update({"error": error, "lease_expires_at": None, "updated_at": now})
+    await db.jobs.update_one({"_id": job["_id"], "lease_owner": job["lease_owner"]}, {"$set": update})
+
+async def defer_job(db, job: dict, delay: timedelta = MOVE_RETRY_DELAY):
+    """Requeue after ``delay`` without using up an attempt (the claim counted one)"""
+    now = datetime.utcnow()
+    await db.jobs.update_one(
+        {"_id": job["_id"], "lease_owner": job["lease_owner"]},
+        {
+            "$set": {"status": "queued", "run_at": now + delay, "lease_expires_at": None, "updated_at": now},
+            "$inc": {"attempts": -1}
+        }
+    )
+
+async def run_handler(db, kind: str, user_id, payload: dict):
+    handler = JOB_HANDLERS.get(kind)
+    if handler is None:
+        raise LookupError(f"No handler registered for job kind '{kind}'")
+    return await handler(db, user_id, payload)
+
+# Pool children keep one event loop and one Motor client for their whole life
+_child_loop = None
+_child_db = None
+
+def _init_child():
+    global _child_loop, _child_db
+    from ..database import connect
+
+    load_handlers()
+    _child_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_child_loop)
+    _child_db = connect()
+
+def _run_in_child(kind: str, user_id, payload: dict):
+    return _child_loop.run_until_complete(run_handler(_child_db, kind, user_id, payload))
+
+async def _process(db, pool: Optional[Executor], job: dict, lease_seconds: int):
+    if pool is None:
+        work = asyncio.ensure_future(run_handler(db, job["kind"], job.get("user_id"), job["payload"]))
+    else:
+        work = asyncio.get_running_loop().run_in_executor(
+            pool, _run_in_child, job["kind"], job.get("user_id"), job["payload"]
+        )
+
+    try:
+        # Heartbeat the lease while the handler runs so no other worker steals the job
+        while True:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(work), timeout=lease_seconds / 3)
+                break
+            except asyncio.TimeoutError:
+                await renew_lease(db, job, lease_seconds)
+    except ShardMoving as e:
+        logger.info(f"Job {job['_id']} ({job['kind']}) deferred: {e}")
+        await defer_job(db, job)
+        return
+    except Exception as e:
+        logger.exception(f"Job {job['_id']} ({job['kind']}) failed on attempt {job['attempts']}")
+        await fail_job(db, job, f"{type(e).__name__}: {e}")
+        return
+
+    await complete_job(db, job, result)
+
+async def run_worker(
+    db,
+    processes: int = os.cpu_count() or 1,
+    worker_id: Optional[str] = None,
+    poll_interval: float = POLL_INTERVAL_SECONDS,
+    lease_seconds: int = LEASE_SECONDS,
+    stop_event: Optional[asyncio.Event] = None
+):
+    """Claim jobs and run them on a process pool, one job per pool process.
+
+    ``processes=0`` runs handlers on the worker's own event loop, which is
+    handy for development.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = stop_event or asyncio.Event()
+    load_handlers()
+
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_child) if processes else None
+    slots = asyncio.Semaphore(processes or 1)
+    running = set()
+    logger.info(f"Job worker {worker_id} started with {processes} processes")
+
+    try:
+        while not stop_event.is_set():
+            await slots.acquire()
+            job = await claim_job(db, worker_id, lease_seconds)
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(_process(db, pool, job, lease_seconds))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+        # Drain: let in-flight jobs finish before the pool shuts down
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the background job worker")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from ..database import connect
+    db = connect()
+
+    async def main():
+        await create_job_indexes(db)
+        await run_worker(db, processes=args.processes, poll_interval=args.poll_interval)
+
+    asyncio.run(main())
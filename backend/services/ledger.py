@@ -0,0 +1,89 @@
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+# Transaction types that move money into / out of the checking account
+CREDIT_TYPES = ("credit", "pix_received", "investment_redemption")
+FUNDS_CHECKED_TYPES = ("debit", "pix_sent", "bill_payment", "investment")
+
+# Fields returned by the balance read path (and kept by the balance cache)
+BALANCE_FIELDS = ("account_number", "balance", "available_balance")
+BALANCE_PROJECTION = {field: 1 for field in BALANCE_FIELDS}
+
+# Posting keys remembered per account; a retry of a keyed posting older than
+# the last this many is still caught by the unique index on transactions
+POSTING_KEYS_KEPT = 100
+
+class AccountNotFound(Exception):
+    pass
+
+class InsufficientFunds(Exception):
+    pass
+
+def balance_delta(transaction_type, amount: float) -> float:
+    return amount if transaction_type in CREDIT_TYPES else -amount
+
+async def posting_applied(repos, user_id, posting_key: str) -> bool:
+    """Whether the posting keyed ``posting_key`` changed the balance (even if its transaction is not stored yet)"""
+    account = await repos.accounts.get_for_user(user_id, {"posting_keys": 1})
+    if account is not None and posting_key in account.get("posting_keys", ()):
+        return True
+    return await repos.transactions.find_by_posting_key(posting_key) is not None
+
+async def _already_posted(repos, transaction: dict) -> Optional[dict]:
+    """The transaction stored for ``posting_key`` when its balance change was applied before"""
+    posting_key = transaction["posting_key"]
+    account = await repos.accounts.get_for_user(transaction["user_id"], {"posting_keys": 1, "balance": 1})
+    if account is None or posting_key not in account.get("posting_keys", ()):
+        return None
+    existing = await repos.transactions.find_by_posting_key(posting_key)
+    if existing is not None:
+        return existing
+    # The earlier attempt stopped between the balance change and the insert
+    transaction["account_id"] = account["_id"]
+    transaction["balance_after"] = account["balance"]
+    try:
+        transaction["_id"] = await repos.transactions.insert(transaction)
+    except DuplicateKeyError:
+        return await repos.transactions.find_by_posting_key(posting_key)
+    return transaction
+
+async def post_transaction(repos, transaction: dict) -> dict:
+    """Post a transaction document against the owner's account.
+
+    The funds check and the balance change are a single conditional
+    update (``AccountRepository.apply_delta``), so concurrent postings (API
+    requests, scheduled payments) can never overdraw the account or lose
+    an update.
+
+    A transaction with a ``posting_key`` is posted at most once: posting
+    it again (a retried scheduled payment, say) returns the transaction
+    stored the first time, and finishes a first attempt that changed the
+    balance but stopped before storing the transaction.
+    """
+    amount = transaction["amount"]
+    delta = balance_delta(transaction["transaction_type"], amount)
+    minimum_balance = amount if transaction["transaction_type"] in FUNDS_CHECKED_TYPES else None
+    posting_key = transaction.get("posting_key")
+
+    account = await repos.accounts.apply_delta(transaction["user_id"], delta, minimum_balance, posting_key)
+    if account is None:
+        if posting_key is not None:
+            existing = await _already_posted(repos, transaction)
+            if existing is not None:
+                return existing
+        if minimum_balance is not None and await repos.accounts.get_for_user(transaction["user_id"], {"_id": 1}):
+            raise InsufficientFunds()
+        raise AccountNotFound()
+
+    transaction["account_id"] = account["_id"]
+    transaction["balance_after"] = account["balance"]
+    try:
+        transaction["_id"] = await repos.transactions.insert(transaction)
+    except DuplicateKeyError:
+        if posting_key is None:
+            raise
+        # Posted before and since dropped from the account's posting_keys: undo this change
+        await repos.accounts.apply_delta(transaction["user_id"], -delta)
+        return await repos.transactions.find_by_posting_key(posting_key)
+    return transaction
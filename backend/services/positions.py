@@ -0,0 +1,289 @@
+"""Consolidated positions with FIFO lots.
+
+Holdings with a ``symbol`` live in ``investments`` as one position per
+``(user_id, symbol)`` with the aggregated quantity and remaining cost
+basis, so portfolio reads scale with symbols held, not purchases. Every
+buy also records a lot in ``investment_lots``; sells consume the oldest
+open lots first and relieve their cost. Holdings without a symbol (CDB
+contracts, unlisted assets) stay one document per purchase and are
+redeemed pro rata.
+
+A sale takes the quantity off the holding and its lots before the
+proceeds are credited. The lot draws are tagged with the sale's
+``redemption`` key and the credit is posted with ``posting_key``
+``redemption:<key>``, so a credit that fails is undone with
+``cancel_sale``, and disposals whose key has no transaction are sales
+interrupted in between, to reconcile.
+
+Existing per-purchase documents are merged with:
+
+    python -m backend.services.positions --consolidate
+"""
+from datetime import datetime
+from typing import Optional
+import argparse
+import asyncio
+import logging
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from .cdb import accrue, income_tax_rate
+
+logger = logging.getLogger(__name__)
+
+QUANTITY_EPSILON = 1e-12
+
+LOT_PROJECTION = {
+    "symbol": 1,
+    "quantity": 1,
+    "remaining": 1,
+    "price": 1,
+    "purchase_date": 1,
+    "disposals": 1,
+}
+
+class PositionNotFound(Exception):
+    pass
+
+class InsufficientQuantity(Exception):
+    pass
+
+async def create_position_indexes(db):
+    # One position per user and symbol; symbol-less holdings are exempt
+    await db.investments.create_index(
+        [("user_id", 1), ("symbol", 1)],
+        unique=True,
+        partialFilterExpression={"symbol": {"$type": "string"}}
+    )
+    await db.investment_lots.create_index([("position_id", 1), ("purchase_date", 1)])
+    await db.investment_lots.create_index("user_id")
+
+def _lot(position_id, user_id, symbol: str, quantity: float, price: float, purchase_date: datetime) -> dict:
+    return {
+        "position_id": position_id,
+        "user_id": user_id,
+        "symbol": symbol,
+        "quantity": quantity,
+        "remaining": quantity,
+        "price": price,
+        "purchase_date": purchase_date,
+        "disposals": [],
+    }
+
+async def buy(repos, user_id, investment_type: str, asset_name: str, symbol: str, quantity: float, price: float,
+              now: Optional[datetime] = None) -> dict:
+    """Add a lot to the user's position in ``symbol``, opening it if needed.
+
+    The position is updated with a single atomic upsert, so concurrent
+    buys never lose quantity or cost basis.
+    """
+    now = now or datetime.utcnow()
+    investments = repos.investments
+    try:
+        position = await investments.add_to_position(user_id, investment_type, asset_name, symbol, quantity, price, now)
+    except DuplicateKeyError:
+        # Lost the race to open the position; it exists now, so this is a plain update
+        position = await investments.add_to_position(user_id, investment_type, asset_name, symbol, quantity, price, now)
+    await investments.insert_lot(_lot(position["_id"], user_id, symbol, quantity, price, now))
+    return position
+
+async def _reserve(investments, user_id, investment_id, quantity: float, now: datetime) -> dict:
+    """Take ``quantity`` off the holding atomically; returns it as it was before"""
+    holding = await investments.reserve(investment_id, user_id, quantity, now)
+    if holding is None:
+        if await investments.get_active(investment_id, user_id, {"_id": 1}):
+            raise InsufficientQuantity()
+        raise PositionNotFound()
+    return holding
+
+async def _consume_lots(investments, position_id, quantity: float, price: float, now: datetime,
+                        redemption: Optional[str] = None) -> tuple:
+    """Draw ``quantity`` from the oldest open lots; returns (quantity drawn, cost relieved)"""
+    remaining, cost = quantity, 0.0
+    while remaining > QUANTITY_EPSILON:
+        lot = await investments.oldest_open_lot(position_id)
+        if lot is None:
+            break
+        take = min(lot["remaining"], remaining)
+        # Compare-and-set on the lot's remaining quantity; a concurrent sale makes us re-read
+        disposal = {"quantity": take, "price": price, "sold_at": now}
+        if redemption is not None:
+            disposal["redemption"] = redemption
+        if await investments.draw_from_lot(lot["_id"], lot["remaining"], disposal):
+            remaining -= take
+            cost += take * lot["price"]
+    return quantity - remaining, cost
+
+async def _relieve_cost(investments, investment_id, cost: float, now: datetime) -> dict:
+    open_lot = await investments.oldest_open_lot(investment_id)
+    return await investments.relieve_cost(investment_id, cost, open_lot["purchase_date"] if open_lot else None, now)
+
+async def sell(repos, user_id, investment_id, quantity: Optional[float], market_price: Optional[float],
+               now: Optional[datetime] = None, redemption: Optional[str] = None) -> dict:
+    """Sell ``quantity`` (all if None) of a holding.
+
+    Positions relieve cost from their lots in FIFO order at
+    ``market_price``. Symbol-less holdings are redeemed pro rata; CDBs at
+    their accrued value with income tax withheld on the gain. The lot
+    draws are tagged with ``redemption``.
+    """
+    now = now or datetime.utcnow()
+    investments = repos.investments
+    if quantity is None:
+        current = await investments.get_active(investment_id, user_id, {"quantity": 1})
+        if current is None:
+            raise PositionNotFound()
+        quantity = current["quantity"]
+
+    holding = await _reserve(investments, user_id, investment_id, quantity, now)
+    income_tax = 0.0
+    if holding.get("symbol"):
+        drawn, cost = await _consume_lots(investments, investment_id, quantity, market_price, now, redemption)
+        # Quantity not covered by lots (holdings older than lot tracking) is relieved at average cost
+        cost += (quantity - drawn) * holding["purchase_price"]
+        proceeds = quantity * market_price
+    else:
+        fraction = quantity / holding["quantity"]
+        cost = holding["total_invested"] * fraction
+        if holding["investment_type"] == "cdb":
+            proceeds = float(accrue([holding], now)[0]) * fraction
+            income_tax = max(proceeds - cost, 0.0) * float(income_tax_rate((now - holding["purchase_date"]).days))
+        else:
+            proceeds = quantity * (market_price or holding["purchase_price"])
+
+    position = await _relieve_cost(investments, investment_id, cost, now)
+    accrued_value_sold = None
+    if holding.get("accrued_value") is not None:
+        accrued_value_sold = holding["accrued_value"] * quantity / holding["quantity"]
+        await investments.set_accrued_value(investment_id, holding["accrued_value"] - accrued_value_sold)
+    return {
+        "position": position,
+        "redemption": redemption,
+        "accrued_value_sold": accrued_value_sold,
+        "quantity": quantity,
+        "proceeds": proceeds - income_tax,
+        "income_tax": income_tax,
+        "cost_basis": cost,
+        "realized_profit_loss": proceeds - income_tax - cost,
+    }
+
+async def cancel_sale(repos, investment_id, sale: dict, now: Optional[datetime] = None) -> dict:
+    """Put back what ``sell`` took (``sale`` is its result); returns the holding after"""
+    now = now or datetime.utcnow()
+    investments = repos.investments
+    if sale["redemption"] is not None:
+        await investments.restore_lots(investment_id, sale["redemption"])
+    await investments.restore_holding(investment_id, sale["quantity"], sale["cost_basis"], sale["accrued_value_sold"])
+    # Reopens a closed position and takes the oldest open lot's date again
+    return await _relieve_cost(investments, investment_id, 0.0, now)
+
+async def position_movements(db, user_id) -> list:
+    """Buys and sales as signed quantity/cost movements, for value-over-time reconstruction.
+
+    Lots give the full history of positions, including closed ones;
+    symbol-less holdings contribute their purchase.
+    """
+    movements = []
+    async for lot in db.investment_lots.find({"user_id": user_id}, LOT_PROJECTION):
+        movements.append({
+            "symbol": lot["symbol"],
+            "quantity": lot["quantity"],
+            "total_invested": lot["quantity"] * lot["price"],
+            "purchase_date": lot["purchase_date"],
+        })
+        for disposal in lot.get("disposals", []):
+            movements.append({
+                "symbol": lot["symbol"],
+                "quantity": -disposal["quantity"],
+                "total_invested": -disposal["quantity"] * lot["price"],
+                "purchase_date": disposal["sold_at"],
+            })
+    async for holding in db.investments.find(
+        {"user_id": user_id, "is_active": True, "symbol": {"$not": {"$type": "string"}}},
+        {"symbol": 1, "quantity": 1, "total_invested": 1, "purchase_date": 1}
+    ):
+        movements.append(holding)
+    return movements
+
+async def consolidate_positions(db) -> int:
+    """Merge per-purchase documents into one position per (user_id, symbol), one lot per purchase.
+
+    Safe to run again after an interruption: each lot takes the ``_id`` of
+    the document it came from and is upserted, and the kept position
+    records in ``merged_from`` the documents its quantity already
+    includes, until they are deleted.
+    """
+    merged = 0
+    groups = db.investments.aggregate([
+        {"$match": {"symbol": {"$type": "string"}}},
+        {"$sort": {"purchase_date": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "symbol": "$symbol"},
+            "docs": {"$push": {
+                "_id": "$_id",
+                "quantity": "$quantity",
+                "purchase_price": "$purchase_price",
+                "total_invested": "$total_invested",
+                "purchase_date": "$purchase_date",
+                "is_active": "$is_active",
+                "merged_from": "$merged_from",
+            }}
+        }}
+    ], allowDiskUse=True)
+    async for group in groups:
+        docs = group["docs"]
+        keep = docs[0]
+        has_lots = await db.investment_lots.find_one({"position_id": keep["_id"]}, {"_id": 1}) is not None
+        if has_lots and len(docs) == 1:
+            continue
+
+        active = [doc for doc in docs if doc.get("is_active", True)]
+        # The kept position's own purchase has its lot already once it has any
+        new_lots = [doc for doc in active if doc is not keep or not has_lots]
+        if new_lots:
+            await db.investment_lots.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": _lot(
+                    keep["_id"], group["_id"]["user_id"], group["_id"]["symbol"],
+                    doc["quantity"], doc["purchase_price"], doc["purchase_date"]
+                )}, upsert=True)
+                for doc in new_lots
+            ], ordered=False)
+
+        # Documents an interrupted run already added to the kept position
+        already_merged = set(keep.get("merged_from") or ())
+        adding = [doc for doc in active if doc["_id"] not in already_merged]
+        quantity = sum(doc["quantity"] for doc in adding)
+        total_invested = sum(doc["total_invested"] for doc in adding)
+        others = [doc["_id"] for doc in docs[1:]]
+        await db.investments.update_one({"_id": keep["_id"]}, {"$set": {
+            "quantity": quantity,
+            "total_invested": total_invested,
+            "purchase_price": total_invested / quantity if quantity > QUANTITY_EPSILON else keep["purchase_price"],
+            "purchase_date": active[0]["purchase_date"] if active else keep["purchase_date"],
+            "is_active": quantity > QUANTITY_EPSILON,
+            "merged_from": others,
+            "updated_at": datetime.utcnow(),
+        }})
+        if others:
+            await db.investments.delete_many({"_id": {"$in": others}})
+        merged += 1
+    return merged
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Position maintenance")
+    parser.add_argument("--consolidate", action="store_true", help="Merge per-purchase holdings into positions with lots")
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from ..database import connect, fan_out
+    connect()
+
+    async def main():
+        if args.consolidate:
+            logger.info(f"Consolidated {sum((await fan_out(consolidate_positions)).values())} positions")
+        await fan_out(create_position_indexes)
+
+    asyncio.run(main())
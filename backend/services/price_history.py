@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta
+from typing import Optional
+import argparse
+import asyncio
+import logging
+
+import numpy as np
+from pymongo.errors import CollectionInvalid
+
+logger = logging.getLogger(__name__)
+
+TICKS = "price_ticks"
+
+# resolution -> (collection, $dateTrunc unit, bucket size, source collection, retention)
+RESOLUTIONS = {
+    "1m": ("price_bars_1m", "minute", timedelta(minutes=1), TICKS, timedelta(days=30)),
+    "1h": ("price_bars_1h", "hour", timedelta(hours=1), "price_bars_1m", timedelta(days=2 * 365)),
+    "1d": ("price_bars_1d", "day", timedelta(days=1), "price_bars_1h", None),
+}
+RAW_TICK_RETENTION = timedelta(days=2)
+ROLLUP_INTERVAL_SECONDS = 60.0
+
+async def create_price_history_collections(db):
+    """Time-series collections bucketed by symbol, with retention via expireAfterSeconds"""
+    collections = [(TICKS, "seconds", RAW_TICK_RETENTION)] + [
+        (name, "minutes" if unit == "minute" else "hours", retention)
+        for name, unit, _, _, retention in RESOLUTIONS.values()
+    ]
+    for name, granularity, retention in collections:
+        options = {"timeseries": {"timeField": "ts", "metaField": "symbol", "granularity": granularity}}
+        if retention is not None:
+            options["expireAfterSeconds"] = int(retention.total_seconds())
+        try:
+            await db.create_collection(name, **options)
+        except CollectionInvalid:
+            pass  # Already exists
+        await db[name].create_index([("symbol", 1), ("ts", 1)])
+
+async def record_ticks(db, prices: dict, ts: Optional[datetime] = None):
+    ts = ts or datetime.utcnow()
+    if prices:
+        await db[TICKS].insert_many([{"symbol": symbol, "ts": ts, "price": price} for symbol, price in prices.items()], ordered=False)
+
+def _rollup_pipeline(source: str, unit: str, start: datetime, end: datetime) -> list:
+    # Raw ticks carry a single price; bars carry OHLC
+    is_ticks = source == TICKS
+    return [
+        {"$match": {"ts": {"$gte": start, "$lt": end}}},
+        {"$sort": {"ts": 1}},
+        {"$group": {
+            "_id": {"symbol": "$symbol", "ts": {"$dateTrunc": {"date": "$ts", "unit": unit}}},
+            "open": {"$first": "$price" if is_ticks else "$open"},
+            "high": {"$max": "$price" if is_ticks else "$high"},
+            "low": {"$min": "$price" if is_ticks else "$low"},
+            "close": {"$last": "$price" if is_ticks else "$close"},
+        }},
+        {"$project": {"_id": 0, "symbol": "$_id.symbol", "ts": "$_id.ts", "open": 1, "high": 1, "low": 1, "close": 1}}
+    ]
+
+def _floor(moment: datetime, step: timedelta) -> datetime:
+    epoch = datetime(1970, 1, 1)
+    return epoch + (moment - epoch) // step * step
+
+async def rollup(db, resolution: str, now: Optional[datetime] = None) -> int:
+    """Downsample every completed bucket since the last run into ``resolution`` bars.
+
+    A watermark per resolution in ``price_rollups`` makes runs incremental
+    and keeps partially filled buckets out of the bars.
+    """
+    target, unit, step, source, retention = RESOLUTIONS[resolution]
+    end = _floor(now or datetime.utcnow(), step)
+    state = await db.price_rollups.find_one({"_id": resolution})
+    if state:
+        start = state["until"]
+    else:
+        start = end - retention if retention else datetime(1970, 1, 1)
+    if start >= end:
+        return 0
+
+    bars = await db[source].aggregate(_rollup_pipeline(source, unit, start, end)).to_list(None)
+    if bars:
+        await db[target].insert_many(bars, ordered=False)
+    await db.price_rollups.update_one({"_id": resolution}, {"$set": {"until": end}}, upsert=True)
+    return len(bars)
+
+async def run_rollups(db, now: Optional[datetime] = None) -> dict:
+    # Finest first, each coarser resolution reads the one below it
+    return {resolution: await rollup(db, resolution, now) for resolution in RESOLUTIONS}
+
+def time_grid(start: datetime, end: datetime, step: timedelta) -> np.ndarray:
+    return np.arange(np.datetime64(_floor(start, step)), np.datetime64(end) + 1, np.timedelta64(step)).astype("datetime64[us]")
+
+def price_matrix(bars: list, grid: np.ndarray) -> tuple:
+    """(symbols, symbol x time matrix of closes) aligned to ``grid``.
+
+    Gaps are forward-filled and the leading gap of each symbol is
+    back-filled with its first known close.
+    """
+    symbols = sorted({b["symbol"] for b in bars})
+    row = {symbol: i for i, symbol in enumerate(symbols)}
+    prices = np.full((len(symbols), len(grid)), np.nan)
+    if bars:
+        bar_row = np.fromiter((row[b["symbol"]] for b in bars), dtype=np.intp, count=len(bars))
+        bar_col = np.searchsorted(grid, np.array([b["ts"] for b in bars], dtype="datetime64[us]"), side="right") - 1
+        keep = bar_col >= 0
+        prices[bar_row[keep], bar_col[keep]] = np.fromiter((b["close"] for b in bars), dtype=float, count=len(bars))[keep]
+
+    filled = np.where(np.isnan(prices), 0, np.arange(len(grid)))
+    np.maximum.accumulate(filled, axis=1, out=filled)
+    prices = np.take_along_axis(prices, filled, axis=1)
+    first = np.argmax(~np.isnan(prices), axis=1)
+    prices = np.where(np.isnan(prices), prices[np.arange(len(symbols)), first][:, None], prices)
+    return symbols, prices
+
+def reconstruct_performance(holdings: list, bars: list, start: datetime, end: datetime, step: timedelta) -> dict:
+    """Portfolio value over time from holdings and price bars, in one vectorized pass.
+
+    Builds a (symbol x time) price matrix from the bars (forward-filled)
+    and a (symbol x time) quantity matrix from purchase dates (cumulative
+    sum of buys), then values the portfolio as their element-wise product.
+    Holdings without market prices are carried at cost.
+    """
+    grid = time_grid(start, end, step)
+    symbols, market = price_matrix(bars, grid)
+    row = {symbol: i for i, symbol in enumerate(symbols)}
+    # Holdings whose symbol has no bars go to an extra last row, priced at 1.0 and carried at cost
+    n_symbols, n_points = len(symbols) + 1, len(grid)
+    prices = np.vstack([market, np.ones((1, n_points))])
+
+    quantity = np.zeros((n_symbols, n_points))
+    invested = np.zeros(n_points)
+    if holdings:
+        # Bucket containing the purchase; older purchases count from the first point
+        bought = np.searchsorted(grid, np.array([h["purchase_date"] for h in holdings], dtype="datetime64[us]"), side="right") - 1
+        np.clip(bought, 0, None, out=bought)
+        h_row = np.fromiter((row.get(h.get("symbol"), n_symbols - 1) for h in holdings), dtype=np.intp, count=len(holdings))
+        h_qty = np.fromiter((h["quantity"] for h in holdings), dtype=float, count=len(holdings))
+        h_cost = np.fromiter((h["total_invested"] for h in holdings), dtype=float, count=len(holdings))
+        at_cost = h_row == n_symbols - 1
+        np.add.at(quantity, (h_row, bought), np.where(at_cost, h_cost, h_qty))
+        np.add.at(invested, bought, h_cost)
+    quantity = np.cumsum(quantity, axis=1)
+    invested = np.cumsum(invested)
+
+    values = (quantity * prices).sum(axis=0)
+    return {
+        "timestamps": grid.astype(datetime).tolist(),
+        "values": values.tolist(),
+        "invested": invested.tolist(),
+    }
+
+async def load_bars(db, symbols: list, start: datetime, end: datetime, resolution: str = "1d") -> list:
+    if not symbols:
+        return []
+    return await db[RESOLUTIONS[resolution][0]].find(
+        {"symbol": {"$in": symbols}, "ts": {"$gte": start, "$lte": end}},
+        {"_id": 0, "symbol": 1, "ts": 1, "close": 1}
+    ).sort("ts", 1).to_list(None)
+
+async def portfolio_performance(db, holdings: list, start: datetime, end: datetime, resolution: str = "1d") -> dict:
+    step = RESOLUTIONS[resolution][2]
+    symbols = sorted({h["symbol"] for h in holdings if h.get("symbol")})
+    bars = await load_bars(db, symbols, start, end, resolution)
+    return reconstruct_performance(holdings, bars, start, end, step)
+
+async def run_rollup_worker(db, interval: float = ROLLUP_INTERVAL_SECONDS, stop_event: Optional[asyncio.Event] = None):
+    stop_event = stop_event or asyncio.Event()
+    await create_price_history_collections(db)
+    while not stop_event.is_set():
+        counts = await run_rollups(db)
+        logger.info(f"Price rollups written: {counts}")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Downsample price ticks into 1m/1h/1d bars")
+    parser.add_argument("--interval", type=float, default=ROLLUP_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from ..database import connect
+    db = connect()
+
+    asyncio.run(run_rollup_worker(db, args.interval))
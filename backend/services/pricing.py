@@ -0,0 +1,127 @@
+from datetime import datetime
+from typing import Optional
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+
+from pymongo import UpdateOne
+
+from .price_history import create_price_history_collections, record_ticks
+
+logger = logging.getLogger(__name__)
+
+# Mock cryptocurrency data, used to seed the market price table
+MOCK_CRYPTO_DATA = [
+    {"symbol": "BTC", "name": "Bitcoin", "current_price": 98500.0, "price_change_24h": 1250.0, "price_change_percentage_24h": 1.28, "market_cap": 1950000000000, "volume_24h": 32000000000},
+    {"symbol": "ETH", "name": "Ethereum", "current_price": 3850.0, "price_change_24h": -45.0, "price_change_percentage_24h": -1.15, "market_cap": 463000000000, "volume_24h": 18500000000},
+    {"symbol": "ADA", "name": "Cardano", "current_price": 1.25, "price_change_24h": 0.08, "price_change_percentage_24h": 6.84, "market_cap": 44500000000, "volume_24h": 1200000000},
+    {"symbol": "SOL", "name": "Solana", "current_price": 245.0, "price_change_24h": 12.5, "price_change_percentage_24h": 5.38, "market_cap": 115000000000, "volume_24h": 3500000000},
+]
+
+TICK_INTERVAL_SECONDS = 5.0
+
+class PriceFeed:
+    """Source of new prices. ``quotes`` maps symbol -> current price table entry."""
+
+    async def next_prices(self, quotes: dict) -> dict:
+        raise NotImplementedError
+
+class SimulatedPriceFeed(PriceFeed):
+    """Local random-walk feed (geometric Brownian motion) for development and tests"""
+
+    def __init__(self, annual_volatility: float = 0.8, tick_seconds: float = TICK_INTERVAL_SECONDS, seed: Optional[int] = None):
+        self.sigma = annual_volatility * math.sqrt(tick_seconds / (365 * 24 * 3600))
+        self.random = random.Random(seed)
+
+    async def next_prices(self, quotes: dict) -> dict:
+        return {
+            symbol: quote["current_price"] * math.exp(self.random.gauss(-0.5 * self.sigma ** 2, self.sigma))
+            for symbol, quote in quotes.items()
+        }
+
+PRICE_FEEDS = {
+    "simulated": SimulatedPriceFeed,
+}
+
+def get_price_feed(name: Optional[str] = None) -> PriceFeed:
+    return PRICE_FEEDS[name or os.environ.get("PRICE_FEED", "simulated")]()
+
+def mock_quote(crypto: dict, now: datetime) -> dict:
+    """Price table entry for one of ``MOCK_CRYPTO_DATA``"""
+    return {
+        **crypto,
+        "open_24h": crypto["current_price"] - crypto["price_change_24h"],
+        "updated_at": now
+    }
+
+async def seed_price_table(db):
+    """Insert the mock quotes for symbols not yet in ``market_prices``"""
+    now = datetime.utcnow()
+    await db.market_prices.bulk_write([
+        UpdateOne({"_id": crypto["symbol"]}, {"$setOnInsert": mock_quote(crypto, now)}, upsert=True)
+        for crypto in MOCK_CRYPTO_DATA
+    ], ordered=False)
+
+async def get_quotes(db) -> dict:
+    quotes = await db.market_prices.find({}).to_list(None)
+    return {quote["_id"]: quote for quote in quotes}
+
+async def publish_prices(db, quotes: dict, prices: dict):
+    now = datetime.utcnow()
+    ops = []
+    for symbol, price in prices.items():
+        open_24h = quotes[symbol].get("open_24h", price)
+        ops.append(UpdateOne({"_id": symbol}, {"$set": {
+            "current_price": price,
+            "price_change_24h": price - open_24h,
+            "price_change_percentage_24h": ((price - open_24h) / open_24h * 100) if open_24h else 0,
+            "updated_at": now
+        }}))
+    if ops:
+        await db.market_prices.bulk_write(ops, ordered=False)
+
+async def market_tick(db, feed: PriceFeed) -> dict:
+    """Advance the market one step: new prices from the feed, published to the price table.
+
+    Holdings are valued on read from this table (see ``services.valuation``),
+    so a tick writes one document per symbol and nothing per holder. The
+    prices are also appended to the ``price_ticks`` history.
+    """
+    quotes = await get_quotes(db)
+    prices = await feed.next_prices(quotes)
+    await publish_prices(db, quotes, prices)
+    await record_ticks(db, prices)
+    return prices
+
+async def run_price_engine(db, feed: Optional[PriceFeed] = None, interval: float = TICK_INTERVAL_SECONDS, stop_event: Optional[asyncio.Event] = None):
+    feed = feed or get_price_feed()
+    stop_event = stop_event or asyncio.Event()
+    await seed_price_table(db)
+    await create_price_history_collections(db)
+
+    while not stop_event.is_set():
+        started = datetime.utcnow()
+        prices = await market_tick(db, feed)
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        logger.info(f"Market tick: {len(prices)} symbols published in {elapsed:.3f}s")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=max(interval - elapsed, 0))
+        except asyncio.TimeoutError:
+            pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the market price engine")
+    parser.add_argument("--feed", default=None, choices=sorted(PRICE_FEEDS))
+    parser.add_argument("--interval", type=float, default=TICK_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from ..database import connect
+    db = connect()
+
+    asyncio.run(run_price_engine(db, get_price_feed(args.feed), args.interval))
@@ -0,0 +1,237 @@
+"""In-process quote hub for streaming price updates.
+
+One pump task per worker reads quotes from a source and publishes them
+to every subscription interested in the symbol. Each subscription keeps
+only the latest pending quote per symbol, so a slow client skips stale
+prices instead of building a backlog, and the publisher never waits on
+a client. Quotes are JSON-encoded once per publish, not per subscriber.
+
+Streams are open to anonymous clients, so a subscription may only name
+listed symbols (the mock quotes and whatever the source has published),
+at most ``MAX_SYMBOLS_PER_SUBSCRIPTION`` of them, and a symbol's entry is
+dropped with its last subscriber.
+
+Sources:
+
+- ``market``: polls the market repository (the shared ``market_prices``
+  table advanced by the price engine, or the in-process quotes on
+  ``STORAGE_BACKEND=memory``) (default)
+- ``simulated``: local random walk, no database (development and tests)
+"""
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+
+from .pricing import MOCK_CRYPTO_DATA, SimulatedPriceFeed
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 1.0
+MAX_SYMBOLS_PER_SUBSCRIPTION = 20
+QUOTE_FIELDS = ("current_price", "price_change_24h", "price_change_percentage_24h", "updated_at")
+
+class InvalidSubscription(ValueError):
+    pass
+
+def encode_quote(symbol: str, quote: dict) -> str:
+    payload = {"symbol": symbol, **{field: quote.get(field) for field in QUOTE_FIELDS}}
+    if isinstance(payload["updated_at"], datetime):
+        payload["updated_at"] = payload["updated_at"].isoformat()
+    # Publish time, for delivery latency measurements
+    payload["published_at"] = time.time()
+    return json.dumps(payload)
+
+def encode_batch(batch: dict) -> str:
+    """Wire message for a batch of pre-encoded quotes"""
+    return '{"type":"quotes","quotes":[' + ",".join(batch.values()) + "]}"
+
+class Subscription:
+    """A client's interest in some symbols, with at most one pending quote per symbol"""
+
+    __slots__ = ("hub", "symbols", "pending", "event", "delivered", "coalesced")
+
+    def __init__(self, hub: "PriceHub"):
+        self.hub = hub
+        self.symbols = set()
+        self.pending = {}
+        self.event = asyncio.Event()
+        self.delivered = 0
+        self.coalesced = 0
+
+    def offer(self, symbol: str, payload: str):
+        if symbol in self.pending:
+            self.coalesced += 1
+        self.pending[symbol] = payload
+        self.event.set()
+
+    async def next_batch(self) -> dict:
+        """Latest quote per symbol updated since the previous batch (waits for at least one)"""
+        while not self.pending:
+            self.event.clear()
+            await self.event.wait()
+        batch, self.pending = self.pending, {}
+        self.delivered += len(batch)
+        return batch
+
+    def subscribe(self, symbols: Iterable[str]):
+        self.hub.add_symbols(self, symbols)
+
+    def unsubscribe(self, symbols: Iterable[str]):
+        self.hub.remove_symbols(self, symbols)
+
+    def close(self):
+        self.hub.remove_symbols(self, list(self.symbols))
+
+class PriceHub:
+    def __init__(self):
+        self.subscribers = {}  # symbol -> subscriptions
+        self.latest = {}  # symbol -> last encoded quote
+        self.published = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def listed(self) -> set:
+        return {crypto["symbol"] for crypto in MOCK_CRYPTO_DATA} | self.latest.keys()
+
+    def subscribe(self, symbols: Iterable[str]) -> Subscription:
+        subscription = Subscription(self)
+        self.add_symbols(subscription, symbols)
+        return subscription
+
+    def add_symbols(self, subscription: Subscription, symbols: Iterable[str]):
+        """Raises ``InvalidSubscription`` (adding nothing) for unlisted symbols or too many"""
+        symbols = set(symbols)
+        unknown = symbols - self.listed()
+        if unknown:
+            raise InvalidSubscription(f"Unknown symbols: {', '.join(sorted(unknown))}")
+        if len(subscription.symbols | symbols) > MAX_SYMBOLS_PER_SUBSCRIPTION:
+            raise InvalidSubscription(f"At most {MAX_SYMBOLS_PER_SUBSCRIPTION} symbols per subscription")
+        for symbol in symbols:
+            self.subscribers.setdefault(symbol, set()).add(subscription)
+            subscription.symbols.add(symbol)
+            # New subscribers start from the current price
+            if symbol in self.latest:
+                subscription.offer(symbol, self.latest[symbol])
+
+    def remove_symbols(self, subscription: Subscription, symbols: Iterable[str]):
+        for symbol in symbols:
+            subscribers = self.subscribers.get(symbol)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[symbol]
+            subscription.symbols.discard(symbol)
+            subscription.pending.pop(symbol, None)
+
+    @property
+    def subscriptions(self) -> int:
+        return len({subscription for subscribers in self.subscribers.values() for subscription in subscribers})
+
+    def publish(self, quotes: dict):
+        """Fan quotes (symbol -> quote) out to subscribers; never blocks"""
+        for symbol, quote in quotes.items():
+            payload = encode_quote(symbol, quote)
+            self.latest[symbol] = payload
+            for subscription in self.subscribers.get(symbol, ()):
+                subscription.offer(symbol, payload)
+            self.published += 1
+
+    async def run(self, source: "QuoteSource", stop_event: Optional[asyncio.Event] = None):
+        async for quotes in source.stream(stop_event or asyncio.Event()):
+            self.publish(quotes)
+
+    def start(self, source: "QuoteSource"):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(source))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class QuoteSource:
+    async def stream(self, stop_event: asyncio.Event) -> AsyncIterator[dict]:
+        raise NotImplementedError
+        yield
+
+class MarketTableSource(QuoteSource):
+    """Polls the market repository and yields quotes whose ``updated_at`` changed"""
+
+    def __init__(self, market, interval: float = POLL_INTERVAL_SECONDS):
+        self.market = market
+        self.interval = interval
+
+    async def stream(self, stop_event: asyncio.Event) -> AsyncIterator[dict]:
+        seen = {}
+        while not stop_event.is_set():
+            try:
+                quotes = await self.market.quotes()
+                changed = {symbol: q for symbol, q in quotes.items() if seen.get(symbol) != q.get("updated_at")}
+                seen.update({symbol: quote.get("updated_at") for symbol, quote in changed.items()})
+                if changed:
+                    yield changed
+            except Exception as e:
+                logger.warning(f"Quote poll failed: {e}")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+class SimulatedSource(QuoteSource):
+    """Random-walk quotes generated in process, for development and tests"""
+
+    def __init__(self, interval: float = POLL_INTERVAL_SECONDS, seed: Optional[int] = None):
+        self.interval = interval
+        self.feed = SimulatedPriceFeed(tick_seconds=interval, seed=seed)
+        self.quotes = {
+            crypto["symbol"]: {**crypto, "open_24h": crypto["current_price"] - crypto["price_change_24h"]}
+            for crypto in MOCK_CRYPTO_DATA
+        }
+
+    async def tick(self) -> dict:
+        now = datetime.utcnow()
+        for symbol, price in (await self.feed.next_prices(self.quotes)).items():
+            quote = self.quotes[symbol]
+            quote.update(
+                current_price=price,
+                price_change_24h=price - quote["open_24h"],
+                price_change_percentage_24h=(price - quote["open_24h"]) / quote["open_24h"] * 100,
+                updated_at=now
+            )
+        return dict(self.quotes)
+
+    async def stream(self, stop_event: asyncio.Event) -> AsyncIterator[dict]:
+        while not stop_event.is_set():
+            yield await self.tick()
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+QUOTE_SOURCES = {
+    "market": lambda market: MarketTableSource(market),
+    "simulated": lambda market: SimulatedSource(),
+}
+
+_hub: Optional[PriceHub] = None
+
+def get_price_hub(market, source: Optional[str] = None) -> PriceHub:
+    """Process-wide hub; the pump starts with the first subscriber"""
+    global _hub
+    if _hub is None:
+        _hub = PriceHub()
+    _hub.start(QUOTE_SOURCES[source or os.environ.get("QUOTE_SOURCE", "market")](market))
+    return _hub
+
+async def stop_price_hub():
+    global _hub
+    if _hub is not None:
+        await _hub.stop()
+        _hub = None
@@ -0,0 +1,210 @@
+"""Move users whose data is not on the shard the hash ring assigns them.
+
+After a shard is added to ``MONGO_SHARDS`` and ``SHARD_RING`` (or removed
+from the ring), about 1/N of the users belong elsewhere; this moves them
+in batches:
+
+    python -m backend.services.rebalance --dry-run
+    python -m backend.services.rebalance --batch-size 100 --grace-seconds 10
+    python -m backend.services.rebalance --user 65f0c1... --to s2
+
+Every step is recorded on the user's directory entry on home, so an
+interrupted run is finished by the next one:
+
+1. claim: ``moving_to`` is set. From then on the user's requests are
+   answered 503 with ``Retry-After`` and their jobs and scheduled
+   payments are deferred.
+2. wait ``--grace-seconds`` (once per batch) for requests that loaded
+   the user before the claim to finish writing on the source. A request
+   slower than that could still write there after the copy; keep the
+   grace above the slowest request.
+3. copy the user's ``SHARDED_COLLECTIONS`` documents to the target and
+   check it holds exactly what the source does (one retry). A copy that
+   fails, e.g. on an ``account_number`` already taken on the target
+   shard, is rolled back and the user stays where they are (and is
+   reported again by every run until the conflict is resolved).
+4. flip: ``shard`` becomes the target, ``moving_from`` records the
+   source and ``moving_to`` is cleared, so requests go to the target.
+5. delete the user's documents from the source and clear ``moving_from``.
+"""
+from typing import Optional
+import argparse
+import asyncio
+import logging
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from ..sharding import HOME_SHARD, SHARDED_COLLECTIONS
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+GRACE_SECONDS = 10.0
+DIRECTORY_PROJECTION = {"shard": 1, "moving_to": 1, "moving_from": 1}
+
+class MoveFailed(Exception):
+    pass
+
+async def plan_moves(shards, limit: Optional[int] = None) -> list:
+    """(user_id, source, target) of every user to move; interrupted moves first"""
+    home = shards.home
+    moves = []
+    # Claimed or flipped by an earlier run
+    async for user in home.users.find({"$or": [{"moving_to": {"$ne": None}}, {"moving_from": {"$ne": None}}]},
+                                      DIRECTORY_PROJECTION):
+        shard = user.get("shard") or HOME_SHARD
+        moves.append((user["_id"], user.get("moving_from") or shard, user.get("moving_to") or shard))
+    async for user in home.users.find({"moving_to": None, "moving_from": None}, DIRECTORY_PROJECTION).sort("_id", 1):
+        if limit is not None and len(moves) >= limit:
+            break
+        source, target = user.get("shard") or HOME_SHARD, shards.placement(user["_id"])
+        if source != target:
+            moves.append((user["_id"], source, target))
+    return moves[:limit] if limit is not None else moves
+
+async def _claim(home, user_id, source: str, target: str) -> bool:
+    """Mark the user as moving, unless their shard changed since the plan"""
+    shard_filter = {"$in": [source, None]} if source == HOME_SHARD else source
+    result = await home.users.update_one(
+        {"_id": user_id, "shard": shard_filter, "moving_from": None, "moving_to": {"$in": [None, target]}},
+        {"$set": {"moving_to": target}}
+    )
+    return result.matched_count > 0
+
+async def _copy(source_db, target_db, user_id):
+    for name in SHARDED_COLLECTIONS:
+        # Leftovers of an interrupted attempt are replaced, so the copy can be repeated
+        await target_db[name].delete_many({"user_id": user_id})
+        documents = await source_db[name].find({"user_id": user_id}).to_list(None)
+        if documents:
+            await target_db[name].insert_many(documents, ordered=False)
+
+async def _differences(source_db, target_db, user_id) -> list:
+    different = []
+    for name in SHARDED_COLLECTIONS:
+        source_docs = await source_db[name].find({"user_id": user_id}).sort("_id", 1).to_list(None)
+        target_docs = await target_db[name].find({"user_id": user_id}).sort("_id", 1).to_list(None)
+        if source_docs != target_docs:
+            different.append(name)
+    return different
+
+async def _rollback(target_db, home, user_id):
+    for name in SHARDED_COLLECTIONS:
+        await target_db[name].delete_many({"user_id": user_id})
+    await home.users.update_one({"_id": user_id}, {"$unset": {"moving_to": ""}})
+
+async def _copy_and_verify(source_db, target_db, user_id):
+    for attempt in range(2):
+        await _copy(source_db, target_db, user_id)
+        different = await _differences(source_db, target_db, user_id)
+        if not different:
+            return
+        logger.warning(f"User {user_id}: copy differs in {', '.join(different)} (attempt {attempt + 1})")
+    raise MoveFailed(f"copy of {', '.join(different)} does not match the source")
+
+async def _finish(shards, user_id, source: str, target: str):
+    """Flip the user to ``target`` and drop their documents from ``source``"""
+    home = shards.home
+    await home.users.update_one(
+        {"_id": user_id, "moving_to": target},
+        {"$set": {"shard": target, "moving_from": source}, "$unset": {"moving_to": ""}}
+    )
+    source_db = shards.database(source)
+    for name in SHARDED_COLLECTIONS:
+        await source_db[name].delete_many({"user_id": user_id})
+    await home.users.update_one({"_id": user_id, "moving_from": source}, {"$unset": {"moving_from": ""}})
+
+async def move_batch(shards, moves: list, grace_seconds: float = GRACE_SECONDS) -> dict:
+    """Claim, copy, verify and flip one batch of (user_id, source, target); {outcome: users}"""
+    home = shards.home
+    counts = {"moved": 0, "failed": 0, "skipped": 0}
+    pending = []
+    for user_id, source, target in moves:
+        user = await home.users.find_one({"_id": user_id}, DIRECTORY_PROJECTION)
+        if user and user.get("moving_from") and (user.get("shard") or HOME_SHARD) == target:
+            # Flipped by an earlier run; only the source cleanup is left
+            await _finish(shards, user_id, source, target)
+            counts["moved"] += 1
+        elif await _claim(home, user_id, source, target):
+            pending.append((user_id, source, target))
+        else:
+            counts["skipped"] += 1
+    if not pending:
+        return counts
+
+    await asyncio.sleep(grace_seconds)
+    for user_id, source, target in pending:
+        source_db, target_db = shards.database(source), shards.database(target)
+        try:
+            await _copy_and_verify(source_db, target_db, user_id)
+        except (BulkWriteError, MoveFailed) as e:
+            logger.error(f"User {user_id}: move {source} -> {target} rolled back: {e}")
+            await _rollback(target_db, home, user_id)
+            counts["failed"] += 1
+            continue
+        await _finish(shards, user_id, source, target)
+        counts["moved"] += 1
+        logger.info(f"User {user_id}: moved {source} -> {target}")
+    return counts
+
+async def rebalance(
+    shards,
+    batch_size: int = BATCH_SIZE,
+    grace_seconds: float = GRACE_SECONDS,
+    limit: Optional[int] = None,
+    dry_run: bool = False,
+    user_id=None,
+    target: Optional[str] = None
+) -> dict:
+    """Move every misplaced user (or only ``user_id``, to ``target`` or its ring owner)"""
+    if user_id is not None:
+        user = await shards.home.users.find_one({"_id": user_id}, DIRECTORY_PROJECTION)
+        if user is None:
+            raise LookupError(f"User {user_id} not found")
+        target = target or shards.placement(user_id)
+        shards.database(target)  # Unknown shard names fail here, before anything is claimed
+        source = user.get("moving_from") or user.get("shard") or HOME_SHARD
+        moves = [(user_id, source, target)] if source != target or user.get("moving_from") else []
+    else:
+        moves = await plan_moves(shards, limit)
+
+    by_route = {}
+    for _, source, to in moves:
+        by_route[f"{source}->{to}"] = by_route.get(f"{source}->{to}", 0) + 1
+    logger.info(f"{len(moves)} users to move: {by_route}")
+    totals = {"planned": len(moves), "moved": 0, "failed": 0, "skipped": 0, "by_route": by_route}
+    if dry_run:
+        return totals
+
+    for start in range(0, len(moves), batch_size):
+        counts = await move_batch(shards, moves[start:start + batch_size], grace_seconds)
+        for outcome, users in counts.items():
+            totals[outcome] += users
+        logger.info(f"Rebalance batch done: {counts}")
+    return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move users to the shard the hash ring assigns them")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the moves")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--grace-seconds", type=float, default=GRACE_SECONDS,
+                        help="Wait after claiming a batch, for requests already in flight")
+    parser.add_argument("--limit", type=int, default=None, help="Move at most this many users")
+    parser.add_argument("--user", type=ObjectId, default=None, help="Move only this user")
+    parser.add_argument("--to", default=None,
+                        help="Target shard for --user (default: its ring owner; a later full run moves it back unless the ring agrees)")
+    args = parser.parse_args()
+    if args.to and args.user is None:
+        parser.error("--to needs --user")
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from .. import database
+    database.connect()
+
+    totals = asyncio.run(rebalance(
+        database.shards, args.batch_size, args.grace_seconds, args.limit, args.dry_run, args.user, args.to
+    ))
+    logger.info(f"Rebalance complete: {totals}")
@@ -0,0 +1,273 @@
+"""Portfolio risk metrics from daily price history.
+
+Annualized volatility, historical VaR/CVaR and maximum drawdown of each
+portfolio's current positions, replayed over the last ``LOOKBACK_DAYS``
+of daily closes (``price_bars_1d``). Many portfolios are scored at once
+as a (portfolio x symbol) weight matrix times a (symbol x day) return
+matrix. Results are cached per user per day in ``risk_metrics``.
+
+The bank-wide batch splits the users of every shard into ranges scored
+by a process pool:
+
+    python -m backend.services.risk --processes 8
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import argparse
+import logging
+import math
+import os
+import time
+
+import numpy as np
+from pymongo import MongoClient, UpdateOne
+
+from ..database import analytics
+from ..sharding import shard_addresses
+from .price_history import RESOLUTIONS, load_bars, price_matrix, time_grid
+from .valuation import HOLDING_PROJECTION, value_holdings
+
+logger = logging.getLogger(__name__)
+
+LOOKBACK_DAYS = 365
+CONFIDENCE = 0.95
+PERIODS_PER_YEAR = 365  # Crypto trades every day
+CHUNK_DOCS = 200_000  # Holdings scored per batch in a pool worker
+SAMPLE_SIZE = 2000
+
+def daily_returns(prices: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = prices[:, 1:] / prices[:, :-1] - 1
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+def position_matrix(portfolio: np.ndarray, symbol: np.ndarray, value: np.ndarray, n_portfolios: int, n_symbols: int) -> tuple:
+    """(portfolio x symbol) market values and per-portfolio value without price history.
+
+    ``symbol`` is -1 for holdings with no return series (CDB, unlisted
+    assets); they count towards the portfolio value but carry no risk.
+    """
+    exposures = np.zeros((n_portfolios, n_symbols))
+    priced = symbol >= 0
+    np.add.at(exposures, (portfolio[priced], symbol[priced]), value[priced])
+    unpriced = np.bincount(portfolio[~priced], weights=value[~priced], minlength=n_portfolios)
+    return exposures, unpriced
+
+def portfolio_risk(exposures: np.ndarray, unpriced: np.ndarray, returns: np.ndarray, confidence: float = CONFIDENCE) -> dict:
+    """Risk metrics for every portfolio at once; returns arrays aligned with the rows of ``exposures``"""
+    total = exposures.sum(axis=1) + unpriced
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = np.where(total[:, None] > 0, exposures / total[:, None], 0.0)
+    n_portfolios, observations = len(total), returns.shape[1]
+    if observations < 2:
+        zeros = np.zeros(n_portfolios)
+        return {"portfolio_value": total, "volatility": zeros, "value_at_risk": zeros,
+                "conditional_value_at_risk": zeros, "max_drawdown": zeros, "observations": observations}
+
+    r = weights @ returns  # (portfolio x day) returns of today's positions
+    volatility = r.std(axis=1, ddof=1) * math.sqrt(PERIODS_PER_YEAR)
+
+    cutoff = np.quantile(r, 1 - confidence, axis=1)
+    tail = r <= cutoff[:, None]
+    tail_mean = np.where(tail, r, 0.0).sum(axis=1) / np.maximum(tail.sum(axis=1), 1)
+
+    path = np.cumprod(1 + r, axis=1)
+    path = np.hstack([np.ones((n_portfolios, 1)), path])
+    drawdown = 1 - path / np.maximum.accumulate(path, axis=1)
+
+    return {
+        "portfolio_value": total,
+        "volatility": volatility,
+        "value_at_risk": np.maximum(-cutoff, 0) * total,
+        "conditional_value_at_risk": np.maximum(-tail_mean, 0) * total,
+        "max_drawdown": drawdown.max(axis=1),
+        "observations": observations,
+    }
+
+def _as_of(moment: Optional[datetime] = None) -> datetime:
+    return (moment or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _documents(user_ids: list, metrics: dict, as_of: datetime, lookback_days: int, confidence: float) -> list:
+    now = datetime.utcnow()
+    return [
+        {
+            "user_id": user_id,
+            "as_of": as_of,
+            "lookback_days": lookback_days,
+            "confidence": confidence,
+            "observations": metrics["observations"],
+            "portfolio_value": float(metrics["portfolio_value"][i]),
+            "annualized_volatility": float(metrics["volatility"][i]),
+            "value_at_risk": float(metrics["value_at_risk"][i]),
+            "conditional_value_at_risk": float(metrics["conditional_value_at_risk"][i]),
+            "max_drawdown": float(metrics["max_drawdown"][i]),
+            "computed_at": now,
+        }
+        for i, user_id in enumerate(user_ids)
+    ]
+
+def _upserts(documents: list) -> list:
+    return [
+        UpdateOne({"user_id": doc["user_id"], "as_of": doc["as_of"]}, {"$set": doc}, upsert=True)
+        for doc in documents
+    ]
+
+async def create_risk_indexes(db):
+    await db.risk_metrics.create_index([("user_id", 1), ("as_of", -1)], unique=True)
+
+async def get_user_risk(db, user_id, snapshot, lookback_days: int = LOOKBACK_DAYS, confidence: float = CONFIDENCE,
+                        history=None) -> dict:
+    """Today's metrics for one user, computed on first request of the day and cached.
+
+    ``db`` is the user's shard; price bars are read from ``history`` (the home shard, default ``db``).
+    """
+    as_of = _as_of()
+    cached = await db.risk_metrics.find_one({"user_id": user_id, "as_of": as_of}, {"_id": 0})
+    if cached and cached["lookback_days"] == lookback_days and cached["confidence"] == confidence:
+        return cached
+
+    holdings = await db.investments.find({"user_id": user_id, "is_active": True}, HOLDING_PROJECTION).to_list(None)
+    symbols_held = sorted({h["symbol"] for h in holdings if h.get("symbol")})
+    grid = time_grid(as_of - timedelta(days=lookback_days), as_of, RESOLUTIONS["1d"][2])
+    symbols, prices = price_matrix(await load_bars(history if history is not None else db, symbols_held, grid[0].item(), as_of), grid)
+
+    column = {symbol: i for i, symbol in enumerate(symbols)}
+    value = value_holdings(holdings, snapshot)["current_value"] if holdings else np.zeros(0)
+    symbol = np.fromiter((column.get(h.get("symbol"), -1) for h in holdings), dtype=np.intp, count=len(holdings))
+    exposures, unpriced = position_matrix(np.zeros(len(holdings), dtype=np.intp), symbol, value, 1, len(symbols))
+
+    document = _documents([user_id], portfolio_risk(exposures, unpriced, daily_returns(prices), confidence), as_of, lookback_days, confidence)[0]
+    await db.risk_metrics.bulk_write(_upserts([document]))
+    return document
+
+def _user_bounds(collection, partitions: int) -> list:
+    """(lo, hi) ``user_id`` ranges of roughly equal size, from a random sample of holdings"""
+    if partitions <= 1:
+        return [(None, None)]
+    sample = sorted({doc["user_id"] for doc in collection.aggregate([
+        {"$match": {"is_active": True}},
+        {"$sample": {"size": SAMPLE_SIZE}},
+        {"$project": {"_id": 0, "user_id": 1}}
+    ])})
+    if not sample:
+        return [(None, None)]
+    cuts = [sample[len(sample) * i // partitions] for i in range(1, partitions)]
+    edges = [None] + sorted(set(cuts)) + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def _score(docs: list, prices: dict, column: dict, returns: np.ndarray, as_of: datetime, lookback_days: int, confidence: float) -> list:
+    user_index = {}
+    portfolio = np.fromiter((user_index.setdefault(doc["user_id"], len(user_index)) for doc in docs), dtype=np.intp, count=len(docs))
+    user_ids = list(user_index)
+    quantity = np.fromiter((doc["quantity"] for doc in docs), dtype=float, count=len(docs))
+    purchase_price = np.fromiter((doc["purchase_price"] for doc in docs), dtype=float, count=len(docs))
+    accrued = np.array([doc.get("accrued_value") for doc in docs], dtype=float)
+    market_price = np.array([prices.get(doc.get("symbol")) for doc in docs], dtype=float)
+    # Holdings without a market price are carried at their accrued (CDB) or purchase price
+    price = np.where(np.isnan(market_price), np.where(np.isnan(accrued), purchase_price, accrued / quantity), market_price)
+    symbol = np.fromiter((column.get(doc.get("symbol"), -1) for doc in docs), dtype=np.intp, count=len(docs))
+    exposures, unpriced = position_matrix(portfolio, symbol, quantity * price, len(user_ids), len(column))
+    return _documents(user_ids, portfolio_risk(exposures, unpriced, returns, confidence), as_of, lookback_days, confidence)
+
+def _score_partition(mongo_url: str, db_name: str, lo, hi, prices: dict, symbols: list, returns: np.ndarray,
+                     as_of: datetime, lookback_days: int, confidence: float) -> int:
+    """Score every user in one ``user_id`` range (runs in a pool process)"""
+    client = MongoClient(mongo_url)
+    db = analytics(client[db_name])
+    query = {"is_active": True}
+    user_range = {}
+    if lo is not None:
+        user_range["$gte"] = lo
+    if hi is not None:
+        user_range["$lt"] = hi
+    if user_range:
+        query["user_id"] = user_range
+
+    column = {symbol: i for i, symbol in enumerate(symbols)}
+    scored = 0
+    pending = []
+    cursor = db.investments.find(
+        query, {"_id": 0, "user_id": 1, "symbol": 1, "quantity": 1, "purchase_price": 1, "accrued_value": 1}
+    ).sort("user_id", 1).batch_size(10_000)
+    for doc in cursor:
+        # Only cut between users so each portfolio is scored whole
+        if len(pending) >= CHUNK_DOCS and doc["user_id"] != pending[-1]["user_id"]:
+            documents = _score(pending, prices, column, returns, as_of, lookback_days, confidence)
+            db.risk_metrics.bulk_write(_upserts(documents), ordered=False)
+            scored += len(documents)
+            pending = []
+        pending.append(doc)
+    if pending:
+        documents = _score(pending, prices, column, returns, as_of, lookback_days, confidence)
+        db.risk_metrics.bulk_write(_upserts(documents), ordered=False)
+        scored += len(documents)
+
+    client.close()
+    return scored
+
+def build_risk_report(
+    mongo_url: str,
+    db_name: str,
+    processes: int = os.cpu_count() or 1,
+    lookback_days: int = LOOKBACK_DAYS,
+    confidence: float = CONFIDENCE,
+    as_of: Optional[datetime] = None
+) -> dict:
+    """Score every portfolio and store today's metrics in ``risk_metrics`` of its shard"""
+    started = time.perf_counter()
+    as_of = _as_of(as_of)
+    client = MongoClient(mongo_url)
+    db = analytics(client[db_name])
+
+    # One price snapshot and one return matrix for the whole run
+    prices = {quote["_id"]: quote["current_price"] for quote in db.market_prices.find({}, {"current_price": 1})}
+    grid = time_grid(as_of - timedelta(days=lookback_days), as_of, RESOLUTIONS["1d"][2])
+    bars = list(db[RESOLUTIONS["1d"][0]].find(
+        {"ts": {"$gte": grid[0].item(), "$lte": as_of}}, {"_id": 0, "symbol": 1, "ts": 1, "close": 1}
+    ).sort("ts", 1))
+    symbols, closes = price_matrix(bars, grid)
+    returns = daily_returns(closes)
+
+    args = []
+    for shard_url, shard_db_name in shard_addresses(mongo_url, db_name).values():
+        shard_client = MongoClient(shard_url)
+        shard_db = analytics(shard_client[shard_db_name])
+        shard_db.risk_metrics.create_index([("user_id", 1), ("as_of", -1)], unique=True)
+        bounds = _user_bounds(shard_db.investments, processes)
+        shard_client.close()
+        args += [(shard_url, shard_db_name, lo, hi, prices, symbols, returns, as_of, lookback_days, confidence)
+                 for lo, hi in bounds]
+    if processes > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        # spawn, not fork: the parent already holds a MongoClient, which is not fork-safe
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            scored = sum(pool.map(_score_partition, *zip(*args)))
+    else:
+        scored = sum(_score_partition(*arg) for arg in args)
+    client.close()
+
+    report = {"as_of": as_of, "portfolios": scored, "elapsed_seconds": time.perf_counter() - started}
+    logger.info(f"Risk report: {scored} portfolios in {report['elapsed_seconds']:.1f}s")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute risk metrics for every portfolio")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--lookback-days", type=int, default=LOOKBACK_DAYS)
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    build_risk_report(
+        os.environ['MONGO_URL'],
+        os.environ.get('DB_NAME', 'banksys'),
+        processes=args.processes,
+        lookback_days=args.lookback_days,
+        confidence=args.confidence
+    )
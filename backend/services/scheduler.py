@@ -0,0 +1,231 @@
+from datetime import datetime, timedelta
+from typing import Optional
+import argparse
+import asyncio
+import calendar
+import logging
+import os
+import socket
+import uuid
+
+from ..database import user_database
+from ..repositories.mongo import mongo_repositories
+from ..sharding import ShardMoving
+from .ledger import AccountNotFound, InsufficientFunds, post_transaction
+
+logger = logging.getLogger(__name__)
+
+CLAIM_BATCH_SIZE = 500
+EXECUTION_CONCURRENCY = 50
+LEASE_SECONDS = 60
+POLL_INTERVAL_SECONDS = 1.0
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = timedelta(hours=1)  # Doubled on every further attempt
+
+# Fields copied from the schedule onto the posted transaction
+_TRANSACTION_FIELDS = ("user_id", "transaction_type", "category", "amount", "description",
+                       "pix_key", "recipient_name", "merchant_name")
+
+class SchedulerMetrics:
+    """In-process counters for one worker, logged after every batch"""
+
+    def __init__(self):
+        self.claimed = 0
+        self.executed = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def observe_lag(self, scheduled_for: datetime, now: datetime):
+        lag = max((now - scheduled_for).total_seconds(), 0.0)
+        self.last_lag_seconds = lag
+        self.max_lag_seconds = max(self.max_lag_seconds, lag)
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+def add_month(moment: datetime, anchor_day: int) -> datetime:
+    """Same time next month on ``anchor_day``, clamped to the month's last day"""
+    year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+    day = min(anchor_day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+def next_occurrence(schedule: dict) -> Optional[datetime]:
+    if schedule["frequency"] == "weekly":
+        return schedule["next_run_at"] + timedelta(weeks=1)
+    if schedule["frequency"] == "monthly":
+        return add_month(schedule["next_run_at"], schedule["anchor_day"])
+    return None
+
+async def create_schedule_indexes(db):
+    await db.scheduled_payments.create_index([("status", 1), ("next_run_at", 1)])
+    await db.scheduled_payments.create_index("user_id")
+    await db.scheduled_payments.create_index("lease_token", sparse=True)
+
+def _due_filter(now: datetime) -> dict:
+    return {
+        "status": "active",
+        "next_run_at": {"$lte": now},
+        "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lte": now}}]
+    }
+
+async def claim_due_schedules(db, worker_id: str, now: datetime, batch_size: int = CLAIM_BATCH_SIZE, lease_seconds: int = LEASE_SECONDS) -> list:
+    """Lease up to ``batch_size`` due schedules for this worker.
+
+    Candidates are read, then leased with one ``update_many`` that re-checks
+    the lease condition, so two workers racing for the same documents can
+    never both win. Only documents stamped with this claim's token are
+    returned.
+    """
+    candidates = await db.scheduled_payments.find(
+        _due_filter(now), {"_id": 1}
+    ).sort("next_run_at", 1).limit(batch_size).to_list(batch_size)
+    if not candidates:
+        return []
+
+    token = uuid.uuid4().hex
+    await db.scheduled_payments.update_many(
+        {"_id": {"$in": [c["_id"] for c in candidates]}, **_due_filter(now)},
+        {"$set": {
+            "lease_owner": worker_id,
+            "lease_token": token,
+            "lease_expires_at": now + timedelta(seconds=lease_seconds)
+        }}
+    )
+    return await db.scheduled_payments.find({"lease_token": token}).to_list(batch_size)
+
+async def execute_schedule(db, schedule: dict, metrics: SchedulerMetrics) -> None:
+    """Post one due schedule through the ledger and advance or retry it"""
+    now = datetime.utcnow()
+    metrics.observe_lag(schedule["next_run_at"], now)
+    lease = {"_id": schedule["_id"], "lease_token": schedule["lease_token"]}
+    release = {"lease_owner": None, "lease_token": None, "lease_expires_at": None, "updated_at": now}
+
+    transaction = {field: schedule.get(field) for field in _TRANSACTION_FIELDS}
+    transaction.update({
+        "schedule_id": schedule["_id"],
+        "scheduled_for": schedule["next_run_at"],
+        # A run that posted but never advanced the schedule (lease expired, worker died)
+        # is repeated by the next claim; the key makes that repeat a no-op
+        "posting_key": f"schedule:{schedule['_id']}:{schedule['next_run_at'].isoformat()}",
+        "transaction_date": now,
+        "created_at": now,
+        "status": "completed"
+    })
+
+    try:
+        shard_db = await user_database(schedule["user_id"])
+    except ShardMoving as e:
+        # Leave the lease to expire; the next claim after it finds the user on their new shard
+        logger.info(f"Scheduled payment {schedule['_id']} deferred: {e}")
+        return
+
+    try:
+        await post_transaction(mongo_repositories(shard_db, home=db), transaction)
+    except (InsufficientFunds, AccountNotFound) as e:
+        attempts = schedule.get("attempts", 0) + 1
+        error = "insufficient_funds" if isinstance(e, InsufficientFunds) else "account_not_found"
+        if isinstance(e, InsufficientFunds) and attempts < MAX_ATTEMPTS:
+            metrics.retried += 1
+            update = {"attempts": attempts, "last_error": error,
+                      "next_run_at": now + RETRY_BACKOFF * (2 ** (attempts - 1))}
+        else:
+            # Give up on this occurrence; recurring schedules move on to the next one
+            metrics.failed += 1
+            following = next_occurrence(schedule)
+            update = {"attempts": 0, "last_error": error, "last_run_at": now}
+            update.update({"next_run_at": following} if following else {"status": "failed"})
+        await db.scheduled_payments.update_one(lease, {"$set": {**update, **release}})
+        return
+
+    metrics.executed += 1
+    following = next_occurrence(schedule)
+    update = {"attempts": 0, "last_error": None, "last_run_at": now}
+    update.update({"next_run_at": following} if following else {"status": "completed"})
+    await db.scheduled_payments.update_one(lease, {"$set": {**update, **release}})
+
+async def run_batch(db, worker_id: str, metrics: SchedulerMetrics, batch_size: int = CLAIM_BATCH_SIZE, concurrency: int = EXECUTION_CONCURRENCY) -> int:
+    schedules = await claim_due_schedules(db, worker_id, datetime.utcnow(), batch_size)
+    if not schedules:
+        return 0
+    metrics.claimed += len(schedules)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(schedule):
+        async with semaphore:
+            try:
+                await execute_schedule(db, schedule, metrics)
+            except Exception:
+                # Leave the lease to expire so another pass picks it up
+                logger.exception(f"Scheduled payment {schedule['_id']} failed unexpectedly")
+
+    await asyncio.gather(*(bounded(schedule) for schedule in schedules))
+    return len(schedules)
+
+async def run_worker(
+    db,
+    worker_id: Optional[str] = None,
+    batch_size: int = CLAIM_BATCH_SIZE,
+    concurrency: int = EXECUTION_CONCURRENCY,
+    poll_interval: float = POLL_INTERVAL_SECONDS,
+    stop_event: Optional[asyncio.Event] = None
+):
+    """Drain due schedules until ``stop_event`` is set.
+
+    Full batches are followed immediately by the next claim so a backlog
+    (e.g. the first of the month) drains at full speed; an empty claim
+    sleeps for ``poll_interval``.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = stop_event or asyncio.Event()
+    metrics = SchedulerMetrics()
+    logger.info(f"Scheduler worker {worker_id} started")
+
+    while not stop_event.is_set():
+        processed = await run_batch(db, worker_id, metrics, batch_size, concurrency)
+        if processed:
+            logger.info(f"Scheduler batch: {processed} payments, metrics={metrics.as_dict()}")
+        if processed < batch_size:
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    return metrics
+
+async def scheduler_lag(db, now: Optional[datetime] = None) -> dict:
+    """Backlog view shared by all workers: how many schedules are due and how late"""
+    now = now or datetime.utcnow()
+    due_filter = {"status": "active", "next_run_at": {"$lte": now}}
+    due_count = await db.scheduled_payments.count_documents(due_filter)
+    leased_count = await db.scheduled_payments.count_documents({**due_filter, "lease_expires_at": {"$gt": now}})
+    oldest = await db.scheduled_payments.find_one(due_filter, {"next_run_at": 1}, sort=[("next_run_at", 1)])
+
+    oldest_due_at = oldest["next_run_at"] if oldest else None
+    return {
+        "due_count": due_count,
+        "oldest_due_at": oldest_due_at,
+        "lag_seconds": (now - oldest_due_at).total_seconds() if oldest_due_at else 0.0,
+        "leased_count": leased_count
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the scheduled payments worker")
+    parser.add_argument("--batch-size", type=int, default=CLAIM_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=EXECUTION_CONCURRENCY)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    from ..logs import setup_logging
+    setup_logging()
+
+    from ..database import connect
+    db = connect()
+
+    async def main():
+        await create_schedule_indexes(db)
+        await run_worker(db, batch_size=args.batch_size, concurrency=args.concurrency, poll_interval=args.poll_interval)
+
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+from typing import Optional
+import asyncio
+import time
+
+import numpy as np
+
+SNAPSHOT_MAX_AGE_SECONDS = 1.0
+
+# Only what valuation needs: quantity and cost basis, never stored values
+HOLDING_PROJECTION = {
+    "investment_type": 1,
+    "asset_name": 1,
+    "symbol": 1,
+    "quantity": 1,
+    "purchase_price": 1,
+    "total_invested": 1,
+    "purchase_date": 1,
+    "accrued_value": 1,
+}
+
+class PriceSnapshot:
+    """Immutable view of the market price table, shared by all requests in a process"""
+
+    def __init__(self, prices: dict, loaded_at: float):
+        self.symbols = list(prices)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.prices = np.array([prices[symbol] for symbol in self.symbols] + [np.nan], dtype=float)
+        self.loaded_at = loaded_at
+
+    def price_of(self, symbol: Optional[str]) -> Optional[float]:
+        i = self.index.get(symbol)
+        return None if i is None else float(self.prices[i])
+
+_snapshot: Optional[PriceSnapshot] = None
+# An asyncio.Lock belongs to the loop it is first used on; one per running loop
+_snapshot_lock: Optional[asyncio.Lock] = None
+_snapshot_lock_loop = None
+
+def _reload_lock() -> asyncio.Lock:
+    global _snapshot_lock, _snapshot_lock_loop
+    loop = asyncio.get_running_loop()
+    if _snapshot_lock_loop is not loop:
+        _snapshot_lock, _snapshot_lock_loop = asyncio.Lock(), loop
+    return _snapshot_lock
+
+async def get_price_snapshot(market, max_age: float = SNAPSHOT_MAX_AGE_SECONDS) -> PriceSnapshot:
+    """Return the process-wide snapshot, reloading it when older than ``max_age``.
+
+    ``market`` is a ``MarketRepository``. A single in-flight reload is
+    shared by every request that finds the snapshot stale, so a price tick
+    costs one query per process.
+    """
+    global _snapshot
+    if _snapshot is not None and time.monotonic() - _snapshot.loaded_at < max_age:
+        return _snapshot
+
+    async with _reload_lock():
+        if _snapshot is None or time.monotonic() - _snapshot.loaded_at >= max_age:
+            _snapshot = PriceSnapshot(await market.current_prices(), time.monotonic())
+    return _snapshot
+
+def value_holdings(holdings: list, snapshot: PriceSnapshot) -> dict:
+    """Value holdings against a snapshot in one vectorized pass.
+
+    Holdings without a market price are carried at their accrued value
+    (CDB, see ``services.cdb``) or else at their purchase price. Returns
+    per-holding arrays aligned with ``holdings``.
+    """
+    missing = len(snapshot.symbols)  # Points at the trailing NaN
+    index = np.fromiter((snapshot.index.get(h.get("symbol"), missing) for h in holdings), dtype=np.intp, count=len(holdings))
+    quantity = np.fromiter((h["quantity"] for h in holdings), dtype=float, count=len(holdings))
+    purchase_price = np.fromiter((h["purchase_price"] for h in holdings), dtype=float, count=len(holdings))
+    invested = np.fromiter((h["total_invested"] for h in holdings), dtype=float, count=len(holdings))
+    accrued = np.array([h.get("accrued_value") for h in holdings], dtype=float)
+
+    market_price = snapshot.prices[index]
+    book_price = np.where(np.isnan(accrued), purchase_price, accrued / quantity)
+    current_price = np.where(np.isnan(market_price), book_price, market_price)
+    current_value = quantity * current_price
+    profit_loss = current_value - invested
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profit_loss_percentage = np.where(invested > 0, profit_loss / invested * 100, 0.0)
+
+    return {
+        "current_price": current_price,
+        "current_value": current_value,
+        "profit_loss": profit_loss,
+        "profit_loss_percentage": profit_loss_percentage,
+        "invested": invested,
+    }
+
+def _market_price_expression(snapshot: PriceSnapshot) -> dict:
+    """``$switch`` mapping each symbol to its snapshot price, else the accrued or purchase price"""
+    book_price = {"$ifNull": [{"$divide": ["$accrued_value", "$quantity"]}, "$purchase_price"]}
+    branches = [
+        {"case": {"$eq": ["$symbol", symbol]}, "then": float(snapshot.prices[i])}
+        for symbol, i in snapshot.index.items()
+    ]
+    if not branches:
+        return book_price
+    return {"$switch": {"branches": branches, "default": book_price}}
+
+def _with_profit_loss(invested: str, current_value: str) -> dict:
+    return {
+        "profit_loss": {"$subtract": [current_value, invested]},
+        "profit_loss_percentage": {"$cond": [
+            {"$gt": [invested, 0]},
+            {"$multiply": [{"$divide": [{"$subtract": [current_value, invested]}, invested]}, 100]},
+            0
+        ]}
+    }
+
+def portfolio_summary_pipeline(user_id, snapshot: PriceSnapshot) -> list:
+    """Totals and per-type breakdown for one user in a single aggregation.
+
+    Prices from the snapshot are inlined into the pipeline, so the server
+    values and groups every holding (no truncation) and returns only the
+    summary rows.
+    """
+    return [
+        {"$match": {"user_id": user_id, "is_active": True}},
+        {"$project": {
+            "_id": 0,
+            "investment_type": 1,
+            "total_invested": 1,
+            "current_value": {"$multiply": ["$quantity", _market_price_expression(snapshot)]}
+        }},
+        {"$facet": {
+            "totals": [
+                {"$group": {"_id": None, "invested": {"$sum": "$total_invested"}, "current_value": {"$sum": "$current_value"}}},
+                {"$project": {"_id": 0, "invested": 1, "current_value": 1, **_with_profit_loss("$invested", "$current_value")}}
+            ],
+            "by_type": [
+                {"$group": {
+                    "_id": "$investment_type",
+                    "invested": {"$sum": "$total_invested"},
+                    "current_value": {"$sum": "$current_value"},
+                    "count": {"$sum": 1}
+                }},
+                {"$sort": {"_id": 1}},
+                {"$project": {
+                    "_id": 0,
+                    "type": "$_id",
+                    "invested": 1,
+                    "current_value": 1,
+                    "count": 1,
+                    **_with_profit_loss("$invested", "$current_value")
+                }}
+            ]
+        }}
+    ]
+
+async def summarize_portfolio(repos, user_id, snapshot: PriceSnapshot) -> dict:
+    facets = await repos.investments.portfolio_facets(user_id, snapshot)
+    totals = facets["totals"][0] if facets["totals"] else {
+        "invested": 0.0, "current_value": 0.0, "profit_loss": 0.0, "profit_loss_percentage": 0.0
+    }
+    return {
+        "total_invested": totals["invested"],
+        "current_value": totals["current_value"],
+        "total_profit_loss": totals["profit_loss"],
+        "total_profit_loss_percentage": totals["profit_loss_percentage"],
+        "investments_by_type": facets["by_type"]
+    }
@@ -0,0 +1,127 @@
+"""Horizontal sharding of customer data by ``user_id``.
+
+The database named by ``MONGO_URL``/``DB_NAME`` is the home shard. It
+keeps what is global or small: users (the directory of where each
+user's data lives), market prices and price history, the job and
+schedule queues, and operational collections (profiles, slow commands,
+rate limits, reports). A user's accounts, transactions, cards,
+invoices, investments, lots and risk metrics (``SHARDED_COLLECTIONS``)
+live on one shard:
+
+    MONGO_SHARDS="s1=mongodb://localhost:27018/banksys,s2=mongodb://localhost:27019/banksys"
+
+Shards are databases; several may share a cluster (or the home one).
+Without ``MONGO_SHARDS`` there is only the home shard and nothing
+changes.
+
+The shard of a user is recorded on the user document (``shard``;
+missing means home), which every authenticated request loads anyway,
+so routing a request costs no extra read. New users are placed by a
+consistent-hash ring over ``SHARD_RING`` (default: every shard), so
+adding a shard to the ring only changes the owner of about 1/N of the
+users; ``backend.services.rebalance`` moves the users whose recorded
+shard differs from their owner. While a user is being moved
+(``moving_to`` set), requests and jobs touching their data are turned
+away (``ShardMoving``) and retried.
+
+Batch jobs run on every shard through ``ShardMap.fan_out``.
+"""
+from bisect import bisect
+from typing import Dict, Iterable, Optional, Tuple
+import asyncio
+import hashlib
+import os
+
+HOME_SHARD = "home"
+SHARD_VNODES = 128
+
+# Collections whose documents belong to one user (``user_id``) and live on that user's shard
+SHARDED_COLLECTIONS = ("accounts", "transactions", "credit_cards", "invoices", "investments", "investment_lots",
+                       "risk_metrics")
+
+class ShardMoving(Exception):
+    """The user's data is being moved to another shard; retry shortly"""
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    """Consistent hashing of user ids onto shard names, ``vnodes`` points per shard"""
+
+    def __init__(self, names: Iterable[str], vnodes: int = SHARD_VNODES):
+        points = sorted((_hash(f"{name}#{i}"), name) for name in names for i in range(vnodes))
+        if not points:
+            raise ValueError("A hash ring needs at least one shard")
+        self.hashes = [point for point, _ in points]
+        self.names = [name for _, name in points]
+
+    def owner(self, user_id) -> str:
+        return self.names[bisect(self.hashes, _hash(str(user_id))) % len(self.names)]
+
+def parse_shards(spec: Optional[str], home: Optional[Tuple[str, str]] = None) -> Dict[str, Tuple[str, str]]:
+    """``name=mongodb://host:port/db_name,...`` -> {name: (url, db_name)}
+
+    Every shard must be a distinct database, ``home`` (url, db_name) included.
+    """
+    shards = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, url = item.partition("=")
+        scheme, _, rest = url.partition("://")
+        db_name = rest.partition("/")[2].partition("?")[0]
+        if not name or not scheme or not db_name or name == HOME_SHARD or name in shards:
+            raise ValueError(f"Bad MONGO_SHARDS entry {item!r}; expected <name>=mongodb://<host>/<db_name> "
+                             f"with a unique name other than {HOME_SHARD!r}")
+        if (url, db_name) == home or (url, db_name) in shards.values():
+            raise ValueError(f"MONGO_SHARDS entry {item!r} names a database already used by another shard")
+        shards[name] = (url, db_name)
+    return shards
+
+def shard_addresses(mongo_url: Optional[str] = None, db_name: Optional[str] = None) -> Dict[str, Tuple[str, str]]:
+    """(url, db_name) of every shard, home first, from the environment"""
+    home = (mongo_url or os.environ["MONGO_URL"], db_name or os.environ.get("DB_NAME", "banksys"))
+    return {HOME_SHARD: home, **parse_shards(os.environ.get("MONGO_SHARDS"), home)}
+
+def ring_from_env(names: Iterable[str]) -> HashRing:
+    """Ring over ``SHARD_RING`` (comma-separated names), else over ``names``"""
+    names = list(names)
+    members = [name.strip() for name in os.environ.get("SHARD_RING", "").split(",") if name.strip()] or names
+    unknown = set(members) - set(names)
+    if unknown:
+        raise ValueError(f"SHARD_RING names unknown shards: {', '.join(sorted(unknown))}")
+    return HashRing(members)
+
+class ShardMap:
+    """Database handles of every shard, and where each user's data lives"""
+
+    def __init__(self, databases: Dict[str, object], ring: Optional[HashRing] = None):
+        self.databases = databases
+        self.home = databases[HOME_SHARD]
+        self.ring = ring or HashRing([HOME_SHARD])
+
+    def database(self, name: Optional[str]):
+        try:
+            return self.databases[name or HOME_SHARD]
+        except KeyError:
+            raise LookupError(f"Unknown shard {name!r}; is it in MONGO_SHARDS?")
+
+    def placement(self, user_id) -> str:
+        """Shard a new user's data goes to"""
+        return self.ring.owner(user_id)
+
+    async def locate(self, user_id) -> str:
+        user = await self.home.users.find_one({"_id": user_id}, {"shard": 1, "moving_to": 1})
+        if user is None:
+            raise LookupError("User not found")
+        if user.get("moving_to"):
+            raise ShardMoving(f"User {user_id} is moving to shard {user['moving_to']}")
+        return user.get("shard") or HOME_SHARD
+
+    async def database_for(self, user_id):
+        """Database holding the user's data (one read of the user's directory entry)"""
+        return self.database(await self.locate(user_id))
+
+    async def fan_out(self, func, *args, **kwargs) -> dict:
+        """``await func(db, *args, **kwargs)`` on every shard concurrently; {shard: result}"""
+        names = list(self.databases)
+        results = await asyncio.gather(*(func(self.databases[name], *args, **kwargs) for name in names))
+        return dict(zip(names, results))
@@ -0,0 +1,262 @@
+"""Slow MongoDB command log.
+
+A pymongo ``CommandListener`` times every command; the ones slower than
+``SLOW_COMMAND_THRESHOLD_MS`` are handed to the event loop, where they
+are reduced to a shape (field names and operators kept, values replaced
+by ``"?"``), tagged with the route of the request that issued them,
+explained (``queryPlanner`` verbosity, so nothing is executed) and
+stored in ``slow_commands``. Each shape is explained at most once per
+``EXPLAIN_INTERVAL_SECONDS`` per worker; later samples reuse that plan.
+
+The listener itself only keeps a reference to the command until it
+completes; redaction, hashing and explain happen off the driver threads,
+and only for slow commands.
+"""
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+SLOW_COMMAND_THRESHOLD_MS = float(os.environ.get("SLOW_COMMAND_THRESHOLD_MS", "100"))
+EXPLAIN_SLOW_COMMANDS = os.environ.get("SLOW_COMMAND_EXPLAIN", "1") != "0"
+EXPLAIN_INTERVAL_SECONDS = 600.0
+SLOW_COMMAND_RETENTION_SECONDS = 7 * 24 * 3600
+QUEUE_SIZE = 1000
+MAX_SHAPE_ITEMS = 20  # Of a bulk write, for instance
+
+RECORDED_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify", "getMore", "insert"}
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Session, transaction and routing fields: not part of the query, and rejected by explain
+DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction",
+                 "readConcern", "writeConcern", "signature"}
+# Kept verbatim in shapes: they describe the query, not the data
+LITERAL_FIELDS = {"sort", "projection", "hint", "key", "fields"}
+OWN_COLLECTION = "slow_commands"
+
+_request_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_queue: Optional[asyncio.Queue] = None
+_plans = {}
+
+class RouteContextMiddleware:
+    """Makes the request's scope (and so, once routed, its route) visible to the command listener"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _request_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
+
+def _route() -> str:
+    scope = _request_scope.get()
+    if scope is None:
+        return "background"
+    return f"{scope['method']} {getattr(scope.get('route'), 'path', 'unmatched')}"
+
+def redact(value, key: Optional[str] = None):
+    """Command shape: keys and operators are kept, values become ``"?"``"""
+    if key in LITERAL_FIELDS:
+        return value
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items() if k not in DRIVER_FIELDS}
+    if isinstance(value, (list, tuple)):
+        # Pipelines and update/delete statements keep their structure; value lists collapse
+        if value and all(isinstance(item, dict) for item in value):
+            shapes = []
+            for item in (redact(item) for item in value[:MAX_SHAPE_ITEMS]):
+                if item not in shapes:
+                    shapes.append(item)
+            return shapes
+        return ["?"]
+    if isinstance(value, str) and value.startswith("$"):
+        return value  # Field path in an aggregation expression
+    return "?"
+
+def shape_id(shape: dict) -> str:
+    return hashlib.sha1(json.dumps(shape, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _explain_command(command_name: str, command: dict) -> dict:
+    command = {k: v for k, v in command.items() if k not in DRIVER_FIELDS}
+    # Explain takes a single update/delete statement
+    for field in ("updates", "deletes"):
+        if field in command:
+            command[field] = command[field][:1]
+    return {"explain": command, "verbosity": "queryPlanner"}
+
+def _winning_plan(explain: dict) -> Optional[dict]:
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations whose first stage reads the collection
+        for stage in explain.get("stages", []):
+            planner = stage.get("$cursor", {}).get("queryPlanner")
+            if planner:
+                break
+    if not planner:
+        return None
+    plan = planner.get("winningPlan", {})
+    # Slot-based engine plans nest the classic tree under queryPlan
+    return plan.get("queryPlan", plan)
+
+def plan_tree(plan: dict) -> dict:
+    """Stages and index names only; filters and bounds carry values"""
+    node = {"stage": plan.get("stage", "?")}
+    if plan.get("indexName"):
+        node["index"] = plan["indexName"]
+    inputs = ([plan["inputStage"]] if "inputStage" in plan else []) + plan.get("inputStages", [])
+    if inputs:
+        node["inputs"] = [plan_tree(child) for child in inputs]
+    return node
+
+def plan_summary(node: dict) -> str:
+    label = f"{node['stage']}({node['index']})" if "index" in node else node["stage"]
+    inputs = node.get("inputs", [])
+    if len(inputs) == 1:
+        return f"{label} > {plan_summary(inputs[0])}"
+    if inputs:
+        return f"{label} > [{', '.join(plan_summary(child) for child in inputs)}]"
+    return label
+
+class SlowCommandRecorder(monitoring.CommandListener):
+    """Runs on the driver's threads; slow commands are queued to the event loop"""
+
+    def __init__(self):
+        self.inflight = {}
+
+    def started(self, event):
+        if _queue is not None and event.command_name in RECORDED_COMMANDS:
+            self.inflight[(event.connection_id, event.request_id)] = (event.command, event.database_name, _route())
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+    def _finish(self, event, ok: bool):
+        started = self.inflight.pop((event.connection_id, event.request_id), None)
+        if started is None or event.duration_micros < SLOW_COMMAND_THRESHOLD_MS * 1000:
+            return
+        command, database_name, route = started
+        slow = {
+            "command_name": event.command_name,
+            "command": command,
+            "database": database_name,
+            "route": route,
+            "duration_ms": event.duration_micros / 1000,
+            "ok": ok,
+            "at": datetime.utcnow(),
+        }
+        try:
+            _loop.call_soon_threadsafe(_enqueue, slow)
+        except (AttributeError, RuntimeError):
+            pass  # Not serving (or shutting down)
+
+slow_command_recorder = SlowCommandRecorder()
+
+def _enqueue(slow: dict):
+    if _queue is not None and not _queue.full():
+        _queue.put_nowait(slow)
+
+async def _plan(db, slow: dict, sid: str) -> Optional[tuple]:
+    cached = _plans.get(sid)
+    if cached and time.monotonic() - cached[0] < EXPLAIN_INTERVAL_SECONDS:
+        return cached[1]
+    if not EXPLAIN_SLOW_COMMANDS or slow["command_name"] not in EXPLAINABLE_COMMANDS:
+        return None
+    _plans[sid] = (time.monotonic(), cached[1] if cached else None)
+    try:
+        explain = await db.client[slow["database"]].command(_explain_command(slow["command_name"], slow["command"]))
+    except Exception as e:
+        logger.warning(f"Explain of slow {slow['command_name']} failed: {e}")
+        return _plans[sid][1]
+    winning = _winning_plan(explain)
+    plan = None
+    if winning:
+        tree = plan_tree(winning)
+        plan = (tree, plan_summary(tree))
+    _plans[sid] = (time.monotonic(), plan)
+    return plan
+
+async def _record(db, slow: dict):
+    command = slow["command"]
+    collection = command.get("collection") if slow["command_name"] == "getMore" else command.get(slow["command_name"])
+    if collection == OWN_COLLECTION:
+        return
+    shape = redact(command)
+    shape[slow["command_name"]] = collection
+    sid = shape_id(shape)
+    plan = await _plan(db, slow, sid)
+    await db[OWN_COLLECTION].insert_one({
+        "shape_id": sid,
+        "shape": json.dumps(shape, sort_keys=True, default=str),
+        "command": slow["command_name"],
+        "collection": collection,
+        "route": slow["route"],
+        "duration_ms": slow["duration_ms"],
+        "ok": slow["ok"],
+        "skip": command.get("skip"),
+        "at": slow["at"],
+        "plan": plan[0] if plan else None,
+        "plan_summary": plan[1] if plan else None,
+        "collscan": "COLLSCAN" in plan[1] if plan else None,
+    })
+
+async def record_slow_commands(db):
+    """Drain the slow-command queue for this worker (run from the app lifespan)"""
+    global _loop, _queue
+    _loop, _queue = asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE)
+    try:
+        while True:
+            slow = await _queue.get()
+            try:
+                await _record(db, slow)
+            except Exception as e:
+                logger.warning(f"Recording slow command failed: {e}")
+    finally:
+        _loop, _queue = None, None
+
+async def create_slow_command_indexes(db):
+    await db[OWN_COLLECTION].create_index("at", expireAfterSeconds=SLOW_COMMAND_RETENTION_SECONDS)
+    await db[OWN_COLLECTION].create_index([("shape_id", 1), ("at", -1)])
+
+def by_shape_pipeline(since: datetime, route: Optional[str] = None, limit: int = 50) -> list:
+    match = {"at": {"$gte": since}}
+    if route:
+        match["route"] = route
+    return [
+        {"$match": match},
+        {"$sort": {"at": 1}},
+        {"$group": {
+            "_id": "$shape_id",
+            "shape": {"$last": "$shape"},
+            "command": {"$last": "$command"},
+            "collection": {"$last": "$collection"},
+            "count": {"$sum": 1},
+            "total_ms": {"$sum": "$duration_ms"},
+            "avg_ms": {"$avg": "$duration_ms"},
+            "max_ms": {"$max": "$duration_ms"},
+            "max_skip": {"$max": "$skip"},
+            "failures": {"$sum": {"$cond": ["$ok", 0, 1]}},
+            "routes": {"$addToSet": "$route"},
+            "plan_summary": {"$last": "$plan_summary"},
+            "collscan": {"$last": "$collscan"},
+            "last_seen": {"$last": "$at"},
+        }},
+        {"$sort": {"total_ms": -1}},
+        {"$limit": limit},
+    ]
@@ -118,7 +118,7 @@ db.createCollection('transactions', {
           description: 'Reference to account'
         },
         transaction_type: {
-          enum: ['debit', 'credit', 'pix_sent', 'pix_received', 'bill_payment', 'transfer', 'mobile_topup', 'investment', 'loan_payment'],
+          enum: ['debit', 'credit', 'pix_sent', 'pix_received', 'bill_payment', 'transfer', 'mobile_topup', 'investment', 'investment_redemption', 'loan_payment', 'card_purchase'],
           description: 'Type of transaction'
         },
         category: {
@@ -222,6 +222,23 @@ db.createCollection('investments', {
   }
 });
 
+// Price history: raw ticks and 1m/1h/1d bars, bucketed by symbol
+db.createCollection('price_ticks', {
+  timeseries: { timeField: 'ts', metaField: 'symbol', granularity: 'seconds' },
+  expireAfterSeconds: 2 * 24 * 3600
+});
+db.createCollection('price_bars_1m', {
+  timeseries: { timeField: 'ts', metaField: 'symbol', granularity: 'minutes' },
+  expireAfterSeconds: 30 * 24 * 3600
+});
+db.createCollection('price_bars_1h', {
+  timeseries: { timeField: 'ts', metaField: 'symbol', granularity: 'hours' },
+  expireAfterSeconds: 2 * 365 * 24 * 3600
+});
+db.createCollection('price_bars_1d', {
+  timeseries: { timeField: 'ts', metaField: 'symbol', granularity: 'hours' }
+});
+
 // Create indexes for better performance
 print('🔍 Creating database indexes...');
 
@@ -241,11 +258,30 @@ db.transactions.createIndex({ 'category': 1 });
 db.transactions.createIndex({ 'status': 1 });
 
 // Credit Cards indexes
-db.credit_cards.createIndex({ 'user_id': 1 });
+db.credit_cards.createIndex({ 'user_id': 1, 'card_name': 1 }, { unique: true });
 
 // Investments indexes
-db.investments.createIndex({ 'user_id': 1 });
+db.investments.createIndex({ 'user_id': 1, 'is_active': 1 });
 db.investments.createIndex({ 'investment_type': 1 });
+db.investments.createIndex(
+  { 'user_id': 1, 'symbol': 1 },
+  { unique: true, partialFilterExpression: { 'symbol': { $type: 'string' } } }
+);
+db.investment_lots.createIndex({ 'position_id': 1, 'purchase_date': 1 });
+db.investment_lots.createIndex({ 'user_id': 1 });
+
+// Price history indexes
+['price_ticks', 'price_bars_1m', 'price_bars_1h', 'price_bars_1d'].forEach(function (name) {
+  db.getCollection(name).createIndex({ 'symbol': 1, 'ts': 1 });
+});
+
+// Request profiles (kept for a week)
+db.request_profiles.createIndex({ 'started_at': 1 }, { expireAfterSeconds: 604800 });
+db.request_profiles.createIndex({ 'route': 1, 'started_at': -1 });
+
+// Slow command log (kept for a week)
+db.slow_commands.createIndex({ 'at': 1 }, { expireAfterSeconds: 604800 });
+db.slow_commands.createIndex({ 'shape_id': 1, 'at': -1 });
 
 // Insert sample data
 print('📝 Inserting sample banking data...');
@@ -497,6 +533,18 @@ const sampleInvestments = [
 ];
 
 db.investments.insertMany(sampleInvestments);
+
+// FIFO lot behind the sample BTC position
+db.investment_lots.insertOne({
+  position_id: sampleInvestments[0]._id,
+  user_id: sampleInvestments[0].user_id,
+  symbol: 'BTC',
+  quantity: 0.05,
+  remaining: 0.05,
+  price: 95000.00,
+  purchase_date: sampleInvestments[0].purchase_date,
+  disposals: []
+});
 print('✅ Sample investments created');
 
 print('🎉 BankSys database initialization completed successfully!');
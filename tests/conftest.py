@@ -0,0 +1,64 @@
+"""Shared fixtures: the API on the in-memory storage backend, driven in process."""
+import itertools
+
+import httpx
+import pytest
+from passlib.context import CryptContext
+
+from backend import database, repositories
+from backend.app import create_app
+from backend.controllers import auth_controller
+
+from .fake_mongo import FakeDatabase
+
+_numbers = itertools.count(1)
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture(autouse=True)
+def fast_password_hashing(monkeypatch):
+    # bcrypt is slow by design; the tests only need hashes that verify
+    monkeypatch.setattr(auth_controller, "pwd_context", CryptContext(schemes=["plaintext"]))
+
+@pytest.fixture
+async def app(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    app = create_app(instrument=False, limit_rate=False)
+    async with app.router.lifespan_context(app):
+        yield app
+
+@pytest.fixture
+def mongo_db(app):
+    """A ``FakeDatabase`` behind the endpoints that use ``get_database`` (jobs, schedules, ...)"""
+    db = FakeDatabase()
+    app.dependency_overrides[database.get_database] = lambda: db
+    yield db
+    app.dependency_overrides.pop(database.get_database, None)
+
+@pytest.fixture
+async def client(app):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+@pytest.fixture
+def signup(client):
+    """``await signup()`` registers a new user and returns their auth headers (``admin=True``: an admin)"""
+    async def register(admin: bool = False) -> dict:
+        number = next(_numbers)
+        profile = {
+            "cpf": f"{number:011d}",
+            "password": "Secret@123",
+            "full_name": f"Test User {number}",
+            "email": f"user{number}@banksys.test",
+            "phone": f"119{number:08d}",
+        }
+        response = await client.post("/api/auth/register", json=profile)
+        assert response.status_code == 200, response.text
+        if admin:
+            users = (await repositories.get_repositories()).users
+            users.users[users.by_cpf[profile["cpf"]]]["is_admin"] = True
+        response = await client.post("/api/auth/login", json={"cpf": profile["cpf"], "password": profile["password"]})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register
@@ -0,0 +1,425 @@
+"""An in-process stand-in for the slice of Motor's API that the Mongo-only
+services (scheduler, jobs, billing close, rebalance) use, so their claim,
+lease and idempotency logic can be exercised without a ``mongod``.
+
+Only what those modules call is implemented: equality (``None`` matching a
+missing field, scalars matching array elements), ``$lt``/``$lte``/
+``$gt``/``$gte``/``$ne``/``$in``/``$exists``/``$type``, ``$or``/``$and``,
+``$expr`` comparisons; ``$set``/``$inc``/``$unset``/``$push``/
+``$setOnInsert`` updates; ``$match``/``$sort``/``$group`` aggregations;
+unique (optionally partial) indexes. Like ``MemoryRepositories`` nothing awaits
+between a read and its write, so every single-document update is atomic.
+"""
+from functools import cmp_to_key
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from backend.repositories.memory import _clone, _project as _include
+
+_MISSING = object()
+
+def _get(document: dict, path: str):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+def _project(document: dict, projection) -> dict:
+    """Inclusion projections as the memory backend does them, plus exclusion-only ones like ``{"_id": 0}``"""
+    if projection and not any(projection.values()):
+        return {field: _clone(value) for field, value in document.items() if field not in projection}
+    return _include(document, projection)
+
+def _candidates(value):
+    if value is _MISSING:
+        return [None]
+    return [value, *value] if isinstance(value, list) else [value]
+
+def _compare(a, b) -> int:
+    if a is None or b is None:
+        return (a is not None) - (b is not None)
+    return (a > b) - (a < b)
+
+def _comparable(a, b) -> bool:
+    """Range operators only match values of the same BSON type (any two numbers compare)"""
+    numbers = (int, float)
+    if isinstance(a, numbers) and isinstance(b, numbers):
+        return not isinstance(a, bool) and not isinstance(b, bool)
+    return a is not None and type(a) is type(b)
+
+def _operator_matches(value, operator: str, argument) -> bool:
+    if operator == "$ne":
+        return not _operator_matches(value, "$eq", argument)
+    if operator == "$eq":
+        return any(candidate == argument for candidate in _candidates(value))
+    if operator == "$in":
+        return any(candidate in argument for candidate in _candidates(value))
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(argument)
+    if operator == "$type":
+        types = {"string": str, "objectId": ObjectId}
+        return value is not _MISSING and isinstance(value, types[argument])
+    comparisons = {"$lt": lambda c: c < 0, "$lte": lambda c: c <= 0, "$gt": lambda c: c > 0, "$gte": lambda c: c >= 0}
+    if operator in comparisons:
+        return any(
+            _comparable(candidate, argument) and comparisons[operator](_compare(candidate, argument))
+            for candidate in _candidates(value)
+        )
+    raise NotImplementedError(operator)
+
+def _evaluate(document: dict, expression):
+    """Expression operands: ``"$field"`` paths, ``{field: expression}`` objects (missing fields dropped),
+    ``$ifNull``/``$not``, ``$dateTrunc`` and the comparisons"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(document, expression[1:])
+        return None if value is _MISSING else value
+    if not isinstance(expression, dict):
+        return expression
+    if not any(key.startswith("$") for key in expression):
+        evaluated = {}
+        for field, value in expression.items():
+            if not (isinstance(value, str) and value.startswith("$") and _get(document, value[1:]) is _MISSING):
+                evaluated[field] = _evaluate(document, value)
+        return evaluated
+    [(operator, arguments)] = expression.items()
+    if operator == "$dateTrunc":
+        return _truncate(_evaluate(document, arguments["date"]), arguments["unit"])
+    values = [_evaluate(document, argument) for argument in arguments]
+    if operator == "$ifNull":
+        return next((value for value in values if value is not None), None)
+    if operator == "$not":
+        return not values[0]
+    comparisons = {"$lt": lambda c: c < 0, "$lte": lambda c: c <= 0, "$gt": lambda c: c > 0, "$gte": lambda c: c >= 0}
+    return comparisons[operator](_compare(*values))
+
+_TRUNCATED = {"minute": ("second", "microsecond"), "hour": ("minute", "second", "microsecond"),
+              "day": ("hour", "minute", "second", "microsecond")}
+
+def _truncate(moment, unit: str):
+    return moment.replace(**{field: 0 for field in _TRUNCATED[unit]})
+
+def matches(document: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$expr":
+            if not _evaluate(document, condition):
+                return False
+        elif field == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+        elif field == "$and":
+            if not all(matches(document, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+            value = _get(document, field)
+            if not all(_operator_matches(value, operator, argument) for operator, argument in condition.items()):
+                return False
+        elif not _operator_matches(_get(document, field), "$eq", condition):
+            return False
+    return True
+
+def _set(document: dict, path: str, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+def _apply_update(document: dict, update: dict, inserting: bool = False):
+    for operator, fields in update.items():
+        for path, argument in fields.items():
+            current = _get(document, path)
+            if operator == "$set" or (operator == "$setOnInsert" and inserting):
+                _set(document, path, _clone(argument))
+            elif operator == "$inc":
+                _set(document, path, (0 if current is _MISSING else current) + argument)
+            elif operator == "$unset":
+                *parents, last = path.split(".")
+                parent = document
+                for part in parents:
+                    parent = parent.get(part, {})
+                parent.pop(last, None)
+            elif operator == "$push":
+                items = list(argument["$each"]) if isinstance(argument, dict) and "$each" in argument else [argument]
+                pushed = ([] if current is _MISSING else list(current)) + _clone(items)
+                if isinstance(argument, dict) and "$slice" in argument:
+                    pushed = pushed[argument["$slice"]:] if argument["$slice"] < 0 else pushed[:argument["$slice"]]
+                _set(document, path, pushed)
+            elif operator != "$setOnInsert":
+                raise NotImplementedError(operator)
+
+def _sort_key(spec):
+    if isinstance(spec, str):
+        spec = [(spec, 1)]
+
+    def compare(a, b):
+        for field, direction in spec:
+            left, right = _get(a, field), _get(b, field)
+            order = _compare(None if left is _MISSING else left, None if right is _MISSING else right)
+            if order:
+                return order * direction
+        return 0
+    return cmp_to_key(compare)
+
+class _Result:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+class FakeCursor:
+    def __init__(self, documents: list, projection):
+        self.documents = documents
+        self.projection = projection
+        self._skip = 0
+        self._limit = None
+
+    def sort(self, key, direction: int = 1):
+        self.documents = sorted(self.documents, key=_sort_key(key if isinstance(key, list) else [(key, direction)]))
+        return self
+
+    def batch_size(self, count: int):
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count or None
+        return self
+
+    def _results(self) -> list:
+        documents = self.documents[self._skip:]
+        if self._limit is not None:
+            documents = documents[:self._limit]
+        return [_project(document, self.projection) for document in documents]
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results if length is None else results[:length]
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+def _group(documents: list, spec: dict) -> list:
+    groups = {}
+    for document in documents:
+        key = _evaluate(document, spec["_id"])
+        group = groups.setdefault(repr(key), {"_id": key})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            [(operator, expression)] = accumulator.items()
+            value = _evaluate(document, expression)
+            if operator == "$push":
+                group.setdefault(field, []).append(value)
+            elif operator == "$sum":
+                group[field] = group.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+            elif operator == "$first":
+                group.setdefault(field, value)
+            elif operator == "$last":
+                group[field] = value
+            elif operator in ("$max", "$min"):
+                pick = max if operator == "$max" else min
+                group[field] = value if field not in group else pick(group[field], value)
+            else:
+                raise NotImplementedError(operator)
+    return list(groups.values())
+
+def _project_stage(document: dict, spec: dict) -> dict:
+    projected = {} if spec.get("_id", 1) == 0 else {"_id": document.get("_id")}
+    for field, expression in spec.items():
+        if field == "_id":
+            continue
+        if expression in (0, 1):
+            value = _get(document, field)
+            if expression == 1 and value is not _MISSING:
+                projected[field] = value
+        else:
+            projected[field] = _evaluate(document, expression)
+    return projected
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.documents = []
+        self.unique_indexes = []
+
+    # Indexes
+
+    async def create_index(self, keys, unique: bool = False, partialFilterExpression=None, **options):
+        fields = [keys] if isinstance(keys, str) else [field for field, _ in keys]
+        if unique:
+            self.unique_indexes.append((fields, partialFilterExpression or {}))
+        return "_".join(fields)
+
+    def _check_unique(self, document: dict, ignore=None):
+        for fields, partial in self.unique_indexes:
+            if not matches(document, partial):
+                continue
+            key = [_get(document, field) for field in fields]
+            for other in self.documents:
+                if other is not ignore and matches(other, partial) and [_get(other, field) for field in fields] == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} dup key: {key!r}", 11000)
+        if ignore is None and any(other["_id"] == document["_id"] for other in self.documents):
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} dup key: _id", 11000)
+
+    # Reads
+
+    def find(self, query: dict = None, projection: dict = None, **options) -> FakeCursor:
+        return FakeCursor([document for document in self.documents if matches(document, query or {})], projection)
+
+    def aggregate(self, pipeline: list, **options) -> FakeCursor:
+        """``$match``, ``$sort``, ``$group`` (``$push``/``$sum``/``$first``/``$last``/``$max``/``$min``)
+        and ``$project`` stages"""
+        documents = [_clone(document) for document in self.documents]
+        for stage in pipeline:
+            [(name, spec)] = stage.items()
+            if name == "$match":
+                documents = [document for document in documents if matches(document, spec)]
+            elif name == "$sort":
+                documents.sort(key=_sort_key(list(spec.items())))
+            elif name == "$group":
+                documents = _group(documents, spec)
+            elif name == "$project":
+                documents = [_project_stage(document, spec) for document in documents]
+            else:
+                raise NotImplementedError(name)
+        return FakeCursor(documents, None)
+
+    async def find_one(self, query: dict = None, projection: dict = None, sort=None):
+        cursor = self.find(query, projection)
+        if sort:
+            cursor.sort(sort)
+        found = await cursor.limit(1).to_list(1)
+        return found[0] if found else None
+
+    async def count_documents(self, query: dict) -> int:
+        return sum(1 for document in self.documents if matches(document, query))
+
+    # Writes
+
+    async def insert_one(self, document: dict):
+        if document.get("_id") is None:
+            document["_id"] = ObjectId()
+        stored = _clone(document)
+        self._check_unique(stored)
+        self.documents.append(stored)
+        return _Result(inserted_id=stored["_id"])
+
+    async def insert_many(self, documents: list, ordered: bool = True):
+        errors, inserted = [], []
+        for index, document in enumerate(documents):
+            try:
+                inserted.append((await self.insert_one(document)).inserted_id)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return _Result(inserted_ids=inserted)
+
+    def _update(self, query: dict, update: dict, many: bool, upsert: bool = False, sort=None):
+        targets = [document for document in self.documents if matches(document, query)]
+        if sort:
+            targets.sort(key=_sort_key(sort))
+        if not many:
+            targets = targets[:1]
+        for document in targets:
+            before = _clone(document)
+            _apply_update(document, update)
+            try:
+                self._check_unique(document, ignore=document)
+            except DuplicateKeyError:
+                document.clear()
+                document.update(before)
+                raise
+        upserted = None
+        if not targets and upsert:
+            document = {field: value for field, value in query.items() if not field.startswith("$")
+                        and not (isinstance(value, dict) and any(key.startswith("$") for key in value))}
+            document["_id"] = document.get("_id") or ObjectId()
+            _apply_update(document, update, inserting=True)
+            self._check_unique(document)
+            self.documents.append(document)
+            upserted = document
+        return targets, upserted
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        targets, upserted = self._update(query, update, many=False, upsert=upsert)
+        return _Result(matched_count=len(targets), modified_count=len(targets),
+                       upserted_id=upserted["_id"] if upserted else None)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False):
+        targets, upserted = self._update(query, update, many=True, upsert=upsert)
+        return _Result(matched_count=len(targets), modified_count=len(targets),
+                       upserted_id=upserted["_id"] if upserted else None)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False):
+        target = next((document for document in self.documents if matches(document, query)), None)
+        if target is not None:
+            target_id = target["_id"]
+            target.clear()
+            target.update(_clone(replacement), _id=target_id)
+            return _Result(matched_count=1, modified_count=1, upserted_id=None)
+        if not upsert:
+            return _Result(matched_count=0, modified_count=0, upserted_id=None)
+        document = {field: value for field, value in query.items() if not field.startswith("$") and not isinstance(value, dict)}
+        inserted = await self.insert_one({**document, **replacement})
+        return _Result(matched_count=0, modified_count=0, upserted_id=inserted.inserted_id)
+
+    async def find_one_and_update(self, query: dict, update: dict, projection: dict = None, sort=None,
+                                  upsert: bool = False, return_document=ReturnDocument.BEFORE):
+        before = [_clone(document) for document in self.documents if matches(document, query)]
+        if sort:
+            before.sort(key=_sort_key(sort))
+        targets, upserted = self._update(query, update, many=False, upsert=upsert, sort=sort)
+        if targets:
+            document = targets[0] if return_document == ReturnDocument.AFTER else before[0]
+        elif upserted is not None and return_document == ReturnDocument.AFTER:
+            document = upserted
+        else:
+            return None
+        return _project(document, projection)
+
+    async def delete_many(self, query: dict):
+        kept = [document for document in self.documents if not matches(document, query)]
+        deleted = len(self.documents) - len(kept)
+        self.documents = kept
+        return _Result(deleted_count=deleted)
+
+    async def bulk_write(self, operations: list, ordered: bool = True):
+        modified = upserted = 0
+        for operation in operations:
+            spec = operation._doc
+            targets, inserted = self._update(operation._filter, spec, many=False, upsert=operation._upsert)
+            # An upsert that matched ran only $setOnInsert, which changes nothing
+            modified += len(targets) if set(spec) != {"$setOnInsert"} else 0
+            upserted += inserted is not None
+        return _Result(modified_count=modified, upserted_count=upserted)
+
+class FakeDatabase:
+    """``db.name`` / ``db[name]`` collections, created on first use like MongoDB's"""
+
+    def __init__(self, name: str = "test"):
+        self.name = name
+        self.collections = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name)
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
@@ -0,0 +1,123 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from backend.repositories import balance_cache
+from backend.repositories.balance_cache import BalanceCache, CachedAccountRepository, LocalChannel, watch_balance_changes
+from backend.repositories.memory import MemoryAccountRepository
+from backend.services.ledger import BALANCE_PROJECTION
+
+pytestmark = pytest.mark.anyio
+
+async def add_account(accounts, balance: float = 100.0):
+    user_id = ObjectId()
+    await accounts.insert({"user_id": user_id, "account_number": str(user_id)[-8:],
+                           "balance": balance, "available_balance": balance})
+    return user_id
+
+def live_cache(ttl: float = 60.0) -> BalanceCache:
+    cache = BalanceCache(ttl=ttl)
+    cache.resume()
+    return cache
+
+async def balance(repo, user_id) -> float:
+    return (await repo.get_for_user(user_id, {"balance": 1}))["balance"]
+
+class SlowReads(MemoryAccountRepository):
+    """Balance reads wait for ``release``, so a write can land between a read and its fill"""
+
+    def __init__(self):
+        super().__init__()
+        self.reading, self.release = asyncio.Event(), asyncio.Event()
+
+    async def get_for_user(self, user_id, projection=None):
+        account = await super().get_for_user(user_id, projection)
+        self.reading.set()
+        await self.release.wait()
+        return account
+
+async def test_fill_racing_a_write_is_dropped():
+    accounts = SlowReads()
+    user_id = await add_account(accounts)
+    repo = CachedAccountRepository(accounts, live_cache(), LocalChannel())
+
+    read = asyncio.create_task(balance(repo, user_id))
+    await accounts.reading.wait()
+    await repo.apply_delta(user_id, -30.0)  # Lands after the read, before its fill
+    accounts.release.set()
+    assert await read == 100.0
+
+    assert repo.cache.get(user_id)["balance"] == 70.0
+    assert await balance(repo, user_id) == 70.0
+
+async def test_fill_racing_an_invalidation_is_dropped():
+    cache = live_cache()
+    user_id, account = ObjectId(), {"_id": ObjectId(), "account_number": "1", "balance": 5.0, "available_balance": 5.0}
+    cache.fill(user_id, account, cache.begin(user_id))
+    token = cache.begin(user_id)
+    cache.on_change({"account_id": account["_id"], "balance": 9.0, "available_balance": 9.0})
+    cache.fill(user_id, account, token)
+    assert cache.get(user_id) is None
+
+async def test_first_fill_racing_an_unattributed_change_is_dropped():
+    cache = live_cache()
+    user_id, account = ObjectId(), {"_id": ObjectId(), "account_number": "1", "balance": 5.0, "available_balance": 5.0}
+    token = cache.begin(user_id)
+    cache.on_change({"account_id": account["_id"], "balance": 9.0})  # Could be this user's, not yet known
+    cache.fill(user_id, account, token)
+    assert cache.get(user_id) is None
+
+async def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(balance_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    accounts = MemoryAccountRepository()
+    user_id = await add_account(accounts)
+    repo = CachedAccountRepository(accounts, live_cache(ttl=2.0), LocalChannel())
+
+    await balance(repo, user_id)
+    await accounts.apply_delta(user_id, 10.0)  # Behind the cache's back, and never announced
+    clock.now += 1.9
+    assert await balance(repo, user_id) == 100.0
+    clock.now += 0.1
+    assert await balance(repo, user_id) == 110.0
+
+async def test_cache_is_bypassed_until_the_channel_is_live():
+    accounts = MemoryAccountRepository()
+    user_id = await add_account(accounts)
+    repo = CachedAccountRepository(accounts, BalanceCache(ttl=60.0), LocalChannel())
+
+    assert await balance(repo, user_id) == 100.0
+    assert repo.cache.entries == {}
+    await repo.apply_delta(user_id, 5.0)
+    assert repo.cache.get(user_id) is None
+
+async def test_write_of_another_worker_invalidates_through_the_channel():
+    accounts, channel = MemoryAccountRepository(), LocalChannel()
+    user_id = await add_account(accounts)
+    workers = [CachedAccountRepository(accounts, BalanceCache(ttl=60.0), channel) for _ in range(2)]
+    listeners = [asyncio.create_task(watch_balance_changes(worker.cache, channel)) for worker in workers]
+    await asyncio.sleep(0)
+    try:
+        reader, writer = workers
+        assert await balance(reader, user_id) == 100.0
+        await writer.apply_delta(user_id, -40.0)
+        await asyncio.sleep(0)
+        assert reader.cache.get(user_id) is None
+        assert await balance(reader, user_id) == 60.0
+        # The writer's own change, seen again, keeps its entry
+        assert writer.cache.get(user_id)["balance"] == 60.0
+    finally:
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+
+async def test_channel_going_down_empties_and_bypasses_the_cache():
+    cache = live_cache()
+    user_id, account = ObjectId(), {"_id": ObjectId(), **{field: 1.0 for field in BALANCE_PROJECTION}}
+    cache.fill(user_id, account, cache.begin(user_id))
+    cache.suspend()
+    assert cache.get(user_id) is None
+    cache.fill(user_id, account, cache.begin(user_id))
+    assert cache.get(user_id) is None
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from backend.services.billing import (
+    _close_operations, billing_fields, close_billing_cycles, create_billing_indexes, minimum_payment
+)
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+OPENED = datetime(2024, 3, 10)
+CLOSING = datetime(2024, 4, 5)
+
+@pytest.fixture
+async def db():
+    db = FakeDatabase()
+    await create_billing_indexes(db)
+    return db
+
+async def add_card(db, balance: float):
+    card = {"user_id": ObjectId(), "is_active": True, **billing_fields(OPENED), "current_balance": balance}
+    return (await db.credit_cards.insert_one(card)).inserted_id
+
+async def test_closing_twice_issues_one_invoice(db):
+    card_id = await add_card(db, 300.0)
+    assert await close_billing_cycles(db, as_of=CLOSING) == 1
+    assert await close_billing_cycles(db, as_of=CLOSING) == 0
+
+    [invoice] = db.invoices.documents
+    assert (invoice["total"], invoice["minimum_payment"]) == (300.0, minimum_payment(300.0))
+    card = await db.credit_cards.find_one({"_id": card_id})
+    assert (card["current_balance"], card["statement_balance"]) == (0.0, 300.0)
+    assert card["cycle_start"] == CLOSING and card["next_closing_date"] == datetime(2024, 5, 5)
+
+async def test_close_interrupted_after_the_invoice_is_finished_once(db):
+    card_id = await add_card(db, 120.0)
+    cards = await db.credit_cards.find({}).to_list(None)
+    invoice_ops, _ = _close_operations(cards, CLOSING)
+    await db.invoices.bulk_write(invoice_ops)  # The card update never ran
+
+    assert await close_billing_cycles(db, as_of=CLOSING) == 1
+    assert [invoice["total"] for invoice in db.invoices.documents] == [120.0]
+    assert (await db.credit_cards.find_one({"_id": card_id}))["current_balance"] == 0.0
+
+async def test_purchase_racing_the_close_stays_in_the_next_cycle(db):
+    card_id = await add_card(db, 200.0)
+    cards = await db.credit_cards.find({}).to_list(None)
+    invoice_ops, card_ops = _close_operations(cards, CLOSING)
+    # Charged after the close read the card, before it wrote it
+    await db.credit_cards.update_one({"_id": card_id}, {"$inc": {"current_balance": 45.0}})
+    await db.invoices.bulk_write(invoice_ops)
+    await db.credit_cards.bulk_write(card_ops)
+
+    card = await db.credit_cards.find_one({"_id": card_id})
+    assert (card["statement_balance"], card["current_balance"]) == (200.0, 45.0)
+    assert [invoice["total"] for invoice in db.invoices.documents] == [200.0]
+
+async def test_cycles_are_closed_across_concurrent_chunks(db):
+    for balance in range(7):
+        await add_card(db, float(balance))
+    await add_card(db, 50.0)
+    await db.credit_cards.update_one({"current_balance": 50.0}, {"$set": {"is_active": False}})
+
+    assert await close_billing_cycles(db, as_of=CLOSING, chunk_size=2, concurrency=2) == 7
+    assert await db.invoices.count_documents({}) == 7
+    assert await db.credit_cards.count_documents({"next_closing_date": CLOSING}) == 1
@@ -0,0 +1,24 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+async def test_purchase_is_charged_to_the_card_limit(client, signup):
+    headers = await signup()
+    [card, *_] = (await client.get("/api/accounts/credit-cards", headers=headers)).json()
+    response = await client.post(f"/api/accounts/credit-cards/{card['id']}/purchases", headers=headers,
+                                 json={"amount": 100.0, "description": "Groceries"})
+    assert response.status_code == 200
+    assert response.json()["available_limit"] == pytest.approx(card["available_limit"] - 100.0)
+
+    over = await client.post(f"/api/accounts/credit-cards/{card['id']}/purchases", headers=headers,
+                             json={"amount": card["available_limit"], "description": "Too much"})
+    assert over.status_code == 400
+
+@pytest.mark.parametrize("method, path", [
+    ("POST", "/api/accounts/credit-cards/not-an-id/purchases"),
+    ("GET", "/api/accounts/credit-cards/not-an-id/invoices"),
+])
+async def test_malformed_card_id_is_not_found(client, signup, method, path):
+    headers = await signup()
+    response = await client.request(method, path, headers=headers, json={"amount": 1.0, "description": "x"})
+    assert response.status_code == 404
@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from backend.services.cdb import (
+    BUSINESS_DAYS_PER_YEAR, CDI_ANNUAL_RATE, accrue, accrue_all, business_days, cdb_terms, income_tax_rate,
+    national_holidays
+)
+
+from .fake_mongo import FakeDatabase
+
+PURCHASED = datetime(2024, 1, 10)
+
+def compounded_daily(principal: float, start: datetime, end: datetime, daily_rate: float) -> float:
+    """Reference: step through every calendar day, compounding on business days only"""
+    holidays = set(national_holidays(start.year, end.year))
+    value, day = principal, start.date()
+    while day < end.date():
+        if day.weekday() < 5 and day not in holidays:
+            value *= 1 + daily_rate
+        day += timedelta(days=1)
+    return value
+
+@pytest.mark.parametrize("option_id", ["cdb_001", "cdb_002", "cdb_003"])
+def test_closed_form_matches_daily_compounding(option_id):
+    terms = cdb_terms(option_id, PURCHASED)
+    as_of = datetime(2024, 11, 25)
+    [value] = accrue([{"total_invested": 10_000.0, "purchase_date": PURCHASED, **terms}], as_of)
+
+    if terms["cdi_percentage"] is None:
+        daily = (1 + terms["interest_rate"] / 100) ** (1 / BUSINESS_DAYS_PER_YEAR) - 1
+    else:
+        daily = ((1 + CDI_ANNUAL_RATE / 100) ** (1 / BUSINESS_DAYS_PER_YEAR) - 1) * terms["cdi_percentage"] / 100
+    assert value == pytest.approx(compounded_daily(10_000.0, PURCHASED, as_of, daily), rel=1e-12)
+
+def test_weekends_and_holidays_are_not_business_days():
+    # Carnival Monday and Tuesday, then Ash Wednesday (a business day)
+    assert business_days(date(2024, 2, 9), date(2024, 2, 15)) == 2
+    assert business_days(date(2024, 12, 24), date(2024, 12, 27)) == 2
+    assert business_days(date(2024, 3, 1), date(2024, 2, 1)) == 0
+
+def test_accrual_stops_at_maturity():
+    holding = {"total_invested": 1000.0, "purchase_date": PURCHASED, **cdb_terms("cdb_001", PURCHASED)}
+    at_maturity, [later] = accrue([holding], holding["maturity_date"]), accrue([holding], datetime(2026, 6, 1))
+    assert later == at_maturity[0]
+    # A year of business days at 12.5% a.a., give or take the calendar
+    assert at_maturity[0] == pytest.approx(1125.0, rel=0.01)
+
+def test_income_tax_is_regressive_by_calendar_days():
+    assert income_tax_rate([0, 180, 181, 360, 361, 720, 721, 5000]).tolist() == [
+        0.225, 0.225, 0.20, 0.20, 0.175, 0.175, 0.15, 0.15
+    ]
+
+@pytest.mark.anyio
+async def test_daily_job_stores_accrued_value_on_active_cdbs():
+    db, as_of = FakeDatabase(), datetime(2024, 6, 3)
+    holding = {"investment_type": "cdb", "total_invested": 1000.0, "purchase_date": PURCHASED,
+               **cdb_terms("cdb_002", PURCHASED)}
+    active = (await db.investments.insert_one({**holding, "is_active": True})).inserted_id
+    await db.investments.insert_one({**holding, "is_active": False})
+    await db.investments.insert_one({"investment_type": "stocks", "total_invested": 5.0, "is_active": True,
+                                     "purchase_date": PURCHASED, "user_id": ObjectId()})
+
+    assert await accrue_all(db, as_of, batch_size=1) == 1
+    stored = await db.investments.find_one({"_id": active})
+    assert stored["accrued_value"] == pytest.approx(accrue([holding], as_of)[0])
+    assert stored["accrued_at"] == as_of
+    assert [doc.get("accrued_value") for doc in db.investments.documents[1:]] == [None, None]
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from backend.services.exposure import _aggregate, _combine, _frame, _records, _with_profit_loss
+
+PRICES = {"BTC": 100.0, "ETH": 10.0}
+USERS = [ObjectId() for _ in range(3)]
+
+def holding(user: int, investment_type: str, quantity: float, purchase_price: float, symbol=None, accrued_value=None):
+    return {"_id": ObjectId(), "user_id": USERS[user], "investment_type": investment_type, "symbol": symbol,
+            "quantity": quantity, "purchase_price": purchase_price, "total_invested": quantity * purchase_price,
+            "accrued_value": accrued_value}
+
+HOLDINGS = [
+    holding(0, "cryptocurrency", 2, 80.0, "BTC"),
+    holding(0, "cdb", 1, 1000.0, accrued_value=1050.0),
+    holding(1, "cryptocurrency", 5, 12.0, "ETH"),
+    holding(1, "stocks", 3, 20.0, "UNLISTED"),
+    holding(2, "cryptocurrency", 1, 90.0, "BTC"),
+]
+
+def test_holdings_are_valued_at_market_then_accrued_then_purchase_price():
+    frame = _frame(HOLDINGS, PRICES)
+    assert frame["current_value"].tolist() == [200.0, 1050.0, 50.0, 60.0, 100.0]
+    assert frame["invested"].tolist() == [160.0, 1000.0, 60.0, 60.0, 90.0]
+
+@pytest.mark.parametrize("key", ["symbol", "investment_type", "user_id"])
+def test_chunked_aggregates_combine_to_the_whole(key):
+    whole = _aggregate(_frame(HOLDINGS, PRICES), key).sort_index()
+    chunks = [_aggregate(_frame(HOLDINGS[start:start + 2], PRICES), key) for start in range(0, len(HOLDINGS), 2)]
+    combined = _combine(chunks, key).sort_index()
+    assert combined.index.tolist() == whole.index.tolist()
+    assert np.allclose(combined.to_numpy(dtype=float), whole.to_numpy(dtype=float))
+
+def test_report_rows_are_plain_python_with_profit_loss():
+    by_symbol = _with_profit_loss(_aggregate(_frame(HOLDINGS, PRICES), "symbol"))
+    rows = {row["symbol"]: row for row in _records(by_symbol, "symbol")}
+    btc = rows["BTC"]
+    assert (btc["quantity"], btc["invested"], btc["current_value"], btc["holdings"]) == (3.0, 250.0, 300.0, 2)
+    assert btc["profit_loss"] == 50.0 and btc["profit_loss_percentage"] == pytest.approx(20.0)
+    assert all(type(value) in (str, int, float) for row in rows.values() for value in row.values())
+
+def test_empty_scan_combines_to_an_empty_frame():
+    assert _combine([], "symbol").empty
@@ -0,0 +1,147 @@
+import pytest
+
+from backend import repositories
+from backend.controllers import investment_controller
+from backend.services.pricing import MOCK_CRYPTO_DATA
+
+pytestmark = pytest.mark.anyio
+
+BTC_PRICE = next(crypto["current_price"] for crypto in MOCK_CRYPTO_DATA if crypto["symbol"] == "BTC")
+
+async def balance(client, headers) -> float:
+    return (await client.get("/api/accounts/balance", headers=headers)).json()["balance"]
+
+async def buy_btc(client, headers, quantity: float, purchase_price: float = 1.0):
+    return await client.post("/api/investments/", headers=headers, json={
+        "investment_type": "cryptocurrency", "asset_name": "Bitcoin", "symbol": "BTC",
+        "quantity": quantity, "purchase_price": purchase_price,
+    })
+
+async def test_symbol_buy_is_priced_at_the_market(client, signup):
+    headers = await signup()
+    response = await buy_btc(client, headers, 0.001, purchase_price=0.01)
+    assert response.status_code == 200
+    assert response.json()["purchase_price"] == BTC_PRICE
+    assert await balance(client, headers) == pytest.approx(1000.0 - 0.001 * BTC_PRICE)
+
+async def test_buy_and_sell_round_trip_creates_no_money(client, signup):
+    headers = await signup()
+    investment = (await buy_btc(client, headers, 0.005, purchase_price=0.01)).json()
+    response = await client.post(f"/api/investments/{investment['id']}/sell", headers=headers, json={"price": 1_000_000})
+    assert response.status_code == 200
+    assert await balance(client, headers) == pytest.approx(1000.0)
+
+@pytest.mark.parametrize("field, value", [("quantity", -1), ("quantity", 0), ("purchase_price", -5)])
+async def test_non_positive_sizes_are_rejected(client, signup, field, value):
+    headers = await signup()
+    order = {"investment_type": "stocks", "asset_name": "Unlisted", "quantity": 1, "purchase_price": 10, field: value}
+    response = await client.post("/api/investments/", headers=headers, json=order)
+    assert response.status_code == 422
+    assert await balance(client, headers) == 1000.0
+
+async def test_symbol_without_market_price_is_rejected(client, signup):
+    headers = await signup()
+    response = await client.post("/api/investments/", headers=headers, json={
+        "investment_type": "stocks", "asset_name": "Nowhere", "symbol": "NOPE", "quantity": 1, "purchase_price": 1,
+    })
+    assert response.status_code == 400
+    assert await balance(client, headers) == 1000.0
+
+async def test_unlisted_holding_is_redeemed_at_its_purchase_price(client, signup):
+    headers = await signup()
+    investment = (await client.post("/api/investments/", headers=headers, json={
+        "investment_type": "stocks", "asset_name": "Unlisted", "quantity": 2, "purchase_price": 100,
+    })).json()
+    response = await client.post(f"/api/investments/{investment['id']}/sell", headers=headers, json={"price": 1_000_000})
+    assert response.status_code == 200
+    assert response.json()["proceeds"] == pytest.approx(200.0)
+    assert await balance(client, headers) == pytest.approx(1000.0)
+
+async def test_sale_whose_credit_fails_is_undone(client, signup, monkeypatch):
+    headers = await signup()
+    investment = (await buy_btc(client, headers, 0.005)).json()
+    paid = await balance(client, headers)
+
+    async def unreachable(repos, transaction):
+        raise ConnectionError("ledger unreachable")
+    monkeypatch.setattr(investment_controller, "post_transaction", unreachable)
+    response = await client.post(f"/api/investments/{investment['id']}/sell", headers=headers, json={})
+    monkeypatch.undo()
+
+    assert response.status_code == 503
+    assert await balance(client, headers) == paid
+    [holding] = (await client.get("/api/investments/", headers=headers)).json()
+    assert holding["quantity"] == pytest.approx(0.005)
+    lots = (await client.get(f"/api/investments/{investment['id']}/lots", headers=headers)).json()
+    assert [lot["remaining"] for lot in lots] == [pytest.approx(0.005)]
+
+async def test_sale_whose_credit_fails_after_landing_is_credited_once(client, signup, monkeypatch):
+    headers = await signup()
+    investment = (await buy_btc(client, headers, 0.005)).json()
+    post_transaction = investment_controller.post_transaction
+    calls = []
+
+    async def lost_reply(repos, transaction):
+        calls.append(transaction)
+        posted = await post_transaction(repos, transaction)
+        if len(calls) == 1:
+            raise ConnectionError("reply lost")
+        return posted
+    monkeypatch.setattr(investment_controller, "post_transaction", lost_reply)
+    response = await client.post(f"/api/investments/{investment['id']}/sell", headers=headers, json={})
+
+    assert response.status_code == 200
+    assert await balance(client, headers) == pytest.approx(1000.0)
+    assert (await client.get("/api/investments/", headers=headers)).json() == []
+
+@pytest.mark.parametrize("method, path", [("POST", "/api/investments/not-an-id/sell"), ("GET", "/api/investments/not-an-id/lots")])
+async def test_malformed_investment_id_is_not_found(client, signup, method, path):
+    headers = await signup()
+    response = await client.request(method, path, headers=headers, json={})
+    assert response.status_code == 404
+
+async def test_purchase_that_fails_after_the_debit_is_refunded(client, signup, monkeypatch):
+    headers = await signup()
+
+    async def unreachable(*args, **kwargs):
+        raise ConnectionError("positions unreachable")
+    monkeypatch.setattr(investment_controller, "buy", unreachable)
+    with pytest.raises(ConnectionError):
+        await buy_btc(client, headers, 0.005)
+    monkeypatch.undo()
+
+    assert await balance(client, headers) == pytest.approx(1000.0)
+    assert (await client.get("/api/investments/", headers=headers)).json() == []
+    history = (await client.get("/api/transactions/", headers=headers)).json()
+    assert sorted(transaction["transaction_type"] for transaction in history if transaction["category"] == "investment") == [
+        "investment", "investment_redemption"
+    ]
+
+async def test_purchase_whose_debit_reply_is_lost_is_refunded_once(client, signup, monkeypatch):
+    headers = await signup()
+    post_transaction = investment_controller.post_transaction
+    calls = []
+
+    async def lost_reply(repos, transaction):
+        calls.append(transaction)
+        posted = await post_transaction(repos, transaction)
+        if len(calls) == 1:
+            raise ConnectionError("reply lost")
+        return posted
+    monkeypatch.setattr(investment_controller, "post_transaction", lost_reply)
+    response = await buy_btc(client, headers, 0.005)
+
+    assert response.status_code == 503
+    assert await balance(client, headers) == pytest.approx(1000.0)
+    assert [transaction["posting_key"] for transaction in calls[1:]] == [f"refund:{calls[0]['posting_key']}"]
+
+async def test_update_prices_only_rereads_the_market(app, client, signup):
+    headers = await signup()
+    await buy_btc(client, headers, 0.005)
+    market = (await repositories.get_repositories()).market
+    before = await market.quotes()
+
+    response = await client.post("/api/investments/update-prices", headers=headers)
+    assert response.status_code == 200
+    assert [holding["current_price"] for holding in response.json()] == [BTC_PRICE]
+    assert await market.quotes() == before
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.services import jobs
+from backend.services.jobs import JOB_HANDLERS, claim_job, complete_job, enqueue_job, fail_job
+from backend.sharding import ShardMoving
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def db():
+    return FakeDatabase()
+
+def later(db, seconds: float):
+    """Make every queued or leased job look ``seconds`` older"""
+    for job in db.jobs.documents:
+        for field in ("run_at", "lease_expires_at"):
+            if job.get(field) is not None:
+                job[field] -= timedelta(seconds=seconds)
+
+async def test_jobs_are_claimed_by_priority_then_age(db):
+    low = await enqueue_job(db, "k", priority=0)
+    high = await enqueue_job(db, "k", priority=5)
+    claimed = [(await claim_job(db, "w"))["_id"], (await claim_job(db, "w"))["_id"]]
+    assert claimed == [high, low]
+    assert await claim_job(db, "w") is None
+
+async def test_expired_lease_is_claimed_again_as_a_new_attempt(db):
+    await enqueue_job(db, "k")
+    first = await claim_job(db, "a", lease_seconds=60)
+    assert first["attempts"] == 1 and await claim_job(db, "b") is None
+    later(db, 61)
+    second = await claim_job(db, "b")
+    assert (second["lease_owner"], second["attempts"]) == ("b", 2)
+    # The first worker lost the lease: its completion is ignored
+    await complete_job(db, first, {"ok": True})
+    assert (await db.jobs.find_one({"_id": first["_id"]}))["status"] == "running"
+
+async def test_lease_expiring_on_the_last_attempt_dead_letters_the_job(db):
+    job_id = await enqueue_job(db, "k", max_attempts=2)
+    for _ in range(2):
+        assert await claim_job(db, "w", lease_seconds=60) is not None
+        later(db, 61)  # The worker crashed
+    assert await claim_job(db, "w") is None
+    job = await db.jobs.find_one({"_id": job_id})
+    assert (job["status"], job["attempts"], job["lease_expires_at"]) == ("dead", 2, None)
+
+async def test_failures_back_off_then_dead_letter(db):
+    job_id = await enqueue_job(db, "k", max_attempts=2)
+    await fail_job(db, await claim_job(db, "w"), "boom")
+    job = await db.jobs.find_one({"_id": job_id})
+    assert job["status"] == "queued" and job["run_at"] > datetime.utcnow()
+    later(db, jobs.RETRY_BACKOFF.total_seconds())
+    await fail_job(db, await claim_job(db, "w"), "boom")
+    assert (await db.jobs.find_one({"_id": job_id}))["status"] == "dead"
+
+async def test_user_being_moved_defers_without_using_an_attempt(db, monkeypatch):
+    async def moving(db, user_id, payload):
+        raise ShardMoving("moving to s2")
+    monkeypatch.setitem(JOB_HANDLERS, "test.moving", moving)
+    job_id = await enqueue_job(db, "test.moving", max_attempts=1)
+    for _ in range(3):
+        await jobs._process(db, None, await claim_job(db, "w"), lease_seconds=60)
+        job = await db.jobs.find_one({"_id": job_id})
+        assert (job["status"], job["attempts"], job["error"]) == ("queued", 0, None)
+        assert job["run_at"] > datetime.utcnow()
+        later(db, jobs.MOVE_RETRY_DELAY.total_seconds())
+
+async def test_malformed_job_id_is_not_found(client, signup, mongo_db):
+    headers = await signup()
+    response = await client.get("/api/jobs/not-an-id", headers=headers)
+    assert response.status_code == 404
+
+async def test_jobs_are_not_available_on_the_memory_backend(client, signup):
+    headers = await signup()
+    response = await client.get("/api/jobs/", headers=headers)
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Not available with STORAGE_BACKEND=memory"
+
+async def test_customers_only_submit_jobs_on_their_own_data(client, signup, mongo_db):
+    headers = await signup()
+    own = await client.post("/api/jobs/", headers=headers, json={"kind": "transactions.analytics", "payload": {"months": 12}})
+    assert own.status_code == 202
+    for kind in ("investments.accrue_cdbs", "investments.update_prices"):
+        response = await client.post("/api/jobs/", headers=headers, json={"kind": kind})
+        assert response.status_code == 403
+    assert [job["kind"] for job in mongo_db.jobs.documents] == ["transactions.analytics"]
+
+async def test_admins_submit_bank_wide_jobs(client, signup, mongo_db):
+    headers = await signup(admin=True)
+    response = await client.post("/api/jobs/", headers=headers, json={"kind": "investments.accrue_cdbs"})
+    assert response.status_code == 202
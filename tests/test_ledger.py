@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from backend.repositories import memory_repositories
+from backend.services.ledger import POSTING_KEYS_KEPT, AccountNotFound, InsufficientFunds, post_transaction
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def repos():
+    repos = memory_repositories()
+    repos.user_id = ObjectId()
+    await repos.accounts.insert({
+        "user_id": repos.user_id, "account_number": "00000001", "balance": 100.0, "available_balance": 100.0,
+    })
+    return repos
+
+def debit(user_id, amount: float, **fields) -> dict:
+    now = datetime.utcnow()
+    return {"user_id": user_id, "transaction_type": "debit", "category": "other", "amount": amount,
+            "description": "test", "transaction_date": now, "created_at": now, "status": "completed", **fields}
+
+async def balance(repos) -> float:
+    return (await repos.accounts.get_for_user(repos.user_id, {"balance": 1}))["balance"]
+
+async def test_posting_checks_funds_and_records_the_balance_after(repos):
+    posted = await post_transaction(repos, debit(repos.user_id, 30.0))
+    assert posted["balance_after"] == 70.0
+    with pytest.raises(InsufficientFunds):
+        await post_transaction(repos, debit(repos.user_id, 70.01))
+    assert await balance(repos) == 70.0
+
+async def test_posting_for_a_user_without_account_fails(repos):
+    with pytest.raises(AccountNotFound):
+        await post_transaction(repos, debit(ObjectId(), 1.0))
+
+async def test_keyed_posting_is_applied_once(repos):
+    first = await post_transaction(repos, debit(repos.user_id, 30.0, posting_key="k1"))
+    again = await post_transaction(repos, debit(repos.user_id, 30.0, posting_key="k1"))
+    assert again["_id"] == first["_id"]
+    assert await balance(repos) == 70.0
+    assert len(await repos.transactions.list_for_user(repos.user_id)) == 1
+
+async def test_keyed_repeat_is_not_refused_for_funds(repos):
+    await post_transaction(repos, debit(repos.user_id, 80.0, posting_key="k1"))
+    # 20 left: a fresh debit of 80 would fail, the repeat reports the first posting
+    again = await post_transaction(repos, debit(repos.user_id, 80.0, posting_key="k1"))
+    assert again["balance_after"] == 20.0
+
+async def test_keyed_posting_interrupted_before_insert_is_finished(repos):
+    # The balance change landed, the worker died before storing the transaction
+    await repos.accounts.apply_delta(repos.user_id, -30.0, 30.0, "k1")
+    posted = await post_transaction(repos, debit(repos.user_id, 30.0, posting_key="k1"))
+    assert posted["balance_after"] == 70.0
+    assert await balance(repos) == 70.0
+    assert (await repos.transactions.find_by_posting_key("k1"))["_id"] == posted["_id"]
+
+async def test_key_dropped_from_the_account_is_caught_by_the_transaction_index(repos):
+    first = await post_transaction(repos, debit(repos.user_id, 10.0, posting_key="old"))
+    for number in range(POSTING_KEYS_KEPT):
+        await repos.accounts.apply_delta(repos.user_id, 0.0, None, f"filler-{number}")
+    again = await post_transaction(repos, debit(repos.user_id, 10.0, posting_key="old"))
+    assert again["_id"] == first["_id"]
+    assert await balance(repos) == 90.0
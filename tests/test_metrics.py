@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+from backend import metrics
+from backend.metrics import Counter, Gauge, Histogram
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.delenv("METRICS_DIR", raising=False)
+    requests = Counter("requests_total", "Requests", ("route",))
+    in_flight = Gauge("in_flight", "Requests being served")
+    latency = Histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    monkeypatch.setattr(metrics, "METRICS", [requests, in_flight, latency])
+    return requests, in_flight, latency
+
+def test_text_format(registry):
+    requests, in_flight, latency = registry
+    requests.inc(('/a "b"\\c\n',), 2)
+    in_flight.set(1.5)
+    for seconds in (0.05, 0.5, 3.0):
+        latency.observe(seconds, ("/x",))
+
+    assert metrics.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a \\"b\\"\\\\c\\n"} 2',
+        "# HELP in_flight Requests being served",
+        "# TYPE in_flight gauge",
+        "in_flight 1.5",
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/x",le="0.1"} 1',
+        'latency_seconds_bucket{route="/x",le="1"} 2',
+        'latency_seconds_bucket{route="/x",le="+Inf"} 3',
+        'latency_seconds_sum{route="/x"} 3.55',
+        'latency_seconds_count{route="/x"} 3',
+    ]
+
+def test_bucket_bounds_are_inclusive(registry):
+    *_, latency = registry
+    latency.observe(0.1, ("/x",))
+    assert 'latency_seconds_bucket{route="/x",le="0.1"} 1' in metrics.render().splitlines()
+
+def test_scrape_merges_the_snapshots_of_every_worker(registry, monkeypatch, tmp_path):
+    requests, in_flight, latency = registry
+    requests.inc(("/a",))
+    in_flight.set(1)
+    latency.observe(0.5, ("/a",))
+    snapshot = {"requests_total": [[["/a"], 4.0], [["/b"], 1.0]], "in_flight": [[[], 3.0]],
+                "latency_seconds": [[["/a"], [0, 1, 0, 0.125]]]}
+    # A live worker (our parent) and an exited one
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps(snapshot))
+    (tmp_path / "999999999.json").write_text(json.dumps(snapshot))
+    (tmp_path / "broken.json").write_text("{")
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+
+    lines = metrics.render().splitlines()
+    assert 'requests_total{route="/a"} 9' in lines and 'requests_total{route="/b"} 2' in lines
+    # Gauges of exited workers are dropped, their counters and histograms kept
+    assert "in_flight 4" in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines and 'latency_seconds_sum{route="/a"} 0.75' in lines
+    assert (tmp_path / f"{os.getpid()}.json").exists()
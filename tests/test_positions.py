@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from backend.repositories import memory_repositories
+from backend.services.positions import InsufficientQuantity, buy, cancel_sale, consolidate_positions, sell
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+T0 = datetime(2024, 1, 1)
+
+@pytest.fixture
+def repos():
+    return memory_repositories()
+
+async def buy_lots(repos, user_id, *lots) -> dict:
+    position = None
+    for day, (quantity, price) in enumerate(lots):
+        position = await buy(repos, user_id, "stocks", "Acme", "ACME", quantity, price, T0 + timedelta(days=day))
+    return position
+
+async def remaining(repos, position) -> list:
+    return [lot["remaining"] for lot in await repos.investments.lots(position["_id"], position["user_id"])]
+
+async def test_sale_relieves_the_oldest_lots_first(repos):
+    user_id = ObjectId()
+    position = await buy_lots(repos, user_id, (10, 1.0), (10, 2.0), (10, 3.0))
+    result = await sell(repos, user_id, position["_id"], 15, 5.0, T0 + timedelta(days=5))
+    assert result["cost_basis"] == pytest.approx(10 * 1.0 + 5 * 2.0)
+    assert result["realized_profit_loss"] == pytest.approx(15 * 5.0 - 20.0)
+    assert await remaining(repos, position) == [0, 5, 10]
+    # The position now dates from its oldest open lot, at the cost of what is left
+    assert result["position"]["purchase_date"] == T0 + timedelta(days=1)
+    assert result["position"]["purchase_price"] == pytest.approx((5 * 2.0 + 10 * 3.0) / 15)
+
+async def test_selling_everything_closes_the_position(repos):
+    user_id = ObjectId()
+    position = await buy_lots(repos, user_id, (1, 10.0), (2, 20.0))
+    result = await sell(repos, user_id, position["_id"], None, 30.0)
+    assert result["quantity"] == 3 and result["position"]["is_active"] is False
+    assert await repos.investments.get_active(position["_id"], user_id) is None
+
+async def test_overselling_is_refused(repos):
+    user_id = ObjectId()
+    position = await buy_lots(repos, user_id, (1, 10.0))
+    with pytest.raises(InsufficientQuantity):
+        await sell(repos, user_id, position["_id"], 2, 10.0)
+    assert await remaining(repos, position) == [1]
+
+async def test_cancelled_sale_restores_lots_and_position(repos):
+    user_id = ObjectId()
+    position = await buy_lots(repos, user_id, (10, 1.0), (10, 2.0))
+    before = await repos.investments.get_active(position["_id"], user_id)
+    result = await sell(repos, user_id, position["_id"], 20, 5.0, redemption="r1")
+    assert result["position"]["is_active"] is False
+
+    restored = await cancel_sale(repos, position["_id"], result)
+    assert await remaining(repos, position) == [10, 10]
+    assert all(not lot["disposals"] for lot in await repos.investments.lots(position["_id"], user_id))
+    assert (restored["quantity"], restored["total_invested"]) == (20, pytest.approx(30.0))
+    assert (restored["purchase_date"], restored["is_active"]) == (before["purchase_date"], True)
+    assert restored["purchase_price"] == pytest.approx(before["purchase_price"])
+
+async def test_cancel_only_undoes_its_own_sale(repos):
+    user_id = ObjectId()
+    position = await buy_lots(repos, user_id, (10, 1.0))
+    await sell(repos, user_id, position["_id"], 3, 5.0, redemption="kept")
+    undone = await sell(repos, user_id, position["_id"], 4, 5.0, redemption="undone")
+    await cancel_sale(repos, position["_id"], undone)
+    assert await remaining(repos, position) == [7]
+    assert (await repos.investments.get_active(position["_id"], user_id))["quantity"] == 7
+
+async def legacy_purchases(db, user_id, *purchases) -> list:
+    """Per-purchase documents from before positions: (quantity, price, is_active)"""
+    ids = []
+    for day, (quantity, price, is_active) in enumerate(purchases):
+        ids.append((await db.investments.insert_one({
+            "user_id": user_id, "investment_type": "stocks", "asset_name": "Acme", "symbol": "ACME",
+            "quantity": quantity, "purchase_price": price, "total_invested": quantity * price,
+            "purchase_date": T0 + timedelta(days=day), "is_active": is_active,
+        })).inserted_id)
+    return ids
+
+async def test_consolidation_skips_sold_purchases_even_the_earliest():
+    db, user_id = FakeDatabase(), ObjectId()
+    sold, *active = await legacy_purchases(db, user_id, (5, 1.0, False), (10, 2.0, True), (10, 4.0, True))
+    assert await consolidate_positions(db) == 1
+
+    [position] = db.investments.documents
+    assert position["_id"] == sold and position["is_active"]
+    assert (position["quantity"], position["total_invested"]) == (20, 60.0)
+    assert sorted(lot["_id"] for lot in db.investment_lots.documents) == sorted(active)
+    assert {lot["position_id"] for lot in db.investment_lots.documents} == {sold}
+
+async def test_consolidation_interrupted_before_the_delete_is_finished_once(monkeypatch):
+    db, user_id = FakeDatabase(), ObjectId()
+    await legacy_purchases(db, user_id, (10, 1.0, True), (10, 2.0, True), (10, 3.0, True))
+
+    async def interrupted(query):
+        raise ConnectionError("stopped")
+    with monkeypatch.context() as patch:
+        patch.setattr(db.investments, "delete_many", interrupted)
+        with pytest.raises(ConnectionError):
+            await consolidate_positions(db)
+    assert await consolidate_positions(db) == 1
+
+    [position] = db.investments.documents
+    assert (position["quantity"], position["total_invested"]) == (30, 60.0)
+    assert [lot["quantity"] for lot in db.investment_lots.documents] == [10, 10, 10]
+    assert await consolidate_positions(db) == 0
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from backend.services.price_history import price_matrix, record_ticks, reconstruct_performance, rollup, run_rollups, time_grid
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2024, 5, 1, 10, 0)
+
+async def tick(db, seconds: int, **prices):
+    await record_ticks(db, prices, START + timedelta(seconds=seconds))
+
+def bars(db, name: str) -> dict:
+    return {(bar["symbol"], bar["ts"]): (bar["open"], bar["high"], bar["low"], bar["close"]) for bar in db[name].documents}
+
+async def test_ticks_roll_up_into_completed_minute_bars():
+    db = FakeDatabase()
+    for seconds, price in [(5, 10.0), (20, 12.0), (40, 9.0), (55, 11.0), (70, 11.5)]:
+        await tick(db, seconds, BTC=price, ETH=price / 10)
+    await tick(db, 130, BTC=99.0)  # Minute still open at ``now``
+
+    assert await rollup(db, "1m", now=START + timedelta(seconds=150)) == 4
+    minute = START + timedelta(minutes=1)
+    assert bars(db, "price_bars_1m")[("BTC", START)] == (10.0, 12.0, 9.0, 11.0)
+    assert bars(db, "price_bars_1m")[("BTC", minute)] == (11.5, 11.5, 11.5, 11.5)
+    assert ("BTC", minute + timedelta(minutes=1)) not in bars(db, "price_bars_1m")
+
+    # Incremental: nothing new until the open minute completes
+    assert await rollup(db, "1m", now=START + timedelta(seconds=170)) == 0
+    assert await rollup(db, "1m", now=START + timedelta(minutes=3)) == 1
+    assert bars(db, "price_bars_1m")[("BTC", minute + timedelta(minutes=1))] == (99.0,) * 4
+
+async def test_coarser_resolutions_roll_up_the_finer_bars():
+    db = FakeDatabase()
+    for minutes, price in [(0, 5.0), (15, 8.0), (30, 3.0), (59, 6.0), (61, 7.0)]:
+        await tick(db, minutes * 60, BTC=price)
+
+    counts = await run_rollups(db, now=START + timedelta(hours=2))
+    assert counts == {"1m": 5, "1h": 2, "1d": 0}
+    assert bars(db, "price_bars_1h") == {
+        ("BTC", START): (5.0, 8.0, 3.0, 6.0),
+        ("BTC", START + timedelta(hours=1)): (7.0,) * 4,
+    }
+
+def test_price_matrix_fills_gaps_both_ways():
+    grid = time_grid(START, START + timedelta(hours=4), timedelta(hours=1))
+    history = [
+        {"symbol": "BTC", "ts": START + timedelta(hours=1), "close": 2.0},
+        {"symbol": "BTC", "ts": START + timedelta(hours=3), "close": 4.0},
+        {"symbol": "ETH", "ts": START, "close": 1.0},
+    ]
+    symbols, prices = price_matrix(history, grid)
+    assert symbols == ["BTC", "ETH"]
+    assert prices.tolist() == [[2.0, 2.0, 2.0, 4.0, 4.0], [1.0] * 5]
+
+def test_performance_values_holdings_from_their_purchase():
+    history = [{"symbol": "BTC", "ts": START + timedelta(hours=hour), "close": 10.0 + hour} for hour in range(3)]
+    holdings = [
+        {"symbol": "BTC", "quantity": 2.0, "total_invested": 20.0, "purchase_date": START},
+        {"symbol": "BTC", "quantity": 1.0, "total_invested": 11.0, "purchase_date": START + timedelta(minutes=90)},
+        {"symbol": None, "quantity": 1.0, "total_invested": 500.0, "purchase_date": START + timedelta(hours=2)},
+    ]
+    performance = reconstruct_performance(holdings, history, START, START + timedelta(hours=2), timedelta(hours=1))
+    assert performance["timestamps"] == [START + timedelta(hours=hour) for hour in range(3)]
+    assert np.allclose(performance["values"], [20.0, 33.0, 536.0])
+    assert performance["invested"] == [20.0, 31.0, 531.0]
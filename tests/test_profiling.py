@@ -0,0 +1,96 @@
+import asyncio
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from backend import profiling
+from backend.profiling import RequestProfile, Sampler, command_recorder, folded
+
+pytestmark = pytest.mark.anyio
+
+async def waiting_for_io(event: asyncio.Event):
+    await event.wait()
+
+def busy(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+async def profiled(sampler: Sampler, work) -> RequestProfile:
+    async def request():
+        profile = RequestProfile("GET", "/x", None, sys._getframe())
+        sampler.add(asyncio.current_task(), profile)
+        try:
+            await work()
+        finally:
+            sampler.remove(asyncio.current_task())
+        return profile
+    return await asyncio.create_task(request())
+
+async def test_sampler_records_running_and_awaiting_stacks():
+    sampler = Sampler(asyncio.get_running_loop(), threading.get_ident(), 0.001)
+    sampler.start()
+    try:
+        event = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.05, event.set)
+        suspended = await profiled(sampler, lambda: waiting_for_io(event))
+
+        async def spin():
+            busy(0.1)
+        running = await profiled(sampler, spin)
+    finally:
+        sampler.stop()
+
+    assert suspended.cpu == {} and suspended.wall
+    assert all(stack.endswith("<awaiting>") for stack in suspended.wall)
+    assert any("test_profiling.waiting_for_io" in stack for stack in suspended.wall)
+    assert any(stack.endswith("test_profiling.busy") for stack in running.cpu)
+    assert running.cpu_seconds > 0
+
+async def test_commands_are_recorded_only_for_the_profiled_request():
+    event = SimpleNamespace(command_name="find", command={"find": "accounts"}, connection_id=("db", 27017),
+                            request_id=7, duration_micros=1500)
+    command_recorder.started(event)
+    command_recorder.succeeded(event)  # Not profiled: nothing to record into
+
+    profile = RequestProfile("GET", "/x", None, None)
+    token = profiling._current.set(profile)
+    try:
+        command_recorder.started(event)
+        command_recorder.succeeded(event)
+    finally:
+        profiling._current.reset(token)
+    assert profile.commands == [{"command": "find", "collection": "accounts", "duration_ms": 1.5, "ok": True}]
+    assert profile.pending == {}
+
+def test_folded_stacks():
+    assert folded([{"stack": "a;b", "count": 3}, {"stack": "a", "count": 1}]) == "a;b 3\na 1\n"
+
+async def test_profiling_is_installed_for_the_chosen_route_and_removed(app, client, signup, mongo_db):
+    admin, user = await signup(admin=True), await signup()
+    response = await client.put("/api/admin/profiling", headers=admin,
+                                json={"sample_rate": 1.0, "route": "/api/accounts/balance", "interval_ms": 1})
+    assert response.status_code == 200 and response.json()["enabled"]
+    try:
+        assert isinstance(app.middleware_stack, profiling.ProfilingMiddleware)
+        assert (await client.get("/api/accounts/balance", headers=user)).status_code == 200
+        assert (await client.get("/api/accounts/", headers=user)).status_code == 200
+        await asyncio.gather(*profiling._pending_writes)
+
+        [profile] = mongo_db.request_profiles.documents
+        assert (profile["route"], profile["status"], profile["method"]) == ("/api/accounts/balance", 200, "GET")
+    finally:
+        response = await client.delete("/api/admin/profiling", headers=admin)
+    assert response.status_code == 200
+    assert not isinstance(app.middleware_stack, profiling.ProfilingMiddleware)
+    assert profiling._sampler is None
+
+async def test_expired_settings_leave_profiling_off(app):
+    settings = {"enabled": True, "sample_rate": 1.0, "route": None, "user_id": None, "interval_ms": 5,
+                "expires_at": datetime.utcnow() - timedelta(seconds=1)}
+    profiling.apply_settings(app, None, settings)
+    assert profiling._settings is None and profiling._sampler is None
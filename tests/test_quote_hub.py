@@ -0,0 +1,62 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from backend import repositories
+from backend.app import create_app
+from backend.repositories.memory import MemoryMarketRepository
+from backend.services import quote_hub
+from backend.services.quote_hub import (
+    MAX_SYMBOLS_PER_SUBSCRIPTION, InvalidSubscription, MarketTableSource, PriceHub
+)
+
+pytestmark = pytest.mark.anyio
+
+async def test_last_subscriber_leaving_drops_the_symbol():
+    hub = PriceHub()
+    first, second = hub.subscribe(["BTC", "ETH"]), hub.subscribe(["BTC"])
+    first.close()
+    assert set(hub.subscribers) == {"BTC"}
+    second.unsubscribe(["BTC"])
+    assert hub.subscribers == {} and hub.subscriptions == 0
+
+async def test_unlisted_symbols_are_refused():
+    hub = PriceHub()
+    with pytest.raises(InvalidSubscription):
+        hub.subscribe(["BTC", "NOT-A-COIN"])
+    assert hub.subscribers == {}
+
+async def test_published_symbols_become_listed():
+    hub = PriceHub()
+    hub.publish({"PETR4": {"current_price": 38.5}})
+    subscription = hub.subscribe(["PETR4"])
+    assert list(await subscription.next_batch()) == ["PETR4"]
+
+async def test_symbols_per_subscription_are_capped():
+    hub = PriceHub()
+    hub.publish({f"S{number}": {"current_price": 1.0} for number in range(MAX_SYMBOLS_PER_SUBSCRIPTION)})
+    subscription = hub.subscribe([f"S{number}" for number in range(MAX_SYMBOLS_PER_SUBSCRIPTION)])
+    with pytest.raises(InvalidSubscription):
+        subscription.subscribe(["BTC"])
+    assert "BTC" not in hub.subscribers
+
+async def test_stream_of_unknown_symbol_is_a_bad_request(client):
+    response = await client.get("/api/investments/quotes/stream", params={"symbols": "BTC,NOPE"})
+    assert response.status_code == 400
+
+async def test_market_source_yields_only_changed_quotes():
+    market, stop = MemoryMarketRepository(), asyncio.Event()
+    stream = MarketTableSource(market, interval=0).stream(stop)
+    assert set(await stream.__anext__()) == set(market.market_prices)
+    market.market_prices["BTC"]["updated_at"] += timedelta(seconds=1)
+    assert list(await stream.__anext__()) == ["BTC"]
+    stop.set()
+
+async def test_app_shutdown_stops_the_hub(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    app = create_app(instrument=False, limit_rate=False)
+    async with app.router.lifespan_context(app):
+        hub = quote_hub.get_price_hub((await repositories.get_repositories()).market)
+        task = hub._task
+    assert quote_hub._hub is None and task.done()
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+from backend import rate_limit
+from backend.app import create_app
+from backend.rate_limit import MemoryRateLimitBackend
+from backend.serve import worker_config
+
+pytestmark = pytest.mark.anyio
+
+PROXY = "172.28.0.10"
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: clock.now, time=rate_limit.time.time))
+    return clock
+
+async def test_bucket_allows_a_burst_then_refills_at_the_rate(clock):
+    backend = MemoryRateLimitBackend()
+    assert [await backend.take("k", 0.5, 3) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert await backend.take("k", 0.5, 3) == pytest.approx(2.0)
+    clock.now += 1.0
+    assert await backend.take("k", 0.5, 3) == pytest.approx(1.0)
+    clock.now += 2.0
+    assert await backend.take("k", 0.5, 3) == 0.0
+
+async def test_refill_is_capped_at_the_burst(clock):
+    backend = MemoryRateLimitBackend()
+    await backend.take("k", 1.0, 2)
+    clock.now += 3600
+    assert [await backend.take("k", 1.0, 2) for _ in range(3)] == [0.0, 0.0, pytest.approx(1.0)]
+
+@pytest.fixture
+async def proxied(monkeypatch):
+    """The app behind uvicorn's proxy header handling as ``serve`` configures it, reached from nginx"""
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.setenv("RATE_LIMITS", "auth=0.5/2")
+    monkeypatch.setenv("FORWARDED_ALLOW_IPS", PROXY)
+    app = create_app(instrument=False, limit_rate=True)
+    trusted = worker_config(SimpleNamespace(access_log=False, backlog=128, keep_alive=5, graceful_timeout=30))
+    transport = httpx.ASGITransport(app=ProxyHeadersMiddleware(app, trusted["forwarded_allow_ips"]), client=(PROXY, 4321))
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+async def login(client, forwarded_for: str):
+    return await client.post("/api/auth/login", json={"cpf": "00000000000", "password": "x"},
+                             headers={"X-Forwarded-For": forwarded_for})
+
+async def test_clients_behind_the_proxy_get_their_own_buckets(proxied):
+    assert [(await login(proxied, "203.0.113.7")).status_code for _ in range(2)] == [401, 401]
+    limited = await login(proxied, "203.0.113.7")
+    assert limited.status_code == 429 and limited.headers["retry-after"] == "2"
+    assert (await login(proxied, "198.51.100.9")).status_code == 401
@@ -0,0 +1,84 @@
+from datetime import timedelta
+import math
+import statistics
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from backend.services.risk import _as_of, _score, daily_returns, get_user_risk, portfolio_risk, position_matrix
+from backend.services.valuation import PriceSnapshot
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+RETURNS = np.array([
+    [0.02, -0.05, 0.01, 0.03, -0.02, 0.04, -0.01],
+    [-0.01, 0.02, -0.03, 0.01, 0.00, -0.02, 0.05],
+])
+
+def reference(weights: list, value: float) -> tuple:
+    """Volatility, VaR and max drawdown of one portfolio, day by day"""
+    daily = [sum(w * column[i] for i, w in enumerate(weights)) for column in RETURNS.T]
+    peak, level, drawdown = 1.0, 1.0, 0.0
+    for r in daily:
+        level *= 1 + r
+        peak = max(peak, level)
+        drawdown = max(drawdown, 1 - level / peak)
+    cutoff = float(np.quantile(daily, 0.05))
+    return statistics.stdev(daily) * math.sqrt(365), max(-cutoff, 0) * value, drawdown
+
+def test_batch_scoring_matches_each_portfolio_alone():
+    portfolio = np.array([0, 0, 1, 2, 2])
+    symbol = np.array([0, 1, 1, 0, -1])
+    value = np.array([300.0, 100.0, 50.0, 200.0, 200.0])
+    exposures, unpriced = position_matrix(portfolio, symbol, value, 3, 2)
+    assert unpriced.tolist() == [0.0, 0.0, 200.0]
+
+    metrics = portfolio_risk(exposures, unpriced, RETURNS)
+    assert metrics["portfolio_value"].tolist() == [400.0, 50.0, 400.0]
+    # The third portfolio holds half its value in an unpriced asset, which dilutes its risk
+    for i, (weights, total) in enumerate([([0.75, 0.25], 400.0), ([0.0, 1.0], 50.0), ([0.5, 0.0], 400.0)]):
+        volatility, value_at_risk, drawdown = reference(weights, total)
+        assert metrics["volatility"][i] == pytest.approx(volatility)
+        assert metrics["value_at_risk"][i] == pytest.approx(value_at_risk)
+        assert metrics["max_drawdown"][i] == pytest.approx(drawdown)
+        assert metrics["conditional_value_at_risk"][i] >= metrics["value_at_risk"][i]
+
+def test_too_little_history_scores_zero_risk():
+    metrics = portfolio_risk(np.array([[10.0]]), np.zeros(1), np.zeros((1, 1)))
+    assert (metrics["volatility"][0], metrics["value_at_risk"][0], metrics["observations"]) == (0.0, 0.0, 1)
+
+def test_returns_ignore_missing_and_zero_prices():
+    returns = daily_returns(np.array([[10.0, 11.0, 0.0, 5.0], [np.nan, 2.0, 3.0, 3.0]]))
+    assert np.allclose(returns, [[0.1, -1.0, 0.0], [0.0, 0.5, 0.0]])
+
+def test_batch_values_cdb_at_accrued_value():
+    user_id = ObjectId()
+    docs = [
+        {"user_id": user_id, "symbol": "BTC", "quantity": 2.0, "purchase_price": 50.0},
+        {"user_id": user_id, "symbol": None, "quantity": 1.0, "purchase_price": 1000.0, "accrued_value": 1100.0},
+    ]
+    [document] = _score(docs, {"BTC": 60.0}, {"BTC": 0}, RETURNS[:1], _as_of(), 7, 0.95)
+    assert (document["user_id"], document["portfolio_value"]) == (user_id, 1220.0)
+
+async def test_user_risk_is_cached_for_the_day():
+    db, user_id, today = FakeDatabase(), ObjectId(), _as_of()
+    closes = [100.0, 104.0, 98.0, 101.0, 95.0, 99.0]
+    await db.price_bars_1d.insert_many([
+        {"symbol": "BTC", "ts": today - timedelta(days=len(closes) - 1 - day), "close": close}
+        for day, close in enumerate(closes)
+    ])
+    await db.investments.insert_one({"user_id": user_id, "is_active": True, "investment_type": "cryptocurrency",
+                                     "symbol": "BTC", "quantity": 1.0, "purchase_price": 90.0, "total_invested": 90.0})
+    snapshot = PriceSnapshot({"BTC": 99.0}, 0.0)
+
+    first = await get_user_risk(db, user_id, snapshot, lookback_days=10)
+    assert (first["portfolio_value"], first["observations"]) == (99.0, 10)
+    assert first["max_drawdown"] == pytest.approx(1 - 95.0 / 104.0)
+
+    await db.investments.update_many({"user_id": user_id}, {"$set": {"quantity": 5.0}})
+    assert (await get_user_risk(db, user_id, snapshot, lookback_days=10))["portfolio_value"] == 99.0
+    assert (await get_user_risk(db, user_id, snapshot, lookback_days=30))["portfolio_value"] == 495.0
+    assert await db.risk_metrics.count_documents({"user_id": user_id}) == 1
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+import json
+import os
+
+import pytest
+from bson import ObjectId
+
+from backend import metrics
+from backend.services import scheduler
+from backend.services.scheduler import (
+    LEASE_SECONDS, SchedulerMetrics, claim_due_schedules, execute_schedule, scheduler_lag
+)
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def db(monkeypatch):
+    db = FakeDatabase()
+    await scheduler.create_schedule_indexes(db)
+    await db.transactions.create_index(
+        "posting_key", unique=True, partialFilterExpression={"posting_key": {"$type": "string"}}
+    )
+
+    async def same_shard(user_id):
+        return db
+    monkeypatch.setattr(scheduler, "user_database", same_shard)
+    return db
+
+async def add_user(db, balance: float = 100.0):
+    user_id = ObjectId()
+    await db.accounts.insert_one({"user_id": user_id, "account_number": str(user_id)[-8:],
+                                  "balance": balance, "available_balance": balance})
+    return user_id
+
+async def add_schedule(db, user_id, amount: float, frequency: str = "monthly", due: datetime = None) -> dict:
+    due = due or datetime.utcnow() - timedelta(minutes=1)
+    schedule = {"user_id": user_id, "transaction_type": "bill_payment", "category": "bills", "amount": amount,
+                "description": "Rent", "frequency": frequency, "anchor_day": due.day, "next_run_at": due,
+                "status": "active", "attempts": 0, "lease_expires_at": None}
+    await db.scheduled_payments.insert_one(schedule)
+    return schedule
+
+async def balance(db, user_id) -> float:
+    return (await db.accounts.find_one({"user_id": user_id}))["balance"]
+
+async def test_racing_workers_never_claim_the_same_schedule(db):
+    user_id = await add_user(db)
+    await add_schedule(db, user_id, 10.0)
+    now = datetime.utcnow()
+    first = await claim_due_schedules(db, "a", now)
+    second = await claim_due_schedules(db, "b", now)
+    assert len(first) == 1 and second == []
+
+async def test_expired_lease_is_claimed_again(db):
+    user_id = await add_user(db)
+    await add_schedule(db, user_id, 10.0)
+    now = datetime.utcnow()
+    await claim_due_schedules(db, "a", now)
+    assert await claim_due_schedules(db, "b", now + timedelta(seconds=LEASE_SECONDS - 1)) == []
+    again = await claim_due_schedules(db, "b", now + timedelta(seconds=LEASE_SECONDS + 1))
+    assert [schedule["lease_owner"] for schedule in again] == ["b"]
+
+async def test_execution_posts_and_advances_a_monthly_schedule(db):
+    user_id = await add_user(db)
+    schedule = await add_schedule(db, user_id, 10.0)
+    [claimed] = await claim_due_schedules(db, "a", datetime.utcnow())
+    await execute_schedule(db, claimed, SchedulerMetrics())
+    stored = await db.scheduled_payments.find_one({"_id": schedule["_id"]})
+    assert await balance(db, user_id) == 90.0
+    assert stored["next_run_at"] > schedule["next_run_at"] and stored["lease_token"] is None
+
+async def test_occurrence_rerun_after_a_lost_lease_update_posts_once(db, monkeypatch):
+    user_id = await add_user(db)
+    await add_schedule(db, user_id, 10.0)
+    now = datetime.utcnow()
+    [claimed] = await claim_due_schedules(db, "a", now)
+
+    # The worker dies after posting, before advancing the schedule
+    async def crash(*args, **kwargs):
+        raise ConnectionError("worker lost")
+    with monkeypatch.context() as patch:
+        patch.setattr(db.scheduled_payments, "update_one", crash)
+        with pytest.raises(ConnectionError):
+            await execute_schedule(db, claimed, SchedulerMetrics())
+
+    [reclaimed] = await claim_due_schedules(db, "b", now + timedelta(seconds=LEASE_SECONDS + 1))
+    metrics = SchedulerMetrics()
+    await execute_schedule(db, reclaimed, metrics)
+    assert metrics.executed == 1
+    assert await balance(db, user_id) == 90.0
+    assert await db.transactions.count_documents({"user_id": user_id}) == 1
+
+async def test_insufficient_funds_backs_off_without_posting(db):
+    user_id = await add_user(db, balance=5.0)
+    schedule = await add_schedule(db, user_id, 10.0)
+    [claimed] = await claim_due_schedules(db, "a", datetime.utcnow())
+    metrics = SchedulerMetrics()
+    await execute_schedule(db, claimed, metrics)
+    stored = await db.scheduled_payments.find_one({"_id": schedule["_id"]})
+    assert metrics.retried == 1 and stored["attempts"] == 1
+    assert stored["next_run_at"] > datetime.utcnow()
+    assert await balance(db, user_id) == 5.0
+
+async def test_cancelling_a_malformed_schedule_id_is_not_found(client, signup, mongo_db):
+    headers = await signup()
+    response = await client.delete("/api/schedules/not-an-id", headers=headers)
+    assert response.status_code == 404
+
+async def test_lag_is_admin_only(client, signup, mongo_db):
+    response = await client.get("/api/schedules/lag", headers=await signup())
+    assert response.status_code == 403
+    response = await client.get("/api/schedules/lag", headers=await signup(admin=True))
+    assert response.status_code == 200 and response.json()["due_count"] == 0
+
+async def test_lag_is_exported_once_whatever_the_workers(db, monkeypatch, tmp_path):
+    user_id = await add_user(db)
+    now = datetime.utcnow()
+    for minutes in (1, 5):
+        await add_schedule(db, user_id, 10.0, due=now - timedelta(minutes=minutes))
+    await claim_due_schedules(db, "a", now, batch_size=1)
+    metrics.set_scheduler_gauges(await scheduler_lag(db, now))
+
+    # Another live worker's snapshot holds its own reading, which must not be added
+    monkeypatch.setenv("METRICS_DIR", str(tmp_path))
+    (tmp_path / f"{os.getppid()}.json").write_text(json.dumps({"scheduler_due_payments": [[[], 2.0]]}))
+    lines = metrics.render().splitlines()
+    assert "scheduler_due_payments 2" in lines and "scheduler_leased_payments 1" in lines
+    assert "scheduler_lag_seconds 300" in lines
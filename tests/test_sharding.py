@@ -0,0 +1,98 @@
+import pytest
+from bson import ObjectId
+
+from backend.services.rebalance import plan_moves, rebalance
+from backend.sharding import HOME_SHARD, SHARDED_COLLECTIONS, HashRing, ShardMap, ShardMoving
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+USERS = [ObjectId(f"{number:024x}") for number in range(400)]
+
+def test_ring_placement_is_deterministic_and_spread():
+    ring = HashRing(["home", "s2", "s3"])
+    owners = [ring.owner(user_id) for user_id in USERS]
+    assert owners == [HashRing(["s3", "home", "s2"]).owner(user_id) for user_id in USERS]
+    for name in ("home", "s2", "s3"):
+        assert 60 < owners.count(name) < 220
+
+def test_adding_a_shard_only_moves_users_onto_it():
+    before, after = HashRing(["home", "s2"]), HashRing(["home", "s2", "s3"])
+    moved = [user_id for user_id in USERS if before.owner(user_id) != after.owner(user_id)]
+    assert all(after.owner(user_id) == "s3" for user_id in moved)
+    assert 60 < len(moved) < 220
+
+def test_ring_needs_a_shard():
+    with pytest.raises(ValueError):
+        HashRing([])
+
+@pytest.fixture
+async def shards():
+    shards = ShardMap({HOME_SHARD: FakeDatabase("home"), "s2": FakeDatabase("s2")}, HashRing([HOME_SHARD, "s2"]))
+    for db in shards.databases.values():
+        await db.accounts.create_index("account_number", unique=True)
+    return shards
+
+async def add_user(shards, user_id, shard: str = HOME_SHARD):
+    await shards.home.users.insert_one({"_id": user_id, "shard": shard})
+    db = shards.database(shard)
+    await db.accounts.insert_one({"user_id": user_id, "account_number": str(user_id)[-8:], "balance": 10.0})
+    await db.transactions.insert_many([{"user_id": user_id, "amount": amount} for amount in (1.0, 2.0)])
+
+async def documents(db, user_id) -> int:
+    return sum([await db[name].count_documents({"user_id": user_id}) for name in SHARDED_COLLECTIONS])
+
+def owned_by(shards, name: str) -> list:
+    return [user_id for user_id in USERS[:20] if shards.placement(user_id) == name]
+
+async def test_rebalance_copies_flips_and_cleans_up(shards):
+    for user_id in USERS[:20]:
+        await add_user(shards, user_id)
+    movers = owned_by(shards, "s2")
+
+    totals = await rebalance(shards, batch_size=4, grace_seconds=0)
+    assert (totals["planned"], totals["moved"], totals["failed"]) == (len(movers), len(movers), 0)
+    for user_id in USERS[:20]:
+        user = await shards.home.users.find_one({"_id": user_id})
+        owner = shards.placement(user_id)
+        assert (user["shard"], user.get("moving_to"), user.get("moving_from")) == (owner, None, None)
+        assert await shards.database_for(user_id) is shards.database(owner)
+        assert await documents(shards.database(owner), user_id) == 3
+    assert sum([await documents(shards.home, user_id) for user_id in movers]) == 0
+    assert await plan_moves(shards) == []
+
+async def test_copy_conflict_rolls_the_user_back(shards):
+    [user_id, *_] = owned_by(shards, "s2")
+    await add_user(shards, user_id)
+    # Another user already holds the account number on the target
+    await shards.database("s2").accounts.insert_one({"user_id": ObjectId(), "account_number": str(user_id)[-8:]})
+
+    totals = await rebalance(shards, user_id=user_id, grace_seconds=0)
+    assert (totals["moved"], totals["failed"]) == (0, 1)
+    user = await shards.home.users.find_one({"_id": user_id})
+    assert (user["shard"], user.get("moving_to")) == (HOME_SHARD, None)
+    assert await documents(shards.home, user_id) == 3
+    assert await documents(shards.database("s2"), user_id) == 0
+
+async def test_claimed_user_is_moving(shards):
+    [user_id, *_] = owned_by(shards, "s2")
+    await add_user(shards, user_id)
+    await shards.home.users.update_one({"_id": user_id}, {"$set": {"moving_to": "s2"}})
+    with pytest.raises(ShardMoving):
+        await shards.database_for(user_id)
+
+async def test_move_interrupted_after_the_flip_is_finished(shards):
+    [user_id, *_] = owned_by(shards, "s2")
+    await add_user(shards, user_id)
+    for name in SHARDED_COLLECTIONS:
+        copied = await shards.home[name].find({"user_id": user_id}).to_list(None)
+        if copied:
+            await shards.database("s2")[name].insert_many(copied)
+    await shards.home.users.update_one({"_id": user_id}, {"$set": {"shard": "s2", "moving_from": HOME_SHARD}})
+
+    assert await plan_moves(shards) == [(user_id, HOME_SHARD, "s2")]
+    assert (await rebalance(shards, grace_seconds=0))["moved"] == 1
+    assert await documents(shards.home, user_id) == 0
+    assert await documents(shards.database("s2"), user_id) == 3
+    assert (await shards.home.users.find_one({"_id": user_id})).get("moving_from") is None
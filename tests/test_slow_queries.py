@@ -0,0 +1,84 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+
+from backend import slow_queries
+from backend.slow_queries import plan_summary, plan_tree, redact, shape_id, slow_command_recorder
+
+from .fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+def find(account_number: str, user_ids: list) -> dict:
+    return {"find": "accounts", "filter": {"account_number": account_number, "user_id": {"$in": user_ids}},
+            "sort": {"created_at": -1}, "limit": 10, "lsid": {"id": "session"}, "$db": "banksys"}
+
+def test_shapes_keep_structure_and_drop_values():
+    shape = redact(find("12345678", [ObjectId(), ObjectId()]))
+    assert shape == {"find": "?", "filter": {"account_number": "?", "user_id": {"$in": ["?"]}},
+                     "sort": {"created_at": -1}, "limit": "?"}
+    assert shape_id(shape) == shape_id(redact(find("87654321", [ObjectId()])))
+
+def test_pipelines_keep_field_paths_and_statements_collapse():
+    pipeline = redact({"aggregate": "transactions", "pipeline": [
+        {"$match": {"user_id": ObjectId(), "amount": {"$gte": 100}}},
+        {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}},
+    ]})["pipeline"]
+    assert pipeline == [{"$match": {"user_id": "?", "amount": {"$gte": "?"}}},
+                        {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}}]
+
+    updates = [{"q": {"_id": ObjectId()}, "u": {"$inc": {"balance": amount}}} for amount in (1, 2, 3)]
+    assert redact({"update": "accounts", "updates": updates})["updates"] == [{"q": {"_id": "?"}, "u": {"$inc": {"balance": "?"}}}]
+
+def test_plan_summary_of_a_slot_based_plan():
+    winning = {"queryPlan": {"stage": "FETCH", "filter": {"balance": {"$gt": 5}}, "inputStage": {
+        "stage": "OR", "inputStages": [{"stage": "IXSCAN", "indexName": "user_id_1", "indexBounds": {"user_id": ["[1, 1]"]}},
+                                       {"stage": "COLLSCAN"}]}}}
+    tree = plan_tree(slow_queries._winning_plan({"queryPlanner": {"winningPlan": winning}}))
+    assert plan_summary(tree) == "FETCH > OR > [IXSCAN(user_id_1), COLLSCAN]"
+
+class ExplainingDatabase:
+    def __init__(self):
+        self.explained = []
+
+    async def command(self, command: dict) -> dict:
+        self.explained.append(command)
+        return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+def command_event(command: dict, millis: float, request_id: int):
+    return SimpleNamespace(command_name=next(iter(command)), command=command, database_name="banksys",
+                           connection_id=("db", 27017), request_id=request_id, duration_micros=millis * 1000)
+
+async def test_slow_commands_are_stored_redacted_and_explained_once(monkeypatch):
+    monkeypatch.setattr(slow_queries, "_plans", {})
+    db, explaining = FakeDatabase(), ExplainingDatabase()
+    db.client = {"banksys": explaining}
+    recorder = asyncio.create_task(slow_queries.record_slow_commands(db))
+    await asyncio.sleep(0)
+    try:
+        commands = [
+            (find("12345678", [ObjectId()]), 250.0),
+            (find("87654321", [ObjectId()]), 400.0),
+            (find("11111111", [ObjectId()]), 5.0),  # Fast
+            ({"insert": "slow_commands", "documents": [{"route": "x"}]}, 300.0),  # Our own writes
+        ]
+        for request_id, (command, millis) in enumerate(commands):
+            event = command_event(command, millis, request_id)
+            slow_command_recorder.started(event)
+            slow_command_recorder.succeeded(event)
+        for _ in range(10):
+            await asyncio.sleep(0)
+    finally:
+        recorder.cancel()
+        await asyncio.gather(recorder, return_exceptions=True)
+
+    samples = db.slow_commands.documents
+    assert [sample["duration_ms"] for sample in samples] == [250.0, 400.0]
+    assert samples[0]["shape_id"] == samples[1]["shape_id"]
+    assert "12345678" not in samples[0]["shape"] and json.loads(samples[0]["shape"])["find"] == "accounts"
+    assert (samples[0]["route"], samples[0]["plan_summary"], samples[0]["collscan"]) == ("background", "COLLSCAN", True)
+    [explain] = explaining.explained
+    assert "lsid" not in explain["explain"] and explain["verbosity"] == "queryPlanner"
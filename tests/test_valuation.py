@@ -0,0 +1,26 @@
+import asyncio
+
+from backend.services import valuation
+
+class CountingMarket:
+    def __init__(self):
+        self.loads = 0
+
+    async def current_prices(self) -> dict:
+        self.loads += 1
+        await asyncio.sleep(0)
+        return {"BTC": 100.0}
+
+def test_snapshot_reloads_work_across_event_loops(monkeypatch):
+    market = CountingMarket()
+
+    async def stale_readers():
+        snapshots = await asyncio.gather(*(valuation.get_price_snapshot(market, max_age=0.5) for _ in range(10)))
+        return {id(snapshot) for snapshot in snapshots}
+
+    # Each asyncio.run is a new loop, as in pool children and test runs
+    for _ in range(3):
+        monkeypatch.setattr(valuation, "_snapshot", None)
+        assert len(asyncio.run(stale_readers())) == 1
+    # One reload per loop, shared by the readers that found the snapshot stale
+    assert market.loads == 3